@@ -0,0 +1,285 @@
+"""
+Módulo que hace copias de seguridad de la base de datos sin parar al bot.
+
+Copiar soloville.db con el sistema de archivos mientras el bot escribe puede dar una copia
+corrupta. Aquí se usa la API de backup de SQLite (sqlite3.Connection.backup), que copia la
+base de datos por pasos de PAGINAS_POR_PASO páginas y hace una pausa entre pasos: cada paso
+solo bloquea la base de datos un momento, así que los canjes no esperan a la copia.
+
+Si otra conexión escribe entre dos pasos, SQLite reinicia la copia. Con la base de datos en
+modo WAL se evita abriendo una transacción de lectura en el origen: la copia sale de esa
+instantánea y los escritores siguen trabajando. En modo rollback (el modo por defecto) no se
+puede leer mientras otro escribe, así que tras REINICIOS_MAXIMOS reinicios la copia se hace
+de una vez, bloqueando las escrituras solo lo que tarda en copiarse el archivo.
+
+Cada copia se escribe primero en un archivo temporal, se comprueba con PRAGMA
+integrity_check, se comprime con gzip (opcional) y solo entonces se renombra a
+soloville-AAAAMMDD-HHMMSS.db[.gz]. Se conservan las COPIAS_CONSERVADAS más recientes.
+
+Este módulo puede ejecutarse directamente:
+    python DB_BACKUP.py                      # una copia
+    python DB_BACKUP.py servicio [segundos]  # una copia cada INTERVALO_BACKUP segundos
+    python DB_BACKUP.py verificar <copia>    # comprobar una copia
+"""
+import gzip
+import logging
+import os
+import shutil
+import sqlite3
+import sys
+import tempfile
+import threading
+import time
+from datetime import datetime
+from typing import List, Optional
+
+import DB_DML_FUNCIONES
+
+# Configuración del logger
+logger_db = logging.getLogger('database')
+
+# Configuración de las copias
+DIRECTORIO_BACKUPS = 'backups'
+PREFIJO_BACKUP = 'soloville-'
+COPIAS_CONSERVADAS = 24
+INTERVALO_BACKUP = 3600
+COMPRIMIR = True
+
+# Páginas copiadas en cada paso y pausa (segundos) entre pasos
+PAGINAS_POR_PASO = 256
+PAUSA_ENTRE_PASOS = 0.005
+
+# Reinicios de la copia por pasos (modo rollback) antes de copiar de una vez
+REINICIOS_MAXIMOS = 3
+
+class CopiaReiniciada(Exception):
+    """La copia por pasos se ha reiniciado demasiadas veces por escrituras concurrentes."""
+
+def _comprobar_integridad(conn) -> bool:
+    """Ejecuta PRAGMA integrity_check y registra los errores que encuentre."""
+    errores = [fila[0] for fila in conn.execute('PRAGMA integrity_check')]
+    if errores != ['ok']:
+        logger_db.error("Copia corrupta: %s", '; '.join(errores[:5]))
+        return False
+    return True
+
+def verificar_backup(ruta: str) -> bool:
+    """
+    Comprueba la integridad de una copia (comprimida o no).
+
+    Args:
+        ruta: Ruta de la copia
+
+    Returns:
+        bool: True si la copia es una base de datos SQLite íntegra
+    """
+    ruta_db = ruta
+    temporal = None
+    try:
+        if ruta.endswith('.gz'):
+            descriptor, temporal = tempfile.mkstemp(suffix='.db')
+            with os.fdopen(descriptor, 'wb') as salida, gzip.open(ruta, 'rb') as entrada:
+                shutil.copyfileobj(entrada, salida)
+            ruta_db = temporal
+        conn = sqlite3.connect(f'file:{ruta_db}?mode=ro', uri=True)
+        try:
+            return _comprobar_integridad(conn)
+        finally:
+            conn.close()
+    except (sqlite3.Error, OSError) as e:
+        logger_db.error("No se pudo verificar la copia %s: %s", ruta, e)
+        return False
+    finally:
+        if temporal:
+            os.remove(temporal)
+
+def listar_backups(directorio: str = DIRECTORIO_BACKUPS) -> List[str]:
+    """
+    Lista las copias de un directorio, de la más reciente a la más antigua.
+
+    Args:
+        directorio: Directorio de las copias
+
+    Returns:
+        Lista de rutas
+    """
+    if not os.path.isdir(directorio):
+        return []
+    nombres = [
+        nombre for nombre in os.listdir(directorio)
+        if nombre.startswith(PREFIJO_BACKUP) and nombre.endswith(('.db', '.db.gz'))
+    ]
+    # El nombre lleva la fecha, así que el orden alfabético es el cronológico
+    return [os.path.join(directorio, nombre) for nombre in sorted(nombres, reverse=True)]
+
+def rotar_backups(directorio: str = DIRECTORIO_BACKUPS, conservar: int = COPIAS_CONSERVADAS) -> List[str]:
+    """
+    Borra las copias más antiguas, dejando solo las conservar más recientes.
+
+    Args:
+        directorio: Directorio de las copias
+        conservar: Número de copias que se conservan
+
+    Returns:
+        Lista de copias borradas
+    """
+    borradas = listar_backups(directorio)[conservar:]
+    for ruta in borradas:
+        os.remove(ruta)
+        logger_db.info("Copia antigua borrada: %s", ruta)
+    return borradas
+
+def copiar_bd(ruta_origen: str, ruta_destino: str, paginas: int = PAGINAS_POR_PASO,
+              pausa: float = PAUSA_ENTRE_PASOS) -> None:
+    """
+    Copia una base de datos en uso a ruta_destino por pasos, con una pausa entre pasos.
+
+    Args:
+        ruta_origen: Base de datos a copiar
+        ruta_destino: Archivo de destino (se sobrescribe)
+        paginas: Páginas copiadas en cada paso
+        pausa: Segundos de pausa entre pasos
+
+    Raises:
+        sqlite3.Error: Si no se puede hacer la copia
+    """
+    reinicios = 0
+    anterior = None
+
+    def progreso(estado, restantes, total):
+        nonlocal reinicios, anterior
+        # Si no quedan menos páginas que en el paso anterior, SQLite ha reiniciado la copia
+        if anterior is not None and restantes >= anterior:
+            reinicios += 1
+            if reinicios > REINICIOS_MAXIMOS:
+                raise CopiaReiniciada()
+        anterior = restantes
+        # La pausa entre pasos deja a los escritores usar la base de datos
+        if restantes and pausa:
+            time.sleep(pausa)
+
+    origen = sqlite3.connect(ruta_origen, isolation_level=None)
+    copia = sqlite3.connect(ruta_destino)
+    try:
+        if origen.execute('PRAGMA journal_mode').fetchone()[0] == 'wal':
+            # Fijar la instantánea que se va a copiar
+            origen.execute('BEGIN')
+            origen.execute('SELECT COUNT(*) FROM sqlite_master').fetchone()
+        try:
+            origen.backup(copia, pages=paginas, progress=progreso)
+        except CopiaReiniciada:
+            logger_db.warning("La copia de %s se ha reiniciado %s veces; se copia de una vez",
+                              ruta_origen, reinicios)
+            origen.backup(copia)
+        if origen.in_transaction:
+            origen.execute('COMMIT')
+    finally:
+        copia.close()
+        origen.close()
+
+def hacer_backup(ruta_origen: str = None, directorio: str = DIRECTORIO_BACKUPS,
+                 comprimir: bool = COMPRIMIR, conservar: int = COPIAS_CONSERVADAS,
+                 paginas: int = PAGINAS_POR_PASO, pausa: float = PAUSA_ENTRE_PASOS) -> Optional[str]:
+    """
+    Hace una copia en caliente de la base de datos, la verifica, la comprime y rota las antiguas.
+
+    Args:
+        ruta_origen: Base de datos a copiar (por defecto, DB_DML_FUNCIONES.DB_PATH)
+        directorio: Directorio de las copias
+        comprimir: Comprimir la copia con gzip
+        conservar: Número de copias que se conservan
+        paginas: Páginas copiadas en cada paso
+        pausa: Segundos de pausa entre pasos
+
+    Returns:
+        Ruta de la copia creada o None si ha fallado (en ese caso no queda ningún archivo)
+    """
+    ruta_origen = ruta_origen or DB_DML_FUNCIONES.DB_PATH
+    os.makedirs(directorio, exist_ok=True)
+    nombre = f"{PREFIJO_BACKUP}{datetime.now().strftime('%Y%m%d-%H%M%S')}.db"
+    destino = os.path.join(directorio, nombre + ('.gz' if comprimir else ''))
+    temporal = os.path.join(directorio, nombre + '.tmp')
+    temporal_gz = temporal + '.gz'
+    inicio = time.monotonic()
+
+    try:
+        copiar_bd(ruta_origen, temporal, paginas, pausa)
+        copia = sqlite3.connect(temporal)
+        try:
+            if not _comprobar_integridad(copia):
+                return None
+        finally:
+            copia.close()
+
+        if comprimir:
+            with open(temporal, 'rb') as entrada, gzip.open(temporal_gz, 'wb') as salida:
+                shutil.copyfileobj(entrada, salida)
+            os.replace(temporal_gz, destino)
+        else:
+            os.replace(temporal, destino)
+
+        logger_db.info("Copia de seguridad creada: %s (%.2f s)", destino, time.monotonic() - inicio)
+        rotar_backups(directorio, conservar)
+        return destino
+
+    except (sqlite3.Error, OSError) as e:
+        logger_db.error("Error al hacer la copia de seguridad de %s: %s", ruta_origen, e)
+        return None
+    finally:
+        for ruta in (temporal, temporal_gz):
+            if os.path.exists(ruta):
+                os.remove(ruta)
+
+class ServicioBackup(threading.Thread):
+    """
+    Hilo que hace una copia cada intervalo segundos hasta que se llama a detener().
+
+    Los argumentos con nombre se pasan a hacer_backup.
+    """
+
+    def __init__(self, intervalo: float = INTERVALO_BACKUP, **opciones):
+        super().__init__(name='ServicioBackup', daemon=True)
+        self.intervalo = intervalo
+        self.opciones = opciones
+        self._detener = threading.Event()
+        self.ultima_copia: Optional[str] = None
+        self.fallos = 0
+
+    def run(self) -> None:
+        while not self._detener.is_set():
+            ruta = hacer_backup(**self.opciones)
+            if ruta:
+                self.ultima_copia = ruta
+            else:
+                self.fallos += 1
+            self._detener.wait(self.intervalo)
+
+    def detener(self) -> None:
+        """Pide al hilo que termine y espera a que acabe la copia en curso."""
+        self._detener.set()
+        if self.is_alive():
+            self.join()
+
+if __name__ == "__main__":
+    # Configurar logging para la ejecución directa
+    logging.basicConfig(
+        level=logging.INFO,
+        format='%(asctime)s - %(name)s - %(levelname)s - %(message)s',
+        handlers=[
+            logging.StreamHandler()
+        ]
+    )
+
+    orden = sys.argv[1] if len(sys.argv) > 1 else None
+    if orden == 'verificar':
+        sys.exit(0 if verificar_backup(sys.argv[2]) else 1)
+    elif orden == 'servicio':
+        servicio = ServicioBackup(float(sys.argv[2]) if len(sys.argv) > 2 else INTERVALO_BACKUP)
+        servicio.start()
+        try:
+            while servicio.is_alive():
+                servicio.join(1)
+        except KeyboardInterrupt:
+            servicio.detener()
+    else:
+        sys.exit(0 if hacer_backup() else 1)
@@ -0,0 +1,172 @@
+"""
+Módulo que mantiene en memoria el catálogo del juego: recursos, acciones, herramientas,
+habilidades y recetas de fabricación.
+
+Estas tablas solo cambian al desplegar, así que se cargan una vez en un Catalogo inmutable
+con búsquedas O(1) por ID y por código. Los triggers de DB_DDL incrementan
+catalogo_version.version con cada cambio en ellas; la caché comprueba ese contador como
+mucho una vez cada INTERVALO_COMPROBACION segundos y recarga el catálogo si ha cambiado.
+"""
+import sqlite3
+import logging
+import threading
+import time
+from types import MappingProxyType
+from typing import Any, Callable, Dict, Mapping, NamedTuple, Optional
+
+# Configuración del logger
+logger_db = logging.getLogger('database')
+
+# Segundos entre comprobaciones de la versión del catálogo
+INTERVALO_COMPROBACION = 1.0
+
+class Catalogo(NamedTuple):
+    """
+    Catálogo inmutable. Cada fila es un mapeo de solo lectura con las columnas de su tabla.
+
+    Las habilidades se identifican por su código (habilidades_ciudadano.habilidad_id).
+    recetas va del ID del producto a {'fabricacion_id', 'cantidad', 'coste': {codigo: cantidad}}.
+    """
+    version: int
+    recursos: Mapping[int, Mapping[str, Any]]
+    recursos_por_codigo: Mapping[str, Mapping[str, Any]]
+    acciones: Mapping[int, Mapping[str, Any]]
+    acciones_por_codigo: Mapping[str, Mapping[str, Any]]
+    herramientas: Mapping[int, Mapping[str, Any]]
+    herramientas_por_codigo: Mapping[str, Mapping[str, Any]]
+    habilidades_por_codigo: Mapping[str, Mapping[str, Any]]
+    recetas: Mapping[int, Mapping[str, Any]]
+
+def leer_version(cursor) -> int:
+    """
+    Lee la versión actual del catálogo.
+
+    Args:
+        cursor: Cursor de la base de datos
+
+    Returns:
+        int: Versión del catálogo (0 si la tabla catalogo_version todavía no existe)
+    """
+    try:
+        cursor.execute('SELECT version FROM catalogo_version WHERE id = 1')
+    except sqlite3.OperationalError:
+        return 0
+    fila = cursor.fetchone()
+    return fila[0] if fila else 0
+
+def _indexar(cursor, consulta: str, clave: str) -> Dict[Any, Mapping[str, Any]]:
+    """Ejecuta la consulta y devuelve sus filas (de solo lectura) indexadas por la columna clave."""
+    cursor.execute(consulta)
+    columnas = [columna[0] for columna in cursor.description]
+    filas = {}
+    for fila in cursor.fetchall():
+        datos = MappingProxyType(dict(zip(columnas, fila)))
+        filas[datos[clave]] = datos
+    return filas
+
+def cargar_catalogo(cursor) -> Catalogo:
+    """
+    Carga el catálogo completo en una única transacción de lectura.
+
+    Args:
+        cursor: Cursor de la base de datos
+
+    Returns:
+        Catalogo con la versión leída
+    """
+    cursor.execute('BEGIN')
+    try:
+        version = leer_version(cursor)
+        recursos = _indexar(cursor, 'SELECT * FROM recursos', 'id')
+        acciones = _indexar(cursor, 'SELECT * FROM acciones', 'id')
+        herramientas = _indexar(cursor, 'SELECT * FROM herramientas', 'id')
+        habilidades = _indexar(cursor, 'SELECT * FROM habilidades', 'codigo')
+
+        # Como en obtener_receta_fabricacion, cada producto usa su primera fila de fabricacion_productos
+        cursor.execute('''
+            SELECT fp.recurso_id, fp.id, fp.cantidad, r.codigo, rf.cantidad
+            FROM fabricacion_productos fp
+            JOIN recursos_fabricacion rf ON rf.fabricacion_id = fp.id
+            JOIN recursos r ON r.id = rf.recurso_id
+            WHERE fp.id = (SELECT MIN(id) FROM fabricacion_productos WHERE recurso_id = fp.recurso_id)
+            ORDER BY fp.recurso_id, rf.id
+        ''')
+        recetas = {}
+        for producto_id, fabricacion_id, cantidad_generada, codigo, cantidad in cursor.fetchall():
+            receta = recetas.setdefault(producto_id, {
+                'fabricacion_id': fabricacion_id,
+                'cantidad': cantidad_generada,
+                'coste': {}
+            })
+            receta['coste'][codigo] = cantidad
+    finally:
+        cursor.execute('COMMIT')
+
+    for receta in recetas.values():
+        receta['coste'] = MappingProxyType(receta['coste'])
+
+    def por_codigo(filas):
+        return MappingProxyType({fila['codigo']: fila for fila in filas.values()})
+
+    return Catalogo(
+        version=version,
+        recursos=MappingProxyType(recursos),
+        recursos_por_codigo=por_codigo(recursos),
+        acciones=MappingProxyType(acciones),
+        acciones_por_codigo=por_codigo(acciones),
+        herramientas=MappingProxyType(herramientas),
+        herramientas_por_codigo=por_codigo(herramientas),
+        habilidades_por_codigo=MappingProxyType(habilidades),
+        recetas=MappingProxyType({producto_id: MappingProxyType(receta) for producto_id, receta in recetas.items()})
+    )
+
+class CacheCatalogo:
+    """
+    Guarda el último Catalogo cargado y lo recarga cuando cambia la versión en la base de datos
+    (o la ruta de la base de datos).
+    """
+
+    def __init__(self, intervalo: float = INTERVALO_COMPROBACION):
+        self.intervalo = intervalo
+        self._catalogo: Optional[Catalogo] = None
+        self._ruta: Optional[str] = None
+        self._siguiente_comprobacion = 0.0
+        self._lock = threading.Lock()
+        self.recargas = 0
+
+    def obtener(self, ruta: str, forzar: bool = False,
+                conectar: Callable[[], sqlite3.Connection] = None) -> Catalogo:
+        """
+        Devuelve el catálogo de la base de datos en ruta, recargándolo si ha cambiado.
+
+        Args:
+            ruta: Ruta de la base de datos
+            forzar: Comprobar la versión aunque no haya pasado el intervalo
+            conectar: Función que abre la conexión con la que leer (por defecto a ruta), como
+                      DB_LECTURA.LectorBD.conectar; ruta sigue identificando el catálogo
+
+        Returns:
+            Catalogo actual
+
+        Raises:
+            sqlite3.Error: Si no se puede leer el catálogo
+        """
+        with self._lock:
+            ahora = time.monotonic()
+            if (self._catalogo is not None and self._ruta == ruta and not forzar
+                    and ahora < self._siguiente_comprobacion):
+                return self._catalogo
+
+            conn = conectar() if conectar else sqlite3.connect(ruta)
+            try:
+                cursor = conn.cursor()
+                if (self._catalogo is None or self._ruta != ruta
+                        or leer_version(cursor) != self._catalogo.version):
+                    self._catalogo = cargar_catalogo(cursor)
+                    self._ruta = ruta
+                    self.recargas += 1
+                    logger_db.info("Catálogo cargado (versión %s)", self._catalogo.version)
+            finally:
+                conn.close()
+            self._siguiente_comprobacion = ahora + self.intervalo
+            return self._catalogo
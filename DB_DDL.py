@@ -9,10 +9,28 @@ import sqlite3
 import logging
 import sys
 from datetime import datetime
+from typing import List
+
+from cantidades import ESCALA
 
 # Configuración de la base de datos
 DB_PATH = 'soloville.db'
 
+# Tablas del catálogo (cambian solo al desplegar); ver DB_CATALOGO.py
+TABLAS_CATALOGO = ('recursos', 'acciones', 'herramientas', 'habilidades',
+                   'fabricacion_productos', 'recursos_fabricacion', 'recursos_acciones')
+
+# Índices que repiten el principio de una clave primaria o UNIQUE; migrar_indices los borra
+INDICES_OBSOLETOS = ('idx_herramientas_ciudadano_ciudadano', 'idx_habilidades_ciudadano_ciudadano',
+                     'idx_recursos_ciudadano_ciudadano', 'idx_recursos_acciones_accion',
+                     'idx_mapa_ciudadano')
+
+# ID del tipo de casilla SOLAR (db_mapa.TIPOS_CASILLAS), para el índice de solares libres
+TIPO_SOLAR = 13
+
+# Tablas con índices parciales (migrar_indices actualiza sus estadísticas)
+TABLAS_INDICES_PARCIALES = ('herramientas_ciudadano', 'habilidades_ciudadano', 'recursos_acciones')
+
 # Configuración del logger
 logger_db = logging.getLogger('database')
 handler = logging.StreamHandler()
@@ -38,6 +56,10 @@ def crear_tablas(cursor, usuario_crear: str = 'sistema') -> bool:
         bool: True si se crearon todas las tablas correctamente, False en caso contrario
     """
     try:
+        # En una base de datos nueva no hay datos que migrar (ver aplicar_migraciones)
+        cursor.execute("SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'recursos_ciudadano'")
+        nueva = cursor.fetchone() is None
+
         # Crear tabla ciudadanos
         cursor.execute('''
             CREATE TABLE IF NOT EXISTS ciudadanos (
@@ -54,7 +76,8 @@ def crear_tablas(cursor, usuario_crear: str = 'sistema') -> bool:
                 usuario_modif TEXT,
                 usuario_borrar TEXT,
                 activo BOOLEAN DEFAULT TRUE,
-                borrado_logico BOOLEAN DEFAULT FALSE
+                borrado_logico BOOLEAN DEFAULT FALSE,
+                version INTEGER NOT NULL DEFAULT 1
             )
         ''')
         logger_db.info("Tabla ciudadanos creada")
@@ -120,7 +143,7 @@ def crear_tablas(cursor, usuario_crear: str = 'sistema') -> bool:
         ''')
         logger_db.info("Tabla recursos creada")
 
-        # Crear tabla recursos_ciudadano
+        # Crear tabla recursos_ciudadano (cantidad en centésimas, ver cantidades.py)
         cursor.execute('''
             CREATE TABLE IF NOT EXISTS recursos_ciudadano (
                 id INTEGER PRIMARY KEY AUTOINCREMENT,
@@ -217,6 +240,140 @@ def crear_tablas(cursor, usuario_crear: str = 'sistema') -> bool:
         ''')
         logger_db.info("Tabla historial_acciones creada")
 
+        # Crear tabla historial_acciones_archivo (filas antiguas movidas por DB_HISTORIAL)
+        cursor.execute('''
+            CREATE TABLE IF NOT EXISTS historial_acciones_archivo (
+                id INTEGER PRIMARY KEY,
+                codigo_accion TEXT NOT NULL,
+                mensaje_final TEXT NOT NULL,
+                fecha_hora DATETIME,
+                ciudadano_id INTEGER
+            )
+        ''')
+        logger_db.info("Tabla historial_acciones_archivo creada")
+
+        # Crear tabla eventos_acciones (registro compacto de acciones, ver eventos.py)
+        # resultado: índice en eventos.RESULTADOS (o nivel alcanzado en MEJORAR_CASA)
+        # recursos: "recurso_id:cantidad,..."; ts: segundos desde epoch (UTC)
+        cursor.execute('''
+            CREATE TABLE IF NOT EXISTS eventos_acciones (
+                id INTEGER PRIMARY KEY,
+                ciudadano_id INTEGER NOT NULL DEFAULT 0,
+                accion_id INTEGER NOT NULL,
+                resultado INTEGER,
+                recursos TEXT,
+                ts INTEGER NOT NULL
+            )
+        ''')
+        logger_db.info("Tabla eventos_acciones creada")
+
+        # Crear tabla eventos_acciones_archivo (eventos antiguos movidos por DB_HISTORIAL)
+        cursor.execute('''
+            CREATE TABLE IF NOT EXISTS eventos_acciones_archivo (
+                id INTEGER PRIMARY KEY,
+                ciudadano_id INTEGER NOT NULL DEFAULT 0,
+                accion_id INTEGER NOT NULL,
+                resultado INTEGER,
+                recursos TEXT,
+                ts INTEGER NOT NULL
+            )
+        ''')
+        logger_db.info("Tabla eventos_acciones_archivo creada")
+
+        # Crear tabla resumen_acciones_diario (acumulado por ciudadano, acción y día)
+        cursor.execute('''
+            CREATE TABLE IF NOT EXISTS resumen_acciones_diario (
+                ciudadano_id INTEGER NOT NULL DEFAULT 0,
+                accion_id INTEGER NOT NULL,
+                fecha TEXT NOT NULL,
+                total INTEGER NOT NULL DEFAULT 0,
+                PRIMARY KEY (ciudadano_id, accion_id, fecha)
+            )
+        ''')
+        logger_db.info("Tabla resumen_acciones_diario creada")
+
+        # Crear tabla rankings (clasificaciones materializadas, mantenidas por triggers)
+        # tipo: código del recurso o 'acciones:AAAA-SS' (acciones de la semana)
+        # actualizado: secuencia creciente para refrescar solo las filas cambiadas (DB_RANKING)
+        cursor.execute('''
+            CREATE TABLE IF NOT EXISTS rankings (
+                tipo TEXT NOT NULL,
+                ciudadano_id INTEGER NOT NULL,
+                valor REAL NOT NULL DEFAULT 0,
+                actualizado INTEGER NOT NULL DEFAULT 0,
+                PRIMARY KEY (tipo, ciudadano_id)
+            )
+        ''')
+        logger_db.info("Tabla rankings creada")
+
+        # Crear tabla rankings_generacion (una sola fila; DB_RANKING.reconstruir_rankings la
+        # incrementa para que los demás procesos recarguen sus clasificaciones)
+        cursor.execute('''
+            CREATE TABLE IF NOT EXISTS rankings_generacion (
+                id INTEGER PRIMARY KEY CHECK (id = 1),
+                generacion INTEGER NOT NULL DEFAULT 0
+            )
+        ''')
+        cursor.execute('INSERT OR IGNORE INTO rankings_generacion (id, generacion) VALUES (1, 0)')
+        logger_db.info("Tabla rankings_generacion creada")
+
+        # Crear tabla catalogo_version (una sola fila; los triggers la incrementan al cambiar el catálogo)
+        cursor.execute('''
+            CREATE TABLE IF NOT EXISTS catalogo_version (
+                id INTEGER PRIMARY KEY CHECK (id = 1),
+                version INTEGER NOT NULL DEFAULT 0
+            )
+        ''')
+        cursor.execute('INSERT OR IGNORE INTO catalogo_version (id, version) VALUES (1, 0)')
+        logger_db.info("Tabla catalogo_version creada")
+
+        # Crear tabla movimientos_recursos (libro de cambios de recursos_ciudadano, solo se añade)
+        # delta: cambio aplicado en centésimas (ya limitado a 0); ts: segundos desde epoch (UTC)
+        cursor.execute('''
+            CREATE TABLE IF NOT EXISTS movimientos_recursos (
+                id INTEGER PRIMARY KEY,
+                ciudadano_id INTEGER NOT NULL,
+                recurso_id INTEGER NOT NULL,
+                delta INTEGER NOT NULL,
+                ts INTEGER NOT NULL
+            )
+        ''')
+        logger_db.info("Tabla movimientos_recursos creada")
+
+        # Crear tablas de instantáneas del libro (DB_LIBRO)
+        # movimiento_id: último movimiento incluido en los saldos de la instantánea
+        cursor.execute('''
+            CREATE TABLE IF NOT EXISTS instantaneas_recursos (
+                id INTEGER PRIMARY KEY,
+                movimiento_id INTEGER NOT NULL,
+                ts INTEGER NOT NULL
+            )
+        ''')
+        cursor.execute('''
+            CREATE TABLE IF NOT EXISTS saldos_instantanea (
+                instantanea_id INTEGER NOT NULL REFERENCES instantaneas_recursos(id) ON DELETE CASCADE,
+                ciudadano_id INTEGER NOT NULL,
+                recurso_id INTEGER NOT NULL,
+                cantidad INTEGER NOT NULL,
+                PRIMARY KEY (instantanea_id, ciudadano_id, recurso_id)
+            ) WITHOUT ROWID
+        ''')
+        logger_db.info("Tablas de instantáneas de recursos creadas")
+
+        # Crear tabla mantenimiento (tareas de DB_MANTENIMIENTO con su duración y el tamaño del archivo)
+        cursor.execute('''
+            CREATE TABLE IF NOT EXISTS mantenimiento (
+                id INTEGER PRIMARY KEY,
+                tarea TEXT NOT NULL,
+                ts INTEGER NOT NULL,
+                duracion_ms REAL NOT NULL,
+                bytes_antes INTEGER,
+                bytes_despues INTEGER,
+                resultado TEXT
+            )
+        ''')
+        logger_db.info("Tabla mantenimiento creada")
+
         # Crear tabla de herramientas
         cursor.execute('''
             CREATE TABLE IF NOT EXISTS herramientas (
@@ -324,6 +481,20 @@ def crear_tablas(cursor, usuario_crear: str = 'sistema') -> bool:
             )
         ''')
         logger_db.info("Tabla edificios creada")
+
+        crear_tablas_mapa(cursor)
+
+        # Crear tabla migraciones (migraciones de datos ya aplicadas)
+        cursor.execute('''
+            CREATE TABLE IF NOT EXISTS migraciones (
+                nombre TEXT PRIMARY KEY,
+                fecha_aplicada TEXT NOT NULL
+            )
+        ''')
+        if nueva:
+            cursor.executemany('INSERT OR IGNORE INTO migraciones (nombre, fecha_aplicada) VALUES (?, ?)',
+                               [(nombre, datetime.now().isoformat()) for nombre, _ in MIGRACIONES])
+        logger_db.info("Tabla migraciones creada")
         
         return True
 
@@ -331,6 +502,68 @@ def crear_tablas(cursor, usuario_crear: str = 'sistema') -> bool:
         logger_db.error(f"Error al crear tablas: {e}")
         return False
 
+def crear_tablas_mapa(cursor) -> None:
+    """
+    Crea la tabla mapa (ver db_mapa.py) y la de su versión, y añade la columna version a las
+    tablas mapa de versiones anteriores.
+
+    La versión del mapa sube con cada transacción de db_mapa que cambia casillas, con cada
+    cambio de nombre o casa de un ciudadano con solar (trg_mapa_version_ciudadano) y con cada
+    casilla borrada (trg_mapa_version_borrado), y cada casilla guarda la versión en la que
+    cambió: db_mapa y la web la usan para saber si tienen el mapa al día y qué casillas han
+    cambiado.
+
+    Args:
+        cursor: Cursor de la base de datos
+    """
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS mapa (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            x INTEGER NOT NULL,
+            z INTEGER NOT NULL,
+            tipo INTEGER NOT NULL,
+            ciudadano_id INTEGER NULL,
+            version INTEGER NOT NULL DEFAULT 0,
+            UNIQUE(x, z)
+        )
+    ''')
+    cursor.execute('PRAGMA table_info(mapa)')
+    if 'version' not in [fila[1] for fila in cursor.fetchall()]:
+        cursor.execute('ALTER TABLE mapa ADD COLUMN version INTEGER NOT NULL DEFAULT 0')
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS mapa_version (
+            id INTEGER PRIMARY KEY CHECK (id = 1),
+            version INTEGER NOT NULL
+        )
+    ''')
+    cursor.execute('INSERT OR IGNORE INTO mapa_version (id, version) VALUES (1, 0)')
+    logger_db.info("Tablas mapa y mapa_version creadas")
+
+def crear_indices_mapa(cursor) -> None:
+    """
+    Crea los índices de la tabla mapa.
+
+    Args:
+        cursor: Cursor de la base de datos
+    """
+    # Solares libres por distancia a (0,0) (|x| + |z|): el solar más cercano se busca, se
+    # asigna y se libera en O(log n)
+    cursor.execute(f'''
+        CREATE INDEX IF NOT EXISTS idx_mapa_solares_libres ON mapa (abs(x) + abs(z), id)
+        WHERE tipo = {TIPO_SOLAR} AND ciudadano_id IS NULL
+    ''')
+    # Un solar por ciudadano: una asignación repetida falla en vez de darle otro
+    try:
+        cursor.execute('''
+            CREATE UNIQUE INDEX IF NOT EXISTS idx_mapa_ciudadano_unico ON mapa (ciudadano_id)
+            WHERE ciudadano_id IS NOT NULL
+        ''')
+    except sqlite3.IntegrityError as e:
+        logger_db.error(f"Hay ciudadanos con más de un solar, no se crea idx_mapa_ciudadano_unico: {e}")
+    # Casillas cambiadas desde una versión (chunks_mapa.leer_cambios)
+    cursor.execute('CREATE INDEX IF NOT EXISTS idx_mapa_version ON mapa (version)')
+    logger_db.info("Índices de mapa creados")
+
 def crear_indices(cursor):
     """
     Crea índices adicionales para mejorar el rendimiento de las consultas.
@@ -339,10 +572,20 @@ def crear_indices(cursor):
         cursor: Cursor de la base de datos
     """
     try:
-        # Crear índices para mejorar el rendimiento
+        # Los índices de habilidades_ciudadano, herramientas_ciudadano y recursos_acciones
+        # son parciales (solo filas activas) y cubren las columnas que leen obtener_inventario
+        # y realizar_accion, así esas consultas no tocan la tabla ni las filas desactivadas
+        # (activo va al final para que SQLite los considere índices de cobertura).
+        # Las búsquedas por ciudadano_id sin filtro usan la clave primaria (ciudadano_id, ...)
+        cursor.execute('''
+            CREATE INDEX IF NOT EXISTS idx_herramientas_ciudadano_activas
+            ON herramientas_ciudadano(ciudadano_id, herramienta_id, tiene, activo)
+            WHERE activo = 1
+        ''')
         cursor.execute('''
-            CREATE INDEX IF NOT EXISTS idx_herramientas_ciudadano_ciudadano 
-            ON herramientas_ciudadano(ciudadano_id)
+            CREATE INDEX IF NOT EXISTS idx_herramientas_ciudadano_inactivas
+            ON herramientas_ciudadano(ciudadano_id, herramienta_id, activo)
+            WHERE activo = 0
         ''')
         cursor.execute('''
             CREATE INDEX IF NOT EXISTS idx_herramientas_ciudadano_herramienta 
@@ -351,10 +594,6 @@ def crear_indices(cursor):
         logger_db.info("Índices de herramientas_ciudadano creados")
 
         # Índices para la tabla recursos_ciudadano
-        cursor.execute('''
-            CREATE INDEX IF NOT EXISTS idx_recursos_ciudadano_ciudadano 
-            ON recursos_ciudadano(ciudadano_id)
-        ''')
         cursor.execute('''
             CREATE INDEX IF NOT EXISTS idx_recursos_ciudadano_recurso 
             ON recursos_ciudadano(recurso_id)
@@ -362,8 +601,14 @@ def crear_indices(cursor):
         
         # Índices para la tabla habilidades_ciudadano
         cursor.execute('''
-            CREATE INDEX IF NOT EXISTS idx_habilidades_ciudadano_ciudadano 
-            ON habilidades_ciudadano(ciudadano_id)
+            CREATE INDEX IF NOT EXISTS idx_habilidades_ciudadano_activas
+            ON habilidades_ciudadano(ciudadano_id, habilidad_id, nivel, puntos_experiencia, activo)
+            WHERE activo = 1
+        ''')
+        cursor.execute('''
+            CREATE INDEX IF NOT EXISTS idx_habilidades_ciudadano_inactivas
+            ON habilidades_ciudadano(ciudadano_id, habilidad_id, activo)
+            WHERE activo = 0
         ''')
         cursor.execute('''
             CREATE INDEX IF NOT EXISTS idx_habilidades_ciudadano_habilidad 
@@ -372,14 +617,64 @@ def crear_indices(cursor):
         
         # Índices para la tabla recursos_acciones
         cursor.execute('''
-            CREATE INDEX IF NOT EXISTS idx_recursos_acciones_accion 
-            ON recursos_acciones(accion_id)
+            CREATE INDEX IF NOT EXISTS idx_recursos_acciones_activas
+            ON recursos_acciones(accion_id, recurso_id, cantidad, cantidad_pozo, cantidad_herramienta,
+                                 probabilidad, probabilidad_pozo, probabilidad_herramienta, activo)
+            WHERE activo = 1
         ''')
         cursor.execute('''
             CREATE INDEX IF NOT EXISTS idx_recursos_acciones_recurso 
             ON recursos_acciones(recurso_id)
         ''')
-        
+
+        # Índices para la tabla historial_acciones (retención y última acción)
+        cursor.execute('''
+            CREATE INDEX IF NOT EXISTS idx_historial_acciones_fecha
+            ON historial_acciones(fecha_hora)
+        ''')
+        cursor.execute('''
+            CREATE INDEX IF NOT EXISTS idx_historial_acciones_ciudadano
+            ON historial_acciones(ciudadano_id, fecha_hora)
+        ''')
+
+        # Índices para la tabla eventos_acciones (última acción y retención)
+        cursor.execute('''
+            CREATE INDEX IF NOT EXISTS idx_eventos_acciones_ciudadano
+            ON eventos_acciones(ciudadano_id, id)
+        ''')
+        cursor.execute('''
+            CREATE INDEX IF NOT EXISTS idx_eventos_acciones_ts
+            ON eventos_acciones(ts)
+        ''')
+
+        # Índice para consultar el resumen diario por fecha
+        cursor.execute('''
+            CREATE INDEX IF NOT EXISTS idx_resumen_acciones_diario_fecha
+            ON resumen_acciones_diario(fecha)
+        ''')
+
+        # Índices para la tabla movimientos_recursos (inventario de un ciudadano en una fecha)
+        cursor.execute('''
+            CREATE INDEX IF NOT EXISTS idx_movimientos_recursos_ciudadano
+            ON movimientos_recursos(ciudadano_id, id)
+        ''')
+        cursor.execute('''
+            CREATE INDEX IF NOT EXISTS idx_instantaneas_recursos_ts
+            ON instantaneas_recursos(ts)
+        ''')
+
+        # Índices para la tabla rankings (top N por tipo y refresco incremental)
+        cursor.execute('''
+            CREATE INDEX IF NOT EXISTS idx_rankings_tipo_valor
+            ON rankings(tipo, valor DESC)
+        ''')
+        cursor.execute('''
+            CREATE INDEX IF NOT EXISTS idx_rankings_actualizado
+            ON rankings(actualizado)
+        ''')
+
+        crear_indices_mapa(cursor)
+
         logger_db.info("Índices adicionales creados")
         return True
         
@@ -387,6 +682,252 @@ def crear_indices(cursor):
         logger_db.error(f"Error al crear índices: {e}")
         raise
 
+def migrar_indices(cursor) -> None:
+    """
+    Actualiza los índices de una base de datos existente: borra los que repiten el principio
+    de una clave primaria o UNIQUE (INDICES_OBSOLETOS), crea los que falten y actualiza las
+    estadísticas de las tablas afectadas para que el planificador use los índices parciales.
+    
+    Todo se hace en la transacción del cursor, así que si algo falla no cambia nada.
+    
+    Args:
+        cursor: Cursor de la base de datos
+    """
+    for indice in INDICES_OBSOLETOS:
+        cursor.execute(f'DROP INDEX IF EXISTS {indice}')
+    crear_indices(cursor)
+    for tabla in TABLAS_INDICES_PARCIALES:
+        cursor.execute(f'ANALYZE {tabla}')
+    logger_db.info("Índices migrados (%d obsoletos eliminados)", len(INDICES_OBSOLETOS))
+
+def crear_triggers(cursor):
+    """
+    Crea los triggers que mantienen la tabla rankings en la misma transacción
+    que los cambios de inventario y de acciones, los del libro de recursos
+    (crear_triggers_libro) y los que incrementan la versión del catálogo.
+    
+    Args:
+        cursor: Cursor de la base de datos
+    """
+    try:
+        # Cantidad de cada recurso por ciudadano
+        for evento, condicion in (('INSERT', ''), ('UPDATE OF cantidad', 'WHEN NEW.cantidad IS NOT OLD.cantidad')):
+            nombre = 'trg_rankings_recursos_' + evento.split()[0].lower()
+            cursor.execute(f'''
+                CREATE TRIGGER IF NOT EXISTS {nombre}
+                AFTER {evento} ON recursos_ciudadano
+                {condicion}
+                BEGIN
+                    INSERT INTO rankings (tipo, ciudadano_id, valor, actualizado)
+                    SELECT r.codigo, NEW.ciudadano_id, NEW.cantidad,
+                           (SELECT COALESCE(MAX(actualizado), 0) + 1 FROM rankings)
+                    FROM recursos r
+                    WHERE r.id = NEW.recurso_id
+                    ON CONFLICT(tipo, ciudadano_id)
+                    DO UPDATE SET valor = excluded.valor, actualizado = excluded.actualizado;
+                END
+            ''')
+        cursor.execute('''
+            CREATE TRIGGER IF NOT EXISTS trg_rankings_recursos_delete
+            AFTER DELETE ON recursos_ciudadano
+            BEGIN
+                UPDATE rankings
+                SET valor = 0,
+                    actualizado = (SELECT COALESCE(MAX(actualizado), 0) + 1 FROM rankings)
+                WHERE tipo = (SELECT codigo FROM recursos WHERE id = OLD.recurso_id)
+                AND ciudadano_id = OLD.ciudadano_id;
+            END
+        ''')
+
+        crear_triggers_libro(cursor)
+
+        # Acciones realizadas por ciudadano en la semana (sin acciones del sistema)
+        cursor.execute('''
+            CREATE TRIGGER IF NOT EXISTS trg_rankings_acciones_semana
+            AFTER INSERT ON eventos_acciones
+            WHEN NEW.accion_id > 0 AND NEW.ciudadano_id > 0
+            BEGIN
+                INSERT INTO rankings (tipo, ciudadano_id, valor, actualizado)
+                VALUES ('acciones:' || strftime('%Y-%W', NEW.ts, 'unixepoch'), NEW.ciudadano_id, 1,
+                        (SELECT COALESCE(MAX(actualizado), 0) + 1 FROM rankings))
+                ON CONFLICT(tipo, ciudadano_id)
+                DO UPDATE SET valor = valor + 1, actualizado = excluded.actualizado;
+            END
+        ''')
+
+        logger_db.info("Triggers de rankings creados")
+
+        # Versión del catálogo: cualquier cambio en sus tablas invalida las cachés (DB_CATALOGO)
+        for tabla in TABLAS_CATALOGO:
+            for evento in ('INSERT', 'UPDATE', 'DELETE'):
+                cursor.execute(f'''
+                    CREATE TRIGGER IF NOT EXISTS trg_catalogo_version_{tabla}_{evento.lower()}
+                    AFTER {evento} ON {tabla}
+                    BEGIN
+                        UPDATE catalogo_version SET version = version + 1 WHERE id = 1;
+                    END
+                ''')
+        logger_db.info("Triggers de versión del catálogo creados")
+
+        # Versión del mapa: el nombre y la casa de un ciudadano con solar también se ven en el
+        # mapa, así que su solar cambia de versión (ver crear_tablas_mapa)
+        cursor.execute('''
+            CREATE TRIGGER IF NOT EXISTS trg_mapa_version_ciudadano
+            AFTER UPDATE OF nombre, nivel_casa ON ciudadanos
+            WHEN EXISTS (SELECT 1 FROM mapa WHERE ciudadano_id = NEW.id)
+            BEGIN
+                UPDATE mapa_version SET version = version + 1 WHERE id = 1;
+                UPDATE mapa SET version = (SELECT version FROM mapa_version WHERE id = 1)
+                WHERE ciudadano_id = NEW.id;
+            END
+        ''')
+        # Una casilla borrada no queda marcada con ninguna versión: basta con que la versión
+        # suba para que quien tenga el mapa en memoria lo vuelva a contar
+        cursor.execute('''
+            CREATE TRIGGER IF NOT EXISTS trg_mapa_version_borrado
+            AFTER DELETE ON mapa
+            BEGIN
+                UPDATE mapa_version SET version = version + 1 WHERE id = 1;
+            END
+        ''')
+        logger_db.info("Triggers de versión del mapa creados")
+        return True
+        
+    except Exception as e:
+        logger_db.error(f"Error al crear triggers: {e}")
+        raise
+
+def crear_triggers_libro(cursor):
+    """
+    Crea los triggers que copian a movimientos_recursos (registro de auditoría, ver DB_LIBRO)
+    cada cambio de recursos_ciudadano.
+
+    La primera vez guarda una instantánea con los saldos actuales, que es el punto de partida
+    del libro (los cambios anteriores no están en movimientos_recursos).
+
+    Args:
+        cursor: Cursor de la base de datos
+    """
+    cursor.execute('''
+        INSERT INTO instantaneas_recursos (movimiento_id, ts)
+        SELECT (SELECT COALESCE(MAX(id), 0) FROM movimientos_recursos), CAST(strftime('%s', 'now') AS INTEGER)
+        WHERE NOT EXISTS (SELECT 1 FROM instantaneas_recursos)
+    ''')
+    if cursor.rowcount:
+        cursor.execute('''
+            INSERT INTO saldos_instantanea (instantanea_id, ciudadano_id, recurso_id, cantidad)
+            SELECT ?, ciudadano_id, recurso_id, cantidad FROM recursos_ciudadano
+        ''', (cursor.lastrowid,))
+
+    for evento, condicion, delta in (
+        ('INSERT', 'WHEN NEW.cantidad != 0', 'NEW.cantidad'),
+        ('UPDATE OF cantidad', 'WHEN NEW.cantidad IS NOT OLD.cantidad', 'NEW.cantidad - OLD.cantidad'),
+        ('DELETE', 'WHEN OLD.cantidad != 0', '-OLD.cantidad'),
+    ):
+        fila = 'OLD' if evento == 'DELETE' else 'NEW'
+        cursor.execute(f'''
+            CREATE TRIGGER IF NOT EXISTS trg_libro_recursos_{evento.split()[0].lower()}
+            AFTER {evento} ON recursos_ciudadano
+            {condicion}
+            BEGIN
+                INSERT INTO movimientos_recursos (ciudadano_id, recurso_id, delta, ts)
+                VALUES ({fila}.ciudadano_id, {fila}.recurso_id, {delta}, CAST(strftime('%s', 'now') AS INTEGER));
+            END
+        ''')
+    logger_db.info("Triggers del libro de recursos creados")
+
+def migrar_cantidades_centesimas(cursor) -> None:
+    """
+    Pasa las cantidades de recursos_ciudadano, del libro de recursos y de los rankings de
+    recursos de unidades (REAL) a centésimas enteras (ver cantidades.py).
+
+    Los triggers del libro se quitan mientras tanto para que el cambio de escala no se anote
+    como movimientos, y los rankings de recursos se copian de recursos_ciudadano.
+
+    Args:
+        cursor: Cursor de la base de datos
+    """
+    cursor.execute("SELECT 1 FROM sqlite_master WHERE type = 'trigger' AND name LIKE 'trg_libro_recursos_%'")
+    libro = cursor.fetchone() is not None
+    for evento in ('insert', 'update', 'delete'):
+        cursor.execute(f'DROP TRIGGER IF EXISTS trg_libro_recursos_{evento}')
+
+    cursor.execute('UPDATE recursos_ciudadano SET cantidad = CAST(ROUND(cantidad * ?) AS INTEGER)', (ESCALA,))
+    logger_db.info("%d cantidades de recursos_ciudadano pasadas a centésimas", cursor.rowcount)
+    cursor.execute('UPDATE movimientos_recursos SET delta = CAST(ROUND(delta * ?) AS INTEGER)', (ESCALA,))
+    cursor.execute('UPDATE saldos_instantanea SET cantidad = CAST(ROUND(cantidad * ?) AS INTEGER)', (ESCALA,))
+    cursor.execute('''
+        UPDATE rankings
+        SET valor = COALESCE((
+            SELECT rc.cantidad FROM recursos_ciudadano rc
+            JOIN recursos r ON r.id = rc.recurso_id
+            WHERE r.codigo = rankings.tipo AND rc.ciudadano_id = rankings.ciudadano_id
+        ), 0)
+        WHERE tipo NOT LIKE 'acciones:%'
+    ''')
+
+    if libro:
+        crear_triggers_libro(cursor)
+
+def migrar_version_ciudadanos(cursor) -> None:
+    """
+    Añade la columna version a las tablas ciudadanos creadas antes de que existiera
+    (las escrituras optimistas de mejorar_casa la comprueban).
+
+    Args:
+        cursor: Cursor de la base de datos
+    """
+    cursor.execute('PRAGMA table_info(ciudadanos)')
+    if 'version' not in [fila[1] for fila in cursor.fetchall()]:
+        cursor.execute('ALTER TABLE ciudadanos ADD COLUMN version INTEGER NOT NULL DEFAULT 1')
+        logger_db.info("Columna version añadida a ciudadanos")
+
+def migrar_activo_ciudadanos(cursor) -> None:
+    """
+    Añade la columna activo a las tablas ciudadanos creadas antes de que existiera
+    (eliminar_ciudadano la pone a 0 y resolver_ciudadano la consulta).
+
+    Args:
+        cursor: Cursor de la base de datos
+    """
+    cursor.execute('PRAGMA table_info(ciudadanos)')
+    if 'activo' not in [fila[1] for fila in cursor.fetchall()]:
+        cursor.execute('ALTER TABLE ciudadanos ADD COLUMN activo BOOLEAN DEFAULT TRUE')
+        logger_db.info("Columna activo añadida a ciudadanos")
+
+# Migraciones de datos en el orden en que se aplican: (nombre, función que recibe el cursor)
+MIGRACIONES = (
+    ('cantidades_centesimas', migrar_cantidades_centesimas),
+    ('version_ciudadanos', migrar_version_ciudadanos),
+    ('activo_ciudadanos', migrar_activo_ciudadanos),
+)
+
+def aplicar_migraciones(cursor) -> List[str]:
+    """
+    Aplica las migraciones de datos (MIGRACIONES) que no figuran en la tabla migraciones.
+
+    Cada migración se anota en la misma transacción que sus cambios, así que no se aplica
+    dos veces. Las bases de datos creadas desde cero las marcan como aplicadas en crear_tablas.
+
+    Args:
+        cursor: Cursor de la base de datos (después de crear_tablas)
+
+    Returns:
+        Lista con los nombres de las migraciones aplicadas
+    """
+    cursor.execute('SELECT nombre FROM migraciones')
+    aplicadas = {fila[0] for fila in cursor.fetchall()}
+    nuevas = []
+    for nombre, migracion in MIGRACIONES:
+        if nombre in aplicadas:
+            continue
+        migracion(cursor)
+        cursor.execute('INSERT INTO migraciones (nombre, fecha_aplicada) VALUES (?, ?)',
+                       (nombre, datetime.now().isoformat()))
+        logger_db.info("Migración %s aplicada", nombre)
+        nuevas.append(nombre)
+    return nuevas
+
 def main():
     """
     Punto de entrada principal cuando se ejecuta el script directamente.
@@ -405,14 +946,29 @@ def main():
                 logger_db.error("Ocurrieron errores al crear las tablas")
                 return False
             
-            # Crear índices
+            # Crear índices (y borrar los obsoletos de versiones anteriores)
             try:
-                crear_indices(cursor)
+                migrar_indices(cursor)
                 logger_db.info("Índices creados correctamente")
             except Exception as e:
                 logger_db.error(f"Error al crear índices: {e}")
                 return False
             
+            # Crear triggers
+            try:
+                crear_triggers(cursor)
+                logger_db.info("Triggers creados correctamente")
+            except Exception as e:
+                logger_db.error(f"Error al crear triggers: {e}")
+                return False
+            
+            # Migrar los datos de versiones anteriores
+            try:
+                aplicar_migraciones(cursor)
+            except Exception as e:
+                logger_db.error(f"Error al aplicar migraciones: {e}")
+                return False
+            
             conn.commit()
             logger_db.info("Esquema de base de datos creado exitosamente")
             return True
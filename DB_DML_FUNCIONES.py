@@ -2,24 +2,138 @@
 Módulo que contiene funciones de manipulación de datos (DML) para la base de datos.
 Incluye operaciones como inserción, actualización, eliminación y consulta de datos.
 """
+import json
 import sqlite3
 import logging
 import random
+import time
 from typing import Dict, Any, Optional, List, Tuple, Union
 from datetime import datetime
 
+from cache import CacheLRU, NO_ENCONTRADO
+from cantidades import ESCALA, a_centesimas, desde_centesimas
+from DB_CATALOGO import Catalogo, CacheCatalogo, leer_version
+from concurrencia import ConflictoVersion, ejecutar_con_reintentos, metricas_contencion
+from eventos import RESULTADOS, ACCIONES_SISTEMA, decodificar_recursos, codificar_recursos, renderizar_evento
+
 # Configuración del logger
 logger_db = logging.getLogger('database')
 
 # Configuración de la base de datos
 DB_PATH = 'soloville.db'
 
+# Segundos que se reutiliza un inventario leído con obtener_inventario (0 desactiva la caché)
+TTL_INVENTARIO = 2.0
+_cache_inventario: Dict[int, Tuple[float, Dict[str, Any]]] = {}
+
+# Recursos con los que empieza cada ciudadano nuevo {codigo_recurso: cantidad}
+RECURSOS_INICIALES: Dict[str, float] = {}
+
+# Habilidades y herramientas se guardan solo cuando cambian: un ciudadano sin fila en
+# habilidades_ciudadano tiene la habilidad con estos valores, y sin fila en
+# herramientas_ciudadano no tiene la herramienta
+HABILIDAD_INICIAL = {'nivel': 1, 'puntos_experiencia': 0}
+
+# Caché de nombre de ciudadano (login de Twitch) a sus datos básicos; guarda también los
+# nombres que no existen, por eso se invalida al crear, renombrar y desactivar ciudadanos
+CAPACIDAD_CACHE_CIUDADANOS = 1024
+CAMPOS_CACHE_CIUDADANO = ('id', 'nombre', 'activo', 'borrado_logico')
+# Segundos que se reutiliza un nombre que no existe o está desactivado (activo = 0 o
+# borrado_logico): otro proceso (la web o un script) puede crearlo o reactivarlo sin
+# invalidar la caché de este
+TTL_CIUDADANO_NO_ACTIVO = 30.0
+_cache_ciudadanos = CacheLRU(CAPACIDAD_CACHE_CIUDADANOS)
+
+# Catálogo en memoria (recursos, acciones, herramientas, habilidades y recetas)
+_cache_catalogo = CacheCatalogo()
+
 def get_db_connection():
     """Crea una conexión a la base de datos con soporte para filas tipo diccionario."""
     conn = sqlite3.connect(DB_PATH)
     conn.row_factory = sqlite3.Row
     return conn
 
+def obtener_catalogo(forzar: bool = False) -> Catalogo:
+    """
+    Obtiene el catálogo en memoria, recargándolo si su versión ha cambiado en la base de datos.
+    
+    Args:
+        forzar: Comprobar la versión ahora aunque se haya comprobado hace poco
+        
+    Returns:
+        Catalogo con búsquedas por ID y por código (ver DB_CATALOGO.py)
+        
+    Raises:
+        sqlite3.Error: Si no se puede leer el catálogo
+    """
+    return _cache_catalogo.obtener(DB_PATH, forzar)
+
+def normalizar_nombre(nombre: str) -> str:
+    """
+    Normaliza un nombre de ciudadano al login de Twitch (sin '@', sin espacios y en minúsculas).
+    
+    Args:
+        nombre: Nombre tal como llega del chat o de la web
+        
+    Returns:
+        str: Nombre normalizado
+    """
+    return (nombre or '').strip().lstrip('@').lower()
+
+def resolver_ciudadano(nombre: str, cursor=None) -> Optional[Dict[str, Any]]:
+    """
+    Obtiene el ID y los datos básicos de un ciudadano a partir de su nombre, usando la caché LRU.
+    
+    Los ciudadanos activos se guardan hasta que se invalidan; los nombres que no existen o
+    están desactivados, solo TTL_CIUDADANO_NO_ACTIVO segundos.
+    
+    Args:
+        nombre: Nombre del ciudadano (se normaliza con normalizar_nombre)
+        cursor: Cursor a usar si hay que consultar la base de datos (opcional)
+        
+    Returns:
+        Diccionario con id, nombre, activo y borrado_logico, o None si no existe
+    """
+    clave = normalizar_nombre(nombre)
+    en_cache = _cache_ciudadanos.obtener(clave)
+    if en_cache is not NO_ENCONTRADO and (en_cache[0] is None or en_cache[0] > time.monotonic()):
+        ciudadano = en_cache[1]
+        return dict(ciudadano) if ciudadano else None
+    
+    consulta = f"SELECT {', '.join(CAMPOS_CACHE_CIUDADANO)} FROM ciudadanos WHERE nombre = ?"
+    if cursor is None:
+        with get_db_connection() as conn:
+            fila = conn.execute(consulta, (clave,)).fetchone()
+    else:
+        cursor.execute(consulta, (clave,))
+        fila = cursor.fetchone()
+    ciudadano = dict(zip(CAMPOS_CACHE_CIUDADANO, fila)) if fila else None
+    activo = ciudadano and ciudadano['activo'] and not ciudadano['borrado_logico']
+    caduca = None if activo else time.monotonic() + TTL_CIUDADANO_NO_ACTIVO
+    _cache_ciudadanos.guardar(clave, (caduca, ciudadano))
+    return dict(ciudadano) if ciudadano else None
+
+def invalidar_ciudadano(nombre: str = None) -> None:
+    """
+    Elimina un nombre de la caché de ciudadanos (o vacía la caché si no se indica).
+    
+    Args:
+        nombre: Nombre del ciudadano (opcional)
+    """
+    if nombre is None:
+        _cache_ciudadanos.limpiar()
+    else:
+        _cache_ciudadanos.invalidar(normalizar_nombre(nombre))
+
+def estadisticas_cache_ciudadanos() -> Dict[str, Any]:
+    """
+    Devuelve las métricas de la caché de ciudadanos.
+    
+    Returns:
+        Diccionario con tamano, capacidad, aciertos, fallos y tasa_aciertos
+    """
+    return _cache_ciudadanos.estadisticas()
+
 def obtener_receta_fabricacion(nombre_producto: str) -> Optional[Dict[str, Any]]:
     """
     Obtiene la información de fabricación de un producto desde la base de datos.
@@ -44,7 +158,7 @@ def obtener_receta_fabricacion(nombre_producto: str) -> Optional[Dict[str, Any]]
             producto_info = cursor.fetchone()
             
             if not producto_info:
-                logger_db.warning(f'Producto no encontrado o no fabricable: {nombre_producto}')
+                logger_db.warning('Producto no encontrado o no fabricable: %s', nombre_producto)
                 return None
                 
             # Obtener los recursos necesarios para la fabricación
@@ -92,11 +206,10 @@ def es_producto_fabricable(nombre_ciudadano: str, nombre_producto: str, ) -> boo
             cursor = conn.cursor()
             
             # Obtener ID del ciudadano
-            cursor.execute('SELECT id FROM ciudadanos WHERE nombre = ?', (nombre_ciudadano,))
-            ciudadano = cursor.fetchone()
+            ciudadano = resolver_ciudadano(nombre_ciudadano, cursor)
             
             if not ciudadano:
-                logger_db.warning(f'Ciudadano no encontrado: {nombre_ciudadano}')
+                logger_db.warning('Ciudadano no encontrado: %s', nombre_ciudadano)
                 return False
                 
             ciudadano_id = ciudadano['id']
@@ -104,7 +217,7 @@ def es_producto_fabricable(nombre_ciudadano: str, nombre_producto: str, ) -> boo
             # Verificar si el producto es fabricable según la consulta SQL existente
             cursor.execute('''
                 SELECT 
-                        CASE WHEN MIN(CASE WHEN rf.cantidad <= COALESCE(rc.cantidad, 0) THEN 1 ELSE 0 END) = 1 
+                        CASE WHEN MIN(CASE WHEN rf.cantidad * ? <= COALESCE(rc.cantidad, 0) THEN 1 ELSE 0 END) = 1 
                     THEN 1 ELSE 0 END as fabricable
                     FROM recursos r
                     JOIN fabricacion_productos fp ON r.id = fp.recurso_id
@@ -114,13 +227,13 @@ def es_producto_fabricable(nombre_ciudadano: str, nombre_producto: str, ) -> boo
                     WHERE r.es_producto = 1
                     AND r.nombre = ?
                     GROUP BY r.id
-            ''', (ciudadano_id, nombre_producto))
+            ''', (ESCALA, ciudadano_id, nombre_producto))
             
             resultado = cursor.fetchone()
             
             # Si no hay resultados, el producto no existe o no es fabricable
             if not resultado:
-                logger_db.warning(f'Producto no encontrado o no fabricable: {nombre_producto}')
+                logger_db.warning('Producto no encontrado o no fabricable: %s', nombre_producto)
                 return False
                 
             return bool(resultado['fabricable'])
@@ -132,6 +245,9 @@ def es_producto_fabricable(nombre_ciudadano: str, nombre_producto: str, ) -> boo
 def fabricar_producto(nombre_ciudadano: str, nombre_producto: str, usuario_modificar: str = 'sistema') -> bool:
     """Fábrica un producto para un ciudadano, restando los recursos necesarios y sumando el producto.
     
+    Los recursos se leen sin bloquear la base de datos y se escriben comprobando su versión
+    (ver concurrencia.py); si otro escritor los cambia entre tanto, la fabricación se repite.
+    
     Args:
         nombre_ciudadano: Nombre del ciudadano que fabrica el producto
         nombre_producto: Nombre del producto a fabricar
@@ -140,144 +256,84 @@ def fabricar_producto(nombre_ciudadano: str, nombre_producto: str, usuario_modif
     Returns:
         bool: True si la fabricación fue exitosa, False en caso contrario
     """
-    conn = None
     try:
-        conn = sqlite3.connect(DB_PATH)
-        conn.row_factory = sqlite3.Row
-        cursor = conn.cursor()
-        
-        # Iniciar transacción
-        cursor.execute('BEGIN TRANSACTION')
-            
-        # 1. Obtener ID del ciudadano
-        cursor.execute('SELECT id FROM ciudadanos WHERE nombre = ?', (nombre_ciudadano,))
-        ciudadano = cursor.fetchone()
-        
-        if not ciudadano:
-            logger_db.warning(f'Ciudadano no encontrado: {nombre_ciudadano}')
-            conn.rollback()
-            conn.close()
-            return False
-            
-        ciudadano_id = ciudadano['id']
-        
-        # 2. Verificar si el producto es fabricable
-        cursor.execute('''
-            SELECT 
-                CASE WHEN MIN(CASE WHEN rf.cantidad <= COALESCE(rc.cantidad, 0) THEN 1 ELSE 0 END) = 1 
-                THEN 1 ELSE 0 END as fabricable
-            FROM recursos r
-            JOIN fabricacion_productos fp ON r.id = fp.recurso_id
-            JOIN recursos_fabricacion rf ON fp.id = rf.fabricacion_id
-            JOIN recursos sr ON rf.recurso_id = sr.id
-            LEFT JOIN recursos_ciudadano rc ON sr.id = rc.recurso_id AND rc.ciudadano_id = ?
-            WHERE r.es_producto = 1
-            AND r.nombre = ?
-            GROUP BY r.id
-        ''', (ciudadano_id, nombre_producto))
-        
-        resultado = cursor.fetchone()
-        es_producto_fabricable = bool(resultado and resultado['fabricable'])
+        return ejecutar_con_reintentos(
+            lambda: _fabricar_producto(nombre_ciudadano, nombre_producto, usuario_modificar),
+            'fabricar_producto')
+    except (sqlite3.Error, ValueError, ConflictoVersion) as e:
+        logger_db.error(f'Error al fabricar {nombre_producto} para {nombre_ciudadano}: {str(e)}')
+        return False
 
-        if not es_producto_fabricable:
-            logger_db.warning(f'No se puede fabricar {nombre_producto} para {nombre_ciudadano}: recursos insuficientes o producto no encontrado')
-            conn.rollback()
-            conn.close()
-            return False
-        
-        # 3. Obtener información del producto a fabricar
-        cursor.execute('''
-            SELECT r.id as producto_id, r.nombre, r.codigo, fp.cantidad as cantidad_producida
-            FROM recursos r
-            JOIN fabricacion_productos fp ON r.id = fp.recurso_id
-            WHERE r.nombre = ? AND r.es_producto = 1
-        ''', (nombre_producto,))
-        
-        producto_info = cursor.fetchone()
-        
-        if not producto_info:
-            logger_db.warning(f'Producto no encontrado o no es fabricable: {nombre_producto}')
-            conn.rollback()
-            conn.close()
-            return False
-        
-        # 4. Obtener los materiales requeridos para la fabricación
-        cursor.execute('''
-            SELECT r.id as recurso_id, r.nombre, r.codigo, rf.cantidad as cantidad_requerida
-            FROM recursos r
-            JOIN recursos_fabricacion rf ON r.id = rf.recurso_id
-            JOIN fabricacion_productos fp ON rf.fabricacion_id = fp.id
-            WHERE fp.recurso_id = ?
-        ''', (producto_info['producto_id'],))
-        
-        materiales = cursor.fetchall()
-        
-        if not materiales:
-            logger_db.warning(f'No se encontraron materiales para fabricar {nombre_producto}')
-            conn.rollback()
-            conn.close()
-            return False
+def _fabricar_producto(nombre_ciudadano: str, nombre_producto: str, usuario_modificar: str) -> bool:
+    """
+    Un intento de fabricar_producto.
+    
+    Raises:
+        ConflictoVersion: Si los recursos o el catálogo han cambiado desde que se leyeron
+    """
+    # 1. Obtener ID del ciudadano
+    ciudadano = resolver_ciudadano(nombre_ciudadano)
+    if not ciudadano:
+        logger_db.warning('Ciudadano no encontrado: %s', nombre_ciudadano)
+        return False
+    ciudadano_id = ciudadano['id']
+    
+    # 2. Obtener la receta del producto del catálogo
+    catalogo = obtener_catalogo()
+    producto = next((recurso for recurso in catalogo.recursos.values()
+                     if recurso['nombre'] == nombre_producto and recurso['es_producto']), None)
+    receta = catalogo.recetas.get(producto['id']) if producto else None
+    if not receta:
+        logger_db.warning('Producto no encontrado o no es fabricable: %s', nombre_producto)
+        return False
+    
+    cambios = {catalogo.recursos_por_codigo[codigo]['id']: -a_centesimas(cantidad)
+               for codigo, cantidad in receta['coste'].items()}
+    cambios[producto['id']] = cambios.get(producto['id'], 0) + a_centesimas(receta['cantidad'])
+    
+    with get_db_connection() as conn:
+        cursor = conn.cursor()
         
-        # 5. Restar los recursos necesarios
-        for material in materiales:
-            cursor.execute('''
-                UPDATE recursos_ciudadano
-                SET cantidad = cantidad - ?,
-                    fecha_modif = CURRENT_TIMESTAMP,
-                    usuario_modif = ?
-                WHERE recurso_id = ? AND ciudadano_id = ?
-            ''', (material['cantidad_requerida'], usuario_modificar, material['recurso_id'], ciudadano_id))
-            
-            # Verificar si la actualización fue exitosa
-            if cursor.rowcount == 0:
-                logger_db.warning(f'No se pudo actualizar el recurso {material["nombre"]} para {nombre_ciudadano}')
-                conn.rollback()
-                conn.close()
+        # 3. Leer los recursos (fuera de la transacción de escritura) y verificar que alcanzan
+        leidos = _leer_recursos_versionados(cursor, ciudadano_id, cambios)
+        for codigo, cantidad in receta['coste'].items():
+            if leidos.get(catalogo.recursos_por_codigo[codigo]['id'], (0, None))[0] < a_centesimas(cantidad):
+                logger_db.warning('No se puede fabricar %s para %s: recursos insuficientes', nombre_producto, nombre_ciudadano)
                 return False
         
-        # 6. Sumar el producto fabricado al inventario del ciudadano
-        cursor.execute('''
-            INSERT INTO recursos_ciudadano (ciudadano_id, recurso_id, cantidad, fecha_crear, usuario_crear)
-            VALUES (?, ?, ?, CURRENT_TIMESTAMP, ?)
-            ON CONFLICT(ciudadano_id, recurso_id) 
-            DO UPDATE SET 
-                cantidad = cantidad + excluded.cantidad,
-                fecha_modif = CURRENT_TIMESTAMP,
-                usuario_modif = excluded.usuario_crear
-        ''', (ciudadano_id, producto_info['producto_id'], producto_info['cantidad_producida'], usuario_modificar))
+        # 4. Escribir solo si nada ha cambiado desde la lectura
+        cursor.execute('BEGIN IMMEDIATE')
+        if leer_version(cursor) != catalogo.version:
+            conn.rollback()
+            obtener_catalogo(forzar=True)
+            raise ConflictoVersion('El catálogo ha cambiado')
+        _escribir_recursos_versionados(cursor, ciudadano_id, cambios, leidos, usuario_modificar)
         
-        # 7. Registrar la acción
-        cursor.execute('''
-            INSERT INTO historial_acciones (ciudadano_id, codigo_accion, mensaje_final, fecha_hora)
-            VALUES (?, 'FABRICAR', ?, CURRENT_TIMESTAMP)
-        ''', (ciudadano_id, f'{nombre_ciudadano} fabricó {producto_info["cantidad_producida"]} {producto_info["nombre"]}(s)'))
+        # 5. Registrar la acción
+        consumo = {codigo: -cantidad for codigo, cantidad in receta['coste'].items()}
+        consumo[producto['codigo']] = consumo.get(producto['codigo'], 0) + receta['cantidad']
+        _registrar_evento(cursor, 'FABRICAR', ciudadano_id, recursos=consumo)
         
-        # Confirmar la transacción
         conn.commit()
-        logger_db.info(f'{nombre_ciudadano} fabricó exitosamente {producto_info["cantidad_producida"]} {nombre_producto}')
-        return True
-            
-    except Exception as e:
-        logger_db.error(f'Error al fabricar {nombre_producto} para {nombre_ciudadano}: {str(e)}')
-        if conn:
-            conn.rollback()
-        return False
-    finally:
-        if conn:
-            conn.close()
+    
+    invalidar_inventario(ciudadano_id)
+    logger_db.info('%s fabricó exitosamente %s %s', nombre_ciudadano, receta['cantidad'], nombre_producto)
+    return True
 
-def info_fabricacion(recurso_id: int) -> str:
+def info_fabricacion(recurso_id: int, conexion: sqlite3.Connection = None) -> str:
     """
     Obtiene información sobre cómo fabricar un recurso específico.
     
     Args:
         recurso_id: ID del recurso a consultar
+        conexion: Conexión de lectura a usar, como las de DB_LECTURA.LectorBD (por defecto
+                  una nueva a DB_PATH)
         
     Returns:
         str: Cadena con la información de fabricación o mensaje indicando que no es fabricable
     """
     try:
-        with get_db_connection() as conn:
+        with conexion or get_db_connection() as conn:
             cursor = conn.cursor()
             
             # Obtener el nombre del recurso a partir de su ID
@@ -345,18 +401,59 @@ def get_ciudadano(nombre: str) -> Optional[Dict[str, Any]]:
     try:
         with get_db_connection() as conn:
             cursor = conn.cursor()
-            cursor.execute('SELECT * FROM ciudadanos WHERE nombre = ?', (nombre,))
-            ciudadano = cursor.fetchone()
+            ciudadano = resolver_ciudadano(nombre, cursor)
+            if ciudadano:
+                cursor.execute('SELECT * FROM ciudadanos WHERE id = ?', (ciudadano['id'],))
+                ciudadano = cursor.fetchone()
             if ciudadano:
-                logger_db.info(f"Ciudadano encontrado: {nombre}")
+                logger_db.info("Ciudadano encontrado: %s", nombre)
                 return dict(ciudadano)
             else:
-                logger_db.info(f"Ciudadano no encontrado: {nombre}")
+                logger_db.info("Ciudadano no encontrado: %s", nombre)
                 return None
     except sqlite3.Error as e:
         logger_db.error(f"Error al obtener ciudadano {nombre}: {e}")
         return None
 
+def _insertar_ciudadanos(cursor, nombres: List[str], usuario_crear: str) -> Dict[str, int]:
+    """
+    Inserta ciudadanos nuevos con sus recursos iniciales dentro de la transacción en curso,
+    con una sentencia executemany por tabla.
+    
+    No se crean filas de habilidades ni de herramientas: sin fila, el ciudadano tiene cada
+    habilidad en HABILIDAD_INICIAL y ninguna herramienta (ver obtener_inventario).
+    
+    Args:
+        cursor: Cursor de la transacción en curso
+        nombres: Nombres ya normalizados que no existen en la base de datos
+        usuario_crear: Usuario que crea los registros
+        
+    Returns:
+        Diccionario {nombre: ciudadano_id}
+    """
+    fecha_crear = datetime.now().isoformat()
+    cursor.executemany(
+        'INSERT INTO ciudadanos (nombre, fecha_crear, usuario_crear) VALUES (?, ?, ?)',
+        [(nombre, fecha_crear, usuario_crear) for nombre in nombres]
+    )
+    cursor.execute(
+        'SELECT id, nombre FROM ciudadanos WHERE nombre IN (SELECT value FROM json_each(?))',
+        (json.dumps(nombres),)
+    )
+    filas = dict((fila[1], fila[0]) for fila in cursor.fetchall())
+    ids = {nombre: filas[nombre] for nombre in nombres}
+    
+    catalogo = obtener_catalogo()
+    recursos = [(catalogo.recursos_por_codigo[codigo]['id'], a_centesimas(cantidad))
+                for codigo, cantidad in RECURSOS_INICIALES.items() if a_centesimas(cantidad) > 0]
+    
+    cursor.executemany('''
+        INSERT INTO recursos_ciudadano (ciudadano_id, recurso_id, cantidad, usuario_crear)
+        VALUES (?, ?, ?, ?)
+    ''', [(ciudadano_id, recurso_id, cantidad, usuario_crear)
+          for ciudadano_id in ids.values() for recurso_id, cantidad in recursos])
+    return ids
+
 def crear_ciudadano(nombre: str, usuario_crear: str = None) -> bool:
     """
     Crea un nuevo ciudadano en la base de datos con información de auditoría.
@@ -373,59 +470,69 @@ def crear_ciudadano(nombre: str, usuario_crear: str = None) -> bool:
             cursor = conn.cursor()
             
             # Verificar si el ciudadano ya existe
-            cursor.execute('SELECT id FROM ciudadanos WHERE nombre = ?', (nombre,))
-            if cursor.fetchone():
+            nombre = normalizar_nombre(nombre)
+            if resolver_ciudadano(nombre, cursor):
                 logger_db.error(f"Error al crear ciudadano {nombre}: ya existe")
                 return False
-                
-            # Obtener la fecha actual para la creación
-            fecha_crear = datetime.now().isoformat()
-            
-            # Asegurar que usuario_crear no sea nulo
-            if not usuario_crear:
-                usuario_crear = 'sistema'
-            
-            # Construir la consulta de inserción
-            campos = ["nombre", "fecha_crear", "usuario_crear"]
-            placeholders = [":nombre", ":fecha_crear", ":usuario_crear"]
-            valores = {
-                "nombre": nombre,
-                "fecha_crear": fecha_crear,
-                "usuario_crear": usuario_crear
-            }
-            
-            # Insertar el nuevo ciudadano
-            cursor.execute(f"""
-                INSERT INTO ciudadanos ({', '.join(campos)}) 
-                VALUES ({', '.join(placeholders)})
-            """, valores)
             
-            # Obtener el ID del nuevo ciudadano
-            ciudadano_id = cursor.lastrowid
-            
-            # Insertar habilidades para el nuevo ciudadano
-            cursor.execute("SELECT codigo FROM habilidades WHERE activo = 1")
-            habilidades = [row[0] for row in cursor.fetchall()]
-            
-            fecha_actual = datetime.now().isoformat()
-            for habilidad_id in habilidades:
-                cursor.execute('''
-                    INSERT INTO habilidades_ciudadano 
-                    (ciudadano_id, habilidad_id, puntos_experiencia, nivel,
-                     fecha_crear, usuario_crear, activo)
-                    VALUES (?, ?, 0, 1, ?, ?, TRUE)
-                ''', (ciudadano_id, habilidad_id, fecha_actual, usuario_crear))
+            _insertar_ciudadanos(cursor, [nombre], usuario_crear or 'sistema')
             
             conn.commit()
+            invalidar_ciudadano(nombre)
             logger_db.info(f"Ciudadano creado exitosamente: {nombre}")
             return True
     except sqlite3.IntegrityError:
-        logger_db.warning(f"Ciudadano ya existe: {nombre}")
+        logger_db.warning("Ciudadano ya existe: %s", nombre)
         return False
     except sqlite3.Error as e:
         logger_db.error(f"Error al crear ciudadano {nombre}: {e}")
         return False
 
+def crear_ciudadanos(nombres: List[str], usuario_crear: str = None, asignar_solar: bool = True) -> Dict[str, int]:
+    """
+    Registra de una vez a muchos ciudadanos (por ejemplo, los espectadores de una raid).
+    
+    Todos se crean en una sola transacción, con una sentencia executemany por tabla, y
+    reciben sus recursos iniciales y, si asignar_solar es True, los solares libres más
+    cercanos al centro. Los nombres repetidos o que ya existen se ignoran.
+    
+    Args:
+        nombres: Nombres de los ciudadanos (se normalizan con normalizar_nombre)
+        usuario_crear: Usuario que crea los registros (opcional)
+        asignar_solar: Asignar un solar a cada ciudadano nuevo
+        
+    Returns:
+        Diccionario {nombre: ciudadano_id} con los ciudadanos creados (vacío si hay un error)
+    """
+    nombres = [nombre for nombre in dict.fromkeys(normalizar_nombre(nombre) for nombre in nombres) if nombre]
+    if not nombres:
+        return {}
+    
+    try:
+        with get_db_connection() as conn:
+            cursor = conn.cursor()
+            cursor.execute('BEGIN IMMEDIATE')
+            cursor.execute(
+                'SELECT nombre FROM ciudadanos WHERE nombre IN (SELECT value FROM json_each(?))',
+                (json.dumps(nombres),)
+            )
+            existentes = {fila[0] for fila in cursor.fetchall()}
+            nuevos = [nombre for nombre in nombres if nombre not in existentes]
+            
+            ids = _insertar_ciudadanos(cursor, nuevos, usuario_crear or 'sistema') if nuevos else {}
+            if asignar_solar and ids:
+                from db_mapa import asignar_solares
+                asignar_solares(cursor, [ids[nombre] for nombre in nuevos])
+            conn.commit()
+    except (sqlite3.Error, KeyError) as e:
+        logger_db.error("Error al registrar %d ciudadanos: %s", len(nombres), e)
+        return {}
+    
+    for nombre in nuevos:
+        invalidar_ciudadano(nombre)
+    logger_db.info("Registrados %d ciudadanos (%d ya existían)", len(ids), len(existentes))
+    return ids
+
 def actualizar_ciudadano(nombre: str, datos: Dict[str, Any], usuario_modificar: str = None) -> bool:
     """
     Actualiza los datos de un ciudadano existente con información de auditoría.
@@ -442,8 +549,7 @@ def actualizar_ciudadano(nombre: str, datos: Dict[str, Any], usuario_modificar:
         with get_db_connection() as conn:
             cursor = conn.cursor()
             # Verificar si el ciudadano existe
-            cursor.execute('SELECT id FROM ciudadanos WHERE nombre = ?', (nombre,))
-            ciudadano = cursor.fetchone()
+            ciudadano = resolver_ciudadano(nombre, cursor)
             if not ciudadano:
                 logger_db.error(f"Error al actualizar ciudadano {nombre}: ciudadano no encontrado")
                 return False
@@ -462,10 +568,14 @@ def actualizar_ciudadano(nombre: str, datos: Dict[str, Any], usuario_modificar:
             ])
             valores.append(usuario_modificar if usuario_modificar else "sistema")
             # Construir la consulta final
-            consulta = f"UPDATE ciudadanos SET {', '.join(campos_actualizar)} WHERE nombre = ?"
-            valores.append(nombre)
+            consulta = f"UPDATE ciudadanos SET {', '.join(campos_actualizar)} WHERE id = ?"
+            valores.append(ciudadano['id'])
             cursor.execute(consulta, tuple(valores))
             conn.commit()
+            if set(datos) & {'nombre', 'activo', 'borrado_logico'}:
+                invalidar_ciudadano(nombre)
+                if 'nombre' in datos:
+                    invalidar_ciudadano(datos['nombre'])
             logger_db.info(f"Ciudadano actualizado: {nombre}")
             return True
             
@@ -473,6 +583,112 @@ def actualizar_ciudadano(nombre: str, datos: Dict[str, Any], usuario_modificar:
         logger_db.error(f"Error al actualizar ciudadano {nombre}: {e}")
         return False
 
+def obtener_inventario(ciudadano_id: int, usar_cache: bool = True, conexion: sqlite3.Connection = None,
+                       catalogo: Catalogo = None) -> Optional[Dict[str, Any]]:
+    """
+    Obtiene en una sola consulta los recursos, herramientas y habilidades de un ciudadano.
+    
+    Si usar_cache es True, se reutiliza el inventario leído hace menos de TTL_INVENTARIO
+    segundos. Las funciones de este módulo que modifican el inventario lo invalidan; las
+    comprobaciones previas a una escritura deben usar usar_cache=False. Lo leído con otra
+    conexión (la web lee de DB_LECTURA.LectorBD) no pasa por la caché: puede ir retrasado.
+    
+    Args:
+        ciudadano_id: ID del ciudadano
+        usar_cache: Si se puede devolver un inventario leído recientemente
+        conexion: Conexión de lectura a usar (por defecto una nueva a DB_PATH)
+        catalogo: Catálogo de la misma base de datos que conexion (por defecto obtener_catalogo())
+        
+    Returns:
+        Diccionario con:
+            recursos: {codigo_recurso: cantidad}
+            herramientas: {codigo_herramienta: tiene (bool)} (todas las herramientas activas;
+                          False si el ciudadano no tiene fila)
+            habilidades: {codigo_habilidad: {'nivel': int, 'puntos_experiencia': int}} (todas
+                         las habilidades activas; HABILIDAD_INICIAL si no tiene fila)
+        o None en caso de error
+    """
+    if conexion is not None:
+        usar_cache = False
+    if usar_cache and TTL_INVENTARIO > 0:
+        en_cache = _cache_inventario.get(ciudadano_id)
+        if en_cache and en_cache[0] > time.monotonic():
+            return {clave: dict(valor) for clave, valor in en_cache[1].items()}
+    
+    try:
+        with conexion or get_db_connection() as conn:
+            cursor = conn.cursor()
+            # Los códigos de recursos y herramientas se obtienen del catálogo en memoria
+            catalogo = catalogo or obtener_catalogo()
+            cursor.execute('''
+                SELECT 'recurso' AS tipo, rc.recurso_id AS clave, rc.cantidad AS valor, NULL AS extra
+                FROM recursos_ciudadano rc
+                WHERE rc.ciudadano_id = :id
+                UNION ALL
+                SELECT 'herramienta', hc.herramienta_id, hc.tiene, 1
+                FROM herramientas_ciudadano hc
+                WHERE hc.ciudadano_id = :id AND hc.activo = 1
+                UNION ALL
+                SELECT 'herramienta', hc.herramienta_id, NULL, 0
+                FROM herramientas_ciudadano hc
+                WHERE hc.ciudadano_id = :id AND hc.activo = 0
+                UNION ALL
+                SELECT 'habilidad', hc.habilidad_id, hc.nivel, hc.puntos_experiencia
+                FROM habilidades_ciudadano hc
+                WHERE hc.ciudadano_id = :id AND hc.activo = 1
+                UNION ALL
+                SELECT 'habilidad_inactiva', hc.habilidad_id, NULL, NULL
+                FROM habilidades_ciudadano hc
+                WHERE hc.ciudadano_id = :id AND hc.activo = 0
+            ''', {'id': ciudadano_id})
+            
+            # Las filas que faltan toman los valores por defecto
+            inventario = {
+                'recursos': {},
+                'herramientas': {herramienta['codigo']: False for herramienta in catalogo.herramientas.values()
+                                 if herramienta['activo']},
+                'habilidades': {codigo: dict(HABILIDAD_INICIAL) for codigo, habilidad
+                                in catalogo.habilidades_por_codigo.items() if habilidad['activo']}
+            }
+            for fila in cursor.fetchall():
+                if fila['tipo'] == 'recurso':
+                    recurso = catalogo.recursos.get(fila['clave'])
+                    if recurso:
+                        inventario['recursos'][recurso['codigo']] = desde_centesimas(fila['valor'])
+                elif fila['tipo'] == 'herramienta':
+                    herramienta = catalogo.herramientas.get(fila['clave'])
+                    if herramienta and herramienta['activo']:
+                        if fila['extra']:
+                            inventario['herramientas'][herramienta['codigo']] = bool(fila['valor'])
+                        else:
+                            inventario['herramientas'].pop(herramienta['codigo'], None)
+                elif fila['tipo'] == 'habilidad':
+                    inventario['habilidades'][fila['clave']] = {
+                        'nivel': fila['valor'],
+                        'puntos_experiencia': fila['extra']
+                    }
+                else:
+                    inventario['habilidades'].pop(fila['clave'], None)
+    except sqlite3.Error as e:
+        logger_db.error(f"Error al obtener inventario del ciudadano {ciudadano_id}: {e}")
+        return None
+    
+    if conexion is None and TTL_INVENTARIO > 0:
+        _cache_inventario[ciudadano_id] = (time.monotonic() + TTL_INVENTARIO, inventario)
+    return {clave: dict(valor) for clave, valor in inventario.items()}
+
+def invalidar_inventario(ciudadano_id: int = None) -> None:
+    """
+    Elimina de la caché el inventario de un ciudadano (o de todos si no se indica).
+    
+    Args:
+        ciudadano_id: ID del ciudadano (opcional)
+    """
+    if ciudadano_id is None:
+        _cache_inventario.clear()
+    else:
+        _cache_inventario.pop(ciudadano_id, None)
+
 def obtener_cantidad_recurso(ciudadano_id: int, codigo_recurso: str) -> int:
     """
     Obtiene la cantidad de un recurso específico que posee un ciudadano.
@@ -484,37 +700,79 @@ def obtener_cantidad_recurso(ciudadano_id: int, codigo_recurso: str) -> int:
     Returns:
         int: Cantidad del recurso que posee el ciudadano, 0 si no tiene nada
     """
+    inventario = obtener_inventario(ciudadano_id)
+    if not inventario:
+        return 0
+    return inventario['recursos'].get(codigo_recurso, 0)
+
+def _sumar_recursos(cursor, ciudadano_id: int, recursos: Dict[str, float], usuario_modificar: str) -> None:
+    """
+    Suma varias cantidades de recursos a un ciudadano dentro de la transacción en curso.
+    
+    Cada recurso se actualiza con una única sentencia atómica (UPSERT), así dos escritores
+    concurrentes no pierden actualizaciones. El resultado nunca baja de 0. El delta se pasa
+    dos veces porque el valor insertado ya está limitado a 0 y excluded.cantidad no sirve
+    para restar de una fila existente. Cada fila actualizada incrementa su version, para que
+    las escrituras optimistas que la leyeron antes detecten el cambio. Las cantidades se
+    redondean a centésimas, que es como se guardan (ver cantidades.py).
+    
+    Args:
+        cursor: Cursor de la transacción en curso
+        ciudadano_id: ID del ciudadano
+        recursos: Diccionario {codigo_recurso: cantidad} (negativa para restar)
+        usuario_modificar: Usuario que realiza la modificación
+        
+    Raises:
+        ValueError: Si alguno de los recursos no existe
+    """
+    catalogo = obtener_catalogo()
+    faltan = [codigo for codigo in recursos if codigo not in catalogo.recursos_por_codigo]
+    if faltan:
+        raise ValueError(f'Recursos no encontrados: {", ".join(sorted(faltan))}')
+    
+    cursor.executemany('''
+        INSERT INTO recursos_ciudadano (ciudadano_id, recurso_id, cantidad, usuario_crear, usuario_modif)
+        VALUES (?, ?, MAX(0, ?), ?, ?)
+        ON CONFLICT(ciudadano_id, recurso_id)
+        DO UPDATE SET
+            cantidad = MAX(0, recursos_ciudadano.cantidad + ?),
+            version = COALESCE(recursos_ciudadano.version, 0) + 1,
+            fecha_modif = CURRENT_TIMESTAMP,
+            usuario_modif = excluded.usuario_modif
+    ''', [
+        (ciudadano_id, catalogo.recursos_por_codigo[codigo]['id'], centesimas,
+         usuario_modificar, usuario_modificar, centesimas)
+        for codigo, centesimas in ((codigo, a_centesimas(cantidad)) for codigo, cantidad in recursos.items())
+        if centesimas
+    ])
+
+def sumar_recursos_ciudadano(ciudadano_id: int, recursos: Dict[str, float], usuario_modificar: str = None) -> bool:
+    """
+    Suma varias cantidades de recursos a un ciudadano en una sola transacción.
+    
+    Args:
+        ciudadano_id: ID del ciudadano
+        recursos: Diccionario {codigo_recurso: cantidad} (negativa para restar; el resultado
+                  nunca baja de 0)
+        usuario_modificar: Usuario que realiza la modificación (opcional)
+        
+    Returns:
+        bool: True si se aplicaron todos los cambios, False si no se aplicó ninguno
+    """
+    logger_db.debug('sumar_recursos_ciudadano: ciudadano_id=%s, recursos=%s', ciudadano_id, recursos)
+    
     try:
         with get_db_connection() as conn:
             cursor = conn.cursor()
-            
-            # Primero obtener el ID del recurso
-            cursor.execute('SELECT id FROM recursos WHERE codigo = ?', (codigo_recurso,))
-            recurso = cursor.fetchone()
-            
-            if not recurso:
-                return 0
-                
-            recurso_id = recurso['id']
-            
-            # Obtener la cantidad del recurso para el ciudadano
-            cursor.execute('''
-                SELECT cantidad 
-                FROM recursos_ciudadano 
-                WHERE ciudadano_id = ? AND recurso_id = ?
-            ''', (ciudadano_id, recurso_id))
-            
-            resultado = cursor.fetchone()
-            
-            # Si no hay registro, devolver 0
-            if not resultado:
-                return 0
-                
-            return resultado['cantidad']
-            
-    except sqlite3.Error as e:
-        logger_db.error(f"Error al obtener cantidad de recurso: {e}")
-        return 0
+            cursor.execute('BEGIN IMMEDIATE')
+            _sumar_recursos(cursor, ciudadano_id, recursos, usuario_modificar or 'sistema')
+            conn.commit()
+        return True
+    except (sqlite3.Error, ValueError) as e:
+        logger_db.error('Error al sumar recursos %s al ciudadano %s: %s', recursos, ciudadano_id, e)
+        return False
+    finally:
+        invalidar_inventario(ciudadano_id)
 
 def sumar_recurso_ciudadano(ciudadano_id: int, codigo_recurso: str, cantidad: int, usuario_modificar: str = None) -> bool:
     """
@@ -523,109 +781,188 @@ def sumar_recurso_ciudadano(ciudadano_id: int, codigo_recurso: str, cantidad: in
     Args:
         ciudadano_id: ID del ciudadano
         codigo_recurso: Código del recurso a actualizar
-        cantidad: Cantidad a sumar (puede ser negativa para restar)
+        cantidad: Cantidad a sumar (puede ser negativa para restar; el resultado nunca baja de 0)
         usuario_modificar: Usuario que realiza la modificación (opcional)
         
     Returns:
         bool: True si la operación fue exitosa, False en caso contrario
     """
-    logger_db.info(f'sumar_recurso_ciudadano - Iniciando: ciudadano_id={ciudadano_id}, recurso={codigo_recurso}, cantidad={cantidad}')
+    return sumar_recursos_ciudadano(ciudadano_id, {codigo_recurso: cantidad}, usuario_modificar)
+
+def asignar_herramienta(ciudadano_id: int, codigo_herramienta: str, tiene: bool = True,
+                        usuario_modificar: str = None) -> bool:
+    """
+    Da o quita una herramienta a un ciudadano, creando su fila si es el primer cambio.
+    
+    Args:
+        ciudadano_id: ID del ciudadano
+        codigo_herramienta: Código de la herramienta
+        tiene: True para darla, False para quitarla
+        usuario_modificar: Usuario que realiza la modificación (opcional)
+        
+    Returns:
+        bool: True si se guardó el cambio, False en caso de error
+    """
+    usuario = usuario_modificar or 'sistema'
+    try:
+        herramienta = obtener_catalogo().herramientas_por_codigo.get(codigo_herramienta)
+        if not herramienta:
+            raise ValueError(f'Herramienta no encontrada: {codigo_herramienta}')
+        with get_db_connection() as conn:
+            conn.execute('''
+                INSERT INTO herramientas_ciudadano (ciudadano_id, herramienta_id, tiene, fecha_crear, usuario_crear)
+                VALUES (?, ?, ?, ?, ?)
+                ON CONFLICT(ciudadano_id, herramienta_id)
+                DO UPDATE SET
+                    tiene = excluded.tiene,
+                    fecha_modif = excluded.fecha_crear,
+                    usuario_modif = excluded.usuario_crear
+            ''', (ciudadano_id, herramienta['id'], tiene, datetime.now().isoformat(), usuario))
+        return True
+    except (sqlite3.Error, ValueError) as e:
+        logger_db.error('Error al asignar la herramienta %s al ciudadano %s: %s', codigo_herramienta, ciudadano_id, e)
+        return False
+    finally:
+        invalidar_inventario(ciudadano_id)
+
+def sumar_experiencia(ciudadano_id: int, codigo_habilidad: str, puntos: int,
+                      usuario_modificar: str = None) -> Optional[int]:
+    """
+    Suma puntos de experiencia a una habilidad de un ciudadano y recalcula su nivel
+    (niveles.obtener_nivel), creando su fila si es el primer cambio.
     
+    Args:
+        ciudadano_id: ID del ciudadano
+        codigo_habilidad: Código de la habilidad
+        puntos: Puntos a sumar
+        usuario_modificar: Usuario que realiza la modificación (opcional)
+        
+    Returns:
+        int: Nivel de la habilidad tras sumar los puntos, o None en caso de error
+    """
+    from niveles import obtener_nivel
+    usuario = usuario_modificar or 'sistema'
     try:
+        if codigo_habilidad not in obtener_catalogo().habilidades_por_codigo:
+            raise ValueError(f'Habilidad no encontrada: {codigo_habilidad}')
         with get_db_connection() as conn:
             cursor = conn.cursor()
-            
-            # Obtener el ID del recurso
-            cursor.execute('SELECT id, nombre FROM recursos WHERE codigo = ?', (codigo_recurso,))
-            recurso = cursor.fetchone()
-            
-            if not recurso:
-                error_msg = f'Recurso no encontrado: {codigo_recurso}'
-                logger_db.error(error_msg)
-                return False
-                
-            recurso_id = recurso['id']
-            logger_db.info(f'Recuperado recurso: ID={recurso_id}, Nombre={recurso["nombre"]}')
-            
-            # Obtener la cantidad actual del recurso
+            cursor.execute('BEGIN IMMEDIATE')
             cursor.execute('''
-                SELECT cantidad, id 
-                FROM recursos_ciudadano 
-                WHERE ciudadano_id = ? AND recurso_id = ?
-            ''', (ciudadano_id, recurso_id))
-            
-            recurso_actual = cursor.fetchone()
-            
-            if recurso_actual:
-                cantidad_actual = recurso_actual['cantidad']
-                nueva_cantidad = cantidad_actual + cantidad
-                logger_db.info(f'Recurso existente - ID: {recurso_actual["id"]}, Actual: {cantidad_actual}, Nueva cantidad: {nueva_cantidad}')
-                
-                # Si la cantidad resultante es 0 o negativa, lo deja en 0
-                if nueva_cantidad <= 0:
-                    logger_db.info(f'Estableciendo cantidad a 0 para recurso {codigo_recurso}')
-                    cursor.execute('''
-                        UPDATE recursos_ciudadano 
-                        SET cantidad = 0, 
-                            fecha_modif = CURRENT_TIMESTAMP,
-                            usuario_modif = ?
-                        WHERE id = ?
-                    ''', (usuario_modificar or 'sistema', recurso_actual['id']))
-                else:
-                    # Actualizar cantidad existente
-                    logger_db.info(f'Actualizando cantidad a {nueva_cantidad} para recurso {codigo_recurso}')
-                    cursor.execute('''
-                        UPDATE recursos_ciudadano 
-                        SET cantidad = ?, 
-                            fecha_modif = CURRENT_TIMESTAMP,
-                            usuario_modif = ?
-                        WHERE id = ?
-                    ''', (nueva_cantidad, usuario_modificar or 'sistema', recurso_actual['id']))
-            else:
-                # Solo crear nuevo registro si la cantidad es positiva
-                if cantidad > 0:
-                    logger_db.info(f'Creando nuevo registro para recurso {codigo_recurso} con cantidad {cantidad}')
-                    cursor.execute('''
-                        INSERT INTO recursos_ciudadano 
-                        (ciudadano_id, recurso_id, cantidad, usuario_crear, usuario_modif)
-                        VALUES (?, ?, ?, ?, ?)
-                    ''', (ciudadano_id, recurso_id, cantidad, 
-                          usuario_modificar or 'sistema', usuario_modificar or 'sistema'))
-                else:
-                    # No crear registros con cantidad 0 o negativa
-                    logger_db.info(f'No se crea registro para cantidad no positiva: {cantidad}')
-                    return True
-            
-            # Verificar si se realizó la actualización
-            if recurso_actual and cursor.rowcount == 0:
-                # Verificar manualmente si la actualización fue exitosa
-                cursor.execute('''
-                    SELECT cantidad FROM recursos_ciudadano 
-                    WHERE id = ?
-                ''', (recurso_actual['id'],))
-                
-                resultado = cursor.fetchone()
-                if not resultado or resultado['cantidad'] == recurso_actual['cantidad']:
-                    logger_db.warning(f'No se actualizó ningún registro para el recurso {codigo_recurso}')
-                    conn.rollback()
-                    return False
-            
-            # Confirmar la transacción
-            try:
-                conn.commit()
-                logger_db.info(f'Recurso {codigo_recurso} actualizado exitosamente')
-                return True
-            except sqlite3.Error as e:
-                logger_db.error(f'Error al confirmar la transacción: {str(e)}')
-                conn.rollback()
-                return False
-            
+                INSERT INTO habilidades_ciudadano
+                (ciudadano_id, habilidad_id, puntos_experiencia, nivel, fecha_crear, usuario_crear)
+                VALUES (?, ?, ? + ?, ?, ?, ?)
+                ON CONFLICT(ciudadano_id, habilidad_id)
+                DO UPDATE SET
+                    puntos_experiencia = puntos_experiencia + ?,
+                    fecha_modif = excluded.fecha_crear,
+                    usuario_modif = excluded.usuario_crear
+                RETURNING puntos_experiencia
+            ''', (ciudadano_id, codigo_habilidad, HABILIDAD_INICIAL['puntos_experiencia'], puntos,
+                  HABILIDAD_INICIAL['nivel'], datetime.now().isoformat(), usuario, puntos))
+            nivel = obtener_nivel(cursor.fetchone()[0])
+            cursor.execute('''
+                UPDATE habilidades_ciudadano SET nivel = ?
+                WHERE ciudadano_id = ? AND habilidad_id = ?
+            ''', (nivel, ciudadano_id, codigo_habilidad))
+            conn.commit()
+        return nivel
+    except (sqlite3.Error, ValueError) as e:
+        logger_db.error('Error al sumar experiencia de %s al ciudadano %s: %s', codigo_habilidad, ciudadano_id, e)
+        return None
+    finally:
+        invalidar_inventario(ciudadano_id)
+
+def compactar_habilidades_herramientas() -> Optional[int]:
+    """
+    Borra las filas de habilidades_ciudadano y herramientas_ciudadano que solo repiten los
+    valores por defecto (habilidad en HABILIDAD_INICIAL, herramienta que no se tiene).
+    
+    Las creadas al registrar ciudadanos con versiones anteriores no aportan nada.
+    
+    Returns:
+        int: Número de filas borradas, o None en caso de error
+    """
+    try:
+        with get_db_connection() as conn:
+            borradas = conn.execute('''
+                DELETE FROM habilidades_ciudadano
+                WHERE nivel = ? AND puntos_experiencia = ? AND activo = 1
+            ''', (HABILIDAD_INICIAL['nivel'], HABILIDAD_INICIAL['puntos_experiencia'])).rowcount
+            borradas += conn.execute('''
+                DELETE FROM herramientas_ciudadano WHERE NOT tiene AND activo = 1
+            ''').rowcount
     except sqlite3.Error as e:
-        error_msg = f'Error al sumar recurso a ciudadano: {str(e)}'
-        logger_db.error(error_msg, exc_info=True)
-        if 'conn' in locals():
-            conn.rollback()
-        return False
+        logger_db.error(f"Error al compactar habilidades y herramientas: {e}")
+        return None
+    invalidar_inventario()
+    logger_db.info("Filas de habilidades y herramientas por defecto borradas: %d", borradas)
+    return borradas
+
+def _leer_recursos_versionados(cursor, ciudadano_id: int, recurso_ids) -> Dict[int, Tuple[int, Optional[int]]]:
+    """
+    Lee la cantidad (en centésimas, como se guarda) y la versión de varios recursos de un ciudadano.
+    
+    Args:
+        cursor: Cursor de la base de datos
+        ciudadano_id: ID del ciudadano
+        recurso_ids: IDs de los recursos a leer
+        
+    Returns:
+        Diccionario {recurso_id: (cantidad, version)} con los recursos que tiene el ciudadano
+    """
+    recurso_ids = list(recurso_ids)
+    cursor.execute(f'''
+        SELECT recurso_id, cantidad, version
+        FROM recursos_ciudadano
+        WHERE ciudadano_id = ? AND recurso_id IN ({', '.join('?' * len(recurso_ids))})
+    ''', (ciudadano_id, *recurso_ids))
+    return {recurso_id: (cantidad, version) for recurso_id, cantidad, version in cursor.fetchall()}
+
+def _escribir_recursos_versionados(cursor, ciudadano_id: int, cambios: Dict[int, int],
+                                   leidos: Dict[int, Tuple[int, Optional[int]]], usuario_modificar: str) -> None:
+    """
+    Aplica cambios a los recursos de un ciudadano solo si no han cambiado desde que se leyeron
+    (compare-and-swap sobre recursos_ciudadano.version).
+    
+    Args:
+        cursor: Cursor de la transacción en curso
+        ciudadano_id: ID del ciudadano
+        cambios: Diccionario {recurso_id: centésimas a sumar} (negativas para restar)
+        leidos: Resultado de _leer_recursos_versionados para esos recursos
+        usuario_modificar: Usuario que realiza la modificación
+        
+    Raises:
+        ConflictoVersion: Si alguna fila ha cambiado, o se ha creado, desde la lectura
+    """
+    for recurso_id, cantidad in cambios.items():
+        if recurso_id in leidos:
+            actual, version = leidos[recurso_id]
+            cursor.execute('''
+                UPDATE recursos_ciudadano
+                SET cantidad = ?,
+                    version = COALESCE(version, 0) + 1,
+                    fecha_modif = CURRENT_TIMESTAMP,
+                    usuario_modif = ?
+                WHERE ciudadano_id = ? AND recurso_id = ? AND version IS ?
+            ''', (actual + cantidad, usuario_modificar, ciudadano_id, recurso_id, version))
+        else:
+            cursor.execute('''
+                INSERT INTO recursos_ciudadano (ciudadano_id, recurso_id, cantidad, usuario_crear, usuario_modif)
+                VALUES (?, ?, ?, ?, ?)
+                ON CONFLICT(ciudadano_id, recurso_id) DO NOTHING
+            ''', (ciudadano_id, recurso_id, cantidad, usuario_modificar, usuario_modificar))
+        if cursor.rowcount == 0:
+            raise ConflictoVersion(f'El recurso {recurso_id} del ciudadano {ciudadano_id} ha cambiado')
+
+def estadisticas_concurrencia() -> Dict[str, Dict[str, Any]]:
+    """
+    Devuelve cuántas veces se han reintentado las escrituras optimistas.
+    
+    Returns:
+        Diccionario {operacion: {ejecuciones, reintentos, conflictos, bloqueos, agotadas, tasa_reintentos}}
+    """
+    return metricas_contencion.estadisticas()
 
 def mejorar_casa(nombre: str, usuario_modificar: str = None) -> bool:
     """
@@ -669,6 +1006,22 @@ def mejorar_casa(nombre: str, usuario_modificar: str = None) -> bool:
             },
     }
 
+    try:
+        return ejecutar_con_reintentos(
+            lambda: _mejorar_casa(nombre, requisitos_por_nivel, usuario_modificar or 'sistema'),
+            'mejorar_casa')
+    except (sqlite3.Error, ValueError, ConflictoVersion) as e:
+        logger_db.error(f"Error al mejorar la casa de {nombre}: {e}")
+        return False
+
+def _mejorar_casa(nombre: str, requisitos_por_nivel: Dict[int, Dict[str, int]], usuario_modificar: str) -> bool:
+    """
+    Un intento de mejorar_casa: lee ciudadano y recursos sin bloquear y los escribe
+    comprobando sus versiones.
+    
+    Raises:
+        ConflictoVersion: Si el ciudadano o sus recursos han cambiado desde que se leyeron
+    """
     ciudadano = get_ciudadano(nombre)
     if not ciudadano:
         logger_db.error(f"Ciudadano no encontrado: {nombre}")
@@ -676,29 +1029,46 @@ def mejorar_casa(nombre: str, usuario_modificar: str = None) -> bool:
 
     nivel_actual = ciudadano.get('nivel_casa', 0)
     if nivel_actual >= 4:
-        logger_db.info(f"{nombre} ya tiene la casa al nivel máximo")
+        logger_db.info("%s ya tiene la casa al nivel máximo", nombre)
         return False
 
     siguiente_nivel = nivel_actual + 1
     requisitos = requisitos_por_nivel[siguiente_nivel]
+    recursos_por_codigo = obtener_catalogo().recursos_por_codigo
+    cambios = {recursos_por_codigo[campo]['id']: -a_centesimas(requerido) for campo, requerido in requisitos.items()}
 
-    # Verificar recursos suficientes
-    for campo, requerido in requisitos.items():
-        if ciudadano.get(campo, 0) < requerido:
-            logger_db.info(f"{nombre} no tiene suficientes {campo} para mejorar la casa")
-            return False
+    try:
+        with get_db_connection() as conn:
+            cursor = conn.cursor()
 
-    # Construir datos de actualización: restar recursos y aumentar nivel_casa
-    datos_update = {'nivel_casa': siguiente_nivel}
-    for campo, requerido in requisitos.items():
-        datos_update[campo] = ciudadano[campo] - requerido
+            # Verificar recursos suficientes (los recursos están en recursos_ciudadano)
+            leidos = _leer_recursos_versionados(cursor, ciudadano['id'], cambios)
+            for campo, requerido in requisitos.items():
+                if leidos.get(recursos_por_codigo[campo]['id'], (0, None))[0] < a_centesimas(requerido):
+                    logger_db.info("%s no tiene suficientes %s para mejorar la casa", nombre, campo)
+                    return False
 
-    if actualizar_ciudadano(nombre, datos_update, usuario_modificar):
-        registrar_accion('MEJORAR_CASA', f"Casa mejorada a nivel {siguiente_nivel}", ciudadano_id=ciudadano['id'])
-        logger_db.info(f"{nombre} ha mejorado su casa a nivel {siguiente_nivel}")
-        return True
-    else:
-        return False
+            # Restar recursos y aumentar nivel_casa en una sola transacción, si nada ha cambiado
+            cursor.execute('BEGIN IMMEDIATE')
+            cursor.execute('''
+                UPDATE ciudadanos
+                SET nivel_casa = ?,
+                    version = COALESCE(version, 0) + 1,
+                    fecha_modif = CURRENT_TIMESTAMP,
+                    usuario_modif = ?
+                WHERE id = ? AND version IS ?
+            ''', (siguiente_nivel, usuario_modificar, ciudadano['id'], ciudadano['version']))
+            if cursor.rowcount == 0:
+                raise ConflictoVersion(f'El ciudadano {nombre} ha cambiado')
+            _escribir_recursos_versionados(cursor, ciudadano['id'], cambios, leidos, usuario_modificar)
+            _registrar_evento(cursor, 'MEJORAR_CASA', ciudadano['id'], siguiente_nivel,
+                              {campo: -requerido for campo, requerido in requisitos.items()})
+            conn.commit()
+    finally:
+        invalidar_inventario(ciudadano['id'])
+
+    logger_db.info("%s ha mejorado su casa a nivel %s", nombre, siguiente_nivel)
+    return True
 
 def eliminar_ciudadano(nombre: str, usuario_borrar: str = None) -> bool:
     """
@@ -716,8 +1086,7 @@ def eliminar_ciudadano(nombre: str, usuario_borrar: str = None) -> bool:
             cursor = conn.cursor()
             
             # Verificar si el ciudadano existe
-            cursor.execute('SELECT id FROM ciudadanos WHERE nombre = ?', (nombre,))
-            ciudadano = cursor.fetchone()
+            ciudadano = resolver_ciudadano(nombre, cursor)
             if not ciudadano:
                 logger_db.error(f"Error al desactivar ciudadano {nombre}: ciudadano no encontrado")
                 return False
@@ -737,10 +1106,11 @@ def eliminar_ciudadano(nombre: str, usuario_borrar: str = None) -> bool:
                     usuario_borrar = ?,
                     fecha_modif = ?,
                     usuario_modif = ?
-                WHERE nombre = ?
-            ''', (fecha_actual, usuario_borrar, fecha_actual, usuario_borrar, nombre))
+                WHERE id = ?
+            ''', (fecha_actual, usuario_borrar, fecha_actual, usuario_borrar, ciudadano['id']))
             
             conn.commit()
+            invalidar_ciudadano(nombre)
             logger_db.info(f"Ciudadano desactivado: {nombre}")
             return True
             
@@ -748,14 +1118,80 @@ def eliminar_ciudadano(nombre: str, usuario_borrar: str = None) -> bool:
         logger_db.error(f"Error al desactivar ciudadano {nombre}: {e}")
         return False
 
-def registrar_accion(codigo_accion: str, mensaje_final: str, ciudadano_id: int = None) -> bool:
+def _registrar_evento(cursor, codigo_accion: str, ciudadano_id: int = None, resultado: int = None,
+                      recursos: Dict[str, float] = None, accion_id: int = None) -> Dict[str, Any]:
     """
-    Registra una nueva acción en el historial.
+    Inserta un evento en eventos_acciones y actualiza el resumen diario en la misma transacción.
+    
+    El resumen (resumen_acciones_diario) permite consultar estadísticas sin recorrer los
+    eventos, que se archivan periódicamente con DB_HISTORIAL.archivar_historial.
+    
+    Args:
+        cursor: Cursor de la transacción en curso
+        codigo_accion: Código de la acción realizada (de la tabla acciones o de ACCIONES_SISTEMA)
+        ciudadano_id: ID del ciudadano asociado (opcional)
+        resultado: Índice en RESULTADOS o nivel alcanzado para MEJORAR_CASA (opcional)
+        recursos: Diccionario {codigo_recurso: cantidad} ganada o gastada (opcional)
+        accion_id: ID de la acción si ya se conoce (opcional)
+        
+    Returns:
+        Diccionario con los datos del evento registrado
+        
+    Raises:
+        ValueError: Si la acción o alguno de los recursos no existe
+    """
+    recursos = recursos or {}
+    catalogo = obtener_catalogo()
+    if (accion_id is None and codigo_accion not in ACCIONES_SISTEMA
+            and codigo_accion not in catalogo.acciones_por_codigo) \
+            or not set(recursos) <= set(catalogo.recursos_por_codigo):
+        # Puede que el catálogo haya cambiado hace menos de INTERVALO_COMPROBACION segundos
+        catalogo = obtener_catalogo(forzar=True)
+    
+    if accion_id is None:
+        accion_id = ACCIONES_SISTEMA.get(codigo_accion)
+    if accion_id is None:
+        accion = catalogo.acciones_por_codigo.get(codigo_accion)
+        if not accion:
+            raise ValueError(f'Acción no encontrada: {codigo_accion}')
+        accion_id = accion['id']
+    
+    ids_recursos = {codigo: catalogo.recursos_por_codigo[codigo]['id']
+                    for codigo in recursos if codigo in catalogo.recursos_por_codigo}
+    faltan = set(recursos) - set(ids_recursos)
+    if faltan:
+        raise ValueError(f'Recursos no encontrados: {", ".join(sorted(faltan))}')
+    
+    evento = {
+        'ciudadano_id': ciudadano_id or 0,
+        'accion_id': accion_id,
+        'resultado': resultado,
+        'recursos': codificar_recursos({ids_recursos[codigo]: cantidad for codigo, cantidad in recursos.items()}),
+        'ts': int(time.time())
+    }
+    cursor.execute('''
+        INSERT INTO eventos_acciones (ciudadano_id, accion_id, resultado, recursos, ts)
+        VALUES (:ciudadano_id, :accion_id, :resultado, :recursos, :ts)
+    ''', evento)
+    evento['id'] = cursor.lastrowid
+    cursor.execute('''
+        INSERT INTO resumen_acciones_diario (ciudadano_id, accion_id, fecha, total)
+        VALUES (?, ?, date(?, 'unixepoch'), 1)
+        ON CONFLICT(ciudadano_id, accion_id, fecha)
+        DO UPDATE SET total = total + 1
+    ''', (evento['ciudadano_id'], accion_id, evento['ts']))
+    return evento
+
+def registrar_accion(codigo_accion: str, ciudadano_id: int = None, resultado: int = None,
+                     recursos: Dict[str, float] = None) -> bool:
+    """
+    Registra una nueva acción en el historial de eventos.
     
     Args:
         codigo_accion: Código de la acción realizada
-        mensaje_final: Mensaje final devuelto
         ciudadano_id: ID del ciudadano asociado (opcional)
+        resultado: Índice en RESULTADOS o nivel alcanzado para MEJORAR_CASA (opcional)
+        recursos: Diccionario {codigo_recurso: cantidad} ganada o gastada (opcional)
         
     Returns:
         True si se registró exitosamente, False en caso de error
@@ -763,23 +1199,52 @@ def registrar_accion(codigo_accion: str, mensaje_final: str, ciudadano_id: int =
     try:
         with get_db_connection() as conn:
             cursor = conn.cursor()
-            logger_db.info(f"Registrando acción: {codigo_accion}")
+            logger_db.info("Registrando acción: %s", codigo_accion)
             
-            cursor.execute('''
-                INSERT INTO historial_acciones 
-                (codigo_accion, mensaje_final, ciudadano_id)
-                VALUES (?, ?, ?)
-            ''', (codigo_accion, mensaje_final, ciudadano_id))
+            _registrar_evento(cursor, codigo_accion, ciudadano_id, resultado, recursos)
             
             conn.commit()
-            logger_db.info(f"Acción registrada exitosamente: {codigo_accion}")
+            logger_db.info("Acción registrada exitosamente: %s", codigo_accion)
             return True
-    except sqlite3.Error as e:
+    except (sqlite3.Error, ValueError) as e:
         logger_db.error(f"Error al registrar acción: {e}")
         logger_db.error(f"Detalles: codigo_accion={codigo_accion}, ciudadano_id={ciudadano_id}")
-        logger_db.error(f"Mensaje: {mensaje_final}")
+        logger_db.error(f"Recursos: {recursos}")
         return False
 
+def registrar_accion_con_recursos(codigo_accion: str, ciudadano_id: int, resultado: int,
+                                  recursos: Dict[str, float], usuario_modificar: str = None) -> bool:
+    """
+    Suma los recursos obtenidos en una acción y la registra en el historial en una sola transacción.
+    
+    Si falla cualquiera de las dos escrituras no se aplica ninguna, así el inventario y el
+    historial no quedan desparejados.
+    
+    Args:
+        codigo_accion: Código de la acción realizada
+        ciudadano_id: ID del ciudadano
+        resultado: Índice en RESULTADOS
+        recursos: Diccionario {codigo_recurso: cantidad} ganada o gastada
+        usuario_modificar: Usuario que realiza la modificación (opcional)
+        
+    Returns:
+        bool: True si se aplicaron las dos escrituras, False si no se aplicó ninguna
+    """
+    try:
+        with get_db_connection() as conn:
+            cursor = conn.cursor()
+            cursor.execute('BEGIN IMMEDIATE')
+            _sumar_recursos(cursor, ciudadano_id, recursos, usuario_modificar or 'sistema')
+            _registrar_evento(cursor, codigo_accion, ciudadano_id, resultado, recursos)
+            conn.commit()
+        return True
+    except (sqlite3.Error, ValueError) as e:
+        logger_db.error('Error al registrar la acción %s del ciudadano %s con recursos %s: %s',
+                        codigo_accion, ciudadano_id, recursos, e)
+        return False
+    finally:
+        invalidar_inventario(ciudadano_id)
+
 def mostrar_historial_acciones(fecha_inicio: str = None, fecha_fin: str = None, 
                              codigo_accion: str = None, ciudadano_id: int = None):
     """
@@ -801,7 +1266,8 @@ def mostrar_historial_acciones(fecha_inicio: str = None, fecha_fin: str = None,
         print("-" * 50)
 
 def listar_historial_acciones(fecha_inicio: str = None, fecha_fin: str = None, 
-                             codigo_accion: str = None, ciudadano_id: int = None) -> list:
+                             codigo_accion: str = None, ciudadano_id: int = None,
+                             conexion: sqlite3.Connection = None, catalogo: Catalogo = None) -> list:
     """
     Lista las acciones del historial según los filtros proporcionados.
     
@@ -810,30 +1276,54 @@ def listar_historial_acciones(fecha_inicio: str = None, fecha_fin: str = None,
         fecha_fin: Fecha final para filtrar (opcional)
         codigo_accion: Código de acción específico para filtrar (opcional)
         ciudadano_id: ID del ciudadano para filtrar (opcional)
+        conexion: Conexión de lectura a usar, como las de DB_LECTURA.LectorBD (por defecto
+                  una nueva a DB_PATH)
+        catalogo: Catálogo de la misma base de datos que conexion (por defecto obtener_catalogo())
         
     Returns:
         Lista de diccionarios con la información de las acciones.
     """
     try:
-        with get_db_connection() as conn:
+        with conexion or get_db_connection() as conn:
             cursor = conn.cursor()
             logger_db.info("Listando historial de acciones") 
             limite = 10
+            consulta = '''
+                SELECT e.id, e.ciudadano_id, e.accion_id, e.resultado, e.recursos, e.ts, c.nombre
+                FROM eventos_acciones e
+                LEFT JOIN ciudadanos c ON c.id = e.ciudadano_id
+            '''
             if ciudadano_id:
-                cursor.execute('''
-                    SELECT * FROM historial_acciones 
-                    WHERE ciudadano_id = ? 
-                    ORDER BY fecha_hora DESC 
+                cursor.execute(consulta + '''
+                    WHERE e.ciudadano_id = ? 
+                    ORDER BY e.id DESC 
                     LIMIT ?
                 ''', (ciudadano_id, limite))
             else:
-                cursor.execute('''
-                    SELECT * FROM historial_acciones 
-                    ORDER BY fecha_hora DESC 
+                cursor.execute(consulta + '''
+                    ORDER BY e.id DESC 
                     LIMIT ?
                 ''', (limite,))
-            
-            acciones = [dict(row) for row in cursor.fetchall()]
+            eventos = cursor.fetchall()
+            
+            catalogo = catalogo or obtener_catalogo()
+            acciones_sistema = {accion_id: codigo for codigo, accion_id in ACCIONES_SISTEMA.items()}
+            
+            acciones = []
+            for evento in eventos:
+                accion = catalogo.acciones.get(evento['accion_id'])
+                codigo_accion = accion['codigo'] if accion else acciones_sistema.get(evento['accion_id'], str(evento['accion_id']))
+                recursos = {catalogo.recursos[recurso_id]['codigo'] if recurso_id in catalogo.recursos else str(recurso_id): cantidad
+                            for recurso_id, cantidad in decodificar_recursos(evento['recursos']).items()}
+                acciones.append({
+                    'id': evento['id'],
+                    'codigo_accion': codigo_accion,
+                    'mensaje_final': renderizar_evento(evento['nombre'] or '', codigo_accion, evento['resultado'], recursos),
+                    'fecha_hora': time.strftime('%Y-%m-%d %H:%M:%S', time.localtime(evento['ts'])),
+                    'ciudadano_id': evento['ciudadano_id'],
+                    'resultado': evento['resultado'],
+                    'recursos': recursos
+                })
             logger_db.info("Se encontraron %d acciones en el historial", len(acciones))
             return acciones
             
@@ -862,29 +1352,30 @@ def realizar_accion(nombre_ciudadano: str, codigo_accion: str, usuario_modificar
             conn.row_factory = sqlite3.Row
             cursor = conn.cursor()
             
-            # Iniciar transacción
-            cursor.execute('BEGIN TRANSACTION')
+            # Las lecturas se hacen sin transacción; el bloqueo de escritura solo se toma
+            # para sumar los recursos y registrar la acción
             
             # 1. Obtener ID del ciudadano y verificar energía
+            # Sin fila de energía el ciudadano tiene 0, y sin fila de herramienta no la tiene
             cursor.execute('''
-                SELECT c.id, cr.cantidad as energia ,c.fecha_pozo, hc.tiene, a.id as accion_id
+                SELECT c.id, COALESCE(cr.cantidad, 0) as energia, c.fecha_pozo,
+                       COALESCE(hc.tiene, 0) as tiene, a.id as accion_id
                 FROM ciudadanos c
-                join recursos_ciudadano cr on c.id = cr.ciudadano_id
-                join recursos r on cr.recurso_id = r.id
                 join acciones a on a.codigo = ?
-                join herramientas_ciudadano hc on c.id = hc.ciudadano_id 
-                AND a.herramienta_id = hc.herramienta_id
+                left join recursos_ciudadano cr on c.id = cr.ciudadano_id
+                AND cr.recurso_id = (SELECT id FROM recursos WHERE codigo = 'energia')
+                left join herramientas_ciudadano hc on c.id = hc.ciudadano_id 
+                AND a.herramienta_id = hc.herramienta_id AND hc.activo = 1
                 WHERE c.nombre = ? 
                 AND c.borrado_logico = 0
-                AND r.codigo = 'energia'
-                
-            ''', (codigo_accion, nombre_ciudadano))
+            ''', (codigo_accion, normalizar_nombre(nombre_ciudadano)))
             
             ciudadano = cursor.fetchone()
             if not ciudadano:
                 return {'exito': False, 'mensaje': 'Ciudadano ' + nombre_ciudadano + ' no encontrado o inactivo'}
                 
-            if ciudadano['energia'] < 1:
+            energia = desde_centesimas(ciudadano['energia'])
+            if energia < 1:
                 return {'exito': False, 'mensaje': 'No tienes suficiente energía para realizar esta acción'}
             
             ciudadano_id = ciudadano['id']
@@ -895,13 +1386,10 @@ def realizar_accion(nombre_ciudadano: str, codigo_accion: str, usuario_modificar
             suerte = random.random() 
             if suerte < 0.3:
                 resultado_suerte = 'exito'
-                mensaje_suerte = '¡Qué bien!'
             elif suerte < 0.7:
                 resultado_suerte = 'normal'
-                mensaje_suerte = '¡No está mal!'
             else:
                 resultado_suerte = 'fracaso'
-                mensaje_suerte = '¡Podría ser mejor!'
 
             # 3. Obtener los recursos asociados a la acción
             cursor.execute('''
@@ -918,7 +1406,6 @@ def realizar_accion(nombre_ciudadano: str, codigo_accion: str, usuario_modificar
                         
             # 5. Calcular recursos obtenidos
             recursos_obtenidos = {}
-            mensaje = []
             
             for recurso in recursos_accion:
                 codigo = recurso['codigo']
@@ -956,46 +1443,25 @@ def realizar_accion(nombre_ciudadano: str, codigo_accion: str, usuario_modificar
                         cantidad_redondeada = int(cantidad_redondeada)
                     
                     recursos_obtenidos[codigo] = recursos_obtenidos.get(codigo, 0) + cantidad_redondeada
-                    mensaje.append(f"{cantidad_redondeada} {codigo}")
             
             # 6. Actualizar recursos del ciudadano
-            for codigo, cantidad in recursos_obtenidos.items():
-                cursor.execute('''
-                    UPDATE recursos_ciudadano 
-                    SET cantidad = cantidad + ?,
-                        fecha_modif = CURRENT_TIMESTAMP,
-                        usuario_modif = ?
-                    WHERE ciudadano_id = ? 
-                    AND recurso_id = (SELECT id FROM recursos WHERE codigo = ?)
-                ''', (cantidad, usuario_modificar, ciudadano_id, codigo))
-                
-                if cursor.rowcount == 0:
-                    # Si no existe el recurso, crearlo
-                    cursor.execute('''
-                        INSERT INTO recursos_ciudadano 
-                        (ciudadano_id, recurso_id, cantidad, fecha_crear, usuario_crear)
-                        SELECT ?, r.id, ?, CURRENT_TIMESTAMP, ?
-                        FROM recursos r
-                        WHERE r.codigo = ?
-                    ''', (ciudadano_id, cantidad, usuario_modificar, codigo))
+            cursor.execute('BEGIN IMMEDIATE')
+            _sumar_recursos(cursor, ciudadano_id, recursos_obtenidos, usuario_modificar)
             
             # 8. Registrar la acción en el historial
-            mensaje_final = f"{nombre_ciudadano} realizó {codigo_accion} y obtuvo: {', '.join(mensaje) if mensaje else 'nada'}"
-            mensaje_final += f"\n{mensaje_suerte}"
-            cursor.execute('''
-                INSERT INTO historial_acciones 
-                (ciudadano_id, codigo_accion, mensaje_final, fecha_hora)
-                VALUES (?, ?, ?, CURRENT_TIMESTAMP)
-            ''', (ciudadano_id, codigo_accion, mensaje_final))
+            resultado = RESULTADOS.index(resultado_suerte)
+            _registrar_evento(cursor, codigo_accion, ciudadano_id, resultado, recursos_obtenidos, accion_id)
+            mensaje_final = renderizar_evento(nombre_ciudadano, codigo_accion, resultado, recursos_obtenidos)
             
             # Confirmar transacción
             conn.commit()
+            invalidar_inventario(ciudadano_id)
             
             return {
                 'exito': True,
                 'mensaje': mensaje_final,
                 'recursos_obtenidos': recursos_obtenidos,
-                'energia_restante': ciudadano['energia'] - 1
+                'energia_restante': energia - 1
             }
             
     except Exception as e:
@@ -0,0 +1,286 @@
+"""
+Módulo que gestiona la retención del historial de acciones.
+
+Mantiene en eventos_acciones (y en la tabla heredada historial_acciones) solo las filas
+recientes y mueve las antiguas, por lotes, a las tablas *_archivo (en la misma base de datos
+o en una base de datos de archivo adjunta). Las estadísticas se consultan sobre
+resumen_acciones_diario, que se actualiza en el mismo momento en que se registra cada acción.
+
+Este módulo puede ejecutarse directamente para archivar el historial antiguo o para
+recalcular el resumen diario (incluyendo la base de datos de archivo si se indica):
+    python DB_HISTORIAL.py [dias_retencion] [ruta_archivo]
+    python DB_HISTORIAL.py reconstruir [ruta_archivo]
+"""
+import sqlite3
+import logging
+import sys
+from typing import Dict, Any, Optional, List
+
+from DB_DML_FUNCIONES import get_db_connection
+from eventos import ACCIONES_SISTEMA, ALIAS_ACCIONES
+
+# Configuración del logger
+logger_db = logging.getLogger('database')
+
+# Configuración de la retención
+DIAS_RETENCION = 30
+TAMANO_LOTE = 500
+
+# Tablas archivables: columnas y condición de antigüedad (el parámetro es '-N days')
+TABLAS_ARCHIVABLES = {
+    'eventos_acciones': (
+        'id, ciudadano_id, accion_id, resultado, recursos, ts',
+        "ts < CAST(strftime('%s', 'now', ?) AS INTEGER)"
+    ),
+    'historial_acciones': (
+        'id, codigo_accion, mensaje_final, fecha_hora, ciudadano_id',
+        "fecha_hora < datetime('now', ?)"
+    ),
+}
+
+def crear_tablas_archivo(cursor, esquema: str = 'main') -> None:
+    """
+    Crea las tablas de archivo en el esquema indicado si no existen.
+
+    Args:
+        cursor: Cursor de la base de datos
+        esquema: Esquema donde crear las tablas ('main' o el alias de una base de datos adjunta)
+    """
+    cursor.execute(f'''
+        CREATE TABLE IF NOT EXISTS {esquema}.eventos_acciones_archivo (
+            id INTEGER PRIMARY KEY,
+            ciudadano_id INTEGER NOT NULL DEFAULT 0,
+            accion_id INTEGER NOT NULL,
+            resultado INTEGER,
+            recursos TEXT,
+            ts INTEGER NOT NULL
+        )
+    ''')
+    cursor.execute(f'''
+        CREATE TABLE IF NOT EXISTS {esquema}.historial_acciones_archivo (
+            id INTEGER PRIMARY KEY,
+            codigo_accion TEXT NOT NULL,
+            mensaje_final TEXT NOT NULL,
+            fecha_hora DATETIME,
+            ciudadano_id INTEGER
+        )
+    ''')
+
+def _archivar_tabla(conn, tabla: str, esquema: str, limite: str, tamano_lote: int) -> int:
+    """
+    Mueve por lotes las filas antiguas de una tabla a su tabla de archivo.
+
+    Args:
+        conn: Conexión a la base de datos
+        tabla: Nombre de la tabla (clave de TABLAS_ARCHIVABLES)
+        esquema: Esquema de la tabla de archivo
+        limite: Modificador de fecha de SQLite, por ejemplo '-30 days'
+        tamano_lote: Número máximo de filas movidas por transacción
+
+    Returns:
+        int: Número de filas archivadas
+    """
+    columnas, condicion = TABLAS_ARCHIVABLES[tabla]
+    cursor = conn.cursor()
+    total = 0
+    while True:
+        cursor.execute('BEGIN IMMEDIATE')
+        cursor.execute(f'''
+            SELECT MIN(id), MAX(id), COUNT(*) FROM (
+                SELECT id FROM {tabla}
+                WHERE {condicion}
+                ORDER BY id
+                LIMIT ?
+            )
+        ''', (limite, tamano_lote))
+        id_min, id_max, cantidad = cursor.fetchone()
+        if not cantidad:
+            conn.rollback()
+            return total
+
+        cursor.execute(f'''
+            INSERT OR IGNORE INTO {esquema}.{tabla}_archivo ({columnas})
+            SELECT {columnas} FROM {tabla}
+            WHERE id BETWEEN ? AND ? AND {condicion}
+        ''', (id_min, id_max, limite))
+        cursor.execute(f'''
+            DELETE FROM {tabla}
+            WHERE id BETWEEN ? AND ? AND {condicion}
+        ''', (id_min, id_max, limite))
+        conn.commit()
+        total += cantidad
+
+def archivar_historial(dias_retencion: int = DIAS_RETENCION, tamano_lote: int = TAMANO_LOTE,
+                       ruta_archivo: Optional[str] = None) -> int:
+    """
+    Mueve los eventos y el historial heredado más antiguos que dias_retencion a las tablas de archivo.
+
+    Cada lote se mueve en su propia transacción para no bloquear a los escritores durante
+    mucho tiempo.
+
+    Args:
+        dias_retencion: Días de historial que se mantienen en las tablas activas
+        tamano_lote: Número máximo de filas movidas por transacción
+        ruta_archivo: Ruta de una base de datos de archivo a adjuntar (opcional).
+                      Si es None, se usan las tablas de archivo de la base de datos principal.
+
+    Returns:
+        int: Número total de filas archivadas, -1 en caso de error
+    """
+    esquema = 'archivo' if ruta_archivo else 'main'
+    limite = f'-{int(dias_retencion)} days'
+    try:
+        with get_db_connection() as conn:
+            cursor = conn.cursor()
+            if ruta_archivo:
+                cursor.execute('ATTACH DATABASE ? AS archivo', (ruta_archivo,))
+            crear_tablas_archivo(cursor, esquema)
+            conn.commit()
+
+            total = 0
+            for tabla in TABLAS_ARCHIVABLES:
+                total += _archivar_tabla(conn, tabla, esquema, limite, tamano_lote)
+
+            if ruta_archivo:
+                cursor.execute('DETACH DATABASE archivo')
+
+        logger_db.info("Historial archivado: %d filas movidas a %s", total, ruta_archivo or 'tablas *_archivo')
+        return total
+
+    except sqlite3.Error as e:
+        logger_db.error(f"Error al archivar historial de acciones: {e}")
+        return -1
+
+def reconstruir_resumen_diario(ruta_archivo: Optional[str] = None) -> bool:
+    """
+    Recalcula resumen_acciones_diario a partir de los eventos y del historial heredado,
+    tanto activos como archivados.
+
+    Solo es necesario una vez, para incorporar las filas registradas antes de que existiera
+    el resumen, o si el resumen se ha perdido. Los códigos heredados se traducen con
+    ALIAS_ACCIONES; las filas cuyo código no existe en la tabla acciones ni en
+    ACCIONES_SISTEMA no se cuentan.
+
+    Args:
+        ruta_archivo: Ruta de la base de datos de archivo usada con archivar_historial (opcional).
+                      Sus tablas se cuentan además de las tablas de archivo de la principal.
+
+    Returns:
+        bool: True si se reconstruyó correctamente, False en caso contrario
+    """
+    esquemas = ['main', 'archivo'] if ruta_archivo else ['main']
+    eventos = ' UNION ALL '.join(
+        f"SELECT ciudadano_id, accion_id, date(ts, 'unixepoch') FROM {esquema}.eventos_acciones_archivo"
+        for esquema in esquemas)
+    historial = ' UNION ALL '.join(
+        f"SELECT ciudadano_id, codigo_accion, fecha_hora FROM {esquema}.historial_acciones_archivo"
+        for esquema in esquemas)
+    try:
+        with get_db_connection() as conn:
+            cursor = conn.cursor()
+            if ruta_archivo:
+                cursor.execute('ATTACH DATABASE ? AS archivo', (ruta_archivo,))
+                crear_tablas_archivo(cursor, 'archivo')
+                conn.commit()
+            cursor.execute('BEGIN IMMEDIATE')
+            cursor.execute('DELETE FROM resumen_acciones_diario')
+            alias = ' '.join(f"WHEN '{antiguo}' THEN '{codigo}'" for antiguo, codigo in ALIAS_ACCIONES.items())
+            sistema = ' '.join(f"WHEN '{codigo}' THEN {accion_id}" for codigo, accion_id in ACCIONES_SISTEMA.items())
+            cursor.execute(f'''
+                INSERT INTO resumen_acciones_diario (ciudadano_id, accion_id, fecha, total)
+                SELECT ciudadano_id, accion_id, fecha, COUNT(*)
+                FROM (
+                    SELECT ciudadano_id, accion_id, date(ts, 'unixepoch') AS fecha FROM eventos_acciones
+                    UNION ALL
+                    {eventos}
+                    UNION ALL
+                    SELECT COALESCE(h.ciudadano_id, 0),
+                           COALESCE(a.id, CASE h.codigo {sistema} END),
+                           date(h.fecha_hora)
+                    FROM (
+                        SELECT ciudadano_id, CASE codigo_accion {alias} ELSE codigo_accion END AS codigo, fecha_hora
+                        FROM (
+                            SELECT ciudadano_id, codigo_accion, fecha_hora FROM historial_acciones
+                            UNION ALL
+                            {historial}
+                        )
+                    ) h
+                    LEFT JOIN acciones a ON a.codigo = h.codigo
+                )
+                WHERE accion_id IS NOT NULL
+                GROUP BY ciudadano_id, accion_id, fecha
+            ''')
+            conn.commit()
+            if ruta_archivo:
+                cursor.execute('DETACH DATABASE archivo')
+            logger_db.info("Resumen diario reconstruido")
+            return True
+    except sqlite3.Error as e:
+        logger_db.error(f"Error al reconstruir resumen diario: {e}")
+        return False
+
+def obtener_resumen_acciones(ciudadano_id: int = None, fecha_inicio: str = None,
+                             fecha_fin: str = None) -> List[Dict[str, Any]]:
+    """
+    Obtiene el número de acciones por ciudadano y acción desde el resumen diario.
+
+    Args:
+        ciudadano_id: ID del ciudadano para filtrar (opcional)
+        fecha_inicio: Fecha inicial incluida, formato YYYY-MM-DD (opcional)
+        fecha_fin: Fecha final incluida, formato YYYY-MM-DD (opcional)
+
+    Returns:
+        Lista de diccionarios con ciudadano_id, accion_id, codigo_accion y total
+    """
+    condiciones = []
+    valores = []
+    if ciudadano_id is not None:
+        condiciones.append('r.ciudadano_id = ?')
+        valores.append(ciudadano_id)
+    if fecha_inicio:
+        condiciones.append('r.fecha >= ?')
+        valores.append(fecha_inicio)
+    if fecha_fin:
+        condiciones.append('r.fecha <= ?')
+        valores.append(fecha_fin)
+    where = f"WHERE {' AND '.join(condiciones)}" if condiciones else ''
+
+    try:
+        with get_db_connection() as conn:
+            cursor = conn.cursor()
+            cursor.execute(f'''
+                SELECT r.ciudadano_id, r.accion_id, a.codigo AS codigo_accion, SUM(r.total) AS total
+                FROM resumen_acciones_diario r
+                LEFT JOIN acciones a ON a.id = r.accion_id
+                {where}
+                GROUP BY r.ciudadano_id, r.accion_id
+                ORDER BY total DESC
+            ''', tuple(valores))
+            acciones_sistema = {accion_id: codigo for codigo, accion_id in ACCIONES_SISTEMA.items()}
+            resumen = []
+            for row in cursor.fetchall():
+                fila = dict(row)
+                fila['codigo_accion'] = fila['codigo_accion'] or acciones_sistema.get(fila['accion_id'])
+                resumen.append(fila)
+            return resumen
+    except sqlite3.Error as e:
+        logger_db.error(f"Error al obtener resumen de acciones: {e}")
+        return []
+
+if __name__ == "__main__":
+    # Configurar logging para la ejecución directa
+    logging.basicConfig(
+        level=logging.INFO,
+        format='%(asctime)s - %(name)s - %(levelname)s - %(message)s',
+        handlers=[
+            logging.StreamHandler()
+        ]
+    )
+
+    if len(sys.argv) > 1 and sys.argv[1] == 'reconstruir':
+        ruta = sys.argv[2] if len(sys.argv) > 2 else None
+        sys.exit(0 if reconstruir_resumen_diario(ruta) else 1)
+
+    dias = int(sys.argv[1]) if len(sys.argv) > 1 else DIAS_RETENCION
+    ruta = sys.argv[2] if len(sys.argv) > 2 else None
+    sys.exit(0 if archivar_historial(dias, ruta_archivo=ruta) >= 0 else 1)
@@ -0,0 +1,270 @@
+"""
+Módulo que da a la web conexiones de solo lectura que no compiten con el bot.
+
+Durante los directos el bot escribe en soloville.db con cada canje; si el panel web lee del
+mismo archivo, las páginas pesadas retrasan esos commits. LectorBD ofrece tres modos
+(variable de entorno SOLOVILLE_MODO_LECTURA):
+
+    primaria     Lee de la base de datos principal, como siempre (por defecto)
+    instantanea  Lee de una copia (RUTA_INSTANTANEA) que se rehace con la API de backup
+                 cada INTERVALO_INSTANTANEA segundos, en un hilo aparte (LectorBD.iniciar)
+                 o, sin él, al pedir una conexión cuando ha caducado
+    solo_lectura Abre la base de datos principal con mode=ro. Solo evita bloquear a los
+                 escritores si la base de datos está en modo WAL (python DB_LECTURA.py wal)
+
+Las escrituras siguen yendo siempre a la base de datos principal (DB_DML_FUNCIONES). El
+catálogo que se lee con el lector (LectorBD.catalogo) se guarda aparte del de DB_DML_FUNCIONES.
+"""
+import logging
+import os
+import sqlite3
+import sys
+import threading
+import time
+from datetime import datetime
+from typing import Any, Dict, Optional
+from urllib.parse import quote
+
+import DB_DML_FUNCIONES
+from DB_BACKUP import copiar_bd
+from DB_CATALOGO import CacheCatalogo, Catalogo
+
+# Configuración del logger
+logger_db = logging.getLogger('database')
+
+# Configuración de la lectura
+MODOS_LECTURA = ('primaria', 'instantanea', 'solo_lectura')
+MODO_LECTURA = os.getenv('SOLOVILLE_MODO_LECTURA', 'primaria')
+RUTA_INSTANTANEA = 'soloville_lectura.db'
+INTERVALO_INSTANTANEA = 5.0
+
+def _uri_solo_lectura(ruta: str) -> str:
+    """URI para abrir una base de datos en modo solo lectura."""
+    return f"file:{quote(os.path.abspath(ruta))}?mode=ro"
+
+def activar_wal(ruta: str = None) -> str:
+    """
+    Pone la base de datos en modo WAL, en el que los lectores no bloquean a los escritores.
+
+    El modo se guarda en el archivo, así que basta con hacerlo una vez.
+
+    Args:
+        ruta: Base de datos (por defecto, DB_DML_FUNCIONES.DB_PATH)
+
+    Returns:
+        str: Modo de journal resultante ('wal' si se ha podido cambiar)
+    """
+    conn = sqlite3.connect(ruta or DB_DML_FUNCIONES.DB_PATH)
+    try:
+        return conn.execute('PRAGMA journal_mode = WAL').fetchone()[0]
+    finally:
+        conn.close()
+
+class LectorBD:
+    """
+    Da conexiones de lectura según el modo configurado y lleva las métricas de la instantánea.
+    """
+
+    def __init__(self, modo: str = None, ruta_primaria: str = None,
+                 ruta_instantanea: str = RUTA_INSTANTANEA, intervalo: float = INTERVALO_INSTANTANEA):
+        self.modo = modo or MODO_LECTURA
+        if self.modo not in MODOS_LECTURA:
+            raise ValueError(f"Modo de lectura desconocido: {self.modo} (válidos: {', '.join(MODOS_LECTURA)})")
+        self._ruta_primaria = ruta_primaria
+        self.ruta_instantanea = ruta_instantanea
+        self.intervalo = intervalo
+        self._lock = threading.Lock()
+        # Momento (time.time) en que empezó la copia de la instantánea actual
+        self.instante_instantanea: Optional[float] = None
+        self.duracion_actualizacion: Optional[float] = None
+        self.actualizaciones = 0
+        self.fallos = 0
+        # Hilo que rehace la instantánea (iniciar) y evento para pararlo
+        self._hilo: Optional[threading.Thread] = None
+        self._parar = threading.Event()
+        self._cache_catalogo = CacheCatalogo()
+
+    @property
+    def ruta_primaria(self) -> str:
+        # Por defecto se sigue a DB_DML_FUNCIONES.DB_PATH aunque cambie después de crear el lector
+        return self._ruta_primaria or DB_DML_FUNCIONES.DB_PATH
+
+    def actualizar(self) -> bool:
+        """
+        Rehace la instantánea copiando la base de datos principal.
+
+        La copia se escribe en un archivo temporal y se renombra, así que las conexiones ya
+        abiertas siguen leyendo la instantánea anterior.
+
+        Returns:
+            bool: True si se ha actualizado
+        """
+        inicio = time.time()
+        temporal = f"{self.ruta_instantanea}.{os.getpid()}.{threading.get_ident()}.tmp"
+        try:
+            copiar_bd(self.ruta_primaria, temporal)
+            # La copia hereda el modo WAL de la principal; la instantánea no lo necesita
+            conn = sqlite3.connect(temporal)
+            try:
+                conn.execute('PRAGMA journal_mode = DELETE')
+            finally:
+                conn.close()
+            os.replace(temporal, self.ruta_instantanea)
+        except (sqlite3.Error, OSError) as e:
+            self.fallos += 1
+            logger_db.error("Error al actualizar la instantánea de lectura: %s", e)
+            if os.path.exists(temporal):
+                os.remove(temporal)
+            return False
+        self.instante_instantanea = inicio
+        self.duracion_actualizacion = time.time() - inicio
+        self.actualizaciones += 1
+        logger_db.debug("Instantánea de lectura actualizada en %.3f s", self.duracion_actualizacion)
+        return True
+
+    def iniciar(self) -> bool:
+        """
+        Empieza a rehacer la instantánea cada intervalo segundos en un hilo aparte, para que
+        las peticiones no esperen a la copia. Solo en modo instantanea.
+
+        Returns:
+            bool: True si se ha iniciado el hilo (False en otro modo o si ya estaba iniciado)
+        """
+        if self.modo != 'instantanea' or self._hilo is not None:
+            return False
+        self._parar.clear()
+        self._hilo = threading.Thread(target=self._actualizar_periodicamente, name='instantanea_lectura', daemon=True)
+        self._hilo.start()
+        logger_db.info("Hilo de la instantánea de lectura iniciado (cada %s s)", self.intervalo)
+        return True
+
+    def parar(self) -> None:
+        """Para el hilo que rehace la instantánea, si está iniciado."""
+        if self._hilo is None:
+            return
+        self._parar.set()
+        self._hilo.join()
+        self._hilo = None
+
+    def _actualizar_periodicamente(self) -> None:
+        """Bucle del hilo de iniciar(): rehace la instantánea hasta que se llama a parar()."""
+        while not self._parar.is_set():
+            with self._lock:
+                self.actualizar()
+            self._parar.wait(self.intervalo)
+
+    def _comprobar_instantanea(self) -> None:
+        """
+        Actualiza la instantánea si no existe o, si no hay hilo que la rehaga, si está
+        caducada (solo un hilo a la vez).
+        """
+        caducada = (self.instante_instantanea is None
+                    or time.time() - self.instante_instantanea >= self.intervalo
+                    or not os.path.exists(self.ruta_instantanea))
+        if not caducada:
+            return
+        if self.instante_instantanea is None or not os.path.exists(self.ruta_instantanea):
+            # Sin instantánea no se puede leer: esperar a que se cree
+            with self._lock:
+                if self.instante_instantanea is None or not os.path.exists(self.ruta_instantanea):
+                    self.actualizar()
+        elif self._hilo is None and self._lock.acquire(blocking=False):
+            # Si otro hilo ya la está actualizando, se lee la anterior
+            try:
+                self.actualizar()
+            finally:
+                self._lock.release()
+
+    def conectar(self) -> sqlite3.Connection:
+        """
+        Abre una conexión de lectura (con filas tipo diccionario) según el modo.
+
+        Returns:
+            sqlite3.Connection
+
+        Raises:
+            sqlite3.Error: Si no se puede abrir la base de datos
+        """
+        if self.modo == 'instantanea':
+            self._comprobar_instantanea()
+            if os.path.exists(self.ruta_instantanea):
+                conn = sqlite3.connect(_uri_solo_lectura(self.ruta_instantanea), uri=True)
+            else:
+                # Si la instantánea no se ha podido crear, leer de la principal
+                conn = sqlite3.connect(self.ruta_primaria)
+        elif self.modo == 'solo_lectura':
+            conn = sqlite3.connect(_uri_solo_lectura(self.ruta_primaria), uri=True)
+        else:
+            conn = sqlite3.connect(self.ruta_primaria)
+        conn.row_factory = sqlite3.Row
+        return conn
+
+    def catalogo(self, forzar: bool = False) -> Catalogo:
+        """
+        Obtiene el catálogo en memoria leído con las conexiones de este lector, recargándolo
+        si su versión ha cambiado (ver DB_CATALOGO.py).
+
+        Args:
+            forzar: Comprobar la versión ahora aunque se haya comprobado hace poco
+
+        Returns:
+            Catalogo
+
+        Raises:
+            sqlite3.Error: Si no se puede leer el catálogo
+        """
+        return self._cache_catalogo.obtener(self.ruta_primaria, forzar, conectar=self.conectar)
+
+    def estado(self) -> Dict[str, Any]:
+        """
+        Devuelve el modo de lectura, el retraso de los datos y el coste de las actualizaciones.
+
+        Returns:
+            Diccionario con modo, journal_mode de la principal, retraso_segundos (antigüedad de
+            los datos leídos), ultima_actualizacion, duracion_actualizacion_ms, intervalo,
+            en_segundo_plano (si la rehace el hilo de iniciar), actualizaciones y fallos
+        """
+        try:
+            conn = sqlite3.connect(_uri_solo_lectura(self.ruta_primaria), uri=True)
+            try:
+                journal_mode = conn.execute('PRAGMA journal_mode').fetchone()[0]
+            finally:
+                conn.close()
+        except sqlite3.Error:
+            journal_mode = None
+
+        estado = {
+            'modo': self.modo,
+            'journal_mode': journal_mode,
+            'retraso_segundos': 0.0,
+            'ultima_actualizacion': None,
+            'duracion_actualizacion_ms': None,
+            'intervalo': self.intervalo,
+            'en_segundo_plano': self._hilo is not None,
+            'actualizaciones': self.actualizaciones,
+            'fallos': self.fallos,
+        }
+        if self.modo == 'instantanea':
+            if self.instante_instantanea is None:
+                estado['retraso_segundos'] = None
+            else:
+                estado['retraso_segundos'] = round(time.time() - self.instante_instantanea, 3)
+                estado['ultima_actualizacion'] = datetime.fromtimestamp(self.instante_instantanea).isoformat()
+                estado['duracion_actualizacion_ms'] = round(self.duracion_actualizacion * 1000, 2)
+        return estado
+
+if __name__ == "__main__":
+    # Configurar logging para la ejecución directa
+    logging.basicConfig(
+        level=logging.INFO,
+        format='%(asctime)s - %(name)s - %(levelname)s - %(message)s',
+        handlers=[
+            logging.StreamHandler()
+        ]
+    )
+
+    if len(sys.argv) > 1 and sys.argv[1] == 'wal':
+        modo = activar_wal()
+        print(f"journal_mode = {modo}")
+        sys.exit(0 if modo == 'wal' else 1)
+    print(LectorBD().estado())
@@ -0,0 +1,296 @@
+"""
+Módulo que gestiona el libro de movimientos de recursos y sus instantáneas.
+
+El libro es un registro de auditoría alimentado por triggers: las escrituras siguen
+actualizando recursos_ciudadano en el sitio (la fuente de verdad, porque necesitan el saldo
+actual para limitarlo a 0 y para las escrituras optimistas) y los triggers AFTER de
+DB_DDL.crear_triggers_libro copian cada cambio a movimientos_recursos, en la misma
+transacción. No abarata las escrituras: cada una hace el UPSERT, una fila de libro por
+recurso y el UPSERT del ranking. Con python benchmark_libro.py 2000 (acciones de 4 recursos)
+salen unos 2,6-2,7 ms por acción con libro y rankings, 2,5-2,6 ms solo con rankings y
+2,0-2,1 ms sin ninguno de los dos; el libro suma poco porque domina el commit.
+
+Para no sumar el libro entero cada vez, tomar_instantanea guarda los saldos cada
+MOVIMIENTOS_POR_INSTANTANEA movimientos. Un saldo se calcula como la instantánea más reciente
+más los movimientos posteriores, lo que permite:
+    - ver el inventario de un ciudadano en cualquier momento (inventario_en)
+    - comprobar que recursos_ciudadano coincide con el libro (verificar_libro)
+    - rehacer recursos_ciudadano desde el libro, por ejemplo tras un cambio de esquema
+      (reconstruir_inventario)
+
+El delta anotado es el cambio aplicado (ya limitado a 0), así que los saldos se obtienen
+sumando, sin volver a aplicar el límite. Deltas y saldos están en centésimas enteras, como
+recursos_ciudadano (ver cantidades.py), y se comparan de forma exacta.
+
+Este módulo puede ejecutarse directamente:
+    python DB_LIBRO.py                       # tomar una instantánea si toca
+    python DB_LIBRO.py servicio [segundos]   # comprobarlo cada INTERVALO_COMPROBACION segundos
+    python DB_LIBRO.py verificar             # comparar recursos_ciudadano con el libro
+    python DB_LIBRO.py reconstruir           # rehacer recursos_ciudadano desde el libro
+"""
+import logging
+import sqlite3
+import sys
+import time
+from typing import Dict, List, Optional, Tuple
+
+import DB_DDL
+from cantidades import desde_centesimas
+from DB_DML_FUNCIONES import get_db_connection, invalidar_inventario, obtener_catalogo
+
+# Configuración del logger
+logger_db = logging.getLogger('database')
+
+# Movimientos acumulados desde la última instantánea que hacen tomar una nueva
+MOVIMIENTOS_POR_INSTANTANEA = 10000
+
+# Instantáneas conservadas además de la primera (el punto de partida del libro)
+INSTANTANEAS_CONSERVADAS = 24
+
+# Segundos entre comprobaciones en modo servicio
+INTERVALO_COMPROBACION = 300
+
+def _instantanea_base(cursor, instante: int = None) -> Optional[Tuple[int, int]]:
+    """
+    Busca la instantánea más reciente (anterior o igual a instante, si se indica).
+
+    Returns:
+        Tupla (id, movimiento_id) o None si no hay ninguna
+    """
+    if instante is None:
+        cursor.execute('SELECT id, movimiento_id FROM instantaneas_recursos ORDER BY id DESC LIMIT 1')
+    else:
+        cursor.execute('''
+            SELECT id, movimiento_id FROM instantaneas_recursos
+            WHERE ts <= ? ORDER BY ts DESC, id DESC LIMIT 1
+        ''', (instante,))
+    fila = cursor.fetchone()
+    return (fila[0], fila[1]) if fila else None
+
+def _calcular_saldos(cursor, instante: int = None, ciudadano_id: int = None,
+                     hasta_movimiento: int = None) -> Optional[Dict[Tuple[int, int], int]]:
+    """
+    Calcula los saldos como instantánea más movimientos posteriores.
+
+    Args:
+        cursor: Cursor de la base de datos
+        instante: Segundos desde epoch; None para los saldos actuales
+        ciudadano_id: Limitar a un ciudadano (opcional)
+        hasta_movimiento: Último movimiento a sumar (opcional)
+
+    Returns:
+        Diccionario {(ciudadano_id, recurso_id): centésimas} o None si el libro no llega a instante
+    """
+    base = _instantanea_base(cursor, instante)
+    if base is None:
+        return None
+    instantanea_id, movimiento_id = base
+
+    filtro_ciudadano = ' AND ciudadano_id = ?' if ciudadano_id is not None else ''
+    parametros = (ciudadano_id,) if ciudadano_id is not None else ()
+    cursor.execute(f'''
+        SELECT ciudadano_id, recurso_id, cantidad FROM saldos_instantanea
+        WHERE instantanea_id = ?{filtro_ciudadano}
+    ''', (instantanea_id, *parametros))
+    saldos = {(fila[0], fila[1]): fila[2] for fila in cursor.fetchall()}
+
+    condiciones = 'id > ?' + filtro_ciudadano
+    valores = [movimiento_id, *parametros]
+    if instante is not None:
+        condiciones += ' AND ts <= ?'
+        valores.append(instante)
+    if hasta_movimiento is not None:
+        condiciones += ' AND id <= ?'
+        valores.append(hasta_movimiento)
+    cursor.execute(f'''
+        SELECT ciudadano_id, recurso_id, SUM(delta) FROM movimientos_recursos
+        WHERE {condiciones}
+        GROUP BY ciudadano_id, recurso_id
+    ''', valores)
+    for ciudadano, recurso_id, delta in cursor.fetchall():
+        clave = (ciudadano, recurso_id)
+        saldos[clave] = saldos.get(clave, 0) + delta
+    return saldos
+
+def tomar_instantanea(forzar: bool = False,
+                      movimientos: int = MOVIMIENTOS_POR_INSTANTANEA) -> Optional[int]:
+    """
+    Guarda los saldos actuales del libro si desde la última instantánea hay al menos
+    movimientos movimientos, y borra las instantáneas antiguas.
+
+    Args:
+        forzar: Tomarla aunque haya menos movimientos
+        movimientos: Movimientos necesarios para tomarla
+
+    Returns:
+        ID de la instantánea creada o None si no se ha creado
+    """
+    try:
+        with get_db_connection() as conn:
+            cursor = conn.cursor()
+            cursor.execute('BEGIN IMMEDIATE')
+            base = _instantanea_base(cursor)
+            if base is None:
+                logger_db.error("El libro de recursos no está inicializado (DB_DDL.crear_triggers)")
+                conn.rollback()
+                return None
+            cursor.execute('SELECT COALESCE(MAX(id), 0) FROM movimientos_recursos')
+            ultimo = cursor.fetchone()[0]
+            if ultimo == base[1] or (not forzar and ultimo - base[1] < movimientos):
+                conn.rollback()
+                return None
+
+            saldos = _calcular_saldos(cursor, hasta_movimiento=ultimo)
+            cursor.execute('''
+                INSERT INTO instantaneas_recursos (movimiento_id, ts)
+                VALUES (?, CAST(strftime('%s', 'now') AS INTEGER))
+            ''', (ultimo,))
+            instantanea_id = cursor.lastrowid
+            cursor.executemany('''
+                INSERT INTO saldos_instantanea (instantanea_id, ciudadano_id, recurso_id, cantidad)
+                VALUES (?, ?, ?, ?)
+            ''', [(instantanea_id, ciudadano, recurso_id, cantidad)
+                  for (ciudadano, recurso_id), cantidad in saldos.items()])
+
+            # Se conserva siempre la primera, que es el punto de partida del libro
+            cursor.execute('''
+                SELECT id FROM instantaneas_recursos
+                WHERE id != (SELECT MIN(id) FROM instantaneas_recursos)
+                ORDER BY id DESC LIMIT -1 OFFSET ?
+            ''', (INSTANTANEAS_CONSERVADAS,))
+            antiguas = [(fila[0],) for fila in cursor.fetchall()]
+            cursor.executemany('DELETE FROM saldos_instantanea WHERE instantanea_id = ?', antiguas)
+            cursor.executemany('DELETE FROM instantaneas_recursos WHERE id = ?', antiguas)
+            conn.commit()
+        logger_db.info("Instantánea de recursos %s tomada hasta el movimiento %s (%d saldos)",
+                       instantanea_id, ultimo, len(saldos))
+        return instantanea_id
+    except sqlite3.Error as e:
+        logger_db.error(f"Error al tomar instantánea de recursos: {e}")
+        return None
+
+def inventario_en(ciudadano_id: int, instante: float = None) -> Optional[Dict[str, float]]:
+    """
+    Calcula los recursos que tenía un ciudadano en un momento dado a partir del libro.
+
+    Args:
+        ciudadano_id: ID del ciudadano
+        instante: Segundos desde epoch (por defecto, ahora)
+
+    Returns:
+        Diccionario {codigo_recurso: cantidad}, o None si el libro no llega a ese momento
+    """
+    try:
+        with get_db_connection() as conn:
+            saldos = _calcular_saldos(conn.cursor(), None if instante is None else int(instante), ciudadano_id)
+    except sqlite3.Error as e:
+        logger_db.error(f"Error al calcular el inventario del ciudadano {ciudadano_id}: {e}")
+        return None
+    if saldos is None:
+        return None
+    recursos = obtener_catalogo().recursos
+    return {
+        recursos[recurso_id]['codigo'] if recurso_id in recursos else str(recurso_id): desde_centesimas(cantidad)
+        for (_, recurso_id), cantidad in saldos.items()
+    }
+
+def _diferencias(cursor) -> List[Tuple[int, int, Optional[int], int]]:
+    """Filas de recursos_ciudadano que no coinciden con el libro: (ciudadano, recurso, tabla, libro)."""
+    saldos = _calcular_saldos(cursor) or {}
+    cursor.execute('SELECT ciudadano_id, recurso_id, cantidad FROM recursos_ciudadano')
+    actuales = {(fila[0], fila[1]): fila[2] for fila in cursor.fetchall()}
+    diferencias = []
+    for clave in actuales.keys() | saldos.keys():
+        actual, libro = actuales.get(clave), saldos.get(clave, 0)
+        if (actual or 0) != libro or (actual is None and libro):
+            diferencias.append((*clave, actual, libro))
+    return sorted(diferencias)
+
+def verificar_libro() -> Optional[List[Tuple[int, int, Optional[int], int]]]:
+    """
+    Compara recursos_ciudadano con los saldos del libro.
+
+    Returns:
+        Lista de (ciudadano_id, recurso_id, cantidad en la tabla o None, cantidad según el libro),
+        en centésimas, con las diferencias (vacía si todo coincide), o None si hay un error
+    """
+    try:
+        with get_db_connection() as conn:
+            diferencias = _diferencias(conn.cursor())
+    except sqlite3.Error as e:
+        logger_db.error(f"Error al verificar el libro de recursos: {e}")
+        return None
+    for ciudadano_id, recurso_id, actual, libro in diferencias[:20]:
+        logger_db.warning("Ciudadano %s, recurso %s: %s en recursos_ciudadano, %s en el libro",
+                          ciudadano_id, recurso_id, actual, libro)
+    return diferencias
+
+def reconstruir_inventario() -> Optional[int]:
+    """
+    Rehace recursos_ciudadano a partir del libro.
+
+    Los triggers del libro se quitan mientras se escribe (para que la corrección no se anote
+    como un movimiento) y se vuelven a crear en la misma transacción.
+
+    Returns:
+        Número de filas corregidas o None si hay un error
+    """
+    try:
+        with get_db_connection() as conn:
+            cursor = conn.cursor()
+            cursor.execute('BEGIN IMMEDIATE')
+            diferencias = _diferencias(cursor)
+            for evento in ('insert', 'update', 'delete'):
+                cursor.execute(f'DROP TRIGGER IF EXISTS trg_libro_recursos_{evento}')
+            for ciudadano_id, recurso_id, actual, libro in diferencias:
+                if actual is None:
+                    cursor.execute('''
+                        INSERT INTO recursos_ciudadano (ciudadano_id, recurso_id, cantidad, usuario_crear)
+                        VALUES (?, ?, ?, 'libro')
+                    ''', (ciudadano_id, recurso_id, libro))
+                else:
+                    cursor.execute('''
+                        UPDATE recursos_ciudadano
+                        SET cantidad = ?,
+                            version = COALESCE(version, 0) + 1,
+                            fecha_modif = CURRENT_TIMESTAMP,
+                            usuario_modif = 'libro'
+                        WHERE ciudadano_id = ? AND recurso_id = ?
+                    ''', (libro, ciudadano_id, recurso_id))
+            DB_DDL.crear_triggers_libro(cursor)
+            conn.commit()
+    except sqlite3.Error as e:
+        logger_db.error(f"Error al reconstruir el inventario desde el libro: {e}")
+        return None
+    finally:
+        invalidar_inventario()
+    logger_db.info("Inventario reconstruido desde el libro: %d filas corregidas", len(diferencias))
+    return len(diferencias)
+
+if __name__ == "__main__":
+    # Configurar logging para la ejecución directa
+    logging.basicConfig(
+        level=logging.INFO,
+        format='%(asctime)s - %(name)s - %(levelname)s - %(message)s',
+        handlers=[
+            logging.StreamHandler()
+        ]
+    )
+
+    orden = sys.argv[1] if len(sys.argv) > 1 else None
+    if orden == 'verificar':
+        diferencias = verificar_libro()
+        print(f"{len(diferencias)} diferencias" if diferencias is not None else "Error al verificar")
+        sys.exit(0 if diferencias == [] else 1)
+    elif orden == 'reconstruir':
+        sys.exit(0 if reconstruir_inventario() is not None else 1)
+    elif orden == 'servicio':
+        intervalo = float(sys.argv[2]) if len(sys.argv) > 2 else INTERVALO_COMPROBACION
+        try:
+            while True:
+                tomar_instantanea()
+                time.sleep(intervalo)
+        except KeyboardInterrupt:
+            pass
+    else:
+        tomar_instantanea()
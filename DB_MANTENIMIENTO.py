@@ -0,0 +1,265 @@
+"""
+Módulo que hace el mantenimiento de la base de datos en los momentos de poca actividad.
+
+soloville.db no se mantiene sola: el planificador de SQLite no tiene estadísticas para elegir
+índices en las consultas con varios JOIN (realizar_accion, /ciudadano) y el archivo no
+devuelve el espacio de las filas borradas (archivado del historial, instantáneas del libro).
+ejecutar_mantenimiento hace, en este orden:
+    - ANALYZE completo si no hay estadísticas o son de hace más de DIAS_ANALYZE días, y si no
+      PRAGMA optimize (que solo analiza las tablas que lo necesitan)
+    - PRAGMA incremental_vacuum, que devuelve al sistema hasta PAGINAS_VACUUM páginas libres
+      (requiere auto_vacuum = INCREMENTAL; se activa una vez con 'activar_vacuum')
+    - PRAGMA quick_check
+y anota cada tarea en la tabla mantenimiento con su duración y el tamaño del archivo antes y
+después.
+
+ServicioMantenimiento lo ejecuta solo cuando no se ha registrado ninguna acción (canje) en los
+últimos MINUTOS_INACTIVIDAD minutos y han pasado INTERVALO_MANTENIMIENTO segundos desde el
+anterior, para que ninguna tarea haga esperar a los canjes.
+
+Este módulo puede ejecutarse directamente:
+    python DB_MANTENIMIENTO.py                       # mantenimiento ahora
+    python DB_MANTENIMIENTO.py servicio [minutos]    # mantenimiento tras [minutos] sin canjes
+    python DB_MANTENIMIENTO.py activar_vacuum        # auto_vacuum = INCREMENTAL (hace VACUUM)
+"""
+import logging
+import os
+import sqlite3
+import sys
+import threading
+import time
+from typing import Any, Dict, List, Optional
+
+import DB_DML_FUNCIONES
+
+# Configuración del logger
+logger_db = logging.getLogger('database')
+
+# Minutos sin acciones registradas para considerar que el canal está tranquilo
+MINUTOS_INACTIVIDAD = 10
+
+# Segundos mínimos entre dos mantenimientos y entre comprobaciones del servicio
+INTERVALO_MANTENIMIENTO = 6 * 3600
+INTERVALO_COMPROBACION = 60
+
+# Días tras los que se repite el ANALYZE completo
+DIAS_ANALYZE = 7
+
+# Filas por índice que lee PRAGMA optimize al analizar (0 = todas)
+LIMITE_ANALISIS = 1000
+
+# Páginas libres devueltas como máximo en cada incremental_vacuum
+PAGINAS_VACUUM = 2000
+
+# Espera máxima (segundos) a que otra conexión libere la base de datos
+TIEMPO_ESPERA = 5
+
+def _tamano(ruta: str) -> int:
+    """Bytes que ocupan la base de datos y su archivo WAL."""
+    return sum(os.path.getsize(archivo) for archivo in (ruta, ruta + '-wal') if os.path.exists(archivo))
+
+def _analizar(conn) -> str:
+    """ANALYZE completo si las estadísticas faltan o son antiguas; PRAGMA optimize si no."""
+    ultimo = conn.execute('''
+        SELECT MAX(ts) FROM mantenimiento WHERE tarea = 'analizar' AND resultado = 'analyze'
+    ''').fetchone()[0]
+    estadisticas = conn.execute("SELECT 1 FROM sqlite_master WHERE name = 'sqlite_stat1'").fetchone()
+    if not estadisticas or ultimo is None or time.time() - ultimo > DIAS_ANALYZE * 86400:
+        conn.execute('ANALYZE')
+        return 'analyze'
+    conn.execute(f'PRAGMA analysis_limit = {LIMITE_ANALISIS}')
+    conn.execute('PRAGMA optimize')
+    return 'optimize'
+
+def _vacuum_incremental(conn) -> str:
+    """Devuelve al sistema hasta PAGINAS_VACUUM páginas libres."""
+    if conn.execute('PRAGMA auto_vacuum').fetchone()[0] != 2:
+        return 'auto_vacuum desactivado'
+    libres = conn.execute('PRAGMA freelist_count').fetchone()[0]
+    conn.execute(f'PRAGMA incremental_vacuum({PAGINAS_VACUUM})').fetchall()
+    if conn.execute('PRAGMA journal_mode').fetchone()[0] == 'wal':
+        # Las páginas liberadas no salen del archivo hasta pasar el WAL a la base de datos
+        conn.execute('PRAGMA wal_checkpoint(TRUNCATE)').fetchall()
+    return f"{libres - conn.execute('PRAGMA freelist_count').fetchone()[0]} páginas liberadas"
+
+def _comprobar(conn) -> str:
+    """PRAGMA quick_check: 'ok' o los primeros errores encontrados."""
+    errores = [fila[0] for fila in conn.execute('PRAGMA quick_check')]
+    if errores != ['ok']:
+        logger_db.error("quick_check ha encontrado errores: %s", '; '.join(errores[:5]))
+    return '; '.join(errores[:5])
+
+# Tareas en el orden en que se ejecutan: (nombre, función que recibe la conexión)
+TAREAS = (
+    ('analizar', _analizar),
+    ('incremental_vacuum', _vacuum_incremental),
+    ('quick_check', _comprobar),
+)
+
+def _conectar(ruta: str):
+    # Sin transacción implícita: incremental_vacuum y optimize no pueden ir dentro de una
+    return sqlite3.connect(ruta, timeout=TIEMPO_ESPERA, isolation_level=None)
+
+def _anotar(conn, tareas: List[Dict[str, Any]]) -> None:
+    conn.execute('BEGIN IMMEDIATE')
+    conn.executemany('''
+        INSERT INTO mantenimiento (tarea, ts, duracion_ms, bytes_antes, bytes_despues, resultado)
+        VALUES (:tarea, :ts, :duracion_ms, :bytes_antes, :bytes_despues, :resultado)
+    ''', tareas)
+    conn.execute('COMMIT')
+
+def ejecutar_mantenimiento(ruta: str = None) -> Optional[List[Dict[str, Any]]]:
+    """
+    Ejecuta las tareas de mantenimiento (TAREAS) y las anota en la tabla mantenimiento.
+
+    Args:
+        ruta: Base de datos (por defecto, DB_DML_FUNCIONES.DB_PATH)
+
+    Returns:
+        Lista de diccionarios con tarea, ts, duracion_ms, bytes_antes, bytes_despues y
+        resultado, o None si ha fallado
+    """
+    ruta = ruta or DB_DML_FUNCIONES.DB_PATH
+    tareas = []
+    try:
+        conn = _conectar(ruta)
+        try:
+            for nombre, tarea in TAREAS:
+                bytes_antes = _tamano(ruta)
+                inicio = time.perf_counter()
+                resultado = tarea(conn)
+                tareas.append({
+                    'tarea': nombre,
+                    'ts': int(time.time()),
+                    'duracion_ms': round((time.perf_counter() - inicio) * 1000, 3),
+                    'bytes_antes': bytes_antes,
+                    'bytes_despues': _tamano(ruta),
+                    'resultado': resultado,
+                })
+            _anotar(conn, tareas)
+        finally:
+            conn.close()
+    except (sqlite3.Error, OSError) as e:
+        logger_db.error("Error en el mantenimiento de %s: %s", ruta, e)
+        return None
+    for tarea in tareas:
+        logger_db.info("Mantenimiento %s: %s en %.1f ms (%d -> %d bytes)", tarea['tarea'], tarea['resultado'],
+                       tarea['duracion_ms'], tarea['bytes_antes'], tarea['bytes_despues'])
+    return tareas
+
+def toca_mantenimiento(ruta: str = None) -> bool:
+    """
+    Indica si el canal está tranquilo (sin acciones en MINUTOS_INACTIVIDAD minutos) y han
+    pasado INTERVALO_MANTENIMIENTO segundos desde el último mantenimiento.
+
+    Args:
+        ruta: Base de datos (por defecto, DB_DML_FUNCIONES.DB_PATH)
+
+    Returns:
+        bool: True si hay que ejecutar el mantenimiento
+    """
+    try:
+        conn = _conectar(ruta or DB_DML_FUNCIONES.DB_PATH)
+        try:
+            ultima_accion = conn.execute('SELECT MAX(ts) FROM eventos_acciones').fetchone()[0]
+            ultimo = conn.execute('SELECT MAX(ts) FROM mantenimiento').fetchone()[0]
+        finally:
+            conn.close()
+    except sqlite3.Error as e:
+        logger_db.error("Error al comprobar si toca mantenimiento: %s", e)
+        return False
+    ahora = time.time()
+    if ultima_accion is not None and ahora - ultima_accion < MINUTOS_INACTIVIDAD * 60:
+        return False
+    return ultimo is None or ahora - ultimo >= INTERVALO_MANTENIMIENTO
+
+def activar_vacuum_incremental(ruta: str = None) -> bool:
+    """
+    Cambia la base de datos a auto_vacuum = INCREMENTAL. Necesita un VACUUM completo, que
+    bloquea la base de datos mientras reescribe el archivo, así que se hace una sola vez y con
+    el bot parado.
+
+    Args:
+        ruta: Base de datos (por defecto, DB_DML_FUNCIONES.DB_PATH)
+
+    Returns:
+        bool: True si auto_vacuum queda en INCREMENTAL
+    """
+    ruta = ruta or DB_DML_FUNCIONES.DB_PATH
+    try:
+        conn = _conectar(ruta)
+        try:
+            if conn.execute('PRAGMA auto_vacuum').fetchone()[0] == 2:
+                return True
+            bytes_antes = _tamano(ruta)
+            inicio = time.perf_counter()
+            conn.execute('PRAGMA auto_vacuum = INCREMENTAL')
+            conn.execute('VACUUM')
+            _anotar(conn, [{
+                'tarea': 'vacuum', 'ts': int(time.time()),
+                'duracion_ms': round((time.perf_counter() - inicio) * 1000, 3),
+                'bytes_antes': bytes_antes, 'bytes_despues': _tamano(ruta),
+                'resultado': 'auto_vacuum = INCREMENTAL',
+            }])
+            return conn.execute('PRAGMA auto_vacuum').fetchone()[0] == 2
+        finally:
+            conn.close()
+    except sqlite3.Error as e:
+        logger_db.error("Error al activar auto_vacuum en %s: %s", ruta, e)
+        return False
+
+class ServicioMantenimiento(threading.Thread):
+    """
+    Hilo que comprueba cada intervalo segundos si toca mantenimiento y lo ejecuta, hasta que
+    se llama a detener().
+    """
+
+    def __init__(self, intervalo: float = INTERVALO_COMPROBACION, ruta: str = None):
+        super().__init__(name='ServicioMantenimiento', daemon=True)
+        self.intervalo = intervalo
+        self.ruta = ruta
+        self._detener = threading.Event()
+        self.ultimo: Optional[List[Dict[str, Any]]] = None
+        self.fallos = 0
+
+    def run(self) -> None:
+        while not self._detener.is_set():
+            if toca_mantenimiento(self.ruta):
+                tareas = ejecutar_mantenimiento(self.ruta)
+                if tareas is None:
+                    self.fallos += 1
+                else:
+                    self.ultimo = tareas
+            self._detener.wait(self.intervalo)
+
+    def detener(self) -> None:
+        """Pide al hilo que termine y espera a que acabe el mantenimiento en curso."""
+        self._detener.set()
+        if self.is_alive():
+            self.join()
+
+if __name__ == "__main__":
+    # Configurar logging para la ejecución directa
+    logging.basicConfig(
+        level=logging.INFO,
+        format='%(asctime)s - %(name)s - %(levelname)s - %(message)s',
+        handlers=[
+            logging.StreamHandler()
+        ]
+    )
+
+    orden = sys.argv[1] if len(sys.argv) > 1 else None
+    if orden == 'activar_vacuum':
+        sys.exit(0 if activar_vacuum_incremental() else 1)
+    elif orden == 'servicio':
+        if len(sys.argv) > 2:
+            MINUTOS_INACTIVIDAD = float(sys.argv[2])
+        servicio = ServicioMantenimiento()
+        servicio.start()
+        try:
+            while servicio.is_alive():
+                servicio.join(1)
+        except KeyboardInterrupt:
+            servicio.detener()
+    else:
+        sys.exit(0 if ejecutar_mantenimiento() else 1)
@@ -0,0 +1,306 @@
+"""
+Módulo que gestiona las clasificaciones (rankings) de los ciudadanos.
+
+La tabla rankings se mantiene mediante triggers (DB_DDL.crear_triggers) en la misma
+transacción que los cambios de recursos_ciudadano y eventos_acciones. Cada proceso guarda
+en memoria una Clasificacion ordenada por tipo, que se carga la primera vez que se consulta
+y después solo se refresca con las filas cuyo número 'actualizado' es mayor que el último
+leído, así la posición de un ciudadano se busca en O(log n) sin recorrer la tabla.
+Solo se cargan los tipos que existen: códigos de recurso del catálogo y semanas con el
+formato de tipo_semana(); las semanas sin filas no se guardan, para que lo que se pide por
+el chat no haga crecer la memoria.
+reconstruir_rankings incrementa la generación de rankings_generacion, y al verla cambiar
+cada proceso descarta lo cargado.
+Los rankings de recursos guardan centésimas enteras, como recursos_ciudadano (ver
+cantidades.py); top_ranking y posicion_ranking devuelven los valores en unidades.
+
+Este módulo puede ejecutarse directamente para recalcular los rankings desde los datos:
+    python DB_RANKING.py
+"""
+import re
+import sqlite3
+import logging
+import sys
+import time
+import threading
+from bisect import bisect_left, insort
+from typing import Dict, Any, Optional, List, Tuple
+
+from cantidades import desde_centesimas
+from DB_DML_FUNCIONES import get_db_connection, obtener_catalogo
+
+# Configuración del logger
+logger_db = logging.getLogger('database')
+
+# Prefijo de los rankings de acciones semanales
+PREFIJO_ACCIONES = 'acciones:'
+# Tipo de un ranking de acciones semanal: año y semana de strftime('%Y-%W')
+_PATRON_SEMANA = re.compile(re.escape(PREFIJO_ACCIONES) + r'\d{4}-(?:[0-4]\d|5[0-3])')
+
+class Clasificacion:
+    """
+    Clasificación ordenada de mayor a menor valor.
+
+    Guarda una lista ordenada de (-valor, ciudadano_id) y un diccionario con el valor de
+    cada ciudadano. La posición se busca con bisect en O(log n); actualizar un valor también
+    lo busca con bisect, pero insertar o borrar en la lista desplaza los elementos siguientes,
+    así que es O(n) (un memmove, rápido con miles de ciudadanos). Los ciudadanos con valor 0
+    o negativo no aparecen en la clasificación.
+    """
+
+    def __init__(self):
+        self._orden: List[Tuple[float, int]] = []
+        self._valores: Dict[int, float] = {}
+
+    def __len__(self) -> int:
+        return len(self._orden)
+
+    def actualizar(self, ciudadano_id: int, valor: float) -> None:
+        """
+        Actualiza el valor de un ciudadano.
+
+        Args:
+            ciudadano_id: ID del ciudadano
+            valor: Nuevo valor (0 o negativo lo quita de la clasificación)
+        """
+        anterior = self._valores.pop(ciudadano_id, None)
+        if anterior is not None:
+            del self._orden[bisect_left(self._orden, (-anterior, ciudadano_id))]
+        if valor > 0:
+            self._valores[ciudadano_id] = valor
+            insort(self._orden, (-valor, ciudadano_id))
+
+    def valor(self, ciudadano_id: int) -> float:
+        """Devuelve el valor de un ciudadano (0 si no está en la clasificación)."""
+        return self._valores.get(ciudadano_id, 0)
+
+    def posicion(self, ciudadano_id: int) -> Optional[int]:
+        """
+        Obtiene la posición de un ciudadano (1 es el primero). Los empates comparten posición.
+
+        Args:
+            ciudadano_id: ID del ciudadano
+
+        Returns:
+            Posición del ciudadano o None si no está en la clasificación
+        """
+        valor = self._valores.get(ciudadano_id)
+        if valor is None:
+            return None
+        return bisect_left(self._orden, (-valor, float('-inf'))) + 1
+
+    def top(self, n: int = 10) -> List[Tuple[int, float]]:
+        """
+        Devuelve los n primeros ciudadanos.
+
+        Args:
+            n: Número de ciudadanos
+
+        Returns:
+            Lista de tuplas (ciudadano_id, valor) de mayor a menor valor
+        """
+        return [(ciudadano_id, -valor) for valor, ciudadano_id in self._orden[:n]]
+
+# Clasificaciones cargadas en este proceso, último 'actualizado' leído y generación de la tabla
+_clasificaciones: Dict[str, Clasificacion] = {}
+_ultimo_actualizado = 0
+_generacion = 0
+_lock = threading.Lock()
+
+def _valor_visible(tipo: str, valor: float):
+    """Convierte un valor de la tabla rankings a unidades (las acciones ya se cuentan en unidades)."""
+    return valor if tipo.startswith(PREFIJO_ACCIONES) else desde_centesimas(valor)
+
+def tipo_semana(ts: float = None) -> str:
+    """
+    Devuelve el tipo del ranking de acciones de la semana (UTC, igual que el trigger).
+
+    Args:
+        ts: Segundos desde epoch (por defecto, ahora)
+
+    Returns:
+        str: Tipo con formato 'acciones:AAAA-SS'
+    """
+    return PREFIJO_ACCIONES + time.strftime('%Y-%W', time.gmtime(time.time() if ts is None else ts))
+
+def _leer_generacion(cursor) -> int:
+    """Lee la generación de los rankings (0 si la tabla rankings_generacion todavía no existe)."""
+    try:
+        cursor.execute('SELECT generacion FROM rankings_generacion WHERE id = 1')
+    except sqlite3.OperationalError:
+        return 0
+    fila = cursor.fetchone()
+    return fila[0] if fila else 0
+
+def _tipo_valido(tipo: str) -> bool:
+    """Indica si tipo es un código de recurso del catálogo o una semana de tipo_semana()."""
+    return bool(_PATRON_SEMANA.fullmatch(tipo)) or tipo in obtener_catalogo().recursos_por_codigo
+
+def _refrescar(cursor, tipo_nuevo: str = None) -> None:
+    """
+    Aplica a las clasificaciones en memoria los cambios posteriores al último refresco
+    y carga tipo_nuevo si se indica. Debe llamarse con _lock adquirido.
+    """
+    global _ultimo_actualizado, _generacion
+    cursor.execute('BEGIN')
+    try:
+        generacion = _leer_generacion(cursor)
+        cursor.execute('SELECT COALESCE(MAX(actualizado), 0) FROM rankings')
+        maximo = cursor.fetchone()[0]
+        if generacion != _generacion or maximo < _ultimo_actualizado:
+            # La tabla se ha reconstruido por completo (el contador 'actualizado' vuelve a
+            # empezar y puede haber superado ya el último leído): se descarta todo lo cargado
+            _clasificaciones.clear()
+        elif maximo > _ultimo_actualizado and _clasificaciones:
+            cursor.execute('''
+                SELECT tipo, ciudadano_id, valor FROM rankings
+                WHERE actualizado > ? AND actualizado <= ?
+            ''', (_ultimo_actualizado, maximo))
+            for tipo, ciudadano_id, valor in cursor.fetchall():
+                if tipo in _clasificaciones:
+                    _clasificaciones[tipo].actualizar(ciudadano_id, valor)
+
+        if tipo_nuevo is not None and tipo_nuevo not in _clasificaciones:
+            clasificacion = Clasificacion()
+            cursor.execute('SELECT ciudadano_id, valor FROM rankings WHERE tipo = ?', (tipo_nuevo,))
+            for ciudadano_id, valor in cursor.fetchall():
+                clasificacion.actualizar(ciudadano_id, valor)
+            _clasificaciones[tipo_nuevo] = clasificacion
+        _ultimo_actualizado = maximo
+        _generacion = generacion
+    finally:
+        cursor.execute('COMMIT')
+
+def obtener_clasificacion(tipo: str) -> Optional[Clasificacion]:
+    """
+    Obtiene la clasificación de un tipo, actualizada con los últimos cambios.
+
+    Args:
+        tipo: Código del recurso o tipo devuelto por tipo_semana()
+
+    Returns:
+        Clasificacion o None si el tipo no existe o en caso de error
+    """
+    try:
+        if not _tipo_valido(tipo):
+            return None
+        with _lock, get_db_connection() as conn:
+            _refrescar(conn.cursor(), tipo)
+            clasificacion = _clasificaciones[tipo]
+            if not clasificacion and tipo.startswith(PREFIJO_ACCIONES):
+                # Una semana sin acciones se vuelve a cargar si se pide otra vez
+                del _clasificaciones[tipo]
+            return clasificacion
+    except sqlite3.Error as e:
+        logger_db.error(f"Error al obtener el ranking {tipo}: {e}")
+        return None
+
+def top_ranking(tipo: str, n: int = 10) -> List[Dict[str, Any]]:
+    """
+    Obtiene los n primeros ciudadanos de un ranking.
+
+    Args:
+        tipo: Código del recurso o tipo devuelto por tipo_semana()
+        n: Número de ciudadanos
+
+    Returns:
+        Lista de diccionarios con posicion, ciudadano_id, nombre y valor
+    """
+    clasificacion = obtener_clasificacion(tipo)
+    if clasificacion is None:
+        return []
+    primeros = clasificacion.top(n)
+    if not primeros:
+        return []
+    try:
+        with get_db_connection() as conn:
+            cursor = conn.cursor()
+            cursor.execute(f'''
+                SELECT id, nombre FROM ciudadanos WHERE id IN ({', '.join('?' * len(primeros))})
+            ''', tuple(ciudadano_id for ciudadano_id, _ in primeros))
+            nombres = {fila['id']: fila['nombre'] for fila in cursor.fetchall()}
+    except sqlite3.Error as e:
+        logger_db.error(f"Error al obtener nombres del ranking {tipo}: {e}")
+        nombres = {}
+    return [{
+        'posicion': clasificacion.posicion(ciudadano_id),
+        'ciudadano_id': ciudadano_id,
+        'nombre': nombres.get(ciudadano_id, str(ciudadano_id)),
+        'valor': _valor_visible(tipo, valor)
+    } for ciudadano_id, valor in primeros]
+
+def posicion_ranking(tipo: str, ciudadano_id: int) -> Optional[Dict[str, Any]]:
+    """
+    Obtiene la posición de un ciudadano en un ranking.
+
+    Args:
+        tipo: Código del recurso o tipo devuelto por tipo_semana()
+        ciudadano_id: ID del ciudadano
+
+    Returns:
+        Diccionario con posicion, valor y total de ciudadanos, o None si no aparece
+    """
+    clasificacion = obtener_clasificacion(tipo)
+    if clasificacion is None:
+        return None
+    posicion = clasificacion.posicion(ciudadano_id)
+    if posicion is None:
+        return None
+    return {'posicion': posicion, 'valor': _valor_visible(tipo, clasificacion.valor(ciudadano_id)),
+            'total': len(clasificacion)}
+
+def reconstruir_rankings() -> bool:
+    """
+    Recalcula la tabla rankings a partir de recursos_ciudadano y de los eventos de acciones.
+
+    Solo es necesario una vez, para incorporar los datos anteriores a los triggers, o si la
+    tabla se ha perdido. Las clasificaciones en memoria de otros procesos se recargan al
+    ver que ha cambiado la generación de rankings_generacion.
+
+    Returns:
+        bool: True si se reconstruyó correctamente, False en caso contrario
+    """
+    try:
+        with get_db_connection() as conn:
+            cursor = conn.cursor()
+            cursor.execute('BEGIN IMMEDIATE')
+            cursor.execute('DELETE FROM rankings')
+            cursor.execute('''
+                INSERT INTO rankings (tipo, ciudadano_id, valor, actualizado)
+                SELECT r.codigo, rc.ciudadano_id, rc.cantidad, 0
+                FROM recursos_ciudadano rc
+                JOIN recursos r ON r.id = rc.recurso_id
+                WHERE rc.cantidad > 0
+            ''')
+            cursor.execute('''
+                INSERT INTO rankings (tipo, ciudadano_id, valor, actualizado)
+                SELECT ? || strftime('%Y-%W', ts, 'unixepoch'), ciudadano_id, COUNT(*), 0
+                FROM (
+                    SELECT ciudadano_id, accion_id, ts FROM eventos_acciones
+                    UNION ALL
+                    SELECT ciudadano_id, accion_id, ts FROM eventos_acciones_archivo
+                )
+                WHERE accion_id > 0 AND ciudadano_id > 0
+                GROUP BY 1, ciudadano_id
+            ''', (PREFIJO_ACCIONES,))
+            cursor.execute('UPDATE rankings_generacion SET generacion = generacion + 1 WHERE id = 1')
+            conn.commit()
+        with _lock:
+            _clasificaciones.clear()
+        logger_db.info("Rankings reconstruidos")
+        return True
+    except sqlite3.Error as e:
+        logger_db.error(f"Error al reconstruir rankings: {e}")
+        return False
+
+if __name__ == "__main__":
+    # Configurar logging para la ejecución directa
+    logging.basicConfig(
+        level=logging.INFO,
+        format='%(asctime)s - %(name)s - %(levelname)s - %(message)s',
+        handlers=[
+            logging.StreamHandler()
+        ]
+    )
+
+    sys.exit(0 if reconstruir_rankings() else 1)
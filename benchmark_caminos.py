@@ -0,0 +1,45 @@
+"""
+Benchmark del trazado de caminos y solares (db_mapa.crear_caminos_verticales).
+
+Crea en una base de datos temporal un mapa de (2N + 1)² casillas de césped con la plaza
+central y mide crear_caminos_verticales, que calcula el trazado con máscaras de NumPy sobre
+el mapa entero y lo escribe en una sola transacción:
+    python benchmark_caminos.py [N ...]       # por defecto N = 10, 100 y 500
+"""
+import logging
+import os
+import sqlite3
+import sys
+import tempfile
+import time
+
+import db_mapa
+
+def preparar(ruta: str, n: int) -> None:
+    """Crea la tabla mapa con el cuadrado de césped de lado 2n + 1 y la plaza central."""
+    db_mapa.DB_PATH = ruta
+    db_mapa.init_db_mapa()
+    with sqlite3.connect(ruta) as conn:
+        conn.executemany('INSERT INTO mapa (x, z, tipo) VALUES (?, ?, ?)', (
+            (x, z, db_mapa.TIPOS_CASILLAS['CESPED']) for x in range(-n, n + 1) for z in range(-n, n + 1)))
+    db_mapa.plaza_central()
+
+def main(tamanos) -> None:
+    # Sin los INFO de db_mapa en la medida
+    logging.disable(logging.INFO)
+    print(f"{'N':>5} {'casillas':>10} {'no césped':>10} {'total':>11} {'por casilla':>12}")
+    with tempfile.TemporaryDirectory() as directorio:
+        for n in tamanos:
+            ruta = os.path.join(directorio, f'mapa_{n}.db')
+            preparar(ruta, n)
+            inicio = time.perf_counter()
+            assert db_mapa.crear_caminos_verticales()
+            total = time.perf_counter() - inicio
+            with sqlite3.connect(ruta) as conn:
+                no_cesped = conn.execute('SELECT COUNT(*) FROM mapa WHERE tipo != ?',
+                                         (db_mapa.TIPOS_CASILLAS['CESPED'],)).fetchone()[0]
+            casillas = (2 * n + 1) ** 2
+            print(f"{n:>5} {casillas:>10} {no_cesped:>10} {total * 1000:>8.1f} ms {total * 1e6 / casillas:>8.2f} µs")
+
+if __name__ == "__main__":
+    main([int(n) for n in sys.argv[1:]] or [10, 100, 500])
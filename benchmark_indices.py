@@ -0,0 +1,137 @@
+"""
+Benchmark de los índices parciales y de cobertura (DB_DDL.migrar_indices).
+
+Crea una copia de soloville.db con muchos ciudadanos cuyas habilidades y herramientas están
+en su mayoría desactivadas (activo = 0) y compara, antes y después de migrar_indices, las
+consultas de obtener_inventario y realizar_accion: tiempo por consulta, instrucciones de la
+máquina virtual de SQLite (proporcionales a las filas recorridas) y plan de ejecución.
+    python benchmark_indices.py [ciudadanos] [consultas]
+"""
+import logging
+import os
+import random
+import shutil
+import sqlite3
+import sys
+import tempfile
+import time
+from datetime import datetime
+
+import DB_DDL
+
+DIRECTORIO = os.path.dirname(os.path.abspath(__file__))
+
+# Proporción de filas desactivadas
+DESACTIVADAS = 0.8
+
+CONSULTAS = {
+    'obtener_inventario': '''
+        SELECT 'herramienta', hc.herramienta_id, hc.tiene, 1
+        FROM herramientas_ciudadano hc
+        WHERE hc.ciudadano_id = :id AND hc.activo = 1
+        UNION ALL
+        SELECT 'herramienta', hc.herramienta_id, NULL, 0
+        FROM herramientas_ciudadano hc
+        WHERE hc.ciudadano_id = :id AND hc.activo = 0
+        UNION ALL
+        SELECT 'habilidad', hc.habilidad_id, hc.nivel, hc.puntos_experiencia
+        FROM habilidades_ciudadano hc
+        WHERE hc.ciudadano_id = :id AND hc.activo = 1
+        UNION ALL
+        SELECT 'habilidad_inactiva', hc.habilidad_id, NULL, NULL
+        FROM habilidades_ciudadano hc
+        WHERE hc.ciudadano_id = :id AND hc.activo = 0
+    ''',
+    'realizar_accion (herramienta)': '''
+        SELECT COALESCE(hc.tiene, 0)
+        FROM acciones a
+        LEFT JOIN herramientas_ciudadano hc ON hc.ciudadano_id = :id
+        AND a.herramienta_id = hc.herramienta_id AND hc.activo = 1
+        WHERE a.codigo = 'talar'
+    ''',
+    'realizar_accion (recursos)': '''
+        SELECT ra.recurso_id, ra.cantidad, ra.cantidad_pozo, ra.cantidad_herramienta,
+               ra.probabilidad, ra.probabilidad_pozo, ra.probabilidad_herramienta
+        FROM recursos_acciones ra
+        WHERE ra.accion_id = 1 AND ra.activo = 1
+    ''',
+}
+
+def poblar(ruta: str, ciudadanos: int) -> None:
+    """Añade ciudadanos con todas sus habilidades y herramientas, casi todas desactivadas."""
+    conn = sqlite3.connect(ruta)
+    with conn:
+        habilidades = [fila[0] for fila in conn.execute('SELECT codigo FROM habilidades')]
+        herramientas = [fila[0] for fila in conn.execute('SELECT id FROM herramientas')]
+        fecha = datetime.now().isoformat()
+        inicio = conn.execute('SELECT COALESCE(MAX(id), 0) FROM ciudadanos').fetchone()[0] + 1
+        ids = range(inicio, inicio + ciudadanos)
+        conn.executemany('INSERT INTO ciudadanos (id, nombre, fecha_crear, usuario_crear) VALUES (?, ?, ?, ?)',
+                         [(ciudadano_id, f'benchmark{ciudadano_id}', fecha, 'benchmark') for ciudadano_id in ids])
+        conn.executemany('''
+            INSERT INTO habilidades_ciudadano
+            (ciudadano_id, habilidad_id, puntos_experiencia, nivel, fecha_crear, usuario_crear, activo)
+            VALUES (?, ?, ?, 1, ?, 'benchmark', ?)
+        ''', [(ciudadano_id, codigo, random.randint(0, 100), fecha, random.random() > DESACTIVADAS)
+              for ciudadano_id in ids for codigo in habilidades])
+        conn.executemany('''
+            INSERT INTO herramientas_ciudadano (ciudadano_id, herramienta_id, tiene, fecha_crear, usuario_crear, activo)
+            VALUES (?, ?, ?, ?, 'benchmark', ?)
+        ''', [(ciudadano_id, herramienta_id, random.random() < 0.5, fecha, random.random() > DESACTIVADAS)
+              for ciudadano_id in ids for herramienta_id in herramientas])
+        conn.execute('ANALYZE')
+    conn.close()
+
+def medir(ruta: str, ids: list) -> None:
+    """Ejecuta cada consulta para los ciudadanos indicados y muestra el coste medio."""
+    conn = sqlite3.connect(ruta)
+    instrucciones = 0
+
+    def contar():
+        nonlocal instrucciones
+        instrucciones += 1
+
+    try:
+        for nombre, consulta in CONSULTAS.items():
+            plan = [fila[3] for fila in conn.execute('EXPLAIN QUERY PLAN ' + consulta, {'id': ids[0]})]
+            instrucciones = 0
+            conn.set_progress_handler(contar, 10)
+            inicio = time.perf_counter()
+            for ciudadano_id in ids:
+                conn.execute(consulta, {'id': ciudadano_id}).fetchall()
+            total = time.perf_counter() - inicio
+            conn.set_progress_handler(None, 0)
+            print(f"  {nombre:<32} {total * 1e6 / len(ids):8.1f} µs/consulta  "
+                  f"~{instrucciones * 10 / len(ids):7.0f} instrucciones VM")
+            for paso in plan:
+                if paso.startswith(('SEARCH', 'SCAN')):
+                    print(f"      {paso}")
+    finally:
+        conn.close()
+
+def main(ciudadanos: int = 20000, consultas: int = 5000) -> None:
+    logging.getLogger('database').setLevel(logging.WARNING)
+    with tempfile.TemporaryDirectory() as directorio:
+        antes = os.path.join(directorio, 'antes.db')
+        despues = os.path.join(directorio, 'despues.db')
+        shutil.copy(os.path.join(DIRECTORIO, 'soloville.db'), antes)
+        conn = sqlite3.connect(antes)
+        with conn:
+            DB_DDL.crear_tablas(conn.cursor())
+        conn.close()
+        poblar(antes, ciudadanos)
+        shutil.copy(antes, despues)
+        conn = sqlite3.connect(despues)
+        with conn:
+            DB_DDL.migrar_indices(conn.cursor())
+        conn.close()
+
+        ids = random.sample(range(2, ciudadanos + 2), min(consultas, ciudadanos))
+        print(f"{ciudadanos} ciudadanos, {DESACTIVADAS:.0%} de habilidades y herramientas desactivadas")
+        print("Índices anteriores:")
+        medir(antes, ids)
+        print("Índices parciales (migrar_indices):")
+        medir(despues, ids)
+
+if __name__ == "__main__":
+    main(*(int(argumento) for argumento in sys.argv[1:3]))
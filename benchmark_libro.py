@@ -0,0 +1,76 @@
+"""
+Benchmark del coste de escritura de los triggers sobre recursos_ciudadano.
+
+Mide sumar_recursos_ciudadano con todos los triggers de DB_DDL, sin los del libro de
+recursos (movimientos_recursos) y sin los del libro ni los de los rankings de recursos, es
+decir, solo el UPSERT en recursos_ciudadano. Trabaja sobre una copia temporal de soloville.db:
+    python benchmark_libro.py [repeticiones]
+"""
+import logging
+import os
+import shutil
+import sqlite3
+import sys
+import tempfile
+import time
+
+import DB_DDL
+import DB_DML_FUNCIONES
+from DB_DML_FUNCIONES import sumar_recursos_ciudadano
+
+DIRECTORIO = os.path.dirname(os.path.abspath(__file__))
+
+# Recursos obtenidos en una acción típica
+RECURSOS_ACCION = {'madera': 2.6, 'rama': 9.1, 'hierba': 2.6, 'energia': -0.7}
+
+def quitar_triggers(ruta: str, prefijo: str) -> None:
+    """Borra los triggers cuyo nombre empieza por prefijo."""
+    conn = sqlite3.connect(ruta)
+    with conn:
+        for (nombre,) in conn.execute("SELECT name FROM sqlite_master WHERE type = 'trigger' AND name LIKE ?",
+                                      (prefijo + '%',)).fetchall():
+            conn.execute(f'DROP TRIGGER {nombre}')
+    conn.close()
+
+def contar_filas(ruta: str, tabla: str) -> int:
+    conn = sqlite3.connect(ruta)
+    try:
+        return conn.execute(f'SELECT COUNT(*) FROM {tabla}').fetchone()[0]
+    finally:
+        conn.close()
+
+def medir(nombre: str, ruta: str, repeticiones: int) -> None:
+    """Suma los recursos de una acción repeticiones veces y muestra el coste y las filas del libro."""
+    movimientos = contar_filas(ruta, 'movimientos_recursos')
+    inicio = time.perf_counter()
+    for _ in range(repeticiones):
+        sumar_recursos_ciudadano(1, RECURSOS_ACCION)
+    total = time.perf_counter() - inicio
+    nuevos = contar_filas(ruta, 'movimientos_recursos') - movimientos
+    print(f"{nombre:<32} {total * 1000 / repeticiones:8.3f} ms/acción  {repeticiones / total:9.1f} acciones/s  "
+          f"{nuevos / repeticiones:4.1f} filas de libro/acción")
+
+def main(repeticiones: int = 500) -> None:
+    logging.getLogger('database').setLevel(logging.WARNING)
+    with tempfile.TemporaryDirectory() as directorio:
+        ruta = os.path.join(directorio, 'soloville.db')
+        shutil.copy(os.path.join(DIRECTORIO, 'soloville.db'), ruta)
+        conn = sqlite3.connect(ruta)
+        with conn:
+            cursor = conn.cursor()
+            DB_DDL.crear_tablas(cursor)
+            DB_DDL.aplicar_migraciones(cursor)
+            DB_DDL.crear_indices(cursor)
+            DB_DDL.crear_triggers(cursor)
+        conn.close()
+        DB_DML_FUNCIONES.DB_PATH = ruta
+
+        print(f"{repeticiones} acciones de {len(RECURSOS_ACCION)} recursos")
+        medir('libro + rankings (actual)', ruta, repeticiones)
+        quitar_triggers(ruta, 'trg_libro_recursos_')
+        medir('solo rankings', ruta, repeticiones)
+        quitar_triggers(ruta, 'trg_rankings_recursos_')
+        medir('solo recursos_ciudadano', ruta, repeticiones)
+
+if __name__ == "__main__":
+    main(int(sys.argv[1]) if len(sys.argv) > 1 else 500)
@@ -0,0 +1,80 @@
+"""
+Benchmark del coste del logging por canje de recompensa.
+
+Reproduce los registros que genera un canje (bobot.event_message, get_ciudadano,
+registrar_accion y realizar_accion) y mide cuánto tarda el hilo que los emite con:
+    - handlers de archivo y consola en el mismo hilo (la configuración anterior)
+    - QueueHandler/QueueListener (la configuración actual)
+    - QueueHandler/QueueListener con 'database' a WARNING (LOG_NIVELES="database=WARNING")
+
+Escribe en un directorio temporal; la consola va a os.devnull, directamente o a través de
+una consola lenta (ConsolaLenta) que simula un terminal:
+    python benchmark_logging.py [canjes]
+"""
+import logging
+import os
+import sys
+import tempfile
+import time
+
+import configuracion_logging
+from configuracion_logging import setup_logging, detener_logging
+
+logger = logging.getLogger('twitch_bot')
+logger_db = logging.getLogger('database')
+
+# Segundos entre canjes
+PAUSA = 0.001
+
+class ConsolaLenta:
+    """Consola que tarda en escribir, como un terminal o una ventana de OBS con el log."""
+
+    def __init__(self, destino, retardo: float = 0.0002):
+        self.destino = destino
+        self.retardo = retardo
+
+    def write(self, texto: str) -> int:
+        time.sleep(self.retardo)
+        return self.destino.write(texto)
+
+    def flush(self) -> None:
+        self.destino.flush()
+
+def canje(numero: int) -> None:
+    """Emite los registros de un canje de recompensa."""
+    logger.info("[Recompensa] %s: %s (ID: %s) - Acción: %s", 'espectador', 'a talar', 'abc-123', 'talar')
+    logger_db.info("Ciudadano encontrado: %s", 'espectador')
+    logger_db.info("Registrando acción: %s", 'talar')
+    logger_db.info("Acción registrada exitosamente: %s", 'talar')
+    logger_db.info("Proceso completado")
+    logger.debug("Canje %s terminado", numero)
+
+def medir(nombre: str, canjes: int, directorio: str, consola, **opciones) -> None:
+    """
+    Configura el logging con opciones y mide el tiempo por canje en el hilo que registra.
+
+    Entre canjes se deja una pausa, como en el chat, para que el hilo del listener vacíe la cola.
+    """
+    setup_logging(os.path.join(directorio, 'benchmark.log'), consola=consola, **opciones)
+    emitido = 0.0
+    for numero in range(canjes):
+        inicio = time.perf_counter()
+        canje(numero)
+        emitido += time.perf_counter() - inicio
+        time.sleep(PAUSA)
+    detener_logging()
+    print(f"  {nombre:<22} {emitido * 1e6 / canjes:8.1f} µs/canje en el hilo del bot")
+
+def main(canjes: int = 2000) -> None:
+    niveles = configuracion_logging.NIVELES_LOGGING
+    with tempfile.TemporaryDirectory() as directorio, open(os.devnull, 'w') as devnull:
+        print(f"{canjes} canjes")
+        for nombre_consola, consola in (('devnull', devnull), ('lenta', ConsolaLenta(devnull))):
+            print(f"Consola {nombre_consola}:")
+            medir('directo', canjes, directorio, consola, niveles=niveles, usar_cola=False)
+            medir('cola', canjes, directorio, consola, niveles=niveles)
+            medir('cola, database=WARN', canjes, directorio, consola,
+                  niveles=dict(niveles, database=logging.WARNING))
+
+if __name__ == "__main__":
+    main(int(sys.argv[1]) if len(sys.argv) > 1 else 2000)
@@ -0,0 +1,48 @@
+"""
+Benchmark de la suma de recursos a un ciudadano.
+
+Compara sumar los recursos de una acción uno a uno (una transacción por recurso, como hacía
+realiza_accion) con sumar_recursos_ciudadano (una transacción para todos). Trabaja sobre una
+copia temporal de soloville.db:
+    python benchmark_recursos.py [repeticiones]
+"""
+import os
+import shutil
+import sys
+import tempfile
+import time
+
+import DB_DML_FUNCIONES
+from DB_DML_FUNCIONES import sumar_recurso_ciudadano, sumar_recursos_ciudadano
+
+DIRECTORIO = os.path.dirname(os.path.abspath(__file__))
+
+# Recursos obtenidos en una acción típica
+RECURSOS_ACCION = {'madera': 2.6, 'rama': 9.1, 'hierba': 2.6, 'energia': -0.7}
+
+def medir(nombre: str, funcion, repeticiones: int) -> None:
+    """Ejecuta funcion repeticiones veces y muestra el tiempo por llamada y el rendimiento."""
+    inicio = time.perf_counter()
+    for _ in range(repeticiones):
+        funcion()
+    total = time.perf_counter() - inicio
+    print(f"{nombre:<35} {total * 1000 / repeticiones:8.3f} ms/acción  {repeticiones / total:9.1f} acciones/s")
+
+def main(repeticiones: int = 500) -> None:
+    with tempfile.TemporaryDirectory() as directorio:
+        DB_DML_FUNCIONES.DB_PATH = os.path.join(directorio, 'soloville.db')
+        shutil.copy(os.path.join(DIRECTORIO, 'soloville.db'), DB_DML_FUNCIONES.DB_PATH)
+
+        def uno_a_uno():
+            for codigo, cantidad in RECURSOS_ACCION.items():
+                sumar_recurso_ciudadano(1, codigo, cantidad)
+
+        def en_lote():
+            sumar_recursos_ciudadano(1, RECURSOS_ACCION)
+
+        print(f"{repeticiones} acciones de {len(RECURSOS_ACCION)} recursos")
+        medir('sumar_recurso_ciudadano (1 a 1)', uno_a_uno, repeticiones)
+        medir('sumar_recursos_ciudadano (lote)', en_lote, repeticiones)
+
+if __name__ == "__main__":
+    main(int(sys.argv[1]) if len(sys.argv) > 1 else 500)
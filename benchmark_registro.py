@@ -0,0 +1,52 @@
+"""
+Benchmark del registro de ciudadanos durante una raid.
+
+Compara registrar a los espectadores uno a uno (crear_ciudadano y asignar_ciudadano_a_solar,
+una transacción por llamada) con crear_ciudadanos (una transacción para todos). Trabaja sobre
+una copia temporal de soloville.db:
+    python benchmark_registro.py [espectadores]
+"""
+import os
+import shutil
+import sys
+import tempfile
+import time
+
+import DB_DML_FUNCIONES
+import db_mapa
+from DB_DML_FUNCIONES import crear_ciudadano, crear_ciudadanos, resolver_ciudadano
+
+DIRECTORIO = os.path.dirname(os.path.abspath(__file__))
+
+def medir(nombre: str, funcion, espectadores: int) -> None:
+    """Ejecuta funcion y muestra el tiempo total y por ciudadano."""
+    inicio = time.perf_counter()
+    funcion()
+    total = time.perf_counter() - inicio
+    print(f"{nombre:<35} {total * 1000:9.1f} ms  {total * 1000 / espectadores:7.3f} ms/ciudadano")
+
+def main(espectadores: int = 300) -> None:
+    with tempfile.TemporaryDirectory() as directorio:
+        for modo in ('uno_a_uno', 'masivo'):
+            ruta = os.path.join(directorio, f'{modo}.db')
+            shutil.copy(os.path.join(DIRECTORIO, 'soloville.db'), ruta)
+            DB_DML_FUNCIONES.DB_PATH = db_mapa.DB_PATH = ruta
+            DB_DML_FUNCIONES.invalidar_ciudadano()
+            nombres = [f'{modo}{numero}' for numero in range(espectadores)]
+
+            def uno_a_uno():
+                for nombre in nombres:
+                    crear_ciudadano(nombre, 'raid')
+                    db_mapa.asignar_ciudadano_a_solar(resolver_ciudadano(nombre)['id'])
+
+            def masivo():
+                crear_ciudadanos(nombres, 'raid')
+
+            if modo == 'uno_a_uno':
+                print(f"Raid de {espectadores} espectadores")
+                medir('crear_ciudadano + solar (1 a 1)', uno_a_uno, espectadores)
+            else:
+                medir('crear_ciudadanos (lote)', masivo, espectadores)
+
+if __name__ == "__main__":
+    main(int(sys.argv[1]) if len(sys.argv) > 1 else 300)
@@ -14,6 +14,9 @@ Recompensas disponibles:
 - Picar piedra
 - Cazar en el bosque
 - Pescar
+
+Comandos disponibles:
+- !ranking [recurso|semana]
 """
 
 from twitchio.ext import commands
@@ -23,6 +26,7 @@ import configuracion_logging
 from dotenv import load_dotenv
 import os
 from funciones.realiza_accion import realiza_accion
+from funciones.ranking import ranking
 from database import añadir_energia
 
 # Cargar variables de entorno
@@ -78,7 +82,7 @@ class Bot(commands.Bot):
             
             # Manejar mensajes del sistema (sin autor)
             if not message.author:
-                logger.info(f"[Sistema] {message.content}")
+                logger.info("[Sistema] %s", message.content)
                 return
 
             # Mostrar el mensaje
@@ -86,7 +90,7 @@ class Bot(commands.Bot):
                 # Obtener la acción asociada a la recompensa
                 accion = RECOMPENSAS.get(reward_id)
                 if accion: 
-                    logger.info(f"[Recompensa] {message.author.name}: {message.content} (ID: {reward_id}) - Acción: {accion}")
+                    logger.info("[Recompensa] %s: %s (ID: %s) - Acción: %s", message.author.name, message.content, reward_id, accion)
                     # Realizar acción y escribir mensaje en el chat
                     if RECOMPENSAS.get(reward_id) == 'energia1':
                         await message.channel.send(añadir_energia(message.author.name, 1, "añadir_energia"))
@@ -95,9 +99,9 @@ class Bot(commands.Bot):
                     else:
                         await message.channel.send(realiza_accion(accion, message.author.name, message.content))
                 else:
-                    logger.info(f"[Recompensa] {message.author.name}: {message.content} (ID: {reward_id}) - Acción no encontrada")
+                    logger.info("[Recompensa] %s: %s (ID: %s) - Acción no encontrada", message.author.name, message.content, reward_id)
             else:
-                logger.info(f"[Mensaje] {message.author.name}: {message.content}")
+                logger.info("[Mensaje] %s: %s", message.author.name, message.content)
 
             # Lógica de respuesta al jefe
             if 'hola' in message.content.lower() and message.author.name.lower() == 'solounturnomas':
@@ -111,7 +115,7 @@ class Bot(commands.Bot):
 
             # Manejar mensajes del sistema (sin autor)
             if not message.author:
-                logger.info(f"[Sistema] {message.content}")
+                logger.info("[Sistema] %s", message.content)
                 return
 
             # Ignorar mensajes del propio bot
@@ -119,7 +123,7 @@ class Bot(commands.Bot):
                 return
 
             # Mostrar información del mensaje
-            logger.info(f"[Mensaje] {message.author.name}: {message.content}")
+            logger.info("[Mensaje] %s: %s", message.author.name, message.content)
 
             # Lógica de respuesta al jefe
             if 'hola' in message.content.lower() and message.author.name.lower() == 'solounturnomas':
@@ -141,6 +145,13 @@ class Bot(commands.Bot):
         except Exception as e:
             logger.error(f"Error al procesar mensaje: {str(e)}")
 
+    @commands.command(name='ranking')
+    async def comando_ranking(self, ctx, tipo: str = None):
+        try:
+            await ctx.send(ranking(ctx.author.name, tipo))
+        except Exception as e:
+            logger.error(f"Error en comando ranking: {e}")
+
     async def event_command_error(self, ctx, error):
         try:
             logger.error(f"Error en comando '{ctx.command}': {error}")
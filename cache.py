@@ -0,0 +1,89 @@
+"""
+Módulo que define una caché LRU acotada con métricas de aciertos.
+
+Se usa para datos que se leen en cada mensaje del chat y casi nunca cambian, como la
+resolución de nombre de ciudadano a ID (DB_DML_FUNCIONES.resolver_ciudadano).
+"""
+import threading
+from collections import OrderedDict
+from typing import Any, Dict, Hashable
+
+# Valor devuelto por CacheLRU.obtener cuando la clave no está en la caché
+# (None es un valor válido: permite guardar que algo no existe)
+NO_ENCONTRADO = object()
+
+class CacheLRU:
+    """
+    Caché de tamaño máximo fijo que descarta la entrada usada hace más tiempo.
+
+    Es segura entre hilos (la web atiende peticiones en varios hilos).
+    """
+
+    def __init__(self, capacidad: int):
+        self.capacidad = capacidad
+        self._datos: OrderedDict = OrderedDict()
+        self._lock = threading.Lock()
+        self.aciertos = 0
+        self.fallos = 0
+
+    def __len__(self) -> int:
+        return len(self._datos)
+
+    def obtener(self, clave: Hashable) -> Any:
+        """
+        Obtiene el valor de una clave y la marca como usada recientemente.
+
+        Args:
+            clave: Clave a buscar
+
+        Returns:
+            El valor guardado o NO_ENCONTRADO si la clave no está en la caché
+        """
+        with self._lock:
+            if clave in self._datos:
+                self._datos.move_to_end(clave)
+                self.aciertos += 1
+                return self._datos[clave]
+            self.fallos += 1
+            return NO_ENCONTRADO
+
+    def guardar(self, clave: Hashable, valor: Any) -> None:
+        """
+        Guarda un valor, descartando la entrada menos usada si se supera la capacidad.
+
+        Args:
+            clave: Clave a guardar
+            valor: Valor asociado (puede ser None)
+        """
+        with self._lock:
+            self._datos[clave] = valor
+            self._datos.move_to_end(clave)
+            while len(self._datos) > self.capacidad:
+                self._datos.popitem(last=False)
+
+    def invalidar(self, clave: Hashable) -> None:
+        """Elimina una clave de la caché si existe."""
+        with self._lock:
+            self._datos.pop(clave, None)
+
+    def limpiar(self) -> None:
+        """Vacía la caché (las métricas se conservan)."""
+        with self._lock:
+            self._datos.clear()
+
+    def estadisticas(self) -> Dict[str, Any]:
+        """
+        Devuelve las métricas de uso de la caché.
+
+        Returns:
+            Diccionario con tamano, capacidad, aciertos, fallos y tasa_aciertos (0 a 1)
+        """
+        with self._lock:
+            consultas = self.aciertos + self.fallos
+            return {
+                'tamano': len(self._datos),
+                'capacidad': self.capacidad,
+                'aciertos': self.aciertos,
+                'fallos': self.fallos,
+                'tasa_aciertos': self.aciertos / consultas if consultas else 0.0
+            }
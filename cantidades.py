@@ -0,0 +1,42 @@
+"""
+Módulo que convierte las cantidades de recursos entre unidades y centésimas.
+
+recursos_ciudadano.cantidad (y el libro de movimientos y los rankings de recursos) guardan
+enteros en centésimas de unidad: 1,3 maderas se guardan como 130. Así las sumas son exactas
+(los multiplicadores ×1,3 y ×0,7 de las acciones no acumulan error de coma flotante) y SUM y
+las comparaciones trabajan con enteros. Fuera de la base de datos las cantidades siguen
+siendo unidades; solo las funciones que leen o escriben esas columnas hacen la conversión.
+"""
+from typing import Union
+
+# Centésimas por unidad
+ESCALA = 100
+
+def a_centesimas(cantidad: float) -> int:
+    """
+    Convierte una cantidad en unidades al entero que se guarda en la base de datos.
+
+    Args:
+        cantidad: Cantidad en unidades (se redondea a 2 decimales)
+
+    Returns:
+        int: Cantidad en centésimas
+    """
+    return int(round(cantidad * ESCALA))
+
+def desde_centesimas(valor: Union[int, float, None]) -> Union[int, float]:
+    """
+    Convierte un valor guardado en centésimas a unidades.
+
+    Args:
+        valor: Valor de la base de datos (None se trata como 0)
+
+    Returns:
+        int si la cantidad es entera, float con 2 decimales si no
+    """
+    if not valor:
+        return 0
+    unidades, resto = divmod(int(round(valor)), ESCALA)
+    if not resto:
+        return unidades
+    return round(valor / ESCALA, 2)
@@ -0,0 +1,179 @@
+"""
+Módulo que sirve el mapa a la web por chunks.
+
+El mapa se divide en chunks de TAMANO_CHUNK x TAMANO_CHUNK casillas: el chunk (cx, cz) tiene
+las casillas con x // TAMANO_CHUNK == cx y z // TAMANO_CHUNK == cz. La web pide solo los
+chunks que se ven (la vista o los chunks por coordenadas) en vez del mapa entero.
+
+CacheChunks guarda cada chunk ya leído junto con la versión del mapa con la que se leyó
+(db_mapa.version_mapa, que sube con cada cambio de casillas o de sus dueños). Mientras la
+versión no cambia, los chunks salen de la caché sin ir a la base de datos; cuando cambia, los
+chunks antiguos dejan de usarse y salen de la caché por LRU.
+
+leer_cambios devuelve solo las casillas cambiadas desde una versión (cada casilla guarda la
+versión en la que cambió), para que una vista ya cargada se ponga al día sin volver a pedirlo
+todo.
+"""
+import threading
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+
+from cache import NO_ENCONTRADO, CacheLRU
+from db_mapa import TIPOS_CASILLAS, version_mapa
+
+# Casillas por lado de cada chunk
+TAMANO_CHUNK = 16
+
+# Chunks como máximo en una petición (una vista de 8x8 chunks son 128x128 casillas)
+MAX_CHUNKS = 64
+
+# Chunks guardados en la caché (de todas las versiones)
+CAPACIDAD_CACHE_CHUNKS = 1024
+
+# Casillas cambiadas como máximo en una respuesta de cambios: con más, sale más barato
+# volver a pedir los chunks de la vista
+MAX_CAMBIOS = 5000
+
+_SELECT_CASILLAS = '''
+    SELECT m.x, m.z, m.tipo, m.ciudadano_id, c.nivel_casa, c.nombre
+    FROM mapa m
+    LEFT JOIN ciudadanos c ON m.ciudadano_id = c.id
+'''
+
+# Nombre de cada tipo de casilla por su ID
+_NOMBRES_TIPOS = {id_tipo: nombre for nombre, id_tipo in TIPOS_CASILLAS.items()}
+
+def chunk_de(x: int, z: int) -> Tuple[int, int]:
+    """Coordenadas (cx, cz) del chunk que contiene la casilla (x, z)."""
+    return x // TAMANO_CHUNK, z // TAMANO_CHUNK
+
+def chunks_en(desde_x: int, hasta_x: int, desde_z: int, hasta_z: int) -> List[Tuple[int, int]]:
+    """
+    Chunks que cubren el rectángulo de casillas de (desde_x, desde_z) a (hasta_x, hasta_z).
+
+    Raises:
+        ValueError: Si el rectángulo necesita más de MAX_CHUNKS chunks
+    """
+    cx0, cz0 = chunk_de(min(desde_x, hasta_x), min(desde_z, hasta_z))
+    cx1, cz1 = chunk_de(max(desde_x, hasta_x), max(desde_z, hasta_z))
+    if (cx1 - cx0 + 1) * (cz1 - cz0 + 1) > MAX_CHUNKS:
+        raise ValueError(f"La vista necesita más de {MAX_CHUNKS} chunks")
+    return [(cx, cz) for cx in range(cx0, cx1 + 1) for cz in range(cz0, cz1 + 1)]
+
+def leer_chunk(cursor, cx: int, cz: int) -> List[Dict[str, Any]]:
+    """
+    Lee las casillas de un chunk con el nombre y la casa de su ciudadano.
+
+    Args:
+        cursor: Cursor de la base de datos
+        cx, cz: Coordenadas del chunk
+
+    Returns:
+        Lista de casillas con x, z, tipo (nombre), ciudadano_id, nivel_casa y nombre
+    """
+    cursor.execute(_SELECT_CASILLAS + 'WHERE m.x BETWEEN ? AND ? AND m.z BETWEEN ? AND ?', (
+        cx * TAMANO_CHUNK, (cx + 1) * TAMANO_CHUNK - 1, cz * TAMANO_CHUNK, (cz + 1) * TAMANO_CHUNK - 1))
+    return _casillas(cursor.fetchall())
+
+def leer_mapa(cursor) -> List[Dict[str, Any]]:
+    """Lee todas las casillas del mapa, en el mismo formato que leer_chunk."""
+    cursor.execute(_SELECT_CASILLAS)
+    return _casillas(cursor.fetchall())
+
+def leer_cambios(cursor, desde: int) -> Optional[List[Dict[str, Any]]]:
+    """
+    Lee las casillas que han cambiado después de una versión del mapa.
+
+    Args:
+        cursor: Cursor de la base de datos
+        desde: Versión que ya tiene quien pregunta
+
+    Returns:
+        Lista de casillas en el mismo formato que leer_chunk, o None si son más de
+        MAX_CAMBIOS (hay que volver a pedir la vista entera)
+    """
+    cursor.execute(_SELECT_CASILLAS + 'WHERE m.version > ? LIMIT ?', (desde, MAX_CAMBIOS + 1))
+    filas = cursor.fetchall()
+    if len(filas) > MAX_CAMBIOS:
+        return None
+    return _casillas(filas)
+
+def _casillas(filas) -> List[Dict[str, Any]]:
+    """Convierte filas (x, z, tipo, ciudadano_id, nivel_casa, nombre) en diccionarios."""
+    return [{
+        'x': fila[0],
+        'z': fila[1],
+        'tipo': _NOMBRES_TIPOS.get(fila[2], 'CESPED'),
+        'ciudadano_id': fila[3],
+        'nivel_casa': fila[4],
+        'nombre': fila[5],
+    } for fila in filas]
+
+class CacheChunks:
+    """
+    Caché de chunks del mapa por versión, compartida por las peticiones de la web.
+    """
+
+    def __init__(self, capacidad: int = CAPACIDAD_CACHE_CHUNKS):
+        self._cache = CacheLRU(capacidad)
+        self._lock = threading.Lock()
+        self.lecturas = 0
+
+    def obtener(self, conn, chunks: Iterable[Tuple[int, int]]) -> Dict[str, Any]:
+        """
+        Devuelve los chunks pedidos en la versión actual del mapa.
+
+        Args:
+            conn: Conexión de lectura a la base de datos
+            chunks: Coordenadas (cx, cz) de los chunks
+
+        Returns:
+            Diccionario con version, tamano (casillas por lado) y chunks (lista de
+            diccionarios con cx, cz y casillas)
+        """
+        cursor = conn.cursor()
+        version = version_mapa(cursor)
+        resultado = []
+        for cx, cz in chunks:
+            casillas = self._cache.obtener((version, cx, cz))
+            if casillas is NO_ENCONTRADO:
+                casillas = leer_chunk(cursor, cx, cz)
+                self._cache.guardar((version, cx, cz), casillas)
+                with self._lock:
+                    self.lecturas += 1
+            resultado.append({'cx': cx, 'cz': cz, 'casillas': casillas})
+        return {'version': version, 'tamano': TAMANO_CHUNK, 'chunks': resultado}
+
+    def limites(self, conn) -> Dict[str, Any]:
+        """
+        Extremos del mapa y versión, para que la web sepa qué chunks existen.
+
+        Returns:
+            Diccionario con version, tamano y x_min, x_max, z_min, z_max (None si no hay casillas)
+        """
+        cursor = conn.cursor()
+        fila = cursor.execute('SELECT MIN(x), MAX(x), MIN(z), MAX(z) FROM mapa').fetchone()
+        return {'version': version_mapa(cursor), 'tamano': TAMANO_CHUNK,
+                'x_min': fila[0], 'x_max': fila[1], 'z_min': fila[2], 'z_max': fila[3]}
+
+    def estadisticas(self) -> Dict[str, Any]:
+        """Métricas de la caché y número de chunks leídos de la base de datos."""
+        return dict(self._cache.estadisticas(), lecturas=self.lecturas)
+
+    def limpiar(self) -> None:
+        """Vacía la caché."""
+        self._cache.limpiar()
+
+def parsear_chunks(texto: str) -> List[Tuple[int, int]]:
+    """
+    Convierte 'cx,cz;cx,cz;...' en una lista de coordenadas de chunks.
+
+    Raises:
+        ValueError: Si el texto no tiene ese formato o pide más de MAX_CHUNKS chunks
+    """
+    chunks = []
+    for parte in filter(None, texto.split(';')):
+        cx, cz = parte.split(',')
+        chunks.append((int(cx), int(cz)))
+    if len(chunks) > MAX_CHUNKS:
+        raise ValueError(f"No se pueden pedir más de {MAX_CHUNKS} chunks")
+    return chunks
@@ -0,0 +1,110 @@
+"""
+Módulo de control de concurrencia optimista.
+
+Las escrituras que dependen de lo leído (fabricar, mejorar la casa) leen las filas con su
+columna version sin bloquear la base de datos y después las escriben con
+"WHERE version = ?" y "version = version + 1" en una transacción corta. Si otra escritura
+ha cambiado alguna fila entre tanto, la operación lanza ConflictoVersion y
+ejecutar_con_reintentos la repite desde la lectura.
+
+metricas_contencion cuenta por operación cuántas veces se ha reintentado y por qué.
+"""
+import random
+import sqlite3
+import threading
+import time
+from typing import Any, Callable, Dict, TypeVar
+
+# Intentos de una operación antes de darla por fallida
+INTENTOS = 8
+
+# Espera máxima (segundos) antes del primer reintento; se duplica en cada intento
+ESPERA_BASE = 0.005
+
+T = TypeVar('T')
+
+class ConflictoVersion(Exception):
+    """Una fila ha cambiado (su version ya no es la leída) o se han agotado los reintentos."""
+
+class MetricasContencion:
+    """Contadores de ejecuciones, reintentos y fallos por operación, seguros entre hilos."""
+
+    CAMPOS = ('ejecuciones', 'reintentos', 'conflictos', 'bloqueos', 'agotadas')
+
+    def __init__(self):
+        self._datos: Dict[str, Dict[str, int]] = {}
+        self._lock = threading.Lock()
+
+    def registrar(self, operacion: str, campo: str) -> None:
+        """Suma 1 al contador campo de la operación."""
+        with self._lock:
+            contadores = self._datos.setdefault(operacion, dict.fromkeys(self.CAMPOS, 0))
+            contadores[campo] += 1
+
+    def limpiar(self) -> None:
+        """Pone todos los contadores a 0."""
+        with self._lock:
+            self._datos.clear()
+
+    def estadisticas(self) -> Dict[str, Dict[str, Any]]:
+        """
+        Devuelve los contadores de cada operación.
+
+        Returns:
+            Diccionario {operacion: {ejecuciones, reintentos, conflictos, bloqueos, agotadas,
+            tasa_reintentos}}, donde tasa_reintentos es reintentos / ejecuciones
+        """
+        with self._lock:
+            return {
+                operacion: dict(contadores, tasa_reintentos=(
+                    contadores['reintentos'] / contadores['ejecuciones'] if contadores['ejecuciones'] else 0.0))
+                for operacion, contadores in self._datos.items()
+            }
+
+metricas_contencion = MetricasContencion()
+
+def _es_bloqueo(error: sqlite3.OperationalError) -> bool:
+    """Indica si el error se debe a que otra conexión tiene bloqueada la base de datos."""
+    texto = str(error).lower()
+    return 'locked' in texto or 'busy' in texto
+
+def ejecutar_con_reintentos(operacion: Callable[[], T], nombre: str, intentos: int = INTENTOS,
+                            metricas: MetricasContencion = metricas_contencion) -> T:
+    """
+    Ejecuta operacion y la repite si hay un conflicto de versión o la base de datos está bloqueada.
+
+    Entre intentos espera un tiempo aleatorio que se duplica cada vez, para que los
+    escritores que han chocado no vuelvan a coincidir.
+
+    Args:
+        operacion: Función sin argumentos que lee, comprueba y escribe (debe poder repetirse)
+        nombre: Nombre de la operación en las métricas
+        intentos: Número máximo de intentos
+        metricas: Métricas donde se registran los reintentos
+
+    Returns:
+        Lo que devuelva operacion
+
+    Raises:
+        ConflictoVersion: Si todos los intentos han chocado con otra escritura
+        sqlite3.OperationalError: Si el último intento ha encontrado la base de datos bloqueada
+    """
+    metricas.registrar(nombre, 'ejecuciones')
+    for intento in range(intentos):
+        if intento:
+            metricas.registrar(nombre, 'reintentos')
+            time.sleep(random.uniform(0, ESPERA_BASE * 2 ** (intento - 1)))
+        try:
+            return operacion()
+        except ConflictoVersion:
+            metricas.registrar(nombre, 'conflictos')
+            if intento == intentos - 1:
+                metricas.registrar(nombre, 'agotadas')
+                raise ConflictoVersion(f'{nombre}: conflicto de versión tras {intentos} intentos')
+        except sqlite3.OperationalError as e:
+            if not _es_bloqueo(e):
+                raise
+            metricas.registrar(nombre, 'bloqueos')
+            if intento == intentos - 1:
+                metricas.registrar(nombre, 'agotadas')
+                raise
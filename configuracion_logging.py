@@ -1,43 +1,168 @@
+"""
+Configuración del logging de la aplicación.
+
+Los loggers de la aplicación ('twitch_bot' y 'database') no escriben directamente: dejan
+cada registro en una cola (QueueHandler) y un hilo aparte (QueueListener) es quien lo
+formatea y lo escribe en el archivo y en la consola. Así el bucle de eventos del bot no
+espera a la E/S del log en cada canje.
+
+El nivel de cada logger se toma de NIVELES_LOGGING y se puede cambiar con la variable de
+entorno LOG_NIVELES, por ejemplo:
+    LOG_NIVELES="twitch_bot=INFO,database=WARNING"
+
+Los archivos rotados cada medianoche se comprimen con gzip (twitch_bot.log.AAAA-MM-DD.gz).
+"""
+import atexit
+import gzip
 import logging
 import logging.handlers
-from datetime import datetime
-
-def setup_logging():
-    """Configura el sistema de logging"""
-    # Crear logger principal
-    logger = logging.getLogger('twitch_bot')
-    logger.setLevel(logging.DEBUG)
-    
-    # Formato de los logs
-    formatter = logging.Formatter(
-        '%(asctime)s - %(name)s - %(levelname)s - %(message)s',
-        datefmt='%Y-%m-%d %H:%M:%S'
-    )
-    
-    # Handler para archivo de logs rotativo (nuevo archivo cada día)
+import os
+import queue
+import shutil
+import sys
+from typing import Dict, Optional
+
+# Archivo de logs
+RUTA_LOG = 'logs/twitch_bot.log'
+
+# Días de logs rotados que se conservan
+DIAS_LOG = 7
+
+# Loggers de la aplicación a los que se añaden los handlers (sus hijos, como
+# 'twitch_bot.database', propagan hasta ellos)
+LOGGERS_APLICACION = ('twitch_bot', 'database')
+
+# Nivel por defecto de cada logger (se puede indicar también el de un hijo o un módulo externo)
+NIVELES_LOGGING = {
+    'twitch_bot': logging.DEBUG,
+    'database': logging.INFO,
+}
+
+FORMATO = '%(asctime)s - %(name)s - %(levelname)s - %(message)s'
+FORMATO_FECHA = '%Y-%m-%d %H:%M:%S'
+
+# Listener activo (solo hay uno por proceso)
+_listener: Optional[logging.handlers.QueueListener] = None
+
+def niveles_configurados(texto: str = None) -> Dict[str, int]:
+    """
+    Devuelve el nivel de cada logger: NIVELES_LOGGING más lo indicado en LOG_NIVELES.
+
+    Args:
+        texto: Configuración "logger=NIVEL,..." (por defecto, la variable de entorno LOG_NIVELES)
+
+    Returns:
+        Diccionario nombre del logger -> nivel numérico
+    """
+    niveles = dict(NIVELES_LOGGING)
+    if texto is None:
+        texto = os.getenv('LOG_NIVELES', '')
+    for parte in texto.split(','):
+        if '=' not in parte:
+            continue
+        nombre, nivel = (valor.strip() for valor in parte.split('=', 1))
+        numero = logging.getLevelName(nivel.upper())
+        if nombre and isinstance(numero, int):
+            niveles[nombre] = numero
+        else:
+            print(f"LOG_NIVELES: se ignora '{parte.strip()}'", file=sys.stderr)
+    return niveles
+
+def _nombre_rotado(nombre: str) -> str:
+    """Nombre del archivo rotado: el de TimedRotatingFileHandler con la extensión .gz."""
+    return nombre + '.gz'
+
+def _comprimir_rotado(origen: str, destino: str) -> None:
+    """Comprime el archivo recién rotado con gzip y borra el original."""
+    with open(origen, 'rb') as entrada, gzip.open(destino, 'wb') as salida:
+        shutil.copyfileobj(entrada, salida)
+    os.remove(origen)
+
+def crear_handler_archivo(ruta: str = RUTA_LOG, dias: int = DIAS_LOG) -> logging.Handler:
+    """
+    Crea el handler de archivo: un archivo nuevo cada día y los anteriores comprimidos.
+
+    Args:
+        ruta: Ruta del archivo de logs
+        dias: Número de archivos rotados que se conservan
+
+    Returns:
+        TimedRotatingFileHandler configurado
+    """
     file_handler = logging.handlers.TimedRotatingFileHandler(
-        'logs/twitch_bot.log',
+        ruta,
         when='midnight',
         interval=1,
-        backupCount=7  # Mantener 7 días de logs
+        backupCount=dias,
+        encoding='utf-8'
     )
-    file_handler.setLevel(logging.DEBUG)
-    file_handler.setFormatter(formatter)
-    
-    # Handler para consola (todos los niveles)
-    console_handler = logging.StreamHandler()
-    console_handler.setLevel(logging.DEBUG)
-    console_handler.setFormatter(formatter)
-    
-    # Agregar handlers al logger
-    logger.addHandler(file_handler)
-    logger.addHandler(console_handler)
-    
-    return logger
+    file_handler.namer = _nombre_rotado
+    file_handler.rotator = _comprimir_rotado
+    return file_handler
+
+def detener_logging() -> None:
+    """Vacía la cola de logs pendientes y detiene el hilo que los escribe."""
+    global _listener
+    if _listener is not None:
+        _listener.stop()
+        _listener = None
+
+def setup_logging(ruta: str = RUTA_LOG, niveles: Dict[str, int] = None,
+                  consola=None, usar_cola: bool = True) -> logging.Logger:
+    """
+    Configura el sistema de logging.
+
+    Se puede llamar más de una vez: cada llamada sustituye los handlers de la anterior.
+
+    Args:
+        ruta: Ruta del archivo de logs
+        niveles: Nivel de cada logger (por defecto, niveles_configurados())
+        consola: Flujo de la consola (por defecto, sys.stderr)
+        usar_cola: Escribir desde un hilo aparte (False escribe en el hilo que registra)
+
+    Returns:
+        El logger principal 'twitch_bot'
+    """
+    global _listener
+    detener_logging()
+
+    formatter = logging.Formatter(FORMATO, datefmt=FORMATO_FECHA)
+
+    # Handler para archivo de logs rotativo (nuevo archivo cada día) y para consola
+    file_handler = crear_handler_archivo(ruta)
+    console_handler = logging.StreamHandler(consola)
+    handlers = [file_handler, console_handler]
+    for handler in handlers:
+        handler.setFormatter(formatter)
+
+    if usar_cola:
+        cola = queue.SimpleQueue()
+        _listener = logging.handlers.QueueListener(cola, *handlers, respect_handler_level=True)
+        _listener.start()
+        handlers_logger = [logging.handlers.QueueHandler(cola)]
+    else:
+        handlers_logger = handlers
+
+    niveles = niveles_configurados() if niveles is None else niveles
+    for nombre, nivel in niveles.items():
+        logging.getLogger(nombre).setLevel(nivel)
+
+    for nombre in LOGGERS_APLICACION:
+        app_logger = logging.getLogger(nombre)
+        # Quitar los handlers de una configuración anterior
+        for handler in list(app_logger.handlers):
+            if getattr(handler, '_configuracion_logging', False):
+                app_logger.removeHandler(handler)
+                handler.close()
+        for handler in handlers_logger:
+            handler._configuracion_logging = True
+            app_logger.addHandler(handler)
+
+    return logging.getLogger('twitch_bot')
 
 # Crear el directorio de logs si no existe
-import os
 os.makedirs('logs', exist_ok=True)
 
 # Configurar logging al importar el módulo
 logger = setup_logging()
+atexit.register(detener_logging)
@@ -0,0 +1,60 @@
+"""
+Fixtures comunes de las pruebas.
+
+Las pruebas trabajan sobre una copia temporal de soloville.db, nunca sobre el archivo del
+repositorio:
+    copia_bd: la copia tal cual, sin que ningún módulo la use
+    bd_sin_esquema: la copia con los módulos que abren la base de datos apuntando a ella y sus
+        cachés vacías, sin tocar el esquema (para probar migraciones)
+    bd_temporal: lo mismo con el esquema al día (tablas, migraciones, índices y triggers),
+        como lo deja python DB_DDL.py
+
+Un módulo que necesita algo más redefine bd_temporal pidiendo la de aquí.
+"""
+import os
+import shutil
+import sqlite3
+
+import pytest
+
+import DB_DDL
+import DB_DML_FUNCIONES
+import DB_RANKING
+import db_mapa
+from cache import CacheLRU
+from concurrencia import metricas_contencion
+from DB_CATALOGO import CacheCatalogo
+
+DIRECTORIO = os.path.dirname(os.path.abspath(__file__))
+
+@pytest.fixture
+def copia_bd(tmp_path):
+    """Copia soloville.db a un directorio temporal."""
+    ruta = str(tmp_path / 'soloville.db')
+    shutil.copy(os.path.join(DIRECTORIO, 'soloville.db'), ruta)
+    return ruta
+
+@pytest.fixture
+def bd_sin_esquema(copia_bd, monkeypatch):
+    """Usa la copia de soloville.db desde DB_DML_FUNCIONES y db_mapa, con cachés y métricas vacías."""
+    monkeypatch.setattr(DB_DML_FUNCIONES, 'DB_PATH', copia_bd)
+    monkeypatch.setattr(db_mapa, 'DB_PATH', copia_bd)
+    monkeypatch.setattr(DB_DML_FUNCIONES, '_cache_inventario', {})
+    monkeypatch.setattr(DB_DML_FUNCIONES, '_cache_ciudadanos', CacheLRU(DB_DML_FUNCIONES.CAPACIDAD_CACHE_CIUDADANOS))
+    monkeypatch.setattr(DB_DML_FUNCIONES, '_cache_catalogo', CacheCatalogo())
+    monkeypatch.setattr(DB_RANKING, '_clasificaciones', {})
+    monkeypatch.setattr(DB_RANKING, '_ultimo_actualizado', 0)
+    monkeypatch.setattr(DB_RANKING, '_generacion', 0)
+    metricas_contencion.limpiar()
+    return copia_bd
+
+@pytest.fixture
+def bd_temporal(bd_sin_esquema):
+    """Copia de soloville.db en uso por los módulos y con el esquema al día."""
+    with sqlite3.connect(bd_sin_esquema) as conn:
+        cursor = conn.cursor()
+        DB_DDL.crear_tablas(cursor)
+        DB_DDL.aplicar_migraciones(cursor)
+        DB_DDL.crear_indices(cursor)
+        DB_DDL.crear_triggers(cursor)
+    return bd_sin_esquema
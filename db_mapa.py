@@ -1,13 +1,25 @@
 """
 Módulo que maneja la base de datos SQLite para el sistema de mapa.
 Esta base de datos almacena información sobre la cuadrícula del mapa.
+
+Las funciones trabajan sobre un ModeloMapa (modelo_mapa.py): la tabla mapa entera en arrays
+de NumPy, que se lee una vez y después se pone al día leyendo solo las casillas que han
+cambiado desde la versión del mapa que tiene (mapa_version, ver DB_DDL.crear_tablas_mapa);
+los cambios en otras tablas no lo afectan. Las consultas de casillas y vecindarios no van a
+la base de datos y las modificaciones escriben solo las casillas que cambian, en una única
+transacción. Las escrituras de una sola sentencia (asignar un solar) no necesitan el modelo:
+van por su propia conexión y después se aplican al modelo si ya está leído.
 """
 
 import sqlite3
-from typing import Optional, Dict, Any
+import threading
+import numpy as np
+from typing import Optional, Dict, Any, List, Tuple
 import logging
 import configuracion_logging
 from contextlib import contextmanager
+import DB_DDL
+from modelo_mapa import ModeloMapa
 
 # Configurar logging específico para el mapa
 logger = configuracion_logging.logger
@@ -31,24 +43,17 @@ def get_db_connection():
 
 def init_db_mapa():
     """
-    Inicializa la base de datos y crea la tabla mapa si no existe.
+    Crea la tabla mapa, la de su versión y sus índices si no existen (DB_DDL.crear_tablas_mapa
+    y DB_DDL.crear_indices_mapa), para bases de datos con solo el mapa como las de los
+    benchmarks. La del bot se actualiza con python DB_DDL.py; importar este módulo no cambia
+    el esquema.
     """
     try:
         with get_db_connection() as conn:
             cursor = conn.cursor()
             logger_mapa.info("Iniciando creación de tabla mapa")
-            
-            cursor.execute('''
-                CREATE TABLE IF NOT EXISTS mapa (
-                    id INTEGER PRIMARY KEY AUTOINCREMENT,
-                    x INTEGER NOT NULL,
-                    z INTEGER NOT NULL,
-                    tipo INTEGER NOT NULL,
-                    ciudadano_id INTEGER NULL,
-                    UNIQUE(x, z)
-                )
-            ''')
-            
+            DB_DDL.crear_tablas_mapa(cursor)
+            DB_DDL.crear_indices_mapa(cursor)
             logger_mapa.info("Tabla mapa creada")
             conn.commit()
             
@@ -75,6 +80,173 @@ TIPOS_CASILLAS = {
     'CRUCE': 15
 }
 
+# Modelo del mapa en memoria, conexión con la que se lee y se guarda y versión del mapa
+# (mapa_version) hasta la que está al día.
+_modelo: Optional[ModeloMapa] = None
+_conexion_modelo: Optional[sqlite3.Connection] = None
+_ruta_modelo: Optional[str] = None
+_version_modelo: Optional[int] = None
+_lock_modelo = threading.RLock()
+
+# Tipos sobre los que se trazan caminos y tipos que cuentan como camino para los solares
+TIPOS_TRAZABLES = [TIPOS_CASILLAS['CESPED'], TIPOS_CASILLAS['CAMINO'], TIPOS_CASILLAS['CAMINO_2']]
+TIPOS_CAMINO = [TIPOS_CASILLAS['CAMINO'], TIPOS_CASILLAS['CAMINO_2'], TIPOS_CASILLAS['CRUCE']]
+
+def _sincronizar_modelo() -> Tuple[sqlite3.Connection, ModeloMapa]:
+    """
+    Devuelve la conexión del modelo y el modelo, poniéndolo al día si otra conexión ha
+    cambiado el mapa: lee solo las casillas de versión posterior a la suya.
+    """
+    global _modelo, _conexion_modelo, _ruta_modelo, _version_modelo
+    if _conexion_modelo is None or _ruta_modelo != DB_PATH:
+        if _conexion_modelo is not None:
+            _conexion_modelo.close()
+        # Sin transacción implícita: las escrituras abren la suya con BEGIN IMMEDIATE
+        _conexion_modelo = sqlite3.connect(DB_PATH, check_same_thread=False, isolation_level=None)
+        _ruta_modelo = DB_PATH
+        _modelo = None
+    cursor = _conexion_modelo.cursor()
+    # La versión antes que las casillas: un cambio entre las dos lecturas se vuelve a leer
+    # la próxima vez, en vez de perderse
+    version = version_mapa(cursor)
+    if _modelo is None or version < _version_modelo:
+        # Primera lectura, o una base de datos restaurada en la misma ruta
+        _modelo = ModeloMapa.cargar(cursor)
+    elif version > _version_modelo:
+        _modelo.cargar_cambiadas(cursor, _version_modelo)
+        # Las casillas borradas no tienen versión: si faltan filas, se lee el mapa entero
+        if len(_modelo) != cursor.execute('SELECT COUNT(*) FROM mapa').fetchone()[0]:
+            _modelo = ModeloMapa.cargar(cursor)
+    _version_modelo = version
+    return _conexion_modelo, _modelo
+
+@contextmanager
+def modelo_mapa():
+    """
+    Context manager que da el modelo del mapa al día para consultarlo.
+    No debe modificarse: para eso está modificar_mapa().
+    """
+    with _lock_modelo:
+        yield _sincronizar_modelo()[1]
+
+def _subir_version(cursor, version: int) -> None:
+    """
+    Fija la versión del mapa a la de las casillas escritas por la transacción (una vez por
+    transacción que cambia casillas).
+    """
+    try:
+        cursor.execute('UPDATE mapa_version SET version = ? WHERE id = 1', (version,))
+    except sqlite3.OperationalError:
+        # Base de datos que db_mapa aún no ha inicializado: no hay versión que subir
+        pass
+
+def version_mapa(cursor) -> int:
+    """
+    Versión actual del mapa: cambia cada vez que cambia alguna casilla o su dueño.
+
+    Args:
+        cursor: Cursor de la base de datos (o de una copia de lectura)
+
+    Returns:
+        Número de versión (0 si la base de datos no tiene tabla mapa_version)
+    """
+    try:
+        fila = cursor.execute('SELECT version FROM mapa_version WHERE id = 1').fetchone()
+    except sqlite3.OperationalError:
+        return 0
+    return fila[0] if fila else 0
+
+@contextmanager
+def _transaccion_mapa():
+    """
+    Context manager que da la conexión del modelo, el modelo al día y la versión que tendrá
+    el mapa si la transacción cambia casillas; las casillas que se escriben sin pasar por el
+    modelo deben marcarse con ella. Al salir guarda las casillas modificadas del modelo y, si
+    ha cambiado alguna, sube la versión del mapa; si hay un error, deshace la transacción y
+    descarta el modelo para que se vuelva a leer.
+    """
+    global _modelo, _version_modelo
+    with _lock_modelo:
+        conn = None
+        try:
+            conn, modelo = _sincronizar_modelo()
+            conn.execute('BEGIN IMMEDIATE')
+            # Lo escrito por otra conexión justo antes de BEGIN
+            conn, modelo = _sincronizar_modelo()
+            version = version_mapa(conn.cursor()) + 1
+            cambios = conn.total_changes
+            yield conn, modelo, version
+            modelo.guardar(conn.cursor(), version)
+            cambiado = conn.total_changes != cambios
+            if cambiado:
+                _subir_version(conn.cursor(), version)
+            conn.execute('COMMIT')
+            if cambiado:
+                # El modelo ya tiene lo escrito: no hace falta volver a leerlo
+                _version_modelo = version
+        except BaseException:
+            _modelo = None
+            if conn is not None and conn.in_transaction:
+                conn.execute('ROLLBACK')
+            raise
+
+@contextmanager
+def _transaccion_sin_modelo():
+    """
+    Context manager para escribir en mapa sin leer el modelo: da una conexión propia dentro
+    de BEGIN IMMEDIATE y la versión que tendrá el mapa si la transacción cambia casillas
+    (las casillas escritas deben marcarse con ella). Al salir sube la versión si ha cambiado
+    alguna y confirma; si hay un error, deshace la transacción. Lo escrito se aplica al modelo
+    con _parchear_modelo().
+    """
+    conn = sqlite3.connect(DB_PATH, isolation_level=None)
+    try:
+        conn.execute('BEGIN IMMEDIATE')
+        version = version_mapa(conn.cursor()) + 1
+        cambios = conn.total_changes
+        yield conn, version
+        if conn.total_changes != cambios:
+            _subir_version(conn.cursor(), version)
+        conn.execute('COMMIT')
+    except BaseException:
+        if conn.in_transaction:
+            conn.execute('ROLLBACK')
+        raise
+    finally:
+        conn.close()
+
+def _parchear_modelo(version: int, parche) -> None:
+    """
+    Aplica al modelo lo escrito por una transacción de _transaccion_sin_modelo() que ha
+    llevado el mapa a version, solo si el modelo está leído y tenía la versión anterior. Si
+    no, no hace nada: el modelo leerá esas casillas la próxima vez que se sincronice.
+
+    Args:
+        version: Versión del mapa tras la transacción
+        parche: Función que recibe el modelo y le aplica el cambio sin anotarlo para guardar
+    """
+    global _version_modelo
+    with _lock_modelo:
+        if _modelo is not None and _ruta_modelo == DB_PATH and _version_modelo == version - 1:
+            parche(_modelo)
+            _version_modelo = version
+
+@contextmanager
+def modificar_mapa():
+    """
+    Context manager que da el modelo del mapa para modificarlo dentro de una transacción.
+    Al salir guarda las casillas modificadas; si hay un error, deshace la transacción y
+    descarta el modelo para que se vuelva a leer.
+    """
+    with _transaccion_mapa() as (conn, modelo, version):
+        yield modelo
+
+def _descartar_modelo() -> None:
+    """Hace que el modelo se vuelva a leer, tras escribir en mapa sin pasar por él."""
+    global _modelo
+    with _lock_modelo:
+        _modelo = None
+
 def crear_casilla(x: int, z: int, tipo: str) -> bool:
     """
     Crea una nueva casilla en el mapa.
@@ -87,21 +259,19 @@ def crear_casilla(x: int, z: int, tipo: str) -> bool:
         True si se creó exitosamente, False si ya existe
     """
     try:
-        with get_db_connection() as conn:
-            cursor = conn.cursor()
-            cursor.execute('''
-                INSERT INTO mapa (x, z, tipo)
-                VALUES (?, ?, ?)
-            ''', (x, z, TIPOS_CASILLAS[tipo]))
-            conn.commit()
-            logger_mapa.info(f"Casilla creada en ({x}, {z})")
-            return True
-    except sqlite3.IntegrityError:
-        logger_mapa.warning(f"Casilla en ({x}, {z}) ya existe")
-        return False
+        with modificar_mapa() as modelo:
+            creada = modelo.crear(x, z, TIPOS_CASILLAS[tipo])
+        if not creada:
+            logger_mapa.warning(f"Casilla en ({x}, {z}) ya existe")
+            return False
+        logger_mapa.info(f"Casilla creada en ({x}, {z})")
+        return True
     except KeyError:
         logger_mapa.error(f"Tipo de casilla no válido: {tipo}")
         return False
+    except sqlite3.Error as e:
+        logger_mapa.error(f"Error al crear casilla: {e}")
+        return False
 
 def obtener_tipo_casilla_por_id(id_tipo: int) -> str:
     """
@@ -129,18 +299,14 @@ def obtener_casilla(x: int, z: int) -> dict:
         Diccionario con los datos de la casilla si existe, None si no existe
     """
     try:
-        with get_db_connection() as conn:
-            cursor = conn.cursor()
-            cursor.execute('SELECT * FROM mapa WHERE x = ? AND z = ?', (x, z))
-            casilla = cursor.fetchone()
-            if casilla:
-                # Convertir el ID del tipo a nombre
-                casilla = dict(casilla)
-                casilla['tipo'] = obtener_tipo_casilla_por_id(casilla['tipo'])
-            return casilla
+        with modelo_mapa() as modelo:
+            casilla = modelo.casilla(x, z)
+        if casilla:
+            # Convertir el ID del tipo a nombre
+            casilla['tipo'] = obtener_tipo_casilla_por_id(casilla['tipo'])
+        return casilla
     except Exception as e:
         logger_mapa.error(f"Error al obtener casilla: {e}")
-        logger_mapa.error(f"Error al obtener casilla: {str(e)}")
         return None
 
 def actualizar_casilla(x: int, z: int, tipo: str) -> bool:
@@ -155,21 +321,13 @@ def actualizar_casilla(x: int, z: int, tipo: str) -> bool:
         True si se actualizó exitosamente, False si no existe.
     """
     try:
-        with get_db_connection() as conn:
-            cursor = conn.cursor()
-            cursor.execute('''
-                UPDATE mapa 
-                SET tipo = ?
-                WHERE x = ? AND z = ?
-            ''', (TIPOS_CASILLAS[tipo], x, z))
-            
-            if cursor.rowcount == 0:
-                logger_mapa.warning(f"No se encontró casilla en ({x}, {z})")
-                return False
-                
-            conn.commit()
-            logger_mapa.info(f"Casilla actualizada en ({x}, {z})")
-            return True
+        with modificar_mapa() as modelo:
+            actualizada = modelo.poner_tipo(x, z, TIPOS_CASILLAS[tipo])
+        if not actualizada:
+            logger_mapa.warning(f"No se encontró casilla en ({x}, {z})")
+            return False
+        logger_mapa.info(f"Casilla actualizada en ({x}, {z})")
+        return True
             
     except KeyError:
         logger_mapa.error(f"Tipo de casilla no válido: {tipo}")
@@ -178,9 +336,6 @@ def actualizar_casilla(x: int, z: int, tipo: str) -> bool:
         logger_mapa.error(f"Error al actualizar casilla: {e}")
         return False
 
-# Inicializar la tabla mapa al importar el módulo
-init_db_mapa()
-
 
 def obtener_tipo_casilla(x: int, z: int) -> Optional[str]:
     """
@@ -193,12 +348,9 @@ def obtener_tipo_casilla(x: int, z: int) -> Optional[str]:
         Tipo de casilla como string si existe, None si no existe
     """
     try:
-        with get_db_connection() as conn:
-            cursor = conn.cursor()
-            cursor.execute('SELECT tipo FROM mapa WHERE x = ? AND z = ?', (x, z))
-            result = cursor.fetchone()
-            if result:
-                return obtener_tipo_casilla_por_id(result[0])
+        with modelo_mapa() as modelo:
+            if modelo.existe(x, z):
+                return obtener_tipo_casilla_por_id(modelo.tipo(x, z))
             return None
     except sqlite3.Error as e:
         logger_mapa.error(f"Error al obtener tipo de casilla: {e}")
@@ -216,22 +368,12 @@ def tiene_casilla_caminera_adyacente(x: int, z: int) -> bool:
         True si tiene al menos una casilla adyacente de tipo camino, False en caso contrario
     """
     try:
-        tipos_camino = ["CAMINO", "CAMINO_2", "CRUCE"]
-        
-        # Verificar todas las casillas adyacentes (8 posibles)
-        for dx in [-1, 0, 1]:
-            for dz in [-1, 0, 1]:
-                if dx == 0 and dz == 0:  # No verificar la casilla actual
-                    continue
-                    
-                tipo_adyacente = obtener_tipo_casilla(x + dx, z + dz)
-                if tipo_adyacente in tipos_camino:
-                    return True
-        
-        return False
-        
+        # Las 8 casillas adyacentes se leen de una vez del vecindario del modelo
+        with modelo_mapa() as modelo:
+            return modelo.hay_adyacente(x, z, TIPOS_CAMINO)
     except sqlite3.Error as e:
         logger_mapa.error(f"Error al verificar casillas adyacentes: {e}")
+        return False
 
 
 def tiene_CRUCE_adyacente(x: int, z: int) -> bool:
@@ -245,22 +387,11 @@ def tiene_CRUCE_adyacente(x: int, z: int) -> bool:
         True si tiene al menos una casilla adyacente de tipo CRUCE, False en caso contrario
     """
     try:
-        # Verificar todas las casillas adyacentes (8 posibles)
-        for dx in [-1, 0, 1]:
-            for dz in [-1, 0, 1]:
-                if dx == 0 and dz == 0:  # No verificar la casilla actual
-                    continue
-                    
-                tipo_adyacente = obtener_tipo_casilla(x + dx, z + dz)
-                if tipo_adyacente == "CRUCE":
-                    return True
-        
-        return False
-        
+        with modelo_mapa() as modelo:
+            return modelo.hay_adyacente(x, z, [TIPOS_CASILLAS['CRUCE']])
     except sqlite3.Error as e:
         logger_mapa.error(f"Error al verificar casillas CRUCE adyacentes: {e}")
         return False
-        return False
 
 
 def tiene_solar_asignado(ciudadano_id: int) -> bool:
@@ -274,61 +405,66 @@ def tiene_solar_asignado(ciudadano_id: int) -> bool:
         True si tiene solar asignado, False en caso contrario
     """
     try:
-        with get_db_connection() as conn:
-            cursor = conn.cursor()
-            cursor.execute('SELECT COUNT(*) FROM mapa WHERE ciudadano_id = ?', (ciudadano_id,))
-            count = cursor.fetchone()[0]
-            return count > 0
+        with modelo_mapa() as modelo:
+            return modelo.tiene_ciudadano(ciudadano_id)
     except sqlite3.Error as e:
         logger_mapa.error(f"Error al verificar solar asignado: {e}")
         return False
 
 
-def encontrar_solar_mas_cercano() -> Optional[tuple[int, int]]:
+def _solares_libres(cursor, limite: int) -> List[Tuple[int, int, int]]:
     """
-    Encuentra el solar más cercano a (0,0) que no tenga ciudadano asignado.
-    La cercanía se determina sumando los valores absolutos de las coordenadas (|x| + |z|).
-    Si hay varios solares a la misma distancia, devuelve cualquiera de ellos.
-    
+    Los solares libres más cercanos a (0,0), leídos en orden del índice idx_mapa_solares_libres.
+
+    Args:
+        cursor: Cursor de la base de datos (puede estar dentro de una transacción)
+        limite: Número máximo de solares
+
+    Returns:
+        Lista de (id, x, z) por distancia y, a igual distancia, por ID
+    """
+    cursor.execute('''
+        SELECT id, x, z
+        FROM mapa
+        WHERE tipo = ? AND ciudadano_id IS NULL
+        ORDER BY abs(x) + abs(z), id
+        LIMIT ?
+    ''', (TIPOS_CASILLAS['SOLAR'], limite))
+    return [tuple(fila) for fila in cursor.fetchall()]
+
+
+def encontrar_solar_mas_cercano(x: int = 0, z: int = 0) -> Optional[tuple[int, int]]:
+    """
+    Encuentra el solar más cercano a (x, z) que no tenga ciudadano asignado.
+    La cercanía se determina por la distancia Manhattan (|x| + |z| para (0,0)).
+    Si hay varios solares a la misma distancia, devuelve el de menor ID.
+
+    Para (0,0) el solar sale del índice idx_mapa_solares_libres; para otro punto se busca en
+    el modelo en ventanas cada vez mayores alrededor de (x, z), así que el coste depende de
+    la distancia al solar y no del tamaño del mapa.
+
+    Args:
+        x, z: Punto desde el que se mide la distancia (default: (0,0))
+
     Returns:
         Una tupla (x, z) con las coordenadas del solar más cercano, o None si no hay solares disponibles.
     """
     try:
-        with get_db_connection() as conn:
-            cursor = conn.cursor()
-            
-            # Obtener todos los solares sin ciudadano
-            cursor.execute('''
-                SELECT x, z 
-                FROM mapa 
-                WHERE tipo = ? AND ciudadano_id IS NULL
-            ''', (TIPOS_CASILLAS['SOLAR'],))
-            
-            solares = cursor.fetchall()
-            
-            if not solares:
-                logger_mapa.info("No se encontraron solares disponibles")
-                return None
-                
-            # Encontrar el solar más cercano
-            solar_mas_cercano = None
-            distancia_minima = float('inf')
-            
-            for solar in solares:
-                x, z = solar['x'], solar['z']
-                distancia = abs(x) + abs(z)
-                
-                if distancia < distancia_minima:
-                    distancia_minima = distancia
-                    solar_mas_cercano = (x, z)
-            
-            if solar_mas_cercano:
-                logger_mapa.info(f"Solar más cercano encontrado en {solar_mas_cercano}")
+        with _lock_modelo:
+            conn, modelo = _sincronizar_modelo()
+            if (x, z) == (0, 0):
+                solares = _solares_libres(conn.cursor(), 1)
+                solar = solares[0][1:] if solares else None
             else:
-                logger_mapa.warning("No se pudo encontrar un solar más cercano")
-            
-            return solar_mas_cercano
-            
+                solar = modelo.mas_cercano(TIPOS_CASILLAS['SOLAR'], x, z)
+
+        if not solar:
+            logger_mapa.info("No se encontraron solares disponibles")
+            return None
+
+        logger_mapa.info(f"Solar más cercano encontrado en {solar}")
+        return solar
+
     except sqlite3.Error as e:
         logger_mapa.error(f"Error al encontrar solar más cercano: {e}")
         return None
@@ -337,45 +473,106 @@ def encontrar_solar_mas_cercano() -> Optional[tuple[int, int]]:
 def asignar_ciudadano_a_solar(ciudadano_id: int) -> bool:
     """
     Asigna un ciudadano al solar más cercano disponible.
-    
+
+    El solar se elige y se ocupa con una sola sentencia, así que dos registros a la vez
+    (también desde otro proceso, como la web) no pueden quedarse con el mismo solar, y un
+    ciudadano que ya tiene solar no recibe otro. No necesita el modelo del mapa: si está
+    leído, se le aplica la asignación después.
+
     Args:
         ciudadano_id: ID del ciudadano a asignar
-        
+
     Returns:
-        True si se asignó exitosamente, False en caso de error
+        True si se asignó exitosamente, False si no hay solares libres, el ciudadano ya
+        tenía uno o en caso de error
     """
     try:
-        with get_db_connection() as conn:
-            cursor = conn.cursor()
-            
-            # Encontrar el solar más cercano
-            solar = encontrar_solar_mas_cercano()
-            if not solar:
+        with _transaccion_sin_modelo() as (conn, version):
+            solar = conn.execute('''
+                UPDATE mapa SET ciudadano_id = :ciudadano, version = :version
+                WHERE id = (
+                    SELECT id FROM mapa
+                    WHERE tipo = :solar AND ciudadano_id IS NULL
+                    ORDER BY abs(x) + abs(z), id
+                    LIMIT 1
+                )
+                AND ciudadano_id IS NULL
+                AND NOT EXISTS (SELECT 1 FROM mapa WHERE ciudadano_id = :ciudadano)
+                RETURNING x, z
+            ''', {'ciudadano': ciudadano_id, 'solar': TIPOS_CASILLAS['SOLAR'], 'version': version}).fetchone()
+
+        if not solar:
+            if tiene_solar_asignado(ciudadano_id):
+                logger_mapa.warning(f"El ciudadano {ciudadano_id} ya tiene solar")
+            else:
                 logger_mapa.warning(f"No se encontró solar disponible para el ciudadano {ciudadano_id}")
-                return False
-                
-            x, z = solar
-            
-            # Actualizar la casilla asignando el ciudadano
-            cursor.execute('''
-                UPDATE mapa 
-                SET ciudadano_id = ?
-                WHERE x = ? AND z = ? AND tipo = ? AND ciudadano_id IS NULL
-            ''', (ciudadano_id, x, z, TIPOS_CASILLAS['SOLAR']))
-            
-            if cursor.rowcount == 0:
-                logger_mapa.error(f"No se pudo asignar ciudadano {ciudadano_id} al solar ({x}, {z})")
-                return False
-                
-            conn.commit()
-            logger_mapa.info(f"Ciudadano {ciudadano_id} asignado al solar ({x}, {z})")
-            return True
-            
+            return False
+
+        x, z = solar
+        _parchear_modelo(version, lambda modelo: modelo.asignar_ciudadano(x, z, ciudadano_id, anotar=False))
+        logger_mapa.info(f"Ciudadano {ciudadano_id} asignado al solar ({x}, {z})")
+        return True
+
     except sqlite3.Error as e:
         logger_mapa.error(f"Error al asignar ciudadano {ciudadano_id} a solar: {e}")
         return False
 
 
+def liberar_solar(ciudadano_id: int) -> bool:
+    """
+    Deja libre el solar de un ciudadano, que vuelve a estar disponible para asignarse.
+
+    Args:
+        ciudadano_id: ID del ciudadano
+
+    Returns:
+        True si se liberó un solar, False si no tenía o en caso de error
+    """
+    try:
+        with _transaccion_mapa() as (conn, modelo, version):
+            solares = conn.execute('SELECT x, z FROM mapa WHERE ciudadano_id = ?', (ciudadano_id,)).fetchall()
+            for x, z in solares:
+                modelo.asignar_ciudadano(x, z, None)
+
+        if not solares:
+            logger_mapa.warning(f"El ciudadano {ciudadano_id} no tiene solar que liberar")
+            return False
+
+        logger_mapa.info(f"Solar del ciudadano {ciudadano_id} liberado en {solares[0]}")
+        return True
+
+    except sqlite3.Error as e:
+        logger_mapa.error(f"Error al liberar solar del ciudadano {ciudadano_id}: {e}")
+        return False
+
+
+def asignar_solares(cursor, ciudadano_ids: List[int]) -> Dict[int, Tuple[int, int]]:
+    """
+    Asigna a varios ciudadanos los solares libres más cercanos a (0,0) dentro de la
+    transacción en curso (por ejemplo, la de un registro masivo).
+
+    Args:
+        cursor: Cursor de la transacción en curso
+        ciudadano_ids: IDs de los ciudadanos, en el orden en que eligen solar
+
+    Returns:
+        Diccionario {ciudadano_id: (x, z)} con los ciudadanos a los que se ha asignado solar
+        (si no hay solares suficientes, los últimos se quedan sin él)
+    """
+    # El modelo compartido se vuelve a leer cuando la transacción del llamador hace COMMIT
+    solares = _solares_libres(cursor, len(ciudadano_ids))
+    version = version_mapa(cursor) + 1
+    cursor.executemany(
+        'UPDATE mapa SET ciudadano_id = ?, version = ? WHERE id = ? AND ciudadano_id IS NULL',
+        [(ciudadano_id, version, solar[0]) for ciudadano_id, solar in zip(ciudadano_ids, solares)]
+    )
+    if solares:
+        _subir_version(cursor, version)
+    if len(solares) < len(ciudadano_ids):
+        logger_mapa.warning("Solo hay %d solares libres para %d ciudadanos", len(solares), len(ciudadano_ids))
+    return {ciudadano_id: (solar[1], solar[2]) for ciudadano_id, solar in zip(ciudadano_ids, solares)}
+
+
 def crear_caminos_verticales():
     """
     Actualiza las casillas existentes con diferentes tipos de camino:
@@ -388,65 +585,32 @@ def crear_caminos_verticales():
     Returns:
         True si se completaron los caminos exitosamente, False en caso de error.
     """
+    cesped, solar, cruce = TIPOS_CASILLAS['CESPED'], TIPOS_CASILLAS['SOLAR'], TIPOS_CASILLAS['CRUCE']
     try:
-        with get_db_connection() as conn:
-            cursor = conn.cursor()
-            
-            # Obtener el valor máximo absoluto de coordenadas existentes
-            cursor.execute('SELECT MAX(ABS(x)), MAX(ABS(z)) FROM mapa')
-            result = cursor.fetchone()
-            max_abs = max(result[0] or 0, result[1] or 0)
-            
-            # Actualizar caminos verticales en x=0
-            for z in range(-max_abs, -2):
-                tipo_actual = obtener_tipo_casilla(0, z)
-                if tipo_actual in ["CESPED", "CAMINO", "CAMINO_2"]:
-                    if not actualizar_casilla(0, z, "CAMINO"):
-                        logger_mapa.warning(f"No se pudo actualizar camino en (0, {z})")
-            
-            for z in range(3, max_abs+1):
-                tipo_actual = obtener_tipo_casilla(0, z)
-                if tipo_actual in ["CESPED", "CAMINO", "CAMINO_2"]:
-                    if not actualizar_casilla(0, z, "CAMINO"):
-                        logger_mapa.warning(f"No se pudo actualizar camino en (0, {z})")
-            
-            # Actualizar caminos en columnas múltiplos de 5
-            for z in range(-max_abs, max_abs + 1):
-                if z % 5 == 0:  # Si es múltiplo de 5
-                    # Actualizar todas las casillas de la columna como CAMINO_2
-                    for x in range(-max_abs, max_abs + 1):
-                        tipo_actual = obtener_tipo_casilla(x, z)
-                        if tipo_actual in ["CESPED", "CAMINO", "CAMINO_2"]:
-                            if not actualizar_casilla(x, z, "CAMINO_2"):
-                                logger_mapa.warning(f"No se pudo actualizar CAMINO_2 en ({x}, {z})")
-            # Actualizar caminos en columnas múltiplos de 5
-            for z in range(-max_abs, max_abs + 1):
-                if z % 5 == 0:  # Si es múltiplo de 5
-                    # Actualizar todas las casillas de la columna como CAMINO_2
-                    tipo_actual = obtener_tipo_casilla(0, z)
-                    if tipo_actual in ["CESPED", "CAMINO", "CAMINO_2"]:
-                        if not actualizar_casilla(0, z, "CRUCE"):
-                            logger_mapa.warning(f"No se pudo actualizar CRUCE en (0, {z})")
-            
-            # Convertir casillas adyacentes a caminos en SOLAR si son CESPED
-            for x in range(-max_abs, max_abs + 1):
-                for z in range(-max_abs, max_abs + 1):
-                    tipo_actual = obtener_tipo_casilla(x, z)
-                    if tipo_actual == "CESPED" and tiene_casilla_caminera_adyacente(x, z):
-                        if not actualizar_casilla(x, z, "SOLAR"):
-                            logger_mapa.warning(f"No se pudo actualizar casilla a SOLAR en ({x}, {z})")
-            
-            # Convertir casillas SOLAR adyacentes a CRUCE en CESPED
-            for x in range(-max_abs, max_abs + 1):
-                for z in range(-max_abs, max_abs + 1):
-                    tipo_actual = obtener_tipo_casilla(x, z)
-                    if tipo_actual == "SOLAR" and tiene_CRUCE_adyacente(x, z):
-                        if not actualizar_casilla(x, z, "CESPED"):
-                            logger_mapa.warning(f"No se pudo actualizar casilla SOLAR a CESPED en ({x}, {z})")
-            
-            conn.commit()
-            logger_mapa.info("Caminos, solares y conversiones a césped actualizados exitosamente")
-            return True
+        # Cada paso es una máscara sobre el mapa entero, en el mismo orden que el trazado
+        # casilla a casilla: cada uno ve los tipos que han dejado los anteriores
+        with modificar_mapa() as modelo:
+            x, z = modelo.coordenadas()
+            columnas = z % 5 == 0  # Columnas múltiplos de 5
+            
+            # CAMINO en x=0 salvo la plaza (|z| < 3)
+            modelo.poner_tipos(np.isin(modelo.tipos, TIPOS_TRAZABLES) & (x == 0) & (np.abs(z) >= 3),
+                               TIPOS_CASILLAS['CAMINO'])
+            # CAMINO_2 en las columnas múltiplos de 5
+            modelo.poner_tipos(np.isin(modelo.tipos, TIPOS_TRAZABLES) & columnas, TIPOS_CASILLAS['CAMINO_2'])
+            # CRUCE donde esas columnas cortan el camino de x=0
+            modelo.poner_tipos(np.isin(modelo.tipos, TIPOS_TRAZABLES) & columnas & (x == 0), cruce)
+            
+            # CESPED adyacente a un camino pasa a SOLAR
+            modelo.poner_tipos((modelo.tipos == cesped) & modelo.adyacentes(TIPOS_CAMINO), solar)
+            # SOLAR adyacente a un CRUCE vuelve a CESPED
+            modelo.poner_tipos((modelo.tipos == solar) & modelo.adyacentes([cruce]), cesped)
+            
+            cambiadas = int(np.count_nonzero(modelo.cambiadas))
+            
+        logger_mapa.info(f"Caminos, solares y conversiones a césped actualizados exitosamente "
+                         f"({cambiadas} casillas cambiadas)")
+        return True
             
     except sqlite3.Error as e:
         logger_mapa.error(f"Error al actualizar caminos y solares: {e}")
@@ -461,86 +625,80 @@ def plaza_central() -> bool:
         True si se completó exitosamente, False en caso de error.
     """
     try:
-        with get_db_connection() as conn:
-            cursor = conn.cursor()
-            
+        with modificar_mapa() as modelo:
             # Primero actualizar todas las casillas a PUEBLO
-            cursor.execute('''
-                UPDATE mapa 
-                SET tipo = ?
-                WHERE x BETWEEN ? AND ? AND z BETWEEN ? AND ?
-            ''', (TIPOS_CASILLAS['PUEBLO'], -2, 2, -2, 2))
+            for x in range(-2, 3):
+                for z in range(-2, 3):
+                    modelo.poner_tipo(x, z, TIPOS_CASILLAS['PUEBLO'])
             
             # Luego actualizar la casilla (0,0) a POZO
-            cursor.execute('''
-                UPDATE mapa 
-                SET tipo = ?
-                WHERE x = ? AND z = ?
-            ''', (TIPOS_CASILLAS['POZO'], 0, 0))
+            pozo = modelo.poner_tipo(0, 0, TIPOS_CASILLAS['POZO'])
             
-            conn.commit()
-            
-            if cursor.rowcount > 0:
-                logger_mapa.info(f"Casillas actualizadas a PUEBLO en el rango -2,-2 a 2,2")
-                logger_mapa.info(f"Casilla (0,0) actualizada a POZO")
-                return True
-            else:
-                logger_mapa.warning("No se encontraron casillas para actualizar en el rango -2,-2 a 2,2")
-                return False
+        if pozo:
+            logger_mapa.info(f"Casillas actualizadas a PUEBLO en el rango -2,-2 a 2,2")
+            logger_mapa.info(f"Casilla (0,0) actualizada a POZO")
+            return True
+        else:
+            logger_mapa.warning("No se encontraron casillas para actualizar en el rango -2,-2 a 2,2")
+            return False
                 
     except Exception as e:
         logger_mapa.error(f"Error al actualizar casillas a PUEBLO/POZO: {e}")
         return False
 
-def completar_cuadrado(tipo_casilla: str = "CESPED") -> bool:
+def _radios_mapa(cursor) -> Tuple[int, int]:
+    """
+    Mayor |x| o |z| de las casillas existentes (0 si no hay ninguna) y mayor r para el que
+    existen todas las casillas de (-r, -r) a (r, r) (-1 si no existe (0, 0)), contando las
+    casillas de cada anillo en la tabla: el anillo r > 0 está completo con 8r casillas.
+    """
+    anillos = cursor.execute('SELECT max(abs(x), abs(z)) AS r, COUNT(*) FROM mapa GROUP BY r ORDER BY r').fetchall()
+    completo = -1
+    for r, casillas in anillos:
+        if r != completo + 1 or casillas != max(1, 8 * r):
+            break
+        completo = r
+    return (anillos[-1][0] if anillos else 0), completo
+
+def completar_cuadrado(tipo_casilla: str = "CESPED", radio: Optional[int] = None) -> bool:
     """
     Completa el cuadrado del mapa creando todas las casillas necesarias.
-    Busca el mayor valor absoluto de x o z existente (N) y crea todas las casillas
-    desde -N,-N hasta N,N con el tipo especificado.
+    Sin radio, busca el mayor valor absoluto de x o z existente (N) y crea todas las
+    casillas que falten desde -N,-N hasta N,N con el tipo especificado.
+    
+    Las casillas se crean con un único INSERT OR IGNORE sobre una serie generada en SQL, y
+    solo fuera del cuadrado que ya está completo: ampliar el mapa un anillo no vuelve a
+    recorrer las casillas de dentro. No necesita el modelo del mapa: el modelo lee las
+    casillas nuevas por su versión la próxima vez que se use.
     
     Args:
         tipo_casilla: Tipo de casilla a usar para las nuevas casillas (default: CESPED)
+        radio: Radio del cuadrado a completar (default: el mayor |x| o |z|, mínimo 3)
         
     Returns:
         True si se completó el cuadrado exitosamente, False en caso de error.
     """
     try:
-        with get_db_connection() as conn:
-            cursor = conn.cursor()
-            
-            # Obtener el mayor valor absoluto de x o z existente
-            cursor.execute('''
-                SELECT MAX(ABS(x)) as max_x, MAX(ABS(z)) as max_z 
-                FROM mapa
-            ''')
-            result = cursor.fetchone()
-            
-            if not result:
-                # Si no hay casillas, usar el mínimo valor de 3
-                max_valor = 3
-            else:
-                # Usar el máximo valor encontrado o 3 si es menor
-                max_valor = max(3, max(result['max_x'], result['max_z']))
-            
-            logger_mapa.info(f"Completando cuadrado hasta ±{max_valor}")
-            
-            # Crear todas las casillas necesarias
-            for x in range(-max_valor, max_valor + 1):
-                for z in range(-max_valor, max_valor + 1):
-                    # Solo crear si no existe
-                    cursor.execute('''
-                        SELECT 1 FROM mapa 
-                        WHERE x = ? AND z = ?
-                    ''', (x, z))
-                    if not cursor.fetchone():
-                        cursor.execute('''
-                            INSERT INTO mapa (x, z, tipo)
-                            VALUES (?, ?, ?)
-                        ''', (x, z, TIPOS_CASILLAS[tipo_casilla]))
-                        logger_mapa.info(f"Casilla creada en ({x}, {z})")
-            
-            conn.commit()
-            return True
+        tipo = TIPOS_CASILLAS[tipo_casilla]
+        with _transaccion_sin_modelo() as (conn, version):
+            max_abs, completo = _radios_mapa(conn.cursor())
+            if radio is None:
+                radio = max(3, max_abs)
+            antes = conn.total_changes
+            if radio > completo:
+                conn.execute('''
+                    WITH RECURSIVE serie(v) AS (
+                        SELECT -:radio UNION ALL SELECT v + 1 FROM serie WHERE v < :radio
+                    )
+                    INSERT OR IGNORE INTO mapa (x, z, tipo, version)
+                    SELECT a.v, b.v, :tipo, :version
+                    FROM serie AS a, serie AS b
+                    WHERE max(abs(a.v), abs(b.v)) > :completo
+                ''', {'radio': radio, 'tipo': tipo, 'completo': completo, 'version': version})
+            creadas = conn.total_changes - antes
+
+        logger_mapa.info(f"Cuadrado completado hasta ±{radio}: {creadas} casillas creadas")
+        return True
             
     except Exception as e:
         logger_mapa.error(f"Error al completar cuadrado: {e}")
@@ -0,0 +1,113 @@
+"""
+Módulo que define el formato compacto de los eventos de acciones (tabla eventos_acciones).
+
+Cada evento guarda el ciudadano, la acción, el resultado y los recursos ganados o gastados
+codificados como texto compacto "recurso_id:cantidad,...". Los mensajes para el chat y la
+web se generan a partir del evento con renderizar_evento.
+"""
+from typing import Dict, Optional
+
+# Resultados posibles de una acción; el índice es el valor guardado en eventos_acciones.resultado
+RESULTADOS = ('exito', 'normal', 'fracaso')
+
+# Mensajes mostrados según el resultado
+MENSAJES_RESULTADO = {
+    'exito': '¡Qué bien!',
+    'normal': '¡No está mal!',
+    'fracaso': '¡Podría ser mejor!'
+}
+
+# Acciones del sistema que no están en la tabla acciones (IDs negativos para no colisionar)
+ACCIONES_SISTEMA = {
+    'FABRICAR': -1,
+    'MEJORAR_CASA': -2,
+    'AÑADIR_ENERGIA': -3,
+}
+
+# Nombres de acciones usados por versiones anteriores del bot y su código actual
+ALIAS_ACCIONES = {
+    'trabajar en el campo': 'cultivar',
+    'trabajar de guardia': 'guardia',
+    'picar piedra': 'minar',
+    'cazar en el bosque': 'cazar',
+    'cavar arcilla': 'cavar',
+    'sumar_energia': 'AÑADIR_ENERGIA',
+}
+
+def formatear_cantidad(cantidad: float):
+    """
+    Redondea una cantidad a 2 decimales y la convierte a entero si no tiene decimales.
+
+    Args:
+        cantidad: Cantidad a formatear
+
+    Returns:
+        int o float con la cantidad redondeada
+    """
+    redondeada = round(cantidad, 2)
+    if redondeada == int(redondeada):
+        return int(redondeada)
+    return redondeada
+
+def codificar_recursos(recursos: Dict[int, float]) -> str:
+    """
+    Codifica un diccionario {recurso_id: cantidad} como "recurso_id:cantidad,...".
+
+    Las cantidades 0 se omiten.
+
+    Args:
+        recursos: Diccionario con el ID del recurso y la cantidad ganada (o gastada si es negativa)
+
+    Returns:
+        str: Texto compacto con los recursos
+    """
+    return ','.join(
+        f'{recurso_id}:{formatear_cantidad(cantidad)}'
+        for recurso_id, cantidad in recursos.items()
+        if cantidad
+    )
+
+def decodificar_recursos(texto: Optional[str]) -> Dict[int, float]:
+    """
+    Decodifica el texto generado por codificar_recursos.
+
+    Args:
+        texto: Texto compacto "recurso_id:cantidad,..." (puede ser None o vacío)
+
+    Returns:
+        Diccionario {recurso_id: cantidad}
+    """
+    recursos = {}
+    if not texto:
+        return recursos
+    for parte in texto.split(','):
+        recurso_id, cantidad = parte.split(':')
+        recursos[int(recurso_id)] = formatear_cantidad(float(cantidad))
+    return recursos
+
+def renderizar_evento(nombre_ciudadano: str, codigo_accion: str, resultado: Optional[int],
+                      recursos: Dict[str, float]) -> str:
+    """
+    Genera el mensaje legible de un evento.
+
+    Args:
+        nombre_ciudadano: Nombre del ciudadano que realizó la acción
+        codigo_accion: Código de la acción (o de la acción del sistema)
+        resultado: Índice en RESULTADOS, o el nivel alcanzado para MEJORAR_CASA
+        recursos: Diccionario {codigo_recurso: cantidad}
+
+    Returns:
+        str: Mensaje del evento
+    """
+    if codigo_accion == 'FABRICAR':
+        productos = [f"{cantidad} {codigo}(s)" for codigo, cantidad in recursos.items() if cantidad > 0]
+        return f"{nombre_ciudadano} fabricó {', '.join(productos) or 'nada'}"
+
+    if codigo_accion == 'MEJORAR_CASA':
+        return f"Casa mejorada a nivel {resultado}"
+
+    obtenidos = [f"{cantidad} {codigo}" for codigo, cantidad in recursos.items() if cantidad]
+    mensaje = f"{nombre_ciudadano} realizó {codigo_accion} y obtuvo: {', '.join(obtenidos) if obtenidos else 'nada'}"
+    if resultado is not None and 0 <= resultado < len(RESULTADOS):
+        mensaje += f"\n{MENSAJES_RESULTADO[RESULTADOS[resultado]]}"
+    return mensaje
@@ -0,0 +1,49 @@
+import sys
+import os
+import logging
+
+# Agregar el directorio raíz al path de Python
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from DB_DML_FUNCIONES import get_ciudadano
+from DB_RANKING import top_ranking, posicion_ranking, tipo_semana
+from eventos import formatear_cantidad
+
+# Número de ciudadanos que se muestran en el chat
+TOP_CHAT = 5
+
+def ranking(nombre_ciudadano: str, tipo: str = None) -> str:
+    """
+    Genera el mensaje del comando !ranking.
+
+    Args:
+        nombre_ciudadano: Nombre del ciudadano que pide el ranking
+        tipo: Código del recurso o 'semana' para las acciones de la semana (por defecto 'moneda')
+
+    Returns:
+        Mensaje con los primeros del ranking y la posición del ciudadano
+    """
+    try:
+        tipo = (tipo or 'moneda').lower()
+        if tipo in ('semana', 'acciones'):
+            clave, titulo = tipo_semana(), 'acciones de la semana'
+        else:
+            clave, titulo = tipo, tipo
+
+        primeros = top_ranking(clave, TOP_CHAT)
+        if not primeros:
+            return f"@{nombre_ciudadano} Todavía no hay ranking de {titulo}."
+
+        mensaje = f"🏆 Ranking de {titulo}: " + ", ".join(
+            f"{fila['posicion']}. {fila['nombre']} ({formatear_cantidad(fila['valor'])})" for fila in primeros
+        )
+        ciudadano = get_ciudadano(nombre_ciudadano)
+        posicion = posicion_ranking(clave, ciudadano['id']) if ciudadano else None
+        if posicion:
+            mensaje += (f" | @{nombre_ciudadano}: puesto {posicion['posicion']} de {posicion['total']}"
+                        f" ({formatear_cantidad(posicion['valor'])})")
+        return mensaje
+
+    except Exception as e:
+        logging.error(f"Error en ranking: {str(e)}")
+        return f"@{nombre_ciudadano} Ha ocurrido un error al consultar el ranking"
@@ -15,7 +15,8 @@ DB_PATH = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__)
 # Agregar el directorio raíz al path de Python
 sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
 
-from DB_DML_FUNCIONES import sumar_recurso_ciudadano, get_ciudadano, registrar_accion
+from DB_DML_FUNCIONES import get_ciudadano, registrar_accion_con_recursos, obtener_inventario
+from eventos import RESULTADOS, ALIAS_ACCIONES
 
 # Definir mensajes por defecto
 MENSAJES_POR_DEFECTO = {
@@ -89,35 +90,18 @@ def realiza_accion(accion: str, nombre_ciudadano: str) -> str:
             'usuario_modif': 'bot'
         }
 
-        # Obtener herramientas del ciudadano en una sola consulta
-        with sqlite3.connect(DB_PATH) as conn:
-            # Desactivar mensajes de depuración
-            conn.set_trace_callback(None)
-            conn.row_factory = sqlite3.Row
-            cursor = conn.cursor()
-            
-            # Obtener todas las herramientas del ciudadano en una sola consulta
-            cursor.execute('''
-                SELECT h.codigo
-                FROM herramientas_ciudadano hc
-                JOIN herramientas h ON hc.herramienta_id = h.id
-                WHERE hc.ciudadano_id = ? 
-                  AND hc.tiene = 1 
-                  AND hc.activo = 1 
-                  AND h.activo = 1
-            ''', (ciudadano['id'],))
-            
-            # Convertir resultados a un conjunto de códigos de herramientas
-            herramientas_activas = {row['codigo'] for row in cursor.fetchall()}
-            
-            # Verificar qué herramientas tiene el ciudadano
-            tiene_hacha = 'hacha' in herramientas_activas
-            tiene_pico = 'pico' in herramientas_activas
-            tiene_pala = 'pala' in herramientas_activas
-            tiene_arco = 'arco' in herramientas_activas
-            tiene_cana = 'caña' in herramientas_activas
-            tiene_espada = 'espada' in herramientas_activas
-            tiene_hazada = 'hazada' in herramientas_activas
+        # Obtener herramientas del ciudadano desde su inventario (una sola consulta)
+        inventario = obtener_inventario(ciudadano['id']) or {'herramientas': {}}
+        herramientas_activas = {codigo for codigo, tiene in inventario['herramientas'].items() if tiene}
+
+        # Verificar qué herramientas tiene el ciudadano
+        tiene_hacha = 'hacha' in herramientas_activas
+        tiene_pico = 'pico' in herramientas_activas
+        tiene_pala = 'pala' in herramientas_activas
+        tiene_arco = 'arco' in herramientas_activas
+        tiene_cana = 'caña' in herramientas_activas
+        tiene_espada = 'espada' in herramientas_activas
+        tiene_hazada = 'hazada' in herramientas_activas
 
         # Calcular recursos según la acción
         if accion == 'talar':
@@ -219,31 +203,11 @@ def realiza_accion(accion: str, nombre_ciudadano: str) -> str:
                     cantidad = max(1, cantidad * 0.7)  # -30% pero al menos 1
                 recursos_obtenidos[recurso] = cantidad
 
-        # Actualizar recursos del ciudadano
-        for recurso, cantidad in recursos_obtenidos.items():
-            # Verificar si el recurso necesita ser actualizado (cantidad distinta de 0)
-            if cantidad != 0:
-                # Mapeo de recursos a sus nombres de campo en la base de datos
-                nombre_campo = {
-                    'madera': 'madera',
-                    'rama': 'rama',
-                    'trigo': 'trigo',
-                    'hierro': 'hierro',
-                    'carne': 'carne',
-                    'piel': 'piel',
-                    'pescado': 'pescado',
-                    'verdura': 'verdura',
-                    'hierba': 'hierba',
-                    'piedra': 'piedra',
-                    'moneda': 'moneda',
-                    'arcilla': 'arcilla',
-                    'agua': 'agua',
-                    'energia': 'energia'  # Añadido para manejar la energía
-                }.get(recurso)
-                
-                if nombre_campo is not None:  # Solo actualizar si el recurso es válido
-                    sumar_recurso_ciudadano(ciudadano['id'], nombre_campo, cantidad)
-        # Registrar la acción con detalles de recursos 
+        # Sumar los recursos y registrar la acción en una sola transacción
+        recursos_obtenidos = {recurso: cantidad for recurso, cantidad in recursos_obtenidos.items() if cantidad != 0}
+        if not registrar_accion_con_recursos(ALIAS_ACCIONES.get(accion, accion), ciudadano['id'],
+                                             RESULTADOS.index(resultado), recursos_obtenidos, 'bot'):
+            return f"@{nombre_ciudadano} Ha ocurrido un error al realizar la acción {accion}"
         mensaje_base = MENSAJES_POR_DEFECTO.get(accion, f"@{nombre_ciudadano} ha realizado la acción {accion} y obtiene:")
         mensaje_final = mensaje_base.format(autor=nombre_ciudadano) + "\n"
         recursos_obtenidos_str = []
@@ -253,7 +217,6 @@ def realiza_accion(accion: str, nombre_ciudadano: str) -> str:
         if recursos_obtenidos_str:
             mensaje_final += ", ".join(recursos_obtenidos_str) + ".\n"
         mensaje_final += f"{MENSAJES_RESULTADO[resultado]}"
-        registrar_accion(accion, mensaje_final, ciudadano.get('id', 0))
         return mensaje_final 
 
     except Exception as e:
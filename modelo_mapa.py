@@ -0,0 +1,326 @@
+"""
+Módulo que define el modelo en memoria de la tabla mapa sobre arrays densos de NumPy.
+
+db_mapa consulta y modifica el mapa a través de ModeloMapa: la tabla se lee entera con una
+sola SELECT en arrays de tipo de casilla, ciudadano e ID, indexados por el desplazamiento de
+(x, z) respecto a la esquina mínima del mapa. Así una casilla o sus 8 vecinas se consultan en
+O(1) sin ir a la base de datos, y guardar() escribe solo las casillas cambiadas o creadas.
+
+Los arrays tienen un borde de una posición vacía alrededor del mapa, para que el vecindario
+de una casilla del límite se lea con el mismo corte que el de cualquier otra.
+"""
+import itertools
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+
+import numpy as np
+
+# Valor de las posiciones sin casilla (en tipos e ids) y de las casillas sin ciudadano
+VACIO = 0
+
+class ModeloMapa:
+    """
+    Mapa en memoria: tipos[i, j], ciudadanos[i, j] e ids[i, j] son la casilla
+    (x_min + i, z_min + j). Las modificaciones se anotan para que guardar() solo escriba esas.
+    """
+
+    def __init__(self, x_min: int = 0, z_min: int = 0, ancho: int = 0, alto: int = 0):
+        # Origen y tamaño incluyen el borde vacío
+        self.x_min = x_min - 1
+        self.z_min = z_min - 1
+        forma = (ancho + 2, alto + 2)
+        self.tipos = np.zeros(forma, dtype=np.int16)
+        self.ciudadanos = np.zeros(forma, dtype=np.int64)
+        self.ids = np.zeros(forma, dtype=np.int64)
+        self.cambiadas = np.zeros(forma, dtype=bool)
+
+    @staticmethod
+    def _leer_filas(cursor) -> np.ndarray:
+        """Filas (x, z, tipo, ciudadano, id) de la consulta ya ejecutada en el cursor."""
+        return np.fromiter(itertools.chain.from_iterable(cursor), dtype=np.int64).reshape(-1, 5)
+
+    def _poner_filas(self, filas: np.ndarray) -> None:
+        i, j = filas[:, 0] - self.x_min, filas[:, 1] - self.z_min
+        self.tipos[i, j] = filas[:, 2]
+        self.ciudadanos[i, j] = filas[:, 3]
+        self.ids[i, j] = filas[:, 4]
+
+    @classmethod
+    def cargar(cls, cursor) -> 'ModeloMapa':
+        """
+        Lee la tabla mapa entera.
+
+        Args:
+            cursor: Cursor de la base de datos (puede estar dentro de una transacción)
+
+        Returns:
+            ModeloMapa con todas las casillas
+        """
+        cursor.execute('SELECT x, z, tipo, COALESCE(ciudadano_id, 0), id FROM mapa')
+        filas = cls._leer_filas(cursor)
+        if not len(filas):
+            return cls()
+        x_min, z_min = int(filas[:, 0].min()), int(filas[:, 1].min())
+        modelo = cls(x_min, z_min, int(filas[:, 0].max()) - x_min + 1, int(filas[:, 1].max()) - z_min + 1)
+        modelo._poner_filas(filas)
+        return modelo
+
+    def cargar_cambiadas(self, cursor, version: int) -> int:
+        """
+        Pone al día las casillas creadas o cambiadas en la tabla después de una versión del
+        mapa (columna version, con índice idx_mapa_version).
+
+        Returns:
+            Número de casillas leídas
+        """
+        cursor.execute('SELECT x, z, tipo, COALESCE(ciudadano_id, 0), id FROM mapa WHERE version > ?', (version,))
+        filas = self._leer_filas(cursor)
+        if len(filas):
+            self._abarcar(int(filas[:, 0].min()), int(filas[:, 1].min()))
+            self._abarcar(int(filas[:, 0].max()), int(filas[:, 1].max()))
+            self._poner_filas(filas)
+        return len(filas)
+
+    def __len__(self) -> int:
+        return int(np.count_nonzero(self.tipos))
+
+    def _indice(self, x: int, z: int) -> Optional[Tuple[int, int]]:
+        i, j = x - self.x_min, z - self.z_min
+        if 0 <= i < self.tipos.shape[0] and 0 <= j < self.tipos.shape[1]:
+            return i, j
+        return None
+
+    def _ampliar(self, x: int, z: int) -> None:
+        """Agranda los arrays para que (x, z) quede dentro, con su borde vacío."""
+        antes_x = max(0, self.x_min - (x - 1))
+        antes_z = max(0, self.z_min - (z - 1))
+        despues_x = max(0, x + 1 - (self.x_min + self.tipos.shape[0] - 1))
+        despues_z = max(0, z + 1 - (self.z_min + self.tipos.shape[1] - 1))
+        relleno = ((antes_x, despues_x), (antes_z, despues_z))
+        self.tipos = np.pad(self.tipos, relleno)
+        self.ciudadanos = np.pad(self.ciudadanos, relleno)
+        self.ids = np.pad(self.ids, relleno)
+        self.cambiadas = np.pad(self.cambiadas, relleno)
+        self.x_min -= antes_x
+        self.z_min -= antes_z
+
+    def _abarcar(self, x: int, z: int) -> None:
+        """Amplía los arrays si (x, z) o su borde quedan fuera."""
+        if self._indice(x - 1, z - 1) is None or self._indice(x + 1, z + 1) is None:
+            self._ampliar(x, z)
+
+    def existe(self, x: int, z: int) -> bool:
+        """Indica si hay casilla en (x, z)."""
+        return self.tipo(x, z) != VACIO
+
+    def tipo(self, x: int, z: int) -> int:
+        """ID del tipo de la casilla (x, z), o VACIO si no existe."""
+        indice = self._indice(x, z)
+        return int(self.tipos[indice]) if indice else VACIO
+
+    def casilla(self, x: int, z: int) -> Optional[Dict[str, Any]]:
+        """
+        Datos de una casilla como los devuelve la tabla: id, x, z, tipo (ID) y ciudadano_id.
+
+        Returns:
+            Diccionario o None si no existe
+        """
+        if not self.existe(x, z):
+            return None
+        indice = self._indice(x, z)
+        ciudadano_id = int(self.ciudadanos[indice])
+        return {'id': int(self.ids[indice]) or None, 'x': x, 'z': z, 'tipo': int(self.tipos[indice]),
+                'ciudadano_id': ciudadano_id or None}
+
+    def vecindario(self, x: int, z: int) -> np.ndarray:
+        """
+        Tipos de las casillas de (x - 1, z - 1) a (x + 1, z + 1); vecindario[1, 1] es (x, z).
+
+        Returns:
+            Array 3x3 (una vista de los datos si (x, z) está dentro del mapa)
+        """
+        i, j = x - self.x_min, z - self.z_min
+        if 1 <= i < self.tipos.shape[0] - 1 and 1 <= j < self.tipos.shape[1] - 1:
+            return self.tipos[i - 1:i + 2, j - 1:j + 2]
+        vecindario = np.zeros((3, 3), dtype=self.tipos.dtype)
+        for dx in (-1, 0, 1):
+            for dz in (-1, 0, 1):
+                vecindario[dx + 1, dz + 1] = self.tipo(x + dx, z + dz)
+        return vecindario
+
+    def hay_adyacente(self, x: int, z: int, tipos: Iterable[int]) -> bool:
+        """Indica si alguna de las 8 casillas de alrededor de (x, z) es de uno de los tipos."""
+        coincide = np.isin(self.vecindario(x, z), list(tipos))
+        coincide[1, 1] = False
+        return bool(coincide.any())
+
+    def max_abs(self) -> int:
+        """Mayor |x| o |z| de las casillas existentes (0 si no hay ninguna)."""
+        i, j = np.nonzero(self.tipos)
+        if not len(i):
+            return 0
+        return int(max(np.abs(i + self.x_min).max(), np.abs(j + self.z_min).max()))
+
+    def radio_completo(self) -> int:
+        """
+        Mayor r para el que existen todas las casillas de (-r, -r) a (r, r), o -1 si no
+        existe (0, 0).
+        """
+        if not self.existe(0, 0):
+            return -1
+        x, z = self.coordenadas()
+        # El borde vacío asegura que siempre falta alguna posición
+        return int(np.maximum(np.abs(x), np.abs(z))[self.tipos == VACIO].min()) - 1
+
+    def crear(self, x: int, z: int, tipo: int) -> bool:
+        """
+        Crea la casilla (x, z).
+
+        Returns:
+            bool: False si ya existía
+        """
+        if self.existe(x, z):
+            return False
+        self._abarcar(x, z)
+        self.tipos[self._indice(x, z)] = tipo
+        self.cambiadas[self._indice(x, z)] = True
+        return True
+
+    def poner_tipo(self, x: int, z: int, tipo: int) -> bool:
+        """
+        Cambia el tipo de la casilla (x, z).
+
+        Returns:
+            bool: False si la casilla no existe
+        """
+        if not self.existe(x, z):
+            return False
+        indice = self._indice(x, z)
+        if self.tipos[indice] != tipo:
+            self.tipos[indice] = tipo
+            self.cambiadas[indice] = True
+        return True
+
+    def asignar_ciudadano(self, x: int, z: int, ciudadano_id: Optional[int], anotar: bool = True) -> bool:
+        """
+        Asigna (o quita, con None) el ciudadano de la casilla (x, z).
+
+        Args:
+            anotar: False si la tabla ya tiene el cambio y guardar() no debe escribirlo
+
+        Returns:
+            bool: False si la casilla no existe
+        """
+        if not self.existe(x, z):
+            return False
+        indice = self._indice(x, z)
+        if self.ciudadanos[indice] != (ciudadano_id or VACIO):
+            self.ciudadanos[indice] = ciudadano_id or VACIO
+            self.cambiadas[indice] |= anotar
+        return True
+
+    def coordenadas(self) -> Tuple[np.ndarray, np.ndarray]:
+        """
+        Coordenadas de cada posición de los arrays, para construir máscaras.
+
+        Returns:
+            (x, z): x en columna y z en fila, que se combinan por broadcasting
+        """
+        return (np.arange(self.tipos.shape[0])[:, None] + self.x_min,
+                np.arange(self.tipos.shape[1])[None, :] + self.z_min)
+
+    def adyacentes(self, tipos: Iterable[int]) -> np.ndarray:
+        """
+        Máscara de las posiciones con alguna de sus 8 vecinas de uno de los tipos: la suma de
+        la máscara de esos tipos desplazada en las 8 direcciones (una convolución 3x3 sin
+        el centro).
+
+        Returns:
+            Array de bool con la forma de tipos
+        """
+        coincide = np.pad(np.isin(self.tipos, list(tipos)), 1).astype(np.int8)
+        alto, ancho = self.tipos.shape
+        vecinas = np.zeros(self.tipos.shape, dtype=np.int8)
+        for dx in (0, 1, 2):
+            for dz in (0, 1, 2):
+                if dx != 1 or dz != 1:
+                    vecinas += coincide[dx:dx + alto, dz:dz + ancho]
+        return vecinas > 0
+
+    def poner_tipos(self, mascara: np.ndarray, tipo: int) -> int:
+        """
+        Cambia a tipo las casillas existentes marcadas en la máscara.
+
+        Returns:
+            Número de casillas que han cambiado
+        """
+        cambian = mascara & (self.tipos != VACIO) & (self.tipos != tipo)
+        self.tipos[cambian] = tipo
+        self.cambiadas |= cambian
+        return int(np.count_nonzero(cambian))
+
+    def tiene_ciudadano(self, ciudadano_id: int) -> bool:
+        """Indica si alguna casilla está asignada al ciudadano."""
+        return bool((self.ciudadanos == ciudadano_id).any())
+
+    def mas_cercano(self, tipo: int, x: int, z: int) -> Optional[Tuple[int, int]]:
+        """
+        Casilla de un tipo sin ciudadano más cercana a (x, z) por distancia Manhattan (a igual
+        distancia, la de menor ID). Busca en ventanas de radio 1, 2, 4... alrededor de (x, z):
+        toda casilla a distancia <= radio está en la ventana, así que el coste depende de la
+        distancia a la casilla y no del tamaño del mapa.
+
+        Returns:
+            Coordenadas (x, z) o None si no hay ninguna
+        """
+        alto, ancho = self.tipos.shape
+        i, j = x - self.x_min, z - self.z_min
+        radio = 1
+        while True:
+            i0, i1 = min(alto, max(0, i - radio)), max(0, min(alto, i + radio + 1))
+            j0, j1 = min(ancho, max(0, j - radio)), max(0, min(ancho, j + radio + 1))
+            ventana = (slice(i0, i1), slice(j0, j1))
+            vi, vj = np.nonzero((self.tipos[ventana] == tipo) & (self.ciudadanos[ventana] == VACIO))
+            completa = (i0, j0, i1, j1) == (0, 0, alto, ancho)
+            if len(vi):
+                vi, vj = vi + i0, vj + j0
+                distancias = np.abs(vi - i) + np.abs(vj - j)
+                k = np.lexsort((self.ids[vi, vj], distancias))[0]
+                if distancias[k] <= radio or completa:
+                    return int(vi[k]) + self.x_min, int(vj[k]) + self.z_min
+            if completa:
+                return None
+            radio *= 2
+
+    def guardar(self, cursor, version: int = 0) -> int:
+        """
+        Escribe en la tabla mapa las casillas cambiadas o creadas desde la carga (o desde el
+        último guardar) dentro de la transacción del cursor.
+
+        Args:
+            cursor: Cursor de la transacción en curso
+            version: Versión del mapa con la que se marcan las casillas escritas
+
+        Returns:
+            Número de casillas escritas
+        """
+        i, j = np.nonzero(self.cambiadas)
+        tipos, ciudadanos, ids = self.tipos[i, j].tolist(), self.ciudadanos[i, j].tolist(), self.ids[i, j].tolist()
+        x, z = (i + self.x_min).tolist(), (j + self.z_min).tolist()
+        actualizadas, nuevas = [], []
+        for k, casilla_id in enumerate(ids):
+            if casilla_id:
+                actualizadas.append((tipos[k], ciudadanos[k] or None, version, casilla_id))
+            else:
+                nuevas.append((x[k], z[k], tipos[k], ciudadanos[k] or None, version))
+        cursor.executemany('UPDATE mapa SET tipo = ?, ciudadano_id = ?, version = ? WHERE id = ?', actualizadas)
+        if nuevas:
+            cursor.execute('SELECT COALESCE(MAX(id), 0) FROM mapa')
+            ultimo_id = cursor.fetchone()[0]
+            cursor.executemany('INSERT INTO mapa (x, z, tipo, ciudadano_id, version) VALUES (?, ?, ?, ?, ?)', nuevas)
+            cursor.execute('SELECT id, x, z FROM mapa WHERE id > ?', (ultimo_id,))
+            for casilla_id, x, z in cursor.fetchall():
+                indice = self._indice(x, z)
+                if indice:
+                    self.ids[indice] = casilla_id
+        self.cambiadas[:] = False
+        return len(actualizadas) + len(nuevas)
@@ -0,0 +1,78 @@
+"""
+Pruebas de las copias de seguridad en caliente (DB_BACKUP).
+
+Se ejecutan sobre una copia temporal de soloville.db:
+    python -m pytest -q test_backup.py
+"""
+import gzip
+import os
+import sqlite3
+import threading
+
+import pytest
+
+from DB_BACKUP import ServicioBackup, hacer_backup, listar_backups, rotar_backups, verificar_backup
+
+def contar(ruta, tabla='recursos_ciudadano'):
+    with sqlite3.connect(ruta) as conn:
+        return conn.execute(f'SELECT COUNT(*) FROM {tabla}').fetchone()[0]
+
+def test_copia_sin_comprimir(copia_bd, tmp_path):
+    copia = hacer_backup(copia_bd, str(tmp_path / 'backups'), comprimir=False)
+    assert copia and copia.endswith('.db')
+    assert verificar_backup(copia)
+    assert contar(copia) == contar(copia_bd)
+    assert os.listdir(tmp_path / 'backups') == [os.path.basename(copia)]
+
+@pytest.mark.parametrize('modo', ['delete', 'wal'])
+def test_copia_comprimida_mientras_se_escribe(copia_bd, tmp_path, modo):
+    with sqlite3.connect(copia_bd) as conn:
+        conn.execute(f'PRAGMA journal_mode = {modo}')
+    parar = threading.Event()
+    escrituras = []
+
+    def escribir():
+        conn = sqlite3.connect(copia_bd, timeout=5)
+        while not parar.is_set():
+            with conn:
+                conn.execute('UPDATE recursos_ciudadano SET cantidad = cantidad + 1 WHERE ciudadano_id = 1')
+            escrituras.append(1)
+        conn.close()
+
+    escritor = threading.Thread(target=escribir)
+    escritor.start()
+    try:
+        copia = hacer_backup(copia_bd, str(tmp_path / 'backups'), paginas=1, pausa=0.001)
+    finally:
+        parar.set()
+        escritor.join()
+
+    assert copia and copia.endswith('.db.gz')
+    assert escrituras
+    assert verificar_backup(copia)
+    with gzip.open(copia, 'rb') as archivo:
+        assert archivo.read(16) == b'SQLite format 3\x00'
+
+def test_verificar_detecta_copia_corrupta(tmp_path):
+    corrupta = tmp_path / 'soloville-20250101-000000.db'
+    corrupta.write_bytes(b'no es una base de datos' * 100)
+    assert not verificar_backup(str(corrupta))
+
+def test_rotacion_conserva_las_mas_recientes(tmp_path):
+    for dia in range(1, 6):
+        (tmp_path / f'soloville-2025010{dia}-000000.db.gz').write_bytes(b'')
+    (tmp_path / 'otro.db').write_bytes(b'')
+    borradas = rotar_backups(str(tmp_path), conservar=2)
+    assert len(borradas) == 3
+    assert [os.path.basename(ruta) for ruta in listar_backups(str(tmp_path))] == [
+        'soloville-20250105-000000.db.gz', 'soloville-20250104-000000.db.gz']
+    assert (tmp_path / 'otro.db').exists()
+
+def test_servicio(copia_bd, tmp_path):
+    servicio = ServicioBackup(intervalo=60, ruta_origen=copia_bd, directorio=str(tmp_path / 'backups'))
+    servicio.start()
+    while servicio.ultima_copia is None and servicio.fallos == 0:
+        servicio.join(0.01)
+    servicio.detener()
+    assert not servicio.is_alive()
+    assert servicio.fallos == 0 and verificar_backup(servicio.ultima_copia)
@@ -0,0 +1,79 @@
+"""
+Pruebas de la caché LRU (cache.py) y de la resolución de nombres de ciudadanos.
+
+Se ejecutan sobre una copia temporal de soloville.db:
+    python -m pytest -q test_cache.py
+"""
+import sqlite3
+import time
+
+import pytest
+
+import DB_DDL
+import DB_DML_FUNCIONES
+from cache import CacheLRU, NO_ENCONTRADO
+from DB_DML_FUNCIONES import (resolver_ciudadano, get_ciudadano, crear_ciudadano, actualizar_ciudadano,
+                              eliminar_ciudadano, estadisticas_cache_ciudadanos)
+
+def test_cache_lru_descarta_la_menos_usada():
+    cache = CacheLRU(2)
+    cache.guardar('a', 1)
+    cache.guardar('b', None)
+    assert cache.obtener('a') == 1
+    cache.guardar('c', 3)
+    assert cache.obtener('b') is NO_ENCONTRADO
+    assert cache.obtener('c') == 3
+    assert cache.estadisticas() == {'tamano': 2, 'capacidad': 2, 'aciertos': 2, 'fallos': 1, 'tasa_aciertos': 2 / 3}
+
+def test_resolver_normaliza_y_reutiliza(bd_temporal):
+    ciudadano = resolver_ciudadano('@SoloUnTurnoMas ')
+    assert ciudadano['nombre'] == 'solounturnomas'
+    assert resolver_ciudadano('solounturnomas') == ciudadano
+    assert get_ciudadano('SOLOUNTURNOMAS')['id'] == ciudadano['id']
+    estadisticas = estadisticas_cache_ciudadanos()
+    assert (estadisticas['aciertos'], estadisticas['fallos']) == (2, 1)
+
+def test_crear_invalida_nombre_inexistente(bd_temporal):
+    assert get_ciudadano('nuevo') is None
+    assert resolver_ciudadano('nuevo') is None
+    assert crear_ciudadano('Nuevo')
+    assert resolver_ciudadano('nuevo')['nombre'] == 'nuevo'
+    assert not crear_ciudadano('nuevo')
+
+def test_renombrar_y_desactivar_invalidan(bd_temporal):
+    assert crear_ciudadano('viejo')
+    ciudadano_id = resolver_ciudadano('viejo')['id']
+    assert actualizar_ciudadano('viejo', {'nombre': 'renombrado'})
+    assert resolver_ciudadano('viejo') is None
+    assert resolver_ciudadano('renombrado')['id'] == ciudadano_id
+
+    assert actualizar_ciudadano('renombrado', {'borrado_logico': 1})
+    assert resolver_ciudadano('renombrado')['borrado_logico'] == 1
+
+def test_nombre_inexistente_caduca(bd_temporal, monkeypatch):
+    monkeypatch.setattr(DB_DML_FUNCIONES, 'TTL_CIUDADANO_NO_ACTIVO', 0.2)
+    assert resolver_ciudadano('fantasma') is None
+    # Otro proceso lo crea sin invalidar la caché de este
+    with sqlite3.connect(bd_temporal) as conn:
+        conn.execute("INSERT INTO ciudadanos (nombre) VALUES ('fantasma')")
+    assert resolver_ciudadano('fantasma') is None
+
+    time.sleep(0.3)
+    assert resolver_ciudadano('fantasma')['nombre'] == 'fantasma'
+    # Un ciudadano activo no caduca
+    assert DB_DML_FUNCIONES._cache_ciudadanos.obtener('fantasma')[0] is None
+
+def test_desactivar_invalida(bd_temporal):
+    assert resolver_ciudadano('solounturnomas')['activo'] == 1
+    assert eliminar_ciudadano('solounturnomas')
+    assert len(DB_DML_FUNCIONES._cache_ciudadanos) == 0
+    # Al volver a leerlo se guarda como inactivo, con caducidad
+    assert resolver_ciudadano('solounturnomas')['activo'] == 0
+    assert DB_DML_FUNCIONES._cache_ciudadanos.obtener('solounturnomas')[0] is not None
+
+def test_reactivar_invalida(bd_temporal):
+    assert eliminar_ciudadano('solounturnomas')
+    assert resolver_ciudadano('solounturnomas')['activo'] == 0
+    assert actualizar_ciudadano('solounturnomas', {'activo': 1})
+    assert resolver_ciudadano('solounturnomas')['activo'] == 1
+    assert DB_DML_FUNCIONES._cache_ciudadanos.obtener('solounturnomas')[0] is None
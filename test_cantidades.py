@@ -0,0 +1,74 @@
+"""
+Pruebas de las cantidades en centésimas (cantidades.py y DB_DDL.migrar_cantidades_centesimas).
+
+Se ejecutan sobre una copia temporal de soloville.db:
+    python -m pytest -q test_cantidades.py
+"""
+import sqlite3
+
+import pytest
+
+import DB_DDL
+from cantidades import a_centesimas, desde_centesimas
+from DB_DML_FUNCIONES import obtener_inventario, sumar_recursos_ciudadano
+from DB_LIBRO import verificar_libro
+from DB_RANKING import posicion_ranking
+
+@pytest.fixture
+def bd_temporal(bd_sin_esquema):
+    """Copia de soloville.db (con cantidades en unidades) sin aplicar las migraciones."""
+    with sqlite3.connect(bd_sin_esquema) as conn:
+        cursor = conn.cursor()
+        DB_DDL.crear_tablas(cursor)
+        DB_DDL.crear_indices(cursor)
+        DB_DDL.crear_triggers(cursor)
+    return bd_sin_esquema
+
+def cantidades(ruta):
+    with sqlite3.connect(ruta) as conn:
+        return dict(((ciudadano_id, recurso_id), cantidad) for ciudadano_id, recurso_id, cantidad in conn.execute(
+            'SELECT ciudadano_id, recurso_id, cantidad FROM recursos_ciudadano'))
+
+def test_conversion():
+    assert a_centesimas(1.3) == 130
+    assert a_centesimas(0.1 + 0.2) == 30
+    assert a_centesimas(-0.2) == -20
+    assert desde_centesimas(130) == 1.3
+    assert desde_centesimas(500) == 5 and isinstance(desde_centesimas(500), int)
+    assert desde_centesimas(-150) == -1.5
+    assert desde_centesimas(None) == 0
+
+def test_migracion(bd_temporal):
+    antes = cantidades(bd_temporal)
+    with sqlite3.connect(bd_temporal) as conn:
+        movimientos = conn.execute('SELECT COUNT(*) FROM movimientos_recursos').fetchone()[0]
+        assert DB_DDL.aplicar_migraciones(conn.cursor()) == ['cantidades_centesimas', 'version_ciudadanos', 'activo_ciudadanos']
+        # Ya anotada: no se vuelve a aplicar
+        assert DB_DDL.aplicar_migraciones(conn.cursor()) == []
+        assert conn.execute('SELECT COUNT(*) FROM movimientos_recursos').fetchone()[0] == movimientos
+        assert conn.execute("SELECT COUNT(*) FROM sqlite_master WHERE name LIKE 'trg_libro_recursos_%'").fetchone()[0] == 3
+        tipos = {fila[0] for fila in conn.execute('SELECT DISTINCT typeof(cantidad) FROM recursos_ciudadano')}
+
+    despues = cantidades(bd_temporal)
+    assert tipos == {'integer'}
+    assert despues == {clave: a_centesimas(cantidad) for clave, cantidad in antes.items()}
+    assert verificar_libro() == []
+    moneda = posicion_ranking('moneda', 1)
+    assert moneda['valor'] == obtener_inventario(1, usar_cache=False)['recursos']['moneda']
+
+def test_sumas_exactas(bd_temporal):
+    with sqlite3.connect(bd_temporal) as conn:
+        DB_DDL.aplicar_migraciones(conn.cursor())
+    inicial = obtener_inventario(1, usar_cache=False)['recursos'].get('madera', 0)
+    # Diez acciones con ×1,3 y ×0,7 no acumulan error
+    for _ in range(10):
+        assert sumar_recursos_ciudadano(1, {'madera': 1.3, 'energia': -0.1})
+        assert sumar_recursos_ciudadano(1, {'madera': 0.7})
+    assert obtener_inventario(1, usar_cache=False)['recursos']['madera'] == inicial + 20
+
+def test_base_de_datos_nueva(tmp_path):
+    with sqlite3.connect(str(tmp_path / 'nueva.db')) as conn:
+        cursor = conn.cursor()
+        assert DB_DDL.crear_tablas(cursor)
+        # Sin datos anteriores las migraciones se dan por aplicadas
+        assert DB_DDL.aplicar_migraciones(cursor) == []
@@ -0,0 +1,49 @@
+"""
+Pruebas del catálogo en memoria (DB_CATALOGO).
+
+Se ejecutan sobre una copia temporal de soloville.db:
+    python -m pytest -q test_catalogo.py
+"""
+import sqlite3
+
+import pytest
+
+from DB_DML_FUNCIONES import obtener_catalogo, obtener_receta_fabricacion
+
+def test_busquedas_por_id_y_codigo(bd_temporal):
+    catalogo = obtener_catalogo()
+    madera = catalogo.recursos_por_codigo['madera']
+    assert catalogo.recursos[madera['id']] is madera
+    assert catalogo.acciones_por_codigo['talar']['id'] == 1
+    with sqlite3.connect(bd_temporal) as conn:
+        assert len(catalogo.herramientas) == conn.execute('SELECT COUNT(*) FROM herramientas').fetchone()[0]
+        assert set(catalogo.habilidades_por_codigo) == {fila[0] for fila in conn.execute('SELECT codigo FROM habilidades')}
+
+def test_catalogo_inmutable(bd_temporal):
+    catalogo = obtener_catalogo()
+    with pytest.raises(TypeError):
+        catalogo.recursos_por_codigo['madera']['nombre'] = 'otra'
+    with pytest.raises(TypeError):
+        catalogo.recursos[0] = {}
+    with pytest.raises(AttributeError):
+        catalogo.version = 5
+
+def test_recetas_coinciden_con_la_base_de_datos(bd_temporal):
+    catalogo = obtener_catalogo()
+    tabla = catalogo.recursos_por_codigo['tabla']
+    receta = obtener_receta_fabricacion(tabla['nombre'])
+    assert catalogo.recetas[tabla['id']]['cantidad'] == receta['cantidad_generada']
+    assert dict(catalogo.recetas[tabla['id']]['coste']) == receta['coste']
+
+def test_se_recarga_al_cambiar_la_version(bd_temporal):
+    catalogo = obtener_catalogo()
+    assert obtener_catalogo() is catalogo
+    with sqlite3.connect(bd_temporal) as conn:
+        conn.execute("UPDATE recursos SET titulo = 'Madera noble' WHERE codigo = 'madera'")
+        assert conn.execute('SELECT version FROM catalogo_version').fetchone()[0] == catalogo.version + 1
+    # Hasta que pasa el intervalo se sigue usando el catálogo cargado
+    assert obtener_catalogo() is catalogo
+    nuevo = obtener_catalogo(forzar=True)
+    assert nuevo.version == catalogo.version + 1
+    assert nuevo.recursos_por_codigo['madera']['titulo'] == 'Madera noble'
+    assert catalogo.recursos_por_codigo['madera']['titulo'] != 'Madera noble'
@@ -0,0 +1,98 @@
+"""
+Pruebas del mapa por chunks y por cambios (chunks_mapa.py) y de la versión del mapa de db_mapa.
+
+Se ejecutan sobre una copia temporal de soloville.db:
+    python -m pytest -q test_chunks.py
+"""
+import sqlite3
+
+import pytest
+
+import chunks_mapa
+import db_mapa
+from chunks_mapa import (MAX_CHUNKS, TAMANO_CHUNK, CacheChunks, chunk_de, chunks_en, leer_cambios, leer_chunk,
+                         parsear_chunks)
+
+def version(ruta):
+    with sqlite3.connect(ruta) as conn:
+        return db_mapa.version_mapa(conn.cursor())
+
+def test_chunks_de_la_vista():
+    assert chunk_de(0, 0) == (0, 0)
+    assert chunk_de(-1, TAMANO_CHUNK) == (-1, 1)
+    assert chunks_en(-1, 1, 0, TAMANO_CHUNK - 1) == [(-1, 0), (0, 0)]
+    with pytest.raises(ValueError):
+        chunks_en(0, TAMANO_CHUNK * MAX_CHUNKS, 0, TAMANO_CHUNK)
+    assert parsear_chunks('0,0;-1,2') == [(0, 0), (-1, 2)]
+    with pytest.raises(ValueError):
+        parsear_chunks('0,0,0')
+
+def test_la_version_sube_con_cada_cambio(bd_temporal):
+    inicial = version(bd_temporal)
+    # Leer o escribir lo que ya hay no cambia la versión
+    assert db_mapa.actualizar_casilla(2, 2, db_mapa.obtener_tipo_casilla(2, 2))
+    assert version(bd_temporal) == inicial
+
+    assert db_mapa.actualizar_casilla(2, 2, 'AGUA')
+    assert version(bd_temporal) == inicial + 1
+
+    # El nombre y la casa de un ciudadano con solar también se ven en el mapa
+    with sqlite3.connect(bd_temporal) as conn:
+        conn.execute("UPDATE ciudadanos SET nivel_casa = nivel_casa + 1 WHERE id = 1")
+    assert version(bd_temporal) == inicial + 2
+
+def test_cache_por_version(bd_temporal):
+    cache = CacheChunks()
+    with sqlite3.connect(bd_temporal) as conn:
+        datos = cache.obtener(conn, chunks_en(-6, 6, -6, 6))
+        assert len(datos['chunks']) == 4
+        assert sum(len(chunk['casillas']) for chunk in datos['chunks']) == 169
+        casa = next(casilla for chunk in datos['chunks'] for casilla in chunk['casillas']
+                    if (casilla['x'], casilla['z']) == (-3, -1))
+        assert casa['tipo'] == 'SOLAR' and casa['nombre'] == 'solounturnomas'
+
+        # La misma versión sale de la caché
+        assert cache.obtener(conn, [(0, 0)]) == dict(datos, chunks=[datos['chunks'][-1]])
+        assert cache.lecturas == 4
+
+    # Un cambio sube la versión y se vuelve a leer el chunk
+    assert db_mapa.actualizar_casilla(2, 2, 'AGUA')
+    with sqlite3.connect(bd_temporal) as conn:
+        nuevos = cache.obtener(conn, [(0, 0)])
+        assert nuevos['version'] == datos['version'] + 1
+        assert cache.lecturas == 5
+        assert nuevos['chunks'][0]['casillas'] == leer_chunk(conn.cursor(), 0, 0)
+        assert next(c for c in nuevos['chunks'][0]['casillas'] if (c['x'], c['z']) == (2, 2))['tipo'] == 'AGUA'
+
+def cambios(ruta, desde):
+    with sqlite3.connect(ruta) as conn:
+        return {(c['x'], c['z']): c for c in leer_cambios(conn.cursor(), desde)}
+
+def test_cambios_desde_una_version(bd_temporal):
+    inicial = version(bd_temporal)
+    assert cambios(bd_temporal, inicial) == {}
+
+    assert db_mapa.actualizar_casilla(2, 2, 'AGUA')
+    assert cambios(bd_temporal, inicial).keys() == {(2, 2)}
+    assert cambios(bd_temporal, inicial)[(2, 2)]['tipo'] == 'AGUA'
+
+    # El solar de un ciudadano que mejora la casa también cambia
+    with sqlite3.connect(bd_temporal) as conn:
+        conn.execute("UPDATE ciudadanos SET nivel_casa = nivel_casa + 1 WHERE id = 1")
+    assert cambios(bd_temporal, inicial + 1).keys() == {(-3, -1)}
+
+    # Las casillas creadas y los solares asignados llevan la versión de su transacción
+    assert db_mapa.completar_cuadrado(radio=8)
+    nuevas = cambios(bd_temporal, inicial + 2)
+    assert len(nuevas) == 17 * 17 - 13 * 13
+    assert version(bd_temporal) == inicial + 3
+    assert db_mapa.asignar_ciudadano_a_solar(99999)
+    x, z = next((c['x'], c['z']) for c in cambios(bd_temporal, inicial + 3).values())
+    assert db_mapa.obtener_casilla(x, z)['ciudadano_id'] == 99999
+
+def test_demasiados_cambios(bd_temporal, monkeypatch):
+    monkeypatch.setattr(chunks_mapa, 'MAX_CAMBIOS', 10)
+    assert db_mapa.completar_cuadrado(radio=8)
+    with sqlite3.connect(bd_temporal) as conn:
+        assert leer_cambios(conn.cursor(), 0) is None
+        assert len(leer_cambios(conn.cursor(), version(bd_temporal))) == 0
@@ -0,0 +1,77 @@
+"""
+Pruebas de las escrituras optimistas (concurrencia.py, fabricar_producto y mejorar_casa).
+
+Se ejecutan sobre una copia temporal de soloville.db:
+    python -m pytest -q test_concurrencia.py
+"""
+import sqlite3
+import threading
+
+import pytest
+
+import DB_DML_FUNCIONES
+from concurrencia import ConflictoVersion, MetricasContencion, ejecutar_con_reintentos
+from DB_DML_FUNCIONES import (_escribir_recursos_versionados, _leer_recursos_versionados, estadisticas_concurrencia,
+                              fabricar_producto, obtener_inventario, sumar_recurso_ciudadano)
+
+def test_reintenta_hasta_que_no_hay_conflicto():
+    metricas = MetricasContencion()
+    intentos = []
+
+    def operacion():
+        intentos.append(1)
+        if len(intentos) < 3:
+            raise ConflictoVersion('cambiado')
+        return 'hecho'
+
+    assert ejecutar_con_reintentos(operacion, 'prueba', metricas=metricas) == 'hecho'
+    estadisticas = metricas.estadisticas()['prueba']
+    assert (estadisticas['ejecuciones'], estadisticas['reintentos'], estadisticas['conflictos']) == (1, 2, 2)
+    assert estadisticas['tasa_reintentos'] == 2
+
+    def bloqueada():
+        raise sqlite3.OperationalError('database is locked')
+
+    with pytest.raises(sqlite3.OperationalError):
+        ejecutar_con_reintentos(bloqueada, 'bloqueo', intentos=2, metricas=metricas)
+    assert metricas.estadisticas()['bloqueo']['agotadas'] == 1
+
+def test_escritura_detecta_cambio_concurrente(bd_temporal):
+    madera = DB_DML_FUNCIONES.obtener_catalogo().recursos_por_codigo['madera']['id']
+    with sqlite3.connect(bd_temporal) as conn:
+        cursor = conn.cursor()
+        leidos = _leer_recursos_versionados(cursor, 1, [madera])
+        assert sumar_recurso_ciudadano(1, 'madera', 1)
+        with pytest.raises(ConflictoVersion):
+            _escribir_recursos_versionados(cursor, 1, {madera: -1}, leidos, 'prueba')
+        conn.rollback()
+
+        leidos = _leer_recursos_versionados(cursor, 1, [madera])
+        _escribir_recursos_versionados(cursor, 1, {madera: -1}, leidos, 'prueba')
+        conn.commit()
+        assert _leer_recursos_versionados(cursor, 1, [madera])[madera] == (leidos[madera][0] - 1, leidos[madera][1] + 1)
+
+def test_fabricar_en_paralelo_no_gasta_de_mas(bd_temporal):
+    # Recursos exactos para fabricar 5 veces Tabla (1 madera y 1 energía, produce 5 tablas);
+    # la tabla guarda centésimas
+    with sqlite3.connect(bd_temporal) as conn:
+        conn.execute('''
+            UPDATE recursos_ciudadano SET cantidad = 500
+            WHERE ciudadano_id = 1 AND recurso_id IN (SELECT id FROM recursos WHERE codigo IN ('madera', 'energia'))
+        ''')
+    tablas = obtener_inventario(1, usar_cache=False)['recursos'].get('tabla', 0)
+
+    resultados = []
+    def fabricar():
+        resultados.append(fabricar_producto('solounturnomas', 'Tabla', 'prueba'))
+
+    hilos = [threading.Thread(target=fabricar) for _ in range(8)]
+    for hilo in hilos:
+        hilo.start()
+    for hilo in hilos:
+        hilo.join()
+
+    assert resultados.count(True) == 5
+    recursos = obtener_inventario(1, usar_cache=False)['recursos']
+    assert (recursos['madera'], recursos['energia'], recursos['tabla']) == (0, 0, tablas + 25)
+    assert estadisticas_concurrencia()['fabricar_producto']['ejecuciones'] == 8
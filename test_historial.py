@@ -0,0 +1,97 @@
+"""
+Pruebas de la retención del historial de acciones (DB_HISTORIAL).
+
+Se ejecutan sobre una copia temporal de soloville.db:
+    python -m pytest -q test_historial.py
+"""
+import sqlite3
+
+import pytest
+
+from DB_DML_FUNCIONES import registrar_accion, listar_historial_acciones
+from DB_HISTORIAL import archivar_historial, obtener_resumen_acciones, reconstruir_resumen_diario
+
+def test_registrar_accion_actualiza_resumen(bd_temporal):
+    assert registrar_accion('talar', 1, 0, {'madera': 2})
+    assert registrar_accion('talar', 1, 2, {'madera': 1})
+    resumen = obtener_resumen_acciones(ciudadano_id=1)
+    assert {'ciudadano_id': 1, 'accion_id': 1, 'codigo_accion': 'talar', 'total': 2} in resumen
+
+def test_registrar_accion_desconocida_falla(bd_temporal):
+    assert not registrar_accion('volar', 1)
+    assert not registrar_accion('talar', 1, 0, {'oro': 1})
+
+def test_historial_se_renderiza_desde_eventos(bd_temporal):
+    assert registrar_accion('talar', 1, 0, {'madera': 1.95, 'rama': 7.8, 'hierba': 0})
+    assert registrar_accion('FABRICAR', 1, recursos={'madera': -2, 'tabla': 1})
+    fabricar, talar = listar_historial_acciones(ciudadano_id=1)[:2]
+    assert talar['mensaje_final'] == 'solounturnomas realizó talar y obtuvo: 1.95 madera, 7.8 rama\n¡Qué bien!'
+    assert talar['recursos'] == {'madera': 1.95, 'rama': 7.8}
+    assert fabricar['mensaje_final'] == 'solounturnomas fabricó 1 tabla(s)'
+    with sqlite3.connect(bd_temporal) as conn:
+        assert conn.execute('SELECT recursos FROM eventos_acciones ORDER BY id LIMIT 1').fetchone()[0] == '2:1.95,3:7.8'
+
+def test_archivar_mueve_filas_antiguas_por_lotes(bd_temporal):
+    with sqlite3.connect(bd_temporal) as conn:
+        conn.execute('''
+            INSERT INTO eventos_acciones (ciudadano_id, accion_id, ts)
+            VALUES (1, 1, CAST(strftime('%s', 'now', '-40 days') AS INTEGER)), (1, 1, CAST(strftime('%s', 'now') AS INTEGER))
+        ''')
+        antiguas = conn.execute(
+            "SELECT COUNT(*) FROM historial_acciones WHERE fecha_hora < datetime('now', '-30 days')"
+        ).fetchone()[0]
+        total_inicial = conn.execute('SELECT COUNT(*) FROM historial_acciones').fetchone()[0]
+        conn.execute('''
+            INSERT INTO historial_acciones (codigo_accion, mensaje_final, ciudadano_id, fecha_hora)
+            VALUES ('talar', 'reciente', 1, CURRENT_TIMESTAMP)
+        ''')
+    assert antiguas > 0
+
+    assert archivar_historial(dias_retencion=30, tamano_lote=50) == antiguas + 1
+
+    with sqlite3.connect(bd_temporal) as conn:
+        activas = conn.execute('SELECT COUNT(*) FROM historial_acciones').fetchone()[0]
+        archivadas = conn.execute('SELECT COUNT(*) FROM historial_acciones_archivo').fetchone()[0]
+        eventos = conn.execute('SELECT COUNT(*) FROM eventos_acciones').fetchone()[0]
+        eventos_archivados = conn.execute('SELECT COUNT(*) FROM eventos_acciones_archivo').fetchone()[0]
+    assert activas == total_inicial - antiguas + 1
+    assert archivadas == antiguas
+    assert (eventos, eventos_archivados) == (1, 1)
+
+def test_archivar_en_base_de_datos_adjunta(bd_temporal, tmp_path):
+    ruta_archivo = str(tmp_path / 'archivo.db')
+    movidas = archivar_historial(dias_retencion=0, ruta_archivo=ruta_archivo)
+    assert movidas > 0
+    with sqlite3.connect(ruta_archivo) as conn:
+        assert conn.execute('SELECT COUNT(*) FROM historial_acciones_archivo').fetchone()[0] == movidas
+
+def test_reconstruir_resumen_incluye_archivo(bd_temporal):
+    assert registrar_accion('talar', 1, 1, {'madera': 1})
+    with sqlite3.connect(bd_temporal) as conn:
+        # Las filas heredadas con códigos que no son acciones (IDs de recompensa, '1') no se cuentan
+        total = conn.execute('''
+            SELECT COUNT(*) FROM historial_acciones
+            WHERE codigo_accion NOT IN ('1', 'f7b19ecc-5085-43b2-a07e-dee6f8c064dd')
+        ''').fetchone()[0] + 1
+    archivar_historial(dias_retencion=30)
+    assert reconstruir_resumen_diario()
+    assert sum(fila['total'] for fila in obtener_resumen_acciones()) == total
+
+def test_reconstruir_resumen_incluye_base_de_datos_de_archivo(bd_temporal, tmp_path):
+    ruta_archivo = str(tmp_path / 'archivo.db')
+    with sqlite3.connect(bd_temporal) as conn:
+        conn.execute('''
+            INSERT INTO eventos_acciones (ciudadano_id, accion_id, ts)
+            VALUES (1, 1, CAST(strftime('%s', 'now', '-400 days') AS INTEGER)),
+                   (1, 1, CAST(strftime('%s', 'now', '-40 days') AS INTEGER))
+        ''')
+    assert reconstruir_resumen_diario()
+    total = sum(fila['total'] for fila in obtener_resumen_acciones())
+    # Parte del archivo queda en la base de datos principal y parte en la adjunta
+    archivar_historial(dias_retencion=365)
+    assert archivar_historial(dias_retencion=30, ruta_archivo=ruta_archivo) > 0
+
+    assert reconstruir_resumen_diario()
+    assert sum(fila['total'] for fila in obtener_resumen_acciones()) < total
+    assert reconstruir_resumen_diario(ruta_archivo)
+    assert sum(fila['total'] for fila in obtener_resumen_acciones()) == total
@@ -0,0 +1,66 @@
+"""
+Pruebas de los índices parciales y de la migración de índices (DB_DDL.migrar_indices).
+
+Se ejecutan sobre una copia temporal de soloville.db:
+    python -m pytest -q test_indices.py
+"""
+import sqlite3
+
+import pytest
+
+import DB_DDL
+import DB_DML_FUNCIONES
+from DB_DML_FUNCIONES import (asignar_herramienta, crear_ciudadanos, obtener_inventario, realizar_accion,
+                              sumar_recursos_ciudadano)
+
+@pytest.fixture
+def bd_temporal(bd_sin_esquema):
+    """Copia de soloville.db con la migración de índices aplicada."""
+    with sqlite3.connect(bd_sin_esquema) as conn:
+        cursor = conn.cursor()
+        DB_DDL.crear_tablas(cursor)
+        DB_DDL.aplicar_migraciones(cursor)
+        DB_DDL.migrar_indices(cursor)
+    return bd_sin_esquema
+
+def plan(ruta, consulta, parametros=()):
+    with sqlite3.connect(ruta) as conn:
+        return ' | '.join(fila[3] for fila in conn.execute('EXPLAIN QUERY PLAN ' + consulta, parametros))
+
+def test_migracion(bd_temporal):
+    with sqlite3.connect(bd_temporal) as conn:
+        indices = {fila[0] for fila in conn.execute("SELECT name FROM sqlite_master WHERE type = 'index'")}
+        parciales = {fila[1] for fila in conn.execute("PRAGMA index_list('habilidades_ciudadano')") if fila[4]}
+    assert not indices & set(DB_DDL.INDICES_OBSOLETOS)
+    assert {'idx_herramientas_ciudadano_activas', 'idx_herramientas_ciudadano_inactivas',
+            'idx_habilidades_ciudadano_activas', 'idx_habilidades_ciudadano_inactivas',
+            'idx_recursos_acciones_activas'} <= indices
+    assert parciales == {'idx_habilidades_ciudadano_activas', 'idx_habilidades_ciudadano_inactivas'}
+    # La migración puede repetirse
+    with sqlite3.connect(bd_temporal) as conn:
+        DB_DDL.migrar_indices(conn.cursor())
+
+def test_consultas_usan_indices_de_cobertura(bd_temporal):
+    assert 'COVERING INDEX idx_habilidades_ciudadano_activas' in plan(bd_temporal, '''
+        SELECT habilidad_id, nivel, puntos_experiencia FROM habilidades_ciudadano
+        WHERE ciudadano_id = ? AND activo = 1''', (1,))
+    assert 'COVERING INDEX idx_herramientas_ciudadano_activas' in plan(bd_temporal, '''
+        SELECT herramienta_id, tiene FROM herramientas_ciudadano
+        WHERE ciudadano_id = ? AND activo = 1''', (1,))
+    assert 'COVERING INDEX idx_recursos_acciones_activas' in plan(bd_temporal, '''
+        SELECT recurso_id, cantidad, probabilidad FROM recursos_acciones
+        WHERE accion_id = ? AND activo = 1''', (1,))
+
+def test_filas_desactivadas(bd_temporal):
+    ids = crear_ciudadanos(['indices'], asignar_solar=False)
+    ciudadano_id = ids['indices']
+    catalogo = DB_DML_FUNCIONES.obtener_catalogo()
+    hacha = next(codigo for codigo, herramienta in catalogo.herramientas_por_codigo.items() if herramienta['activo'])
+    assert asignar_herramienta(ciudadano_id, hacha)
+    assert obtener_inventario(ciudadano_id, usar_cache=False)['herramientas'][hacha] is True
+
+    with sqlite3.connect(bd_temporal) as conn:
+        conn.execute('UPDATE herramientas_ciudadano SET activo = 0 WHERE ciudadano_id = ?', (ciudadano_id,))
+    assert hacha not in obtener_inventario(ciudadano_id, usar_cache=False)['herramientas']
+    assert sumar_recursos_ciudadano(ciudadano_id, {'energia': 1})
+    assert realizar_accion('indices', 'talar', 'prueba')['exito']
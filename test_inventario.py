@@ -0,0 +1,133 @@
+"""
+Pruebas del inventario de un ciudadano (obtener_inventario) y de mejorar_casa.
+
+Se ejecutan sobre una copia temporal de soloville.db:
+    python -m pytest -q test_inventario.py
+"""
+import sqlite3
+
+import pytest
+
+import DB_DDL
+import DB_DML_FUNCIONES
+from cantidades import desde_centesimas
+from DB_DML_FUNCIONES import (obtener_inventario, obtener_cantidad_recurso, sumar_recurso_ciudadano,
+                              crear_ciudadano, mejorar_casa, get_ciudadano, listar_historial_acciones, asignar_herramienta,
+                              sumar_experiencia, compactar_habilidades_herramientas, realizar_accion)
+
+def test_inventario_coincide_con_las_tablas(bd_temporal):
+    inventario = obtener_inventario(1)
+    with sqlite3.connect(bd_temporal) as conn:
+        recursos = dict(conn.execute('''
+            SELECT r.codigo, rc.cantidad FROM recursos_ciudadano rc
+            JOIN recursos r ON r.id = rc.recurso_id WHERE rc.ciudadano_id = 1
+        ''').fetchall())
+        herramientas = dict(conn.execute('''
+            SELECT h.codigo, hc.tiene FROM herramientas_ciudadano hc
+            JOIN herramientas h ON h.id = hc.herramienta_id
+            WHERE hc.ciudadano_id = 1 AND hc.activo = 1 AND h.activo = 1
+        ''').fetchall())
+        habilidades = dict(conn.execute('''
+            SELECT habilidad_id, nivel FROM habilidades_ciudadano WHERE ciudadano_id = 1 AND activo = 1
+        ''').fetchall())
+    catalogo = DB_DML_FUNCIONES.obtener_catalogo()
+    # La tabla guarda centésimas (ver cantidades.py)
+    assert inventario['recursos'] == {codigo: desde_centesimas(cantidad) for codigo, cantidad in recursos.items()}
+    # Las herramientas y habilidades sin fila toman los valores por defecto
+    assert inventario['herramientas'] == {
+        **{codigo: False for codigo, herramienta in catalogo.herramientas_por_codigo.items() if herramienta['activo']},
+        **{codigo: bool(tiene) for codigo, tiene in herramientas.items()}
+    }
+    assert {codigo: datos['nivel'] for codigo, datos in inventario['habilidades'].items()} == {
+        **{codigo: 1 for codigo, habilidad in catalogo.habilidades_por_codigo.items() if habilidad['activo']},
+        **habilidades
+    }
+
+def test_habilidades_y_herramientas_sin_filas(bd_temporal):
+    assert compactar_habilidades_herramientas() == 15 + 3
+    inventario = obtener_inventario(1, usar_cache=False)
+    assert inventario['habilidades']['minero'] == {'nivel': 1, 'puntos_experiencia': 0}
+    assert inventario['herramientas']['pala'] is False
+    assert sum(inventario['herramientas'].values()) == 4
+
+    # La fila se crea con el primer cambio
+    assert sumar_experiencia(1, 'minero', 80) == 2
+    assert sumar_experiencia(1, 'minero', 130) == 3
+    assert asignar_herramienta(1, 'pala')
+    inventario = obtener_inventario(1)
+    assert inventario['habilidades']['minero'] == {'nivel': 3, 'puntos_experiencia': 210}
+    assert inventario['herramientas']['pala'] is True
+    assert sumar_experiencia(1, 'no_existe', 1) is None
+    with sqlite3.connect(bd_temporal) as conn:
+        assert conn.execute('SELECT COUNT(*) FROM habilidades_ciudadano').fetchone()[0] == 1
+
+def test_accion_sin_fila_de_herramienta(bd_temporal):
+    with sqlite3.connect(bd_temporal) as conn:
+        conn.execute('DELETE FROM herramientas_ciudadano')
+    assert realizar_accion('solounturnomas', 'talar')['exito']
+
+def test_accion_con_nombre_del_chat(bd_temporal):
+    assert realizar_accion('@SoloUnTurnoMas', 'talar')['exito']
+
+def test_cache_se_invalida_al_escribir(bd_temporal):
+    piedra = obtener_cantidad_recurso(1, 'piedra')
+    with sqlite3.connect(bd_temporal) as conn:
+        conn.execute("UPDATE recursos_ciudadano SET cantidad = cantidad + 100 WHERE ciudadano_id = 1 AND recurso_id = 4")
+    # Un cambio hecho fuera de este módulo no se ve hasta que caduca la caché
+    assert obtener_cantidad_recurso(1, 'piedra') == piedra
+    assert obtener_inventario(1, usar_cache=False)['recursos']['piedra'] == piedra + 1
+
+    assert sumar_recurso_ciudadano(1, 'piedra', 2)
+    assert obtener_cantidad_recurso(1, 'piedra') == piedra + 3
+
+def test_cache_devuelve_copias(bd_temporal):
+    obtener_inventario(1)['recursos']['piedra'] = -1
+    assert obtener_inventario(1)['recursos'].get('piedra') != -1
+
+def test_mejorar_casa_usa_recursos_ciudadano(bd_temporal):
+    ciudadano = get_ciudadano('solounturnomas')
+    with sqlite3.connect(bd_temporal) as conn:
+        conn.execute('UPDATE ciudadanos SET nivel_casa = 0 WHERE id = ?', (ciudadano['id'],))
+        conn.execute("DELETE FROM recursos_ciudadano WHERE ciudadano_id = ? AND recurso_id = (SELECT id FROM recursos WHERE codigo = 'cuerda')",
+                     (ciudadano['id'],))
+    assert not mejorar_casa('solounturnomas')
+
+    for codigo, cantidad in (('piel', 10), ('rama', 20), ('cuerda', 2), ('moneda', 20), ('energia', 5)):
+        assert sumar_recurso_ciudadano(ciudadano['id'], codigo, cantidad)
+    antes = obtener_inventario(ciudadano['id'])['recursos']
+    assert mejorar_casa('solounturnomas')
+
+    despues = obtener_inventario(ciudadano['id'])['recursos']
+    assert despues['cuerda'] == antes['cuerda'] - 2
+    assert despues['moneda'] == antes['moneda'] - 20
+    assert get_ciudadano('solounturnomas')['nivel_casa'] == 1
+    assert listar_historial_acciones(ciudadano_id=ciudadano['id'])[0]['mensaje_final'] == 'Casa mejorada a nivel 1'
+
+def test_mejorar_casa_en_base_de_datos_nueva(bd_sin_esquema, tmp_path, monkeypatch):
+    ruta = str(tmp_path / 'nueva.db')
+    with sqlite3.connect(ruta) as conn:
+        cursor = conn.cursor()
+        assert DB_DDL.crear_tablas(cursor)
+        DB_DDL.crear_indices(cursor)
+        DB_DDL.crear_triggers(cursor)
+        # Solo el catálogo de recursos de soloville.db
+        cursor.execute('ATTACH DATABASE ? AS origen', (bd_sin_esquema,))
+        cursor.execute('INSERT INTO recursos SELECT * FROM origen.recursos')
+        conn.commit()
+        cursor.execute('DETACH DATABASE origen')
+    monkeypatch.setattr(DB_DML_FUNCIONES, 'DB_PATH', ruta)
+
+    assert crear_ciudadano('nuevo')
+    ciudadano_id = get_ciudadano('nuevo')['id']
+    for codigo, cantidad in (('piel', 10), ('rama', 20), ('cuerda', 2), ('moneda', 20), ('energia', 5)):
+        assert sumar_recurso_ciudadano(ciudadano_id, codigo, cantidad)
+    assert mejorar_casa('nuevo')
+    assert get_ciudadano('nuevo')['nivel_casa'] == 1
+
+def test_migracion_anade_version_a_ciudadanos(tmp_path):
+    with sqlite3.connect(str(tmp_path / 'antigua.db')) as conn:
+        cursor = conn.cursor()
+        cursor.execute('CREATE TABLE ciudadanos (id INTEGER PRIMARY KEY, nombre TEXT)')
+        cursor.execute("INSERT INTO ciudadanos (nombre) VALUES ('antiguo')")
+        DB_DDL.migrar_version_ciudadanos(cursor)
+        assert cursor.execute('SELECT version FROM ciudadanos').fetchone()[0] == 1
@@ -0,0 +1,100 @@
+"""
+Pruebas de las conexiones de lectura del panel web (DB_LECTURA).
+
+Se ejecutan sobre una copia temporal de soloville.db:
+    python -m pytest -q test_lectura.py
+"""
+import sqlite3
+import time
+
+import pytest
+
+from DB_DML_FUNCIONES import info_fabricacion, listar_historial_acciones, obtener_inventario
+from DB_LECTURA import LectorBD, activar_wal
+
+def nivel_casa(conn):
+    return conn.execute('SELECT nivel_casa FROM ciudadanos WHERE id = 1').fetchone()['nivel_casa']
+
+def escribir_nivel(ruta, nivel):
+    with sqlite3.connect(ruta) as conn:
+        conn.execute('UPDATE ciudadanos SET nivel_casa = ? WHERE id = 1', (nivel,))
+
+def test_instantanea_se_actualiza_tras_el_intervalo(copia_bd, tmp_path):
+    lector = LectorBD('instantanea', copia_bd, str(tmp_path / 'lectura.db'), intervalo=3600)
+    escribir_nivel(copia_bd, 1)
+    with lector.conectar() as conn:
+        assert nivel_casa(conn) == 1
+    assert lector.actualizaciones == 1
+
+    # Hasta que caduca, la instantánea no ve las escrituras nuevas
+    escribir_nivel(copia_bd, 2)
+    with lector.conectar() as conn:
+        assert nivel_casa(conn) == 1
+    estado = lector.estado()
+    assert estado['modo'] == 'instantanea' and estado['retraso_segundos'] >= 0
+    assert estado['duracion_actualizacion_ms'] is not None
+
+    lector.intervalo = 0
+    with lector.conectar() as conn:
+        assert nivel_casa(conn) == 2
+    assert lector.actualizaciones == 2
+
+def test_instantanea_en_segundo_plano(copia_bd, tmp_path):
+    lector = LectorBD('instantanea', copia_bd, str(tmp_path / 'lectura.db'), intervalo=0.05)
+    assert lector.iniciar()
+    assert not lector.iniciar()
+    try:
+        escribir_nivel(copia_bd, 4)
+        limite = time.monotonic() + 5
+        while lector.actualizaciones < 3 and time.monotonic() < limite:
+            time.sleep(0.01)
+        # Con el hilo, pedir una conexión no rehace la instantánea aunque haya caducado
+        lector.intervalo = 3600
+        actualizaciones = lector.actualizaciones
+        with lector.conectar() as conn:
+            assert nivel_casa(conn) == 4
+        assert lector.actualizaciones == actualizaciones
+        assert lector.estado()['en_segundo_plano']
+    finally:
+        lector.parar()
+    assert not lector.estado()['en_segundo_plano']
+
+def test_lecturas_de_la_web_con_el_lector(bd_temporal, tmp_path):
+    lector = LectorBD('instantanea', bd_temporal, str(tmp_path / 'lectura.db'), intervalo=3600)
+    catalogo = lector.catalogo()
+    with lector.conectar() as conn:
+        inventario = obtener_inventario(1, conexion=conn, catalogo=catalogo)
+    assert inventario == obtener_inventario(1, usar_cache=False)
+
+    # Lo que se escribe después no está en la instantánea
+    with sqlite3.connect(bd_temporal) as conn:
+        conn.execute('UPDATE recursos_ciudadano SET cantidad = cantidad + 100 WHERE ciudadano_id = 1')
+    with lector.conectar() as conn:
+        assert obtener_inventario(1, conexion=conn, catalogo=catalogo) == inventario
+        assert listar_historial_acciones(ciudadano_id=1, conexion=conn, catalogo=catalogo) == \
+            listar_historial_acciones(ciudadano_id=1)
+        producto = next(iter(catalogo.recetas))
+        assert info_fabricacion(producto, conexion=conn) == info_fabricacion(producto)
+    assert obtener_inventario(1, usar_cache=False) != inventario
+
+def test_instantanea_no_se_puede_escribir(copia_bd, tmp_path):
+    lector = LectorBD('instantanea', copia_bd, str(tmp_path / 'lectura.db'))
+    with pytest.raises(sqlite3.OperationalError):
+        with lector.conectar() as conn:
+            conn.execute('UPDATE ciudadanos SET nivel_casa = 3')
+
+def test_solo_lectura_en_wal(copia_bd):
+    assert activar_wal(copia_bd) == 'wal'
+    lector = LectorBD('solo_lectura', copia_bd)
+    conn = lector.conectar()
+    escribir_nivel(copia_bd, 3)
+    assert nivel_casa(conn) == 3
+    with pytest.raises(sqlite3.OperationalError):
+        conn.execute('UPDATE ciudadanos SET nivel_casa = 4')
+    conn.close()
+    assert lector.estado()['journal_mode'] == 'wal'
+    assert lector.estado()['retraso_segundos'] == 0
+
+def test_modo_desconocido():
+    with pytest.raises(ValueError):
+        LectorBD('replica')
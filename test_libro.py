@@ -0,0 +1,89 @@
+"""
+Pruebas del libro de movimientos de recursos (DB_LIBRO).
+
+Se ejecutan sobre una copia temporal de soloville.db:
+    python -m pytest -q test_libro.py
+"""
+import sqlite3
+import time
+
+import pytest
+
+import DB_LIBRO
+from cantidades import a_centesimas
+from DB_DML_FUNCIONES import fabricar_producto, obtener_inventario, sumar_recursos_ciudadano
+from DB_LIBRO import inventario_en, reconstruir_inventario, tomar_instantanea, verificar_libro
+
+def movimientos(ruta):
+    with sqlite3.connect(ruta) as conn:
+        return conn.execute('SELECT COUNT(*) FROM movimientos_recursos').fetchone()[0]
+
+def test_cada_cambio_anota_el_delta_aplicado(bd_temporal):
+    inicial = obtener_inventario(1, usar_cache=False)['recursos']
+    assert sumar_recursos_ciudadano(1, {'madera': 5, 'piedra': 2})
+    # El límite a 0 se anota como el cambio que realmente se aplicó
+    assert sumar_recursos_ciudadano(1, {'piedra': -10 ** 9})
+    with sqlite3.connect(bd_temporal) as conn:
+        deltas = conn.execute('SELECT delta FROM movimientos_recursos ORDER BY id').fetchall()
+    # El libro guarda centésimas, como recursos_ciudadano
+    assert [delta for (delta,) in deltas] == [500, 200, -a_centesimas(inicial.get('piedra', 0) + 2)]
+    assert verificar_libro() == []
+
+def test_inventario_en_un_momento_anterior(bd_temporal):
+    sumar_recursos_ciudadano(1, {'madera': 5})
+    antes = obtener_inventario(1, usar_cache=False)['recursos']
+    with sqlite3.connect(bd_temporal) as conn:
+        # Mover los movimientos al pasado para separar los dos momentos
+        conn.execute('UPDATE movimientos_recursos SET ts = ts - 100')
+        conn.execute('UPDATE instantaneas_recursos SET ts = ts - 200')
+    sumar_recursos_ciudadano(1, {'madera': 7, 'piedra': 1})
+
+    pasado = inventario_en(1, time.time() - 50)
+    assert pasado['madera'] == pytest.approx(antes['madera'])
+    assert pasado.get('piedra', 0) == antes.get('piedra', 0)
+    actual = inventario_en(1)
+    assert actual['madera'] == pytest.approx(antes['madera'] + 7)
+    # Antes de la primera instantánea el libro no tiene datos
+    assert inventario_en(1, time.time() - 10 ** 6) is None
+
+def test_instantaneas(bd_temporal, monkeypatch):
+    assert tomar_instantanea() is None
+    sumar_recursos_ciudadano(1, {'madera': 5})
+    assert tomar_instantanea(movimientos=2) is None
+    primera = tomar_instantanea(forzar=True)
+    assert primera
+    sumar_recursos_ciudadano(1, {'madera': 1, 'piedra': 1})
+    monkeypatch.setattr(DB_LIBRO, 'INSTANTANEAS_CONSERVADAS', 1)
+    segunda = tomar_instantanea(movimientos=2)
+    assert segunda
+    with sqlite3.connect(bd_temporal) as conn:
+        ids = [fila[0] for fila in conn.execute('SELECT id FROM instantaneas_recursos ORDER BY id')]
+    # Se conservan el punto de partida y la más reciente
+    assert len(ids) == 2 and ids[-1] == segunda and primera not in ids
+    assert inventario_en(1)['madera'] == pytest.approx(obtener_inventario(1, usar_cache=False)['recursos']['madera'])
+    assert verificar_libro() == []
+
+def test_fabricar_queda_en_el_libro(bd_temporal):
+    sumar_recursos_ciudadano(1, {'madera': 1, 'energia': 1})
+    anotados = movimientos(bd_temporal)
+    assert fabricar_producto('solounturnomas', 'Tabla', 'prueba')
+    # Se gastan madera y energía y se suman tablas
+    assert movimientos(bd_temporal) == anotados + 3
+    assert verificar_libro() == []
+
+def test_reconstruir_inventario(bd_temporal):
+    sumar_recursos_ciudadano(1, {'madera': 5})
+    esperado = obtener_inventario(1, usar_cache=False)['recursos']
+    anotados = movimientos(bd_temporal)
+    with sqlite3.connect(bd_temporal) as conn:
+        # Simular una migración que pierde datos sin pasar por los triggers
+        conn.execute('DROP TRIGGER trg_libro_recursos_update')
+        conn.execute('UPDATE recursos_ciudadano SET cantidad = 0 WHERE ciudadano_id = 1')
+
+    assert len(verificar_libro()) > 0
+    assert reconstruir_inventario() > 0
+    assert verificar_libro() == []
+    assert obtener_inventario(1)['recursos'] == esperado
+    assert movimientos(bd_temporal) == anotados
+    sumar_recursos_ciudadano(1, {'madera': 1})
+    assert movimientos(bd_temporal) == anotados + 1
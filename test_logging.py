@@ -0,0 +1,69 @@
+"""
+Pruebas de la configuración del logging (configuracion_logging).
+
+    python -m pytest -q test_logging.py
+"""
+import gzip
+import io
+import logging
+import logging.handlers
+import os
+
+import pytest
+
+import configuracion_logging
+from configuracion_logging import crear_handler_archivo, detener_logging, niveles_configurados, setup_logging
+
+@pytest.fixture
+def logging_temporal(tmp_path):
+    """Configura el logging en un directorio temporal y restaura la configuración normal al terminar."""
+    yield str(tmp_path / 'twitch_bot.log')
+    setup_logging()
+
+def test_niveles_configurados():
+    niveles = niveles_configurados('database=warning, twitch_bot.web = ERROR,mal=NIVEL')
+    assert niveles['database'] == logging.WARNING
+    assert niveles['twitch_bot.web'] == logging.ERROR
+    assert niveles['twitch_bot'] == configuracion_logging.NIVELES_LOGGING['twitch_bot']
+    assert 'mal' not in niveles
+
+def test_cola_escribe_archivo_y_consola(logging_temporal):
+    consola = io.StringIO()
+    setup_logging(logging_temporal, niveles={'twitch_bot': logging.DEBUG, 'database': logging.WARNING},
+                  consola=consola)
+    logging.getLogger('twitch_bot').info("Canje de %s", 'espectador')
+    logging.getLogger('twitch_bot.database').debug("Hijo de %s", 'twitch_bot')
+    logging.getLogger('database').info("No se escribe")
+    logging.getLogger('database').warning("Aviso %d", 1)
+    detener_logging()
+
+    with open(logging_temporal, encoding='utf-8') as archivo:
+        lineas = archivo.read().splitlines()
+    assert [linea.split(' - ', 1)[1] for linea in lineas] == [
+        'twitch_bot - INFO - Canje de espectador',
+        'twitch_bot.database - DEBUG - Hijo de twitch_bot',
+        'database - WARNING - Aviso 1',
+    ]
+    assert consola.getvalue().splitlines() == lineas
+
+def test_setup_repetido_no_duplica_handlers(logging_temporal):
+    setup_logging(logging_temporal, consola=io.StringIO())
+    setup_logging(logging_temporal, consola=io.StringIO())
+    for nombre in configuracion_logging.LOGGERS_APLICACION:
+        handlers = logging.getLogger(nombre).handlers
+        assert sum(isinstance(handler, logging.handlers.QueueHandler) for handler in handlers) == 1
+
+def test_rotacion_comprime_con_gzip(tmp_path):
+    ruta = str(tmp_path / 'twitch_bot.log')
+    handler = crear_handler_archivo(ruta)
+    handler.emit(logging.makeLogRecord({'msg': 'ayer'}))
+    handler.doRollover()
+    handler.emit(logging.makeLogRecord({'msg': 'hoy'}))
+    handler.close()
+
+    rotados = [nombre for nombre in os.listdir(tmp_path) if nombre != 'twitch_bot.log']
+    assert len(rotados) == 1 and rotados[0].endswith('.gz')
+    with gzip.open(tmp_path / rotados[0], 'rt', encoding='utf-8') as archivo:
+        assert archivo.read() == 'ayer\n'
+    with open(ruta, encoding='utf-8') as archivo:
+        assert archivo.read() == 'hoy\n'
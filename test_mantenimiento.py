@@ -0,0 +1,55 @@
+"""
+Pruebas del mantenimiento de la base de datos (DB_MANTENIMIENTO).
+
+Se ejecutan sobre una copia temporal de soloville.db:
+    python -m pytest -q test_mantenimiento.py
+"""
+import sqlite3
+import time
+
+import pytest
+
+import DB_MANTENIMIENTO
+from DB_MANTENIMIENTO import activar_vacuum_incremental, ejecutar_mantenimiento, toca_mantenimiento
+
+def anotadas(ruta):
+    with sqlite3.connect(ruta) as conn:
+        return conn.execute('SELECT tarea, resultado FROM mantenimiento ORDER BY id').fetchall()
+
+def test_mantenimiento(bd_temporal):
+    tareas = ejecutar_mantenimiento(bd_temporal)
+    assert [tarea['tarea'] for tarea in tareas] == ['analizar', 'incremental_vacuum', 'quick_check']
+    assert all(tarea['bytes_antes'] > 0 and tarea['duracion_ms'] >= 0 for tarea in tareas)
+    assert anotadas(bd_temporal) == [('analizar', 'analyze'), ('incremental_vacuum', 'auto_vacuum desactivado'),
+                                     ('quick_check', 'ok')]
+    with sqlite3.connect(bd_temporal) as conn:
+        assert conn.execute('SELECT COUNT(*) FROM sqlite_stat1').fetchone()[0] > 0
+
+    # Con estadísticas recientes basta PRAGMA optimize
+    assert ejecutar_mantenimiento(bd_temporal)[0]['resultado'] == 'optimize'
+
+def test_vacuum_incremental_reduce_el_archivo(bd_temporal):
+    assert activar_vacuum_incremental(bd_temporal)
+    with sqlite3.connect(bd_temporal) as conn:
+        conn.execute('CREATE TABLE relleno (datos BLOB)')
+        conn.executemany('INSERT INTO relleno VALUES (?)', [(b'x' * 4000,) for _ in range(500)])
+    with sqlite3.connect(bd_temporal) as conn:
+        conn.execute('DROP TABLE relleno')
+
+    vacuum = ejecutar_mantenimiento(bd_temporal)[1]
+    assert vacuum['tarea'] == 'incremental_vacuum'
+    assert vacuum['resultado'] != '0 páginas liberadas'
+    assert vacuum['bytes_despues'] < vacuum['bytes_antes']
+
+def test_solo_en_periodos_tranquilos(bd_temporal, monkeypatch):
+    with sqlite3.connect(bd_temporal) as conn:
+        conn.execute('INSERT INTO eventos_acciones (ciudadano_id, accion_id, ts) VALUES (1, 1, ?)', (int(time.time()),))
+    # Un canje reciente: el canal no está tranquilo
+    assert not toca_mantenimiento(bd_temporal)
+    monkeypatch.setattr(DB_MANTENIMIENTO, 'MINUTOS_INACTIVIDAD', 0)
+    assert toca_mantenimiento(bd_temporal)
+    ejecutar_mantenimiento(bd_temporal)
+    # Recién hecho: no toca hasta pasado INTERVALO_MANTENIMIENTO
+    assert not toca_mantenimiento(bd_temporal)
+    monkeypatch.setattr(DB_MANTENIMIENTO, 'INTERVALO_MANTENIMIENTO', 0)
+    assert toca_mantenimiento(bd_temporal)
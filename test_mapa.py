@@ -0,0 +1,236 @@
+"""
+Pruebas del modelo del mapa en memoria (modelo_mapa.ModeloMapa) y de las funciones de
+db_mapa que trabajan sobre él.
+
+Se ejecutan sobre una copia temporal de soloville.db:
+    python -m pytest -q test_mapa.py
+"""
+import os
+import sqlite3
+import subprocess
+import sys
+from concurrent.futures import ThreadPoolExecutor
+
+import pytest
+
+import DB_DML_FUNCIONES
+import db_mapa
+from db_mapa import TIPOS_CASILLAS
+from modelo_mapa import ModeloMapa
+
+DIRECTORIO = os.path.dirname(os.path.abspath(__file__))
+
+def casillas(ruta):
+    with sqlite3.connect(ruta) as conn:
+        return {(x, z): (tipo, ciudadano_id) for x, z, tipo, ciudadano_id in conn.execute(
+            'SELECT x, z, tipo, ciudadano_id FROM mapa')}
+
+def test_modelo_refleja_la_tabla(bd_temporal):
+    with sqlite3.connect(bd_temporal) as conn:
+        modelo = ModeloMapa.cargar(conn.cursor())
+    tabla = casillas(bd_temporal)
+    assert len(modelo) == len(tabla)
+    for (x, z), (tipo, ciudadano_id) in tabla.items():
+        assert modelo.tipo(x, z) == tipo
+        assert modelo.casilla(x, z)['ciudadano_id'] == ciudadano_id
+    # Fuera del mapa no hay casillas
+    assert modelo.tipo(100, 100) == 0 and modelo.casilla(100, 100) is None
+    assert modelo.vecindario(0, 0)[1, 1] == TIPOS_CASILLAS['POZO']
+
+def test_vecindario_en_el_borde(bd_temporal):
+    borde = db_mapa.obtener_casilla(6, 6)
+    assert db_mapa.actualizar_casilla(5, 5, 'CRUCE')
+    assert db_mapa.tiene_CRUCE_adyacente(6, 6)
+    assert db_mapa.tiene_casilla_caminera_adyacente(6, 6)
+    # (7, 7) no existe, pero su vecindario incluye (6, 6)
+    assert db_mapa.obtener_tipo_casilla(7, 7) is None
+    assert not db_mapa.tiene_CRUCE_adyacente(7, 7)
+    assert db_mapa.actualizar_casilla(6, 6, 'CRUCE')
+    assert db_mapa.tiene_CRUCE_adyacente(7, 7)
+    assert db_mapa.obtener_casilla(6, 6)['id'] == borde['id']
+
+def test_guarda_solo_lo_cambiado(bd_temporal):
+    antes = casillas(bd_temporal)
+    with sqlite3.connect(bd_temporal) as conn:
+        modelo = ModeloMapa.cargar(conn.cursor())
+        modelo.poner_tipo(1, 1, modelo.tipo(1, 1))
+        assert modelo.guardar(conn.cursor()) == 0
+        assert modelo.poner_tipo(1, 2, TIPOS_CASILLAS['AGUA'])
+        assert modelo.crear(-8, 9, TIPOS_CASILLAS['MONTAÑA'])
+        assert not modelo.crear(-8, 9, TIPOS_CASILLAS['CESPED'])
+        assert modelo.guardar(conn.cursor()) == 2
+        # La casilla nueva queda con el ID que le ha dado la tabla
+        assert modelo.casilla(-8, 9)['id'] == conn.execute(
+            'SELECT id FROM mapa WHERE x = -8 AND z = 9').fetchone()[0]
+    despues = casillas(bd_temporal)
+    assert despues.pop((1, 2))[0] == TIPOS_CASILLAS['AGUA']
+    assert despues.pop((-8, 9))[0] == TIPOS_CASILLAS['MONTAÑA']
+    antes.pop((1, 2))
+    assert despues == antes
+
+def test_ve_lo_escrito_por_otras_conexiones(bd_temporal):
+    solar = db_mapa.encontrar_solar_mas_cercano()
+    assert solar
+    # Como escribe otra conexión: sube la versión del mapa y marca la casilla con ella
+    with sqlite3.connect(bd_temporal) as conn:
+        conn.execute('UPDATE mapa_version SET version = version + 1 WHERE id = 1')
+        conn.execute('UPDATE mapa SET ciudadano_id = 999, version = (SELECT version FROM mapa_version) '
+                     'WHERE x = ? AND z = ?', solar)
+    assert db_mapa.tiene_solar_asignado(999)
+    assert db_mapa.encontrar_solar_mas_cercano() != solar
+
+def test_otras_tablas_no_recargan_el_modelo(bd_temporal):
+    with db_mapa.modelo_mapa() as modelo:
+        pass
+    assert DB_DML_FUNCIONES.sumar_recurso_ciudadano(1, 'agua', 1)
+    assert db_mapa.actualizar_casilla(2, 2, 'AGUA')
+    # Ni lo escrito en otras tablas ni lo escrito por db_mapa obliga a leer el mapa entero
+    with db_mapa.modelo_mapa() as despues:
+        assert despues is modelo
+    with sqlite3.connect(bd_temporal) as conn:
+        conn.execute("UPDATE ciudadanos SET nivel_casa = nivel_casa + 1 WHERE id = 1")
+    with db_mapa.modelo_mapa() as despues:
+        assert despues is modelo
+
+def test_asignar_solar_sin_leer_el_mapa(bd_temporal):
+    # Sin modelo leído, la asignación no lo lee
+    db_mapa._descartar_modelo()
+    assert db_mapa.asignar_ciudadano_a_solar(500)
+    assert db_mapa._modelo is None
+    # Con el modelo al día, se le aplica la asignación en vez de volver a leerlo
+    with db_mapa.modelo_mapa() as modelo:
+        assert modelo.tiene_ciudadano(500)
+    assert db_mapa.asignar_ciudadano_a_solar(501)
+    with db_mapa.modelo_mapa() as despues:
+        assert despues is modelo
+        assert despues.tiene_ciudadano(501)
+
+def test_completar_cuadrado_y_caminos(bd_temporal):
+    assert db_mapa.crear_casilla(8, 0, 'CESPED')
+    assert not db_mapa.crear_casilla(8, 0, 'CESPED')
+    with db_mapa.modelo_mapa() as modelo:
+        pass
+    assert db_mapa.completar_cuadrado()
+    # El modelo lee solo las casillas nuevas
+    with db_mapa.modelo_mapa() as despues:
+        assert despues is modelo and len(despues) == 17 * 17
+    tabla = casillas(bd_temporal)
+    assert len(tabla) == 17 * 17
+    assert db_mapa.plaza_central()
+    assert db_mapa.crear_caminos_verticales()
+    assert db_mapa.obtener_tipo_casilla(0, 0) == 'POZO'
+    assert db_mapa.obtener_tipo_casilla(0, -5) == 'CRUCE'
+    assert db_mapa.obtener_tipo_casilla(-8, 5) == 'CAMINO_2'
+
+def test_mascaras_coinciden_con_el_vecindario(bd_temporal):
+    with sqlite3.connect(bd_temporal) as conn:
+        modelo = ModeloMapa.cargar(conn.cursor())
+    caminos = [TIPOS_CASILLAS['CAMINO'], TIPOS_CASILLAS['CAMINO_2'], TIPOS_CASILLAS['CRUCE']]
+    adyacentes = modelo.adyacentes(caminos)
+    x, z = modelo.coordenadas()
+    for i in range(modelo.tipos.shape[0]):
+        for j in range(modelo.tipos.shape[1]):
+            assert adyacentes[i, j] == modelo.hay_adyacente(int(x[i, 0]), int(z[0, j]), caminos)
+    # Solo cambian (y se anotan) las casillas existentes de otro tipo
+    agua = TIPOS_CASILLAS['AGUA']
+    assert modelo.poner_tipos(x == 0, agua) == 13
+    assert modelo.poner_tipos(x == 0, agua) == 0
+    assert int(modelo.cambiadas.sum()) == 13
+
+def test_ampliar_el_cuadrado(bd_temporal):
+    assert db_mapa.completar_cuadrado()
+    assert len(casillas(bd_temporal)) == 13 * 13
+    # Un anillo nuevo con otro tipo: las casillas de dentro no cambian
+    assert db_mapa.completar_cuadrado('AGUA', radio=7)
+    tabla = casillas(bd_temporal)
+    assert len(tabla) == 15 * 15
+    assert {tipo for (x, z), (tipo, _) in tabla.items() if max(abs(x), abs(z)) == 7} == {TIPOS_CASILLAS['AGUA']}
+    assert db_mapa.obtener_tipo_casilla(-7, 3) == 'AGUA'
+    assert db_mapa.obtener_tipo_casilla(0, 0) == 'POZO'
+    # Un hueco dentro del cuadrado también se rellena
+    with sqlite3.connect(bd_temporal) as conn:
+        conn.execute('DELETE FROM mapa WHERE x = 2 AND z = -1')
+        assert db_mapa._radios_mapa(conn.cursor()) == (7, 1)
+    assert db_mapa.completar_cuadrado(radio=7)
+    assert db_mapa.obtener_tipo_casilla(2, -1) == 'CESPED'
+    assert len(casillas(bd_temporal)) == 15 * 15
+
+def test_solar_mas_cercano_a_un_punto(bd_temporal):
+    with sqlite3.connect(bd_temporal) as conn:
+        modelo = ModeloMapa.cargar(conn.cursor())
+        libres = conn.execute('SELECT x, z, id FROM mapa WHERE tipo = ? AND ciudadano_id IS NULL',
+                              (TIPOS_CASILLAS['SOLAR'],)).fetchall()
+    for px in range(-9, 10, 3):
+        for pz in range(-9, 10, 2):
+            esperado = min(libres, key=lambda s: (abs(s[0] - px) + abs(s[1] - pz), s[2]))[:2]
+            assert modelo.mas_cercano(TIPOS_CASILLAS['SOLAR'], px, pz) == esperado
+    assert modelo.mas_cercano(TIPOS_CASILLAS['AGUA'], 0, 0) is None
+    # Desde (0,0) sale del índice, con el mismo orden
+    cercano = min(libres, key=lambda s: (abs(s[0]) + abs(s[1]), s[2]))[:2]
+    assert db_mapa.encontrar_solar_mas_cercano() == cercano
+    assert db_mapa.encontrar_solar_mas_cercano(6, -6) == modelo.mas_cercano(TIPOS_CASILLAS['SOLAR'], 6, -6)
+
+def test_asignar_y_liberar_por_el_indice(bd_temporal):
+    # db_mapa crea los índices al usar la base de datos por primera vez
+    cercano = db_mapa.encontrar_solar_mas_cercano()
+    with sqlite3.connect(bd_temporal) as conn:
+        plan = conn.execute('EXPLAIN QUERY PLAN SELECT id, x, z FROM mapa WHERE tipo = ? AND ciudadano_id IS NULL '
+                            'ORDER BY abs(x) + abs(z), id LIMIT 1', (TIPOS_CASILLAS['SOLAR'],)).fetchall()
+    assert 'idx_mapa_solares_libres' in plan[0][3]
+    assert db_mapa.asignar_ciudadano_a_solar(500)
+    assert db_mapa.obtener_casilla(*cercano)['ciudadano_id'] == 500
+    # Un ciudadano no puede tener dos solares
+    assert not db_mapa.asignar_ciudadano_a_solar(500)
+    with sqlite3.connect(bd_temporal) as conn, pytest.raises(sqlite3.IntegrityError):
+        conn.execute('UPDATE mapa SET ciudadano_id = 500 WHERE tipo = ? AND ciudadano_id IS NULL',
+                     (TIPOS_CASILLAS['SOLAR'],))
+    assert db_mapa.encontrar_solar_mas_cercano() != cercano
+    assert db_mapa.liberar_solar(500)
+    assert not db_mapa.liberar_solar(500)
+    assert not db_mapa.tiene_solar_asignado(500)
+    assert db_mapa.encontrar_solar_mas_cercano() == cercano
+
+# Otro proceso (como la web o una segunda instancia del bot) que asigna solares a la vez
+PROCESO_ASIGNADOR = """
+import sys
+import DB_DML_FUNCIONES
+import db_mapa
+db_mapa.DB_PATH = sys.argv[1]
+for ciudadano_id in range(int(sys.argv[2]), int(sys.argv[3])):
+    db_mapa.asignar_ciudadano_a_solar(ciudadano_id)
+"""
+
+def test_registros_simultaneos_no_comparten_solar(bd_temporal):
+    assert db_mapa.completar_cuadrado(radio=20) and db_mapa.crear_caminos_verticales()
+    with sqlite3.connect(bd_temporal) as conn:
+        libres = [fila[0] for fila in conn.execute(
+            'SELECT id FROM mapa WHERE tipo = ? AND ciudadano_id IS NULL ORDER BY abs(x) + abs(z), id',
+            (TIPOS_CASILLAS['SOLAR'],))]
+    assert len(libres) > 480
+
+    # 3 procesos con 60 ciudadanos cada uno y 300 ciudadanos en hilos que se registran dos veces
+    procesos = [subprocess.Popen([sys.executable, '-c', PROCESO_ASIGNADOR, bd_temporal, str(inicio), str(inicio + 60)],
+                                 cwd=DIRECTORIO, stderr=subprocess.DEVNULL)
+                for inicio in (10000, 10060, 10120)]
+    with ThreadPoolExecutor(max_workers=32) as hilos:
+        resultados = list(hilos.map(db_mapa.asignar_ciudadano_a_solar, [20000 + n // 2 for n in range(600)]))
+    for proceso in procesos:
+        assert proceso.wait(timeout=60) == 0
+
+    # Cada ciudadano en hilos ha conseguido exactamente un solar, y ningún solar tiene dos
+    assert resultados.count(True) == 300
+    with sqlite3.connect(bd_temporal) as conn:
+        asignados = conn.execute('SELECT id, ciudadano_id FROM mapa WHERE ciudadano_id >= 10000').fetchall()
+    assert sorted(ciudadano_id for _, ciudadano_id in asignados) == list(range(10000, 10180)) + list(range(20000, 20300))
+    # Siempre se ocupa el más cercano libre: los asignados son los 480 primeros
+    assert {solar_id for solar_id, _ in asignados} == set(libres[:480])
+
+def test_importar_no_cambia_la_base_de_datos(copia_bd):
+    # db_mapa usa 'soloville.db' del directorio actual: el de la copia
+    with open(copia_bd, 'rb') as archivo:
+        antes = archivo.read()
+    subprocess.run([sys.executable, '-c', 'import db_mapa, chunks_mapa'], check=True,
+                   cwd=os.path.dirname(copia_bd), env=dict(os.environ, PYTHONPATH=DIRECTORIO),
+                   stderr=subprocess.DEVNULL)
+    with open(copia_bd, 'rb') as archivo:
+        assert archivo.read() == antes
@@ -0,0 +1,92 @@
+"""
+Pruebas de las clasificaciones (DB_RANKING) y del comando !ranking.
+
+Se ejecutan sobre una copia temporal de soloville.db:
+    python -m pytest -q test_ranking.py
+"""
+import sqlite3
+
+import pytest
+
+import DB_RANKING
+from DB_DML_FUNCIONES import registrar_accion, sumar_recurso_ciudadano
+from DB_RANKING import Clasificacion, obtener_clasificacion, posicion_ranking, reconstruir_rankings, tipo_semana, top_ranking
+from funciones.ranking import ranking
+
+@pytest.fixture
+def bd_temporal(bd_temporal):
+    """La copia de conftest.py con un rival y los rankings reconstruidos."""
+    with sqlite3.connect(bd_temporal) as conn:
+        conn.execute('''
+            INSERT INTO ciudadanos (nombre, fecha_crear, usuario_crear)
+            VALUES ('rival', CURRENT_TIMESTAMP, 'prueba')
+        ''')
+    assert reconstruir_rankings()
+    return bd_temporal
+
+def test_clasificacion_posiciones_y_empates():
+    clasificacion = Clasificacion()
+    for ciudadano_id, valor in ((1, 10), (2, 30), (3, 10), (4, 5)):
+        clasificacion.actualizar(ciudadano_id, valor)
+    assert clasificacion.top(2) == [(2, 30), (1, 10)]
+    assert [clasificacion.posicion(i) for i in (1, 2, 3, 4)] == [2, 1, 2, 4]
+
+    clasificacion.actualizar(4, 50)
+    clasificacion.actualizar(2, 0)
+    assert clasificacion.posicion(4) == 1
+    assert clasificacion.posicion(2) is None
+    assert len(clasificacion) == 3
+
+def test_cambios_de_recursos_se_reflejan_incrementalmente(bd_temporal):
+    clasificacion = obtener_clasificacion('moneda')
+    moneda = clasificacion.valor(1)
+    assert sumar_recurso_ciudadano(2, 'moneda', moneda + 100)
+    assert obtener_clasificacion('moneda') is clasificacion
+    assert posicion_ranking('moneda', 2) == {'posicion': 1, 'valor': moneda + 100, 'total': len(clasificacion)}
+    assert top_ranking('moneda', 1)[0]['nombre'] == 'rival'
+
+    assert sumar_recurso_ciudadano(2, 'moneda', -(moneda + 100))
+    assert posicion_ranking('moneda', 2) is None
+
+def test_acciones_de_la_semana(bd_temporal):
+    antes = posicion_ranking(tipo_semana(), 1)
+    assert registrar_accion('talar', 1, 0, {'madera': 1})
+    assert registrar_accion('talar', 1, 1, {'madera': 1})
+    assert registrar_accion('FABRICAR', 1, recursos={'tabla': 1})
+    despues = posicion_ranking(tipo_semana(), 1)
+    assert despues['valor'] == (antes['valor'] if antes else 0) + 2
+
+def test_reconstruir_coincide_con_triggers(bd_temporal):
+    assert sumar_recurso_ciudadano(2, 'piedra', 7)
+    with sqlite3.connect(bd_temporal) as conn:
+        antes = conn.execute('SELECT tipo, ciudadano_id, valor FROM rankings WHERE valor > 0 ORDER BY 1, 2').fetchall()
+    assert reconstruir_rankings()
+    with sqlite3.connect(bd_temporal) as conn:
+        despues = conn.execute('SELECT tipo, ciudadano_id, valor FROM rankings WHERE valor > 0 ORDER BY 1, 2').fetchall()
+    assert antes == despues
+    assert posicion_ranking('piedra', 2)['valor'] == 7
+
+def test_reconstruir_en_otro_proceso_recarga(bd_temporal):
+    clasificacion = obtener_clasificacion('moneda')
+    cargadas = dict(DB_RANKING._clasificaciones)
+    assert reconstruir_rankings()
+    # Otro proceso conserva lo que tenía cargado
+    DB_RANKING._clasificaciones.update(cargadas)
+    # Tras reconstruir, 'actualizado' empieza de nuevo y supera enseguida el último leído
+    assert sumar_recurso_ciudadano(2, 'piedra', 1)
+    assert obtener_clasificacion('moneda') is not clasificacion
+
+def test_tipos_desconocidos_no_se_guardan(bd_temporal):
+    assert obtener_clasificacion('no_existe') is None
+    assert obtener_clasificacion('acciones:semana') is None
+    assert len(obtener_clasificacion('acciones:1999-01')) == 0
+    assert 'no_existe' not in DB_RANKING._clasificaciones
+    assert 'acciones:1999-01' not in DB_RANKING._clasificaciones
+    assert obtener_clasificacion(tipo_semana()) is not None
+
+def test_comando_ranking(bd_temporal):
+    assert sumar_recurso_ciudadano(2, 'piedra', 10000)
+    mensaje = ranking('solounturnomas', 'piedra')
+    assert mensaje.startswith('🏆 Ranking de piedra: 1. rival (10000), 2. solounturnomas')
+    assert '@solounturnomas: puesto 2 de 2' in mensaje
+    assert 'Todavía no hay ranking' in ranking('solounturnomas', 'oro')
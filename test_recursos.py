@@ -0,0 +1,69 @@
+"""
+Pruebas de la suma atómica de recursos (sumar_recursos_ciudadano y registrar_accion_con_recursos).
+
+Se ejecutan sobre una copia temporal de soloville.db:
+    python -m pytest -q test_recursos.py
+"""
+import sqlite3
+import threading
+
+import pytest
+
+from DB_DML_FUNCIONES import (sumar_recursos_ciudadano, sumar_recurso_ciudadano, obtener_inventario,
+                              registrar_accion_con_recursos)
+
+def cantidades(ciudadano_id):
+    return obtener_inventario(ciudadano_id, usar_cache=False)['recursos']
+
+def test_suma_varios_recursos_y_limita_a_cero(bd_temporal):
+    antes = cantidades(1)
+    assert sumar_recursos_ciudadano(1, {'madera': 3, 'piedra': -(antes.get('piedra', 0) + 50), 'cuerda': 0})
+    despues = cantidades(1)
+    assert despues['madera'] == antes['madera'] + 3
+    assert despues['piedra'] == 0
+    assert despues.get('cuerda') == antes.get('cuerda')
+
+def test_recurso_nuevo_se_crea(bd_temporal):
+    assert 'ladrillo' not in cantidades(2)
+    assert sumar_recurso_ciudadano(2, 'ladrillo', 4)
+    assert cantidades(2)['ladrillo'] == 4
+
+def test_recurso_desconocido_no_aplica_nada(bd_temporal):
+    antes = cantidades(1)
+    assert not sumar_recursos_ciudadano(1, {'madera': 3, 'oro': 1})
+    assert cantidades(1) == antes
+
+def test_escritores_concurrentes_no_pierden_sumas(bd_temporal):
+    hilos, repeticiones = 8, 25
+    antes = cantidades(1)['madera']
+    errores = []
+
+    def sumar():
+        for _ in range(repeticiones):
+            if not sumar_recursos_ciudadano(1, {'madera': 1, 'rama': 2}):
+                errores.append(1)
+
+    trabajadores = [threading.Thread(target=sumar) for _ in range(hilos)]
+    for trabajador in trabajadores:
+        trabajador.start()
+    for trabajador in trabajadores:
+        trabajador.join()
+
+    assert not errores
+    assert cantidades(1)['madera'] == antes + hilos * repeticiones
+
+def eventos(ruta, ciudadano_id):
+    with sqlite3.connect(ruta) as conn:
+        return conn.execute('SELECT COUNT(*) FROM eventos_acciones WHERE ciudadano_id = ?', (ciudadano_id,)).fetchone()[0]
+
+def test_accion_con_recursos_en_una_transaccion(bd_temporal):
+    antes, eventos_antes = cantidades(1), eventos(bd_temporal, 1)
+    assert registrar_accion_con_recursos('talar', 1, 0, {'madera': 2, 'energia': -1}, 'test')
+    assert cantidades(1)['madera'] == antes['madera'] + 2
+    assert eventos(bd_temporal, 1) == eventos_antes + 1
+
+def test_accion_desconocida_no_suma_recursos(bd_temporal):
+    antes, eventos_antes = cantidades(1), eventos(bd_temporal, 1)
+    assert not registrar_accion_con_recursos('no_existe', 1, 0, {'madera': 2}, 'test')
+    assert cantidades(1) == antes
+    assert eventos(bd_temporal, 1) == eventos_antes
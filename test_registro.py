@@ -0,0 +1,56 @@
+"""
+Pruebas del registro masivo de ciudadanos (crear_ciudadanos y db_mapa.asignar_solares).
+
+Se ejecutan sobre una copia temporal de soloville.db:
+    python -m pytest -q test_registro.py
+"""
+import sqlite3
+
+import pytest
+
+import DB_DML_FUNCIONES
+import db_mapa
+from DB_DML_FUNCIONES import crear_ciudadano, crear_ciudadanos, obtener_inventario, resolver_ciudadano
+
+def solares_libres(ruta):
+    with sqlite3.connect(ruta) as conn:
+        return conn.execute('SELECT COUNT(*) FROM mapa WHERE tipo = ? AND ciudadano_id IS NULL',
+                            (db_mapa.TIPOS_CASILLAS['SOLAR'],)).fetchone()[0]
+
+def test_registro_masivo(bd_temporal, monkeypatch):
+    monkeypatch.setattr(DB_DML_FUNCIONES, 'RECURSOS_INICIALES', {'moneda': 10})
+    # Un nombre sin registrar queda en la caché como inexistente
+    assert resolver_ciudadano('espectador1') is None
+    libres = solares_libres(bd_temporal)
+
+    ids = crear_ciudadanos(['@Espectador1', 'espectador2', 'ESPECTADOR1', 'SoloUnTurnoMas', ' '], 'raid')
+    assert list(ids) == ['espectador1', 'espectador2']
+    assert resolver_ciudadano('espectador1')['id'] == ids['espectador1']
+
+    catalogo = DB_DML_FUNCIONES.obtener_catalogo()
+    inventario = obtener_inventario(ids['espectador2'], usar_cache=False)
+    assert inventario['recursos'] == {'moneda': 10}
+    assert set(inventario['habilidades']) == {
+        codigo for codigo, habilidad in catalogo.habilidades_por_codigo.items() if habilidad['activo']}
+    assert set(inventario['herramientas']) == {
+        codigo for codigo, herramienta in catalogo.herramientas_por_codigo.items() if herramienta['activo']}
+    assert not any(inventario['herramientas'].values())
+
+    assert solares_libres(bd_temporal) == libres - 2
+    assert db_mapa.tiene_solar_asignado(ids['espectador1'])
+    assert crear_ciudadanos(['espectador1', 'espectador2']) == {}
+
+def test_sin_solares_suficientes(bd_temporal):
+    libres = solares_libres(bd_temporal)
+    ids = crear_ciudadanos([f'raid{numero}' for numero in range(libres + 5)])
+    assert len(ids) == libres + 5
+    assert solares_libres(bd_temporal) == 0
+    assert not db_mapa.tiene_solar_asignado(ids[f'raid{libres + 4}'])
+
+def test_crear_ciudadano_usa_los_mismos_datos_iniciales(bd_temporal):
+    assert crear_ciudadano('individual')
+    assert crear_ciudadanos(['masivo'], asignar_solar=False)
+    individual = obtener_inventario(resolver_ciudadano('individual')['id'], usar_cache=False)
+    masivo = obtener_inventario(resolver_ciudadano('masivo')['id'], usar_cache=False)
+    assert individual == masivo
+    assert not db_mapa.tiene_solar_asignado(resolver_ciudadano('masivo')['id'])
@@ -14,9 +14,12 @@ ROOT_DIR = os.path.dirname(os.path.dirname(__file__))
 if ROOT_DIR not in sys.path:
     sys.path.append(ROOT_DIR)
 
-from DB_DML_FUNCIONES import mejorar_casa, listar_historial_acciones, get_db_connection, info_fabricacion, es_producto_fabricable, fabricar_producto
-from DB_DML_FUNCIONES import realizar_accion 
-from db_mapa import TIPOS_CASILLAS
+from DB_DML_FUNCIONES import mejorar_casa, listar_historial_acciones, get_db_connection, info_fabricacion, fabricar_producto
+from DB_DML_FUNCIONES import realizar_accion, obtener_inventario, estadisticas_concurrencia
+from db_mapa import version_mapa
+from cantidades import desde_centesimas
+from DB_LECTURA import LectorBD
+from chunks_mapa import CacheChunks, chunks_en, parsear_chunks, leer_cambios, leer_mapa
 
 app = Flask(__name__)
 
@@ -26,15 +29,25 @@ app.secret_key = 'tu_clave_secreta_aqui_12345!'
 # Configuración de la ruta de la base de datos
 DB_PATH = os.path.join(os.path.dirname(os.path.dirname(__file__)), 'soloville.db')
 
+# Conexiones de lectura del panel (modo según SOLOVILLE_MODO_LECTURA, ver DB_LECTURA.py);
+# las escrituras van siempre a DB_PATH. En modo instantanea la copia se rehace en un hilo
+# aparte, no dentro de las peticiones
+lector = LectorBD(ruta_primaria=DB_PATH,
+                  ruta_instantanea=os.path.join(os.path.dirname(DB_PATH), 'soloville_lectura.db'))
+lector.iniciar()
+
+# Chunks del mapa ya leídos, por versión del mapa
+cache_chunks = CacheChunks()
+
 def get_ciudadano(nombre):
     """Obtiene los datos del ciudadano de la base de datos"""
-    with sqlite3.connect(DB_PATH) as conn:
+    with lector.conectar() as conn:
         cursor = conn.cursor()
         cursor.execute('''
             SELECT c.nombre as nombre,
             c.id as id, 
             c.nivel_casa as nivel_casa,
-            rtrim( rtrim( round(rc.cantidad, 2), '0'), '.' ) as energia,
+            rc.cantidad as energia,
             c.fecha_pozo as fecha_pozo,
             c.rango as rango,
             c.fecha_crear as fecha_crear,
@@ -50,36 +63,81 @@ def get_ciudadano(nombre):
         if ciudadano:
             # Convertir los nombres de las columnas a minúsculas
             columnas = [col[0].lower() for col in cursor.description]
-            return dict(zip(columnas, ciudadano))
+            datos = dict(zip(columnas, ciudadano))
+            datos['energia'] = desde_centesimas(datos['energia'])
+            return datos
 
 
 
 @app.route('/api/mapa')
 def api_mapa():
-    """Endpoint para obtener los datos de la cuadrícula"""
-    with sqlite3.connect(DB_PATH) as conn:
+    """
+    Endpoint para obtener los datos de la cuadrícula.
+
+    Sin parámetros devuelve todas las casillas. Con since=<versión> devuelve solo las que han
+    cambiado después de esa versión: {'version', 'casillas'}, con casillas a null si son
+    demasiadas y hay que volver a pedir la vista. La respuesta lleva la versión del mapa como
+    ETag, y con If-None-Match de la versión actual responde 304 sin leer las casillas.
+    """
+    desde = request.args.get('since', type=int)
+    if 'since' in request.args and desde is None:
+        return jsonify({'success': False, 'message': 'Versión no válida'}), 400
+
+    with lector.conectar() as conn:
         cursor = conn.cursor()
-        cursor.execute('''
-            SELECT m.x, m.z, m.tipo, m.ciudadano_id, c.nivel_casa, c.nombre FROM mapa m
-            LEFT JOIN ciudadanos c ON m.ciudadano_id = c.id
-        ''')
-        casillas = cursor.fetchall()
-        
-        # Convertir los resultados a un formato JSON con los nombres de los tipos
-        resultado = []
-        for casilla in casillas:
-            # Convertir el ID del tipo a su nombre
-            tipo_nombre = next(key for key, value in TIPOS_CASILLAS.items() if value == casilla[2])
-            resultado.append({
-                'x': casilla[0],
-                'z': casilla[1],
-                'tipo': tipo_nombre,
-                'ciudadano_id': casilla[3],
-                'nivel_casa': casilla[4],
-                'nombre': casilla[5]
-            })
-        
-        return jsonify(resultado)
+        version = version_mapa(cursor)
+        etag = f'mapa-{version}'
+        if etag in request.if_none_match:
+            respuesta = app.response_class(status=304)
+        elif desde is None:
+            respuesta = jsonify(leer_mapa(cursor))
+        else:
+            respuesta = jsonify({'version': version, 'casillas': leer_cambios(cursor, desde)})
+
+    respuesta.set_etag(etag)
+    # El navegador puede guardarla, pero tiene que preguntar siempre si sigue al día
+    respuesta.headers['Cache-Control'] = 'no-cache'
+    return respuesta
+
+@app.route('/api/mapa/chunks')
+def api_mapa_chunks():
+    """
+    Endpoint con las casillas de una parte del mapa, por chunks (ver chunks_mapa.py).
+
+    Parámetros (uno de los dos):
+        desde_x, hasta_x, desde_z, hasta_z: casillas de la vista
+        chunks: coordenadas de los chunks, 'cx,cz;cx,cz;...'
+
+    Sin parámetros devuelve los extremos del mapa para colocar la vista.
+    """
+    try:
+        if 'chunks' in request.args:
+            chunks = parsear_chunks(request.args['chunks'])
+        elif 'desde_x' in request.args:
+            chunks = chunks_en(*(int(request.args[clave]) for clave in ('desde_x', 'hasta_x', 'desde_z', 'hasta_z')))
+        else:
+            with lector.conectar() as conn:
+                return jsonify(cache_chunks.limites(conn))
+    except (KeyError, ValueError) as e:
+        return jsonify({'success': False, 'message': f'Vista no válida: {e}'}), 400
+
+    with lector.conectar() as conn:
+        return jsonify(cache_chunks.obtener(conn, chunks))
+
+@app.route('/api/mapa/cache')
+def api_mapa_cache():
+    """Endpoint con las métricas de la caché de chunks del mapa"""
+    return jsonify(cache_chunks.estadisticas())
+
+@app.route('/api/estado_lectura')
+def api_estado_lectura():
+    """Endpoint con el modo de lectura del panel y el retraso de sus datos"""
+    return jsonify(lector.estado())
+
+@app.route('/api/concurrencia')
+def api_concurrencia():
+    """Endpoint con los reintentos de las escrituras optimistas de este proceso"""
+    return jsonify(estadisticas_concurrencia())
 
 @app.route('/mejorar_casa', methods=['POST'])
 def route_mejorar_casa():
@@ -99,53 +157,46 @@ def ciudadano():
     if not ciudadano:
         return "Ciudadano no encontrado"
         
-    # Obtener recursos no producibles de la base de datos
-    with get_db_connection() as conn:
-        cursor = conn.cursor()
-        cursor.execute('''
-            SELECT r.codigo, r.nombre, r.titulo, r.imagen, rc.cantidad
-            FROM recursos r, recursos_ciudadano rc  
-            WHERE r.activo = 1 AND (r.es_producto = 0 OR r.es_producto IS NULL)
-            AND r.id = rc.recurso_id
-            AND rc.ciudadano_id = ?
-        ''', (ciudadano['id'],))
-        recursos_rows = cursor.fetchall()
-        
-        # Convertir a una lista de diccionarios con la información completa de cada recurso
-        recursos = []
-        for row in recursos_rows:
-            recurso = {
-                'nombre': row['nombre'],
-                'imagen': row['imagen'],
-                'titulo': row['titulo'] or row['nombre'],  # Usar título si existe, si no, usar nombre
-                'cantidad': row['cantidad']
-            }
-            recursos.append(recurso)
+    # Todas las lecturas de la página van por el lector, con una sola conexión que se
+    # cierra aunque falle algo al montar la página
+    conn_lectura = lector.conectar()
+    try:
+        # Catálogo en memoria (recursos, herramientas, habilidades, acciones y recetas)
+        return _pagina_ciudadano(ciudadano, conn_lectura, lector.catalogo())
+    finally:
+        conn_lectura.close()
+
+def _pagina_ciudadano(ciudadano, conn_lectura, catalogo):
+    """Monta la página de un ciudadano leyendo por conn_lectura (del lector) y el catálogo."""
+    # Obtener recursos, herramientas y habilidades del ciudadano en una sola consulta
+    inventario = (obtener_inventario(ciudadano['id'], conexion=conn_lectura, catalogo=catalogo)
+                  or {'recursos': {}, 'herramientas': {}, 'habilidades': {}})
+
+    # Obtener recursos no producibles del catálogo
+    recursos = []
+    for row in catalogo.recursos.values():
+        if not row['activo'] or row['es_producto'] or row['codigo'] not in inventario['recursos']:
+            continue
+        # Convertir a un diccionario con la información completa de cada recurso
+        recurso = {
+            'nombre': row['nombre'],
+            'imagen': row['imagen'],
+            'titulo': row['titulo'] or row['nombre'],  # Usar título si existe, si no, usar nombre
+            'cantidad': inventario['recursos'][row['codigo']]
+        }
+        recursos.append(recurso)
  
-    # Obtener herramientas del ciudadano desde la base de datos
-    with sqlite3.connect(DB_PATH) as conn:
-        conn.row_factory = sqlite3.Row
-        cursor = conn.cursor()
-        
-        cursor.execute('''
-            SELECT h.nombre, h.imagen , hc.tiene 
-            FROM herramientas_ciudadano hc
-            JOIN herramientas h ON hc.herramienta_id = h.id
-            WHERE hc.ciudadano_id = ? AND hc.activo = 1 AND h.activo = 1
-        ''', (ciudadano['id'],))
-        
-        # Crear diccionario de herramientas
-        herramientas = {}
-        for herramienta in cursor.fetchall():
-            nombre = herramienta['nombre']
-            imagen = herramienta['imagen']
-            tiene = bool(herramienta['tiene'])
-            # Crear una entrada para cada herramienta con su información
-            herramientas[nombre] = {
-                'nombre': nombre,
-                'tiene': tiene,
-                'imagen': imagen
-            }
+    # Crear diccionario de herramientas del ciudadano
+    herramientas = {}
+    for codigo, tiene in inventario['herramientas'].items():
+        herramienta = catalogo.herramientas_por_codigo[codigo]
+        nombre = herramienta['nombre']
+        # Crear una entrada para cada herramienta con su información
+        herramientas[nombre] = {
+            'nombre': nombre,
+            'tiene': tiene,
+            'imagen': herramienta['imagen']
+        }
     
     # Formatear fecha del pozo a dd/mm/yy HH:MM
     fecha_pozo_raw = ciudadano.get('fecha_pozo')
@@ -165,20 +216,17 @@ def ciudadano():
 
     # ----- Productos fabricables (obtenidos de la base de datos) -----
     try:
-        with sqlite3.connect(DB_PATH) as conn:
-            conn.row_factory = sqlite3.Row
+        with conn_lectura as conn:
             cursor = conn.cursor()
             
             # Obtener todos los recursos fabricables
             cursor.execute('''
                 SELECT r.id, r.nombre, r.codigo, r.titulo, r.imagen, 
-                       fp.cantidad as cantidad_generada,
-                       rc.cantidad as cantidad_actual
+                       fp.cantidad as cantidad_generada
                 FROM recursos r
                 JOIN fabricacion_productos fp ON r.id = fp.recurso_id
-                LEFT JOIN recursos_ciudadano rc ON r.id = rc.recurso_id AND rc.ciudadano_id = ?
                 WHERE r.activo = 1 AND r.es_producto = 1
-            ''', (ciudadano['id'],))
+            ''')
             
             productos_db = cursor.fetchall()
             
@@ -187,9 +235,9 @@ def ciudadano():
             
             for producto in productos_db:
                 nombre = producto['nombre']
-                cantidad = producto['cantidad_actual'] or 0
+                cantidad = inventario['recursos'].get(producto['codigo'], 0)
                 # Obtener información de fabricación
-                info = info_fabricacion(producto['id'])
+                info = info_fabricacion(producto['id'], conexion=conn)
                 puede_fabricar = True
                 # Inicializar el diccionario del producto con la información básica
                 producto_info = {
@@ -203,32 +251,14 @@ def ciudadano():
                 # Determinar si se puede fabricar (tiene los recursos necesarios)
                 if 'no se puede fabricar' not in info:
                     # Obtener recursos necesarios para la fabricación
-                    cursor.execute('''
-                        SELECT r.nombre, rf.cantidad
-                        FROM recursos_fabricacion rf
-                        JOIN recursos r ON rf.recurso_id = r.id
-                        WHERE rf.fabricacion_id = (
-                            SELECT id FROM fabricacion_productos WHERE recurso_id = ?
-                        )
-                    ''', (producto['id'],))
-                    
-                    recursos_necesarios = cursor.fetchall()
+                    receta = catalogo.recetas.get(producto['id'])
+                    recursos_necesarios = receta['coste'] if receta else {}
                     
                     # Verificar si tiene los recursos necesarios
-                    for recurso in recursos_necesarios:
-                        # Buscar si el ciudadano tiene el recurso necesario
-                        cursor.execute('''
-                            SELECT cantidad 
-                            FROM recursos_ciudadano 
-                            WHERE ciudadano_id = ? AND recurso_id = (
-                                SELECT id FROM recursos WHERE nombre = ?
-                            )
-                        ''', (ciudadano['id'], recurso['nombre']))
-                        
-                        recurso_ciudadano = cursor.fetchone()
-                        cantidad_tiene = recurso_ciudadano['cantidad'] if recurso_ciudadano else 0
+                    for codigo, cantidad in recursos_necesarios.items():
+                        cantidad_tiene = inventario['recursos'].get(codigo, 0)
                         
-                        if cantidad_tiene < recurso['cantidad']:
+                        if cantidad_tiene < cantidad:
                             producto_info['puede'] = False
                             break
                 
@@ -292,7 +322,7 @@ def ciudadano():
         }
         reqs = requisitos_por_nivel[siguiente_nivel]
         #puede_mejorar = all(ciudadano.get(campo, 0) >= cantidad for campo, cantidad in reqs.items())
-        puede_mejorar = all(ciudadano.get(campo, 0) >= cantidad for campo, cantidad in reqs.items())
+        puede_mejorar = all(inventario['recursos'].get(campo, 0) >= cantidad for campo, cantidad in reqs.items())
         desc_edificio_siguiente = {
                 1: 'Tienda de campaña',
                 2: 'Cabaña de madera',
@@ -313,7 +343,7 @@ def ciudadano():
     # Obtener la última acción del ciudadano
     ultima_accion = None
     try:
-        acciones = listar_historial_acciones(ciudadano_id=ciudadano.get('id'))
+        acciones = listar_historial_acciones(ciudadano_id=ciudadano.get('id'), conexion=conn_lectura, catalogo=catalogo)
         if acciones:
             ultima_accion = acciones[0]  # La más reciente es la primera
             # Formatear la fecha
@@ -336,44 +366,28 @@ def ciudadano():
     # Obtener las habilidades del ciudadano
     habilidades_ciudadano = []
     try:
-        with get_db_connection() as conn:
-            cursor = conn.cursor()
-            cursor.execute('''
-                SELECT h.codigo, h.nombre, h.icono, hc.nivel 
-                FROM habilidades_ciudadano hc
-                JOIN habilidades h ON hc.habilidad_id = h.codigo
-                WHERE hc.ciudadano_id = ? AND hc.activo = 1
-            ''', (ciudadano['id'],))
-            
-            for row in cursor.fetchall():
-                habilidades_ciudadano.append({
-                    'codigo': row[0],
-                    'nombre': row[1],
-                    'icono': row[2],
-                    'nivel': row[3]
-                })
-            
-            # Obtener las acciones disponibles
-            cursor.execute('''
-                SELECT codigo, nombre, titulo, imagen 
-                FROM acciones 
-                WHERE activo = 1
-                ORDER BY nombre
-            ''')
-            # Asegurarse de que cada fila sea un diccionario
-            acciones = []
-            for row in cursor.fetchall():
-                if hasattr(row, 'keys'):  # Si ya es un diccionario
-                    acciones.append(dict(row))
-                else:  # Si es una tupla, crear un diccionario manualmente
-                    acciones.append({
-                        'codigo': row[0],
-                        'nombre': row[1],
-                        'titulo': row[2],
-                        'imagen': row[3]
-                    })
+        for codigo, datos in inventario['habilidades'].items():
+            habilidad = catalogo.habilidades_por_codigo.get(codigo)
+            if not habilidad:
+                continue
+            habilidades_ciudadano.append({
+                'codigo': codigo,
+                'nombre': habilidad['nombre'],
+                'icono': habilidad['icono'],
+                'nivel': datos['nivel']
+            })
             
-            print(f"Acciones obtenidas de la base de datos: {acciones}")  # Para depuración
+        # Obtener las acciones disponibles
+        acciones = [
+            {
+                'codigo': accion['codigo'],
+                'nombre': accion['nombre'],
+                'titulo': accion['titulo'],
+                'imagen': accion['imagen']
+            }
+            for accion in sorted(catalogo.acciones.values(), key=lambda accion: accion['nombre'])
+            if accion['activo']
+        ]
             
     except Exception as e:
         logger.error(f"Error al obtener datos del ciudadano: {e}")
@@ -403,7 +417,6 @@ def ciudadano():
                          ultima_accion=ultima_accion,
                          habilidades_ciudadano=habilidades_ciudadano,
                          herramientas=herramientas,
-                         es_producto_fabricable=es_producto_fabricable,
                          acciones=acciones)  # Asegurarse de que acciones se pase a la plantilla
 
 @app.route('/fabricar', methods=['POST'])
@@ -3,7 +3,21 @@ document.addEventListener('DOMContentLoaded', () => {
     const grid = document.getElementById('grid');
     const currentCoords = document.getElementById('current-coords');
     let zoomLevel = 1;
-    
+
+    // Casillas que se ven a cada lado del centro con zoom 1
+    const RADIO_VISTA = 16;
+
+    // Centro de la vista (se mueve con las flechas del teclado)
+    let centroX = 0;
+    let centroZ = 0;
+
+    // Casillas recibidas y casillas dibujadas en la vista, por "x,z"
+    const casillas = new Map();
+    const divs = new Map();
+
+    // Versión del mapa hasta la que se han recibido los cambios (null: pedir la vista entera)
+    let versionMapa = null;
+
     // Mapa de tipos de casillas a imágenes
     const TIPOS_CASILLAS = {
         'CESPED': 'cesped.png',
@@ -32,113 +46,195 @@ document.addEventListener('DOMContentLoaded', () => {
         4: 'nivel_casa_4.png'
     };
 
-    // Función para actualizar la cuadrícula
+    // Casillas de la vista actual según el centro y el zoom
+    function vista() {
+        const radio = Math.ceil(RADIO_VISTA / zoomLevel);
+        return {
+            desdeX: centroX - radio, hastaX: centroX + radio,
+            desdeZ: centroZ - radio, hastaZ: centroZ + radio,
+        };
+    }
+
+    // Pinta una casilla del grid con los datos recibidos
+    function pintarCasilla(div, casilla, x, z) {
+        // Si es solar con ciudadano, mostramos doble fondo
+        if (casilla.ciudadano_id && casilla.tipo === 'SOLAR') {
+            // Primero la casa del nivel del ciudadano
+            div.style.backgroundImage = `url('/static/img/casa/${NIVELES_CASA[casilla.nivel_casa] || 'nivel_casa_0.png'}')`;
+            // Luego el solar encima
+            div.style.backgroundImage += `, url('/static/img/casillas/${TIPOS_CASILLAS[casilla.tipo]}')`;
+
+            // Si es una casa con ciudadano, agregar el tooltip
+            if (casilla.nombre) {
+                const tooltip = document.createElement('div');
+                tooltip.className = 'tooltip';
+                tooltip.textContent = `Casa de ${casilla.nombre}`;
+                div.appendChild(tooltip);
+            }
+
+            // Si es la casilla (0,0) agregar tooltip de pozo
+            if (x === 0 && z === 0) {
+                const pozoTooltip = document.createElement('div');
+                pozoTooltip.className = 'tooltip';
+                pozoTooltip.textContent = 'Pozo';
+                div.appendChild(pozoTooltip);
+            }
+        } else {
+            const imagen = TIPOS_CASILLAS[casilla.tipo];
+            div.style.backgroundImage = `url('/static/img/casillas/${imagen}')`;
+        }
+    }
+
+    // Crea el div de una casilla de la vista
+    function crearCasilla(x, z) {
+        const div = document.createElement('div');
+        div.classList.add('casilla');
+        div.dataset.x = x;
+        div.dataset.z = z;
+
+        const casilla = casillas.get(`${x},${z}`);
+        if (casilla) {
+            pintarCasilla(div, casilla, x, z);
+        } else {
+            // Casilla vacía por defecto
+            div.style.backgroundColor = '#e0e0e0';
+        }
+
+        // Añadir evento click
+        div.addEventListener('click', () => {
+            currentCoords.textContent = `${x},${z}`;
+        });
+        return div;
+    }
+
+    // Dibuja la vista con las casillas recibidas
+    function dibujar() {
+        const { desdeX, hastaX, desdeZ, hastaZ } = vista();
+        const fragmento = document.createDocumentFragment();
+
+        grid.style.gridTemplateColumns = `repeat(${hastaZ - desdeZ + 1}, 1fr)`;
+        grid.style.gridTemplateRows = `repeat(${hastaX - desdeX + 1}, 1fr)`;
+
+        divs.clear();
+        for (let x = desdeX; x <= hastaX; x++) {
+            for (let z = desdeZ; z <= hastaZ; z++) {
+                const div = crearCasilla(x, z);
+                divs.set(`${x},${z}`, div);
+                fragmento.appendChild(div);
+            }
+        }
+        grid.replaceChildren(fragmento);
+    }
+
+    // Pide al servidor los chunks de la vista actual y la dibuja
     async function actualizarMapa() {
         try {
-            const response = await fetch('/api/mapa');
-            const casillas = await response.json();
-            
-            // Limpiar la cuadrícula actual
-            grid.innerHTML = '';
-            
-            // Logs de depuración de datos
-            console.log("Datos completos recibidos:", casillas);
-            console.log("Estructura de la primera casilla:", casillas[0]);
-            console.log("Número total de casillas:", casillas.length);
-            
-            // Calcular el rango del grid basado en los datos
-            let maxAbsValue = 0;
-            casillas.forEach(casilla => {
-                const absX = Math.abs(casilla.x);
-                const absZ = Math.abs(casilla.z);
-                maxAbsValue = Math.max(maxAbsValue, absX, absZ);
+            const { desdeX, hastaX, desdeZ, hastaZ } = vista();
+            const response = await fetch(`/api/mapa/chunks?desde_x=${desdeX}&hasta_x=${hastaX}&desde_z=${desdeZ}&hasta_z=${hastaZ}`);
+            const datos = await response.json();
+            if (!response.ok) {
+                throw new Error(datos.message);
+            }
+
+            datos.chunks.forEach(chunk => {
+                chunk.casillas.forEach(casilla => {
+                    casillas.set(`${casilla.x},${casilla.z}`, casilla);
+                });
             });
-            
-            // Asegurar un mínimo de 3 para que siempre haya al menos una plaza central
-            const rango = Math.max(3, maxAbsValue);
-            
-            // Configurar el grid con el rango calculado
-            grid.style.gridTemplateColumns = `repeat(${rango * 2 + 1}, 1fr)`;
-            grid.style.gridTemplateRows = `repeat(${rango * 2 + 1}, 1fr)`;
-            
-            // Crear el grid con el rango calculado
-            for (let x = -rango; x <= rango; x++) {
-                for (let z = -rango; z <= rango; z++) {
-                    const div = document.createElement('div');
-                    div.classList.add('casilla');
-                    div.dataset.x = x;
-                    div.dataset.z = z;
-                    
-                    // Buscar la casilla en los datos obtenidos
-                    const casilla = casillas.find(c => c.x === x && c.z === z);
-                    if (casilla) {
-                        
-                        // Si es solar con ciudadano, mostramos doble fondo
-                        if (casilla.ciudadano_id && casilla.tipo === 'SOLAR') {
-                            console.log("¡Casilla cumple las condiciones! Mostrando doble fondo (solar y casa)");
-                            console.log("Nivel de casa del ciudadano:", casilla.nivel_casa);
-                            // Primero la casa del nivel del ciudadano
-                            div.style.backgroundImage = `url('/static/img/casa/${NIVELES_CASA[casilla.nivel_casa] || 'nivel_casa_0.png'}')`;
-                            // Luego el solar encima
-                            div.style.backgroundImage += `, url('/static/img/casillas/${TIPOS_CASILLAS[casilla.tipo]}')`;
-                            
-                            // Si es una casa con ciudadano, agregar el tooltip
-                            if (casilla.nombre) {
-                                const tooltip = document.createElement('div');
-                                tooltip.className = 'tooltip';
-                                tooltip.textContent = `Casa de ${casilla.nombre}`;
-                                div.appendChild(tooltip);
-                            }
-                            
-                            // Si es la casilla (0,0) agregar tooltip de pozo
-                            if (x === 0 && z === 0) {
-                                const pozoTooltip = document.createElement('div');
-                                pozoTooltip.className = 'tooltip';
-                                pozoTooltip.textContent = 'Pozo';
-                                div.appendChild(pozoTooltip);
-                            }
-                        } else {
-                            console.log("Casilla no cumple las condiciones, mostrando imagen base");
-                            const imagen = TIPOS_CASILLAS[casilla.tipo];
-                            div.style.backgroundImage = `url('/static/img/casillas/${imagen}')`;
-                        }                           
-                    } else {
-                        // Casilla vacía por defecto
-                        div.style.backgroundColor = '#e0e0e0';
-                    }
-                    
-                    // Añadir evento click
-                    div.addEventListener('click', () => {
-                        currentCoords.textContent = `${x},${z}`;
-                    });
-                    
-                    grid.appendChild(div);
-                }
+            // Los cambios se piden desde la versión de la primera carga: los chunks que se
+            // cargan después pueden ser más nuevos, y volver a recibir sus casillas no importa
+            if (versionMapa === null) {
+                versionMapa = datos.version;
             }
+            dibujar();
         } catch (error) {
             console.error('Error al actualizar la cuadrícula:', error);
         }
     }
 
+    // Pide solo las casillas cambiadas desde la última versión y redibuja esas
+    async function sincronizarMapa() {
+        if (versionMapa === null) {
+            return actualizarMapa();
+        }
+        try {
+            const response = await fetch(`/api/mapa?since=${versionMapa}`, {
+                headers: { 'If-None-Match': `"mapa-${versionMapa}"` },
+            });
+            // 304: el mapa no ha cambiado
+            if (response.status === 304) {
+                return;
+            }
+            const datos = await response.json();
+            if (!response.ok) {
+                throw new Error(datos.message);
+            }
+
+            if (datos.casillas === null) {
+                // Demasiados cambios: se vuelve a pedir la vista entera
+                casillas.clear();
+                versionMapa = null;
+                return actualizarMapa();
+            }
+            datos.casillas.forEach(casilla => {
+                const clave = `${casilla.x},${casilla.z}`;
+                casillas.set(clave, casilla);
+                const div = divs.get(clave);
+                if (div) {
+                    const nuevo = crearCasilla(casilla.x, casilla.z);
+                    div.replaceWith(nuevo);
+                    divs.set(clave, nuevo);
+                }
+            });
+            versionMapa = datos.version;
+        } catch (error) {
+            console.error('Error al sincronizar la cuadrícula:', error);
+        }
+    }
+
     // Eventos de los botones
     document.getElementById('btn-zoom-in').addEventListener('click', () => {
         zoomLevel = Math.min(2, zoomLevel + 0.1);
         grid.style.transform = `scale(${zoomLevel})`;
+        actualizarMapa();
     });
 
     document.getElementById('btn-zoom-out').addEventListener('click', () => {
         zoomLevel = Math.max(0.5, zoomLevel - 0.1);
         grid.style.transform = `scale(${zoomLevel})`;
+        actualizarMapa();
     });
 
     document.getElementById('btn-center').addEventListener('click', () => {
         grid.style.transform = `scale(1)`;
         zoomLevel = 1;
+        centroX = 0;
+        centroZ = 0;
+        actualizarMapa();
+    });
+
+    // Mover la vista con las flechas del teclado
+    const MOVIMIENTOS = {
+        'ArrowUp': [-1, 0],
+        'ArrowDown': [1, 0],
+        'ArrowLeft': [0, -1],
+        'ArrowRight': [0, 1],
+    };
+    document.addEventListener('keydown', (evento) => {
+        const movimiento = MOVIMIENTOS[evento.key];
+        if (!movimiento) {
+            return;
+        }
+        evento.preventDefault();
+        const paso = Math.max(1, Math.floor(RADIO_VISTA / zoomLevel / 2));
+        centroX += movimiento[0] * paso;
+        centroZ += movimiento[1] * paso;
+        actualizarMapa();
     });
 
     // Actualizar la cuadrícula inicialmente
     actualizarMapa();
 
-    // Actualizar cada 5 segundos
-    setInterval(actualizarMapa, 20000);
+    // Pedir los cambios cada 20 segundos
+    setInterval(sincronizarMapa, 20000);
 });